@@ -0,0 +1,45 @@
+# 厨房 API の一覧エンドポイント（GET /kitchen/schedules）のスループットを計測する
+#
+#   python ch06/benchmarks/bench_kitchen_list.py --schedules 1000 --requests 50
+import argparse
+import sys
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'kitchen'))
+
+from app import app
+from api.api import schedules
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--schedules', type=int, default=1_000)
+    parser.add_argument('--requests', type=int, default=50)
+    args = parser.parse_args()
+
+    for _ in range(args.schedules):
+        schedules.add({
+            'id': str(uuid.uuid4()),
+            'scheduled': datetime.utcnow(),
+            'status': 'pending',
+            'order': [{'product': 'cappuccino', 'size': 'small', 'quantity': 1}],
+        })
+
+    client = app.test_client()
+    client.get('/kitchen/schedules')
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        response = client.get('/kitchen/schedules')
+        assert response.status_code == 200
+    elapsed = time.perf_counter() - start
+    print(
+        f'{args.schedules} schedules: {args.requests / elapsed:.1f} req/s, '
+        f'{elapsed / args.requests * 1000:.2f} ms/req'
+    )
+
+
+if __name__ == '__main__':
+    main()
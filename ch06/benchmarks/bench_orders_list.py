@@ -0,0 +1,50 @@
+# 注文 API の一覧エンドポイント（GET /orders）のスループットを計測する
+#
+#   python ch06/benchmarks/bench_orders_list.py --orders 10000 --requests 20
+import argparse
+import sys
+import time
+import uuid
+import warnings
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'orders'))
+warnings.filterwarnings('ignore', message='Using `httpx`')
+
+from fastapi.testclient import TestClient
+
+from orders.app import app
+from orders.api.api import orders
+from orders.repository.records import OrderRecord, make_items, to_timestamp
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--orders', type=int, default=10_000)
+    parser.add_argument('--requests', type=int, default=20)
+    args = parser.parse_args()
+
+    for _ in range(args.orders):
+        orders.repository.add(OrderRecord(
+            uuid.uuid4().int,
+            to_timestamp(datetime.utcnow()),
+            'created',
+            make_items([{'product': 'cappuccino', 'size': 'small', 'quantity': 1}]),
+        ))
+
+    client = TestClient(app)
+    client.get('/orders')
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        response = client.get('/orders')
+        assert response.status_code == 200
+    elapsed = time.perf_counter() - start
+    print(
+        f'{args.orders} orders: {args.requests / elapsed:.1f} req/s, '
+        f'{elapsed / args.requests * 1000:.2f} ms/req'
+    )
+
+
+if __name__ == '__main__':
+    main()
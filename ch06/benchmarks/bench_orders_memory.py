@@ -0,0 +1,74 @@
+# インメモリの注文リポジトリが 1 件の注文あたりに使うメモリを計測する
+#
+#   python ch06/benchmarks/bench_orders_memory.py --orders 1000000
+#
+# 注文は保存用の JSON の形から codec.load_order() で復元してリポジトリに追加するので、
+# リポジトリ内部の表現が変わっても同じスクリプトで比較できる。
+# 計測には tracemalloc を使い、注文とインデックスを含むリポジトリ全体の
+# 確保済みメモリを注文の件数で割る
+import argparse
+import gc
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'orders'))
+
+from orders.repository.codec import load_order
+from orders.repository.orders_repository import OrderRepository
+
+
+PRODUCTS = ['cappuccino', 'latte', 'espresso', 'mocha', 'americano', 'flat white']
+SIZES = ['small', 'medium', 'big']
+
+
+def make_payloads(count):
+    # 現実に近い注文になるように、明細の件数、商品、サイズ、ステータスをばらつかせる
+    start = datetime(2024, 1, 1)
+    for number in range(count):
+        yield {
+            'order': [
+                {
+                    'product': random.choice(PRODUCTS),
+                    'size': random.choice(SIZES),
+                    'quantity': random.randint(1, 3),
+                }
+                for _ in range(random.randint(1, 3))
+            ],
+            'id': str(uuid.uuid4()),
+            'created': (start + timedelta(milliseconds=number)).isoformat(),
+            'status': random.choice(['created', 'progress', 'cancelled']),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--orders', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    repository = OrderRepository()
+    for payload in make_payloads(args.orders):
+        repository.add(load_order(payload))
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    print(f'orders:          {len(repository):>12,}')
+    print(f'total bytes:     {used:>12,}')
+    print(f'bytes per order: {used / args.orders:>12,.1f}')
+    print(f'load time (s):   {elapsed:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
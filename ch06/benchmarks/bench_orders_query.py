@@ -0,0 +1,100 @@
+# 注文リポジトリの絞り込み（クエリエンジン）のレイテンシを計測する
+#
+#   python ch06/benchmarks/bench_orders_query.py --orders 100000 --repeat 200
+#
+# 条件の組み合わせごとに、インデックスを使う OrderRepository.list() と、
+# 全件を内包表記で絞り込んでから並べ替える素朴な実装の 1 回あたりの時間を比べる
+import argparse
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'orders'))
+
+from coffeemesh.repository.query import Query
+
+from orders.repository.orders_repository import OrderRepository
+from orders.repository.records import OrderRecord, make_items, to_timestamp
+
+PRODUCTS = ['cappuccino', 'latte', 'espresso', 'mocha', 'flat white', 'americano']
+SIZES = ['small', 'medium', 'big']
+# 作成済みと配達済みが大半で、キャンセルと調理中は少ない分布にする
+STATUSES = ['created'] * 40 + ['delivered'] * 50 + ['cancelled'] * 5 + ['progress'] * 5
+
+
+def naive(orders, query, limit):
+    # 変更前の API と同じく、全件を条件で絞り込んでから並べ替える
+    start = to_timestamp(query.start) if query.start is not None else None
+    end = to_timestamp(query.end) if query.end is not None else None
+    matches = [
+        order for order in orders
+        if (query.status is None or order.status in query.status)
+        and (query.exclude_status is None or order.status not in query.exclude_status)
+        and (start is None or order.created >= start)
+        and (end is None or order.created < end)
+        and (query.product is None or any(item.product in query.product for item in order.items))
+        and (query.size is None or any(item.size in query.size for item in order.items))
+    ]
+    return sorted(matches, key=lambda order: (order.created, order.id))[:limit]
+
+
+def timed(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - start) / repeat * 1e6, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--orders', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    now = datetime.utcnow()
+    first = now - timedelta(days=30)
+    step = timedelta(days=30) / args.orders
+    repository = OrderRepository()
+    records = [
+        OrderRecord(
+            uuid.uuid4().int,
+            to_timestamp(first + step * number),
+            rng.choice(STATUSES),
+            make_items([
+                {'product': rng.choice(PRODUCTS), 'size': rng.choice(SIZES), 'quantity': 1}
+                for _ in range(rng.randint(1, 2))
+            ]),
+        )
+        for number in range(args.orders)
+    ]
+    repository.add_many(records)
+
+    queries = {
+        'none': Query(),
+        'status=progress': Query(status='progress'),
+        'status!=cancelled': Query(exclude_status='cancelled'),
+        'last hour': Query(start=now - timedelta(hours=1)),
+        'product+size': Query(product='mocha', size='big'),
+        'cancelled+product': Query(status='cancelled', product=['latte', 'mocha']),
+        'day+status+size': Query(
+            start=now - timedelta(days=2), end=now - timedelta(days=1),
+            status=['created', 'progress'], size='small',
+        ),
+    }
+    print(f'{"query":>20} {"index (us)":>12} {"naive (us)":>12} {"speedup":>8}')
+    for name, query in queries.items():
+        indexed, result = timed(lambda: repository.list(query, limit=args.limit), args.repeat)
+        baseline, expected = timed(
+            lambda: naive(records, query, args.limit), max(1, args.repeat // 50)
+        )
+        assert [order.id for order in result] == [order.id for order in expected], name
+        print(f'{name:>20} {indexed:>12.1f} {baseline:>12.1f} {baseline / indexed:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
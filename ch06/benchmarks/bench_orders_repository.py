@@ -0,0 +1,79 @@
+# 注文リポジトリの単一注文操作のレイテンシを、ストアのサイズごとに計測する
+#
+#   python ch06/benchmarks/bench_orders_repository.py --sizes 1000 10000 100000 1000000
+#
+# インデックス化されたリポジトリでは、get / update / delete のレイテンシは
+# ストアのサイズに依存せずほぼ一定になる
+import argparse
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'orders'))
+
+from orders.repository.orders_repository import OrderRepository
+from orders.repository.records import OrderRecord, make_items, to_timestamp
+
+
+def make_order():
+    return OrderRecord(
+        uuid.uuid4().int,
+        to_timestamp(datetime.utcnow()),
+        'created',
+        make_items([{'product': 'cappuccino', 'size': 'small', 'quantity': 1}]),
+    )
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def measure(fn, ids):
+    samples = []
+    for order_id in ids:
+        start = time.perf_counter_ns()
+        fn(order_id)
+        samples.append(time.perf_counter_ns() - start)
+    return samples
+
+
+def run(size, operations):
+    repository = OrderRepository()
+    for _ in range(size):
+        repository.add(make_order())
+    ids = [
+        uuid.UUID(int=order_id)
+        for order_id in random.sample(list(repository._orders), min(operations, size))
+    ]
+
+    results = {}
+    results['get'] = measure(repository.get, ids)
+    results['cancel'] = measure(
+        lambda order_id: repository.update(order_id, status='cancelled'), ids
+    )
+    results['delete'] = measure(repository.delete, ids)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument('--operations', type=int, default=1_000)
+    args = parser.parse_args()
+
+    print(f'{"size":>10} {"operation":>10} {"p50 (ns)":>10} {"p99 (ns)":>10} {"mean (ns)":>10}')
+    for size in args.sizes:
+        for operation, samples in run(size, args.operations).items():
+            print(
+                f'{size:>10} {operation:>10} {percentile(samples, 0.5):>10} '
+                f'{percentile(samples, 0.99):>10} {int(statistics.mean(samples)):>10}'
+            )
+
+
+if __name__ == '__main__':
+    main()
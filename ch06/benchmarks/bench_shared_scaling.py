@@ -0,0 +1,156 @@
+# 共有ストアを使う注文 API のワーカープロセス数ごとのスループットの計測
+#
+#   python ch06/benchmarks/bench_shared_scaling.py --workers 1 2 4 --duration 10
+#
+# 共有ストアのサーバー（orders.repository.shared_repository）を起動してレコードを読み込み、
+# ワーカー数ごとに ORDERS_STORAGE_BACKEND=shared の注文 API をインプロセスで動かす
+# プロセスを起動する。各ワーカーは同じ時刻に開始し、--duration 秒の間リクエストを送り続ける。
+# 全ワーカーの合計のスループットと、ワーカー 1 つのときに対する倍率を出力する。
+# 最後にストアの件数が「読み込んだ件数 + 作成した注文の件数」と一致することを確認し、
+# 一致しなければ終了コード 1 で終了する
+#
+# 書き込みはすべてストアのサーバーの 1 プロセスで行うので、書き込みの多い比率では
+# サーバーの CPU が上限になる。コア数より多いワーカーを起動しても倍率は上がらない
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+from bench_suite import ROOT, choose_operations, orders_request, parse_mix, preload_orders
+
+
+DEFAULT_MIX = 'create=1,list=2,get=6,pay=1'
+AUTHKEY = 'orders-bench'
+
+
+def store_environment(socket):
+    return {
+        **os.environ,
+        'ORDERS_SHARED_STORE_SOCKET': socket,
+        'ORDERS_SHARED_STORE_AUTHKEY': AUTHKEY,
+        'ORDERS_SHARED_STORE_BACKEND': 'memory',
+        'ORDERS_STORAGE_BACKEND': 'shared',
+        'PYTHONPATH': str(ROOT / 'orders'),
+    }
+
+
+async def run_worker(args):
+    warnings.filterwarnings('ignore', message='Using `httpx`')
+    sys.path.insert(0, str(ROOT / 'orders'))
+    import httpx
+    from orders.app import app
+
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    ids = json.loads(Path(args.ids).read_text())
+    requests = errors = created = 0
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://orders') as client:
+        # 全ワーカーの計測の開始時刻をそろえる
+        time.sleep(max(0.0, args.start_at - time.time()))
+        deadline = time.perf_counter() + args.duration
+        while time.perf_counter() < deadline:
+            for operation in choose_operations(mix, 'orders', 100, rng):
+                ok = await orders_request(client, operation, ids, rng)
+                requests += 1
+                errors += not ok
+                created += ok and operation == 'create'
+    json.dump({'requests': requests, 'errors': errors, 'created': created}, sys.stdout)
+
+
+def measure(args, workers, ids_path, environment):
+    start_at = time.time() + 2.0
+    processes = [
+        subprocess.Popen(
+            [
+                sys.executable, __file__, '--worker', '--ids', ids_path, '--mix', args.mix,
+                '--duration', str(args.duration), '--start-at', str(start_at),
+                '--seed', str(args.seed + number),
+            ],
+            env=environment, stdout=subprocess.PIPE, text=True,
+        )
+        for number in range(workers)
+    ]
+    results = []
+    for process in processes:
+        output, _ = process.communicate()
+        if process.returncode != 0:
+            raise SystemExit(f'worker exited with {process.returncode}')
+        results.append(json.loads(output))
+    return {
+        'workers': workers,
+        'requests': sum(result['requests'] for result in results),
+        'errors': sum(result['errors'] for result in results),
+        'created': sum(result['created'] for result in results),
+        'throughput': sum(result['requests'] for result in results) / args.duration,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--size', type=int, default=10_000)
+    parser.add_argument('--mix', default=DEFAULT_MIX)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--seed', type=int, default=0)
+    # ワーカーのプロセスで使う
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--ids', help=argparse.SUPPRESS)
+    parser.add_argument('--start-at', type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        asyncio.run(run_worker(args))
+        return
+
+    sys.path.insert(0, str(ROOT / 'orders'))
+    with tempfile.TemporaryDirectory() as directory:
+        socket = os.path.join(directory, 'orders-store.sock')
+        ids_path = os.path.join(directory, 'ids.json')
+        environment = store_environment(socket)
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'orders.repository.shared_repository'],
+            env=environment, stdout=subprocess.PIPE, text=True,
+        )
+        try:
+            # サーバーが待ち受けを始めたら 1 行出力する
+            server.stdout.readline()
+            from orders.repository.shared_repository import SharedOrderRepository
+            repository = SharedOrderRepository(socket, AUTHKEY.encode())
+            ids = preload_orders(repository, args.size, random.Random(args.seed))
+            Path(ids_path).write_text(json.dumps(ids))
+            expected = repository.count()
+
+            results = []
+            for workers in args.workers:
+                result = measure(args, workers, ids_path, environment)
+                expected += result['created']
+                results.append(result)
+                print(
+                    f'{workers:>3} workers {result["throughput"]:>10.1f} req/s '
+                    f'x{result["throughput"] / results[0]["throughput"]:>5.2f} '
+                    f'errors {result["errors"]}',
+                    file=sys.stderr,
+                )
+            count = repository.count()
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(json.dumps({'cpus': os.cpu_count(), 'results': results}, indent=2))
+    if count != expected:
+        print(f'store has {count} orders, expected {expected}', file=sys.stderr)
+        sys.exit(1)
+    print(f'store has {count} orders as expected', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+# 注文 API と厨房 API の起動時間の計測
+#
+#   python ch06/benchmarks/bench_startup.py --runs 10
+#   python ch06/benchmarks/bench_startup.py --apps kitchen --cache cold
+#
+# アプリケーションごとに新しいプロセスを --runs 回起動し、アプリケーションのモジュールの
+# インポートを始めてから、インポートを終えるまで（import）と、最初の API 仕様書の
+# リクエストに応答するまで（ready）の時間を計る。process はプロセスの起動から終了までの時間で、
+# インタープリターの起動を含む。
+# cold はコンパイル済みの API 仕様書（.openapi-cache）を毎回削除して YAML から読み込む場合、
+# warm はビルド時にコンパイルしておいた場合。結果はアプリケーションとキャッシュの状態ごとの
+# 中央値と最小値（ミリ秒）を JSON で出力する
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+import warnings
+
+from bench_suite import ROOT
+
+
+APPS = {
+    'orders': {
+        'directory': ROOT / 'orders',
+        'build': ['-m', 'coffeemesh.api.openapi', 'oas.yaml'],
+        'environment': {'ORDERS_STORAGE_BACKEND': 'memory'},
+    },
+    'kitchen': {
+        'directory': ROOT / 'kitchen',
+        'build': ['-m', 'coffeemesh.api.openapi', 'oas.yaml'],
+        'environment': {'KITCHEN_STORAGE_BACKEND': 'memory'},
+    },
+}
+
+
+def run_child(name):
+    # 計測の対象外のクライアントのライブラリは先に読み込んでおく
+    warnings.filterwarnings('ignore', message='Using `httpx`')
+    sys.path.insert(0, str(APPS[name]['directory']))
+    if name == 'orders':
+        from fastapi.testclient import TestClient
+
+        started = time.perf_counter()
+        from orders.app import app
+        imported = time.perf_counter()
+        response = TestClient(app).get('/openapi/orders.json')
+        status = response.status_code
+    else:
+        started = time.perf_counter()
+        from app import app
+        imported = time.perf_counter()
+        status = app.test_client().get('/openapi/kitchen.json').status_code
+    ready = time.perf_counter()
+    json.dump({'status': status, 'import': imported - started, 'ready': ready - started}, sys.stdout)
+    # 実行エンジンなどのバックグラウンドのスレッドの終了を待たない
+    sys.stdout.flush()
+    os._exit(0)
+
+
+def environment(name):
+    return {
+        **os.environ,
+        **APPS[name]['environment'],
+        'PYTHONPATH': str(APPS[name]['directory']),
+    }
+
+
+def measure(name, cache, runs):
+    app = APPS[name]
+    cache_dir = app['directory'] / '.openapi-cache'
+    if cache == 'warm':
+        subprocess.run(
+            [sys.executable, *app['build']], cwd=app['directory'], env=environment(name),
+            check=True, stdout=subprocess.DEVNULL,
+        )
+    samples = {'import': [], 'ready': [], 'process': []}
+    for _ in range(runs):
+        if cache == 'cold':
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, __file__, '--child', name], cwd=app['directory'],
+            env=environment(name), check=True, stdout=subprocess.PIPE, text=True,
+        ).stdout
+        elapsed = time.perf_counter() - started
+        result = json.loads(output)
+        if result['status'] != 200:
+            raise RuntimeError(f'{name}: the API document returned {result["status"]}')
+        samples['import'].append(result['import'])
+        samples['ready'].append(result['ready'])
+        samples['process'].append(elapsed)
+    return {
+        metric: {
+            'median_ms': round(statistics.median(values) * 1000, 1),
+            'min_ms': round(min(values) * 1000, 1),
+        }
+        for metric, values in samples.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--apps', nargs='+', choices=list(APPS), default=list(APPS))
+    parser.add_argument('--cache', nargs='+', choices=['cold', 'warm'], default=['cold', 'warm'])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--child', choices=list(APPS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+
+    results = {}
+    for name in args.apps:
+        for cache in args.cache:
+            results[f'{name}/{cache}'] = measure(name, cache, args.runs)
+            print(f'{name}/{cache}: {results[f"{name}/{cache}"]["ready"]}', file=sys.stderr)
+    # 計測の後にコンパイル済みの仕様書を残しておく
+    for name in args.apps:
+        subprocess.run(
+            [sys.executable, *APPS[name]['build']], cwd=APPS[name]['directory'],
+            env=environment(name), check=True, stdout=subprocess.DEVNULL,
+        )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
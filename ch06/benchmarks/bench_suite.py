@@ -0,0 +1,353 @@
+# 注文 API と厨房 API のエンドポイントの負荷テスト
+#
+#   python ch06/benchmarks/bench_suite.py --output results.json
+#   python ch06/benchmarks/bench_suite.py --mix get=8,list=2 --baseline results.json
+#
+# 注文 API は FastAPI の app をインプロセスの ASGI トランスポートで、厨房 API は
+# Flask のテストクライアントで呼び出す。ストアのサイズごとに別のプロセスを起動し、
+# 指定した件数のレコードを読み込んだ後、操作の比率（--mix）に従ってリクエストを送る。
+# 結果はエンドポイントごとのスループットと p50 / p95 / p99 のレイテンシを JSON で出力する。
+# --baseline を指定すると保存済みの結果と比較し、しきい値を超えて悪化した
+# エンドポイントがあれば終了コード 1 で終了する
+#
+# 保存先は各サービスの環境変数（ORDERS_STORAGE_BACKEND、KITCHEN_STORAGE_BACKEND など）で切り替える
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+import warnings
+from datetime import datetime, timedelta
+from pathlib import Path
+
+
+ROOT = Path(__file__).parent.parent
+
+DEFAULT_MIX = 'create=1,list=2,get=4,update=1,cancel=1,pay=1'
+# 厨房 API には支払いの操作がないので、スケジュールのステータスの取得を代わりに使う
+OPERATIONS = {
+    'orders': ('create', 'list', 'get', 'update', 'cancel', 'pay'),
+    'kitchen': ('create', 'list', 'get', 'update', 'cancel', 'status'),
+}
+PRODUCTS = ['cappuccino', 'latte', 'espresso', 'mocha']
+SIZES = ['small', 'medium', 'big']
+
+
+def parse_mix(value):
+    mix = {}
+    for entry in value.split(','):
+        name, _, weight = entry.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def make_items(rng):
+    return [
+        {'product': rng.choice(PRODUCTS), 'size': rng.choice(SIZES), 'quantity': rng.randint(1, 3)}
+        for _ in range(rng.randint(1, 3))
+    ]
+
+
+def percentile(samples, q):
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def summarize(latencies, errors, elapsed):
+    endpoints = {}
+    for operation, samples in sorted(latencies.items()):
+        samples.sort()
+        endpoints[operation] = {
+            'count': len(samples),
+            'errors': errors.get(operation, 0),
+            # 同時実行数 1 あたりのスループット（1 秒間に処理できるリクエスト数）
+            'throughput': len(samples) / (sum(samples) / 1e9),
+            'p50_ms': percentile(samples, 0.50) / 1e6,
+            'p95_ms': percentile(samples, 0.95) / 1e6,
+            'p99_ms': percentile(samples, 0.99) / 1e6,
+        }
+    total = sum(len(samples) for samples in latencies.values())
+    return {'requests': total, 'throughput': total / elapsed, 'endpoints': endpoints}
+
+
+def choose_operations(mix, service, count, rng):
+    names = [name for name in OPERATIONS[service] if mix.get(name)]
+    return rng.choices(names, weights=[mix[name] for name in names], k=count)
+
+
+# 注文 API
+
+def preload_orders(repository, size, rng):
+    from orders.repository.records import OrderRecord, make_items as make_records, to_timestamp
+
+    start = to_timestamp(datetime.utcnow() - timedelta(days=1))
+    ids = []
+    for offset in range(0, size, 10_000):
+        batch = []
+        for number in range(offset, min(size, offset + 10_000)):
+            order_id = uuid.uuid4()
+            ids.append(str(order_id))
+            batch.append(OrderRecord(
+                order_id.int,
+                start + number,
+                rng.choice(['created', 'progress', 'cancelled']),
+                make_records(make_items(rng)),
+            ))
+        repository.add_many(batch)
+    return ids
+
+
+async def orders_request(client, operation, ids, rng):
+    if operation == 'create':
+        response = await client.post('/orders', json={'order': make_items(rng)})
+        if response.status_code == 201:
+            ids.append(response.json()['id'])
+        return response.status_code == 201
+    if operation == 'list':
+        cancelled = rng.choice([None, True, False])
+        params = {'limit': 50} if cancelled is None else {'limit': 50, 'cancelled': cancelled}
+        response = await client.get('/orders', params=params)
+    elif operation == 'get':
+        response = await client.get(f'/orders/{rng.choice(ids)}')
+    elif operation == 'update':
+        response = await client.put(f'/orders/{rng.choice(ids)}', json={'order': make_items(rng)})
+    else:
+        response = await client.post(f'/orders/{rng.choice(ids)}/{operation}')
+    return response.status_code == 200
+
+
+async def run_orders(args, mix, rng):
+    warnings.filterwarnings('ignore', message='Using `httpx`')
+    sys.path.insert(0, str(ROOT / 'orders'))
+    import httpx
+    from orders.app import app
+    from orders.api.api import orders
+
+    ids = preload_orders(orders.repository, args.size, rng)
+    operations = choose_operations(mix, 'orders', args.warmup + args.requests, rng)
+    latencies, errors = {}, {}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://orders') as client:
+        for operation in operations[:args.warmup]:
+            await orders_request(client, operation, ids, rng)
+        queue = iter(operations[args.warmup:])
+
+        async def worker():
+            for operation in queue:
+                start = time.perf_counter_ns()
+                ok = await orders_request(client, operation, ids, rng)
+                latencies.setdefault(operation, []).append(time.perf_counter_ns() - start)
+                if not ok:
+                    errors[operation] = errors.get(operation, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+    return summarize(latencies, errors, elapsed)
+
+
+# 厨房 API
+
+def preload_kitchen(repository, size, rng):
+    start = datetime.utcnow() - timedelta(days=1)
+    ids = []
+    for offset in range(0, size, 10_000):
+        batch = []
+        for number in range(offset, min(size, offset + 10_000)):
+            schedule_id = str(uuid.uuid4())
+            ids.append(schedule_id)
+            batch.append({
+                'id': schedule_id,
+                'scheduled': start + timedelta(microseconds=number),
+                'status': rng.choice(['pending', 'progress', 'cancelled', 'finished']),
+                'order': make_items(rng),
+            })
+        repository.add_many(batch)
+    return ids
+
+
+def kitchen_request(client, operation, ids, rng):
+    if operation == 'create':
+        response = client.post('/kitchen/schedules', json={'order': make_items(rng)})
+        if response.status_code == 201:
+            ids.append(response.json['id'])
+        return response.status_code == 201
+    if operation == 'list':
+        progress = rng.choice([None, True, False])
+        query = 'limit=50' if progress is None else f'limit=50&progress={str(progress).lower()}'
+        response = client.get(f'/kitchen/schedules?{query}')
+    elif operation == 'get':
+        response = client.get(f'/kitchen/schedules/{rng.choice(ids)}')
+    elif operation == 'update':
+        response = client.put(
+            f'/kitchen/schedules/{rng.choice(ids)}', json={'order': make_items(rng)}
+        )
+    elif operation == 'cancel':
+        response = client.post(f'/kitchen/schedules/{rng.choice(ids)}/cancel')
+    else:
+        response = client.get(f'/kitchen/schedules/{rng.choice(ids)}/status')
+    return response.status_code == 200
+
+
+def run_kitchen(args, mix, rng):
+    sys.path.insert(0, str(ROOT / 'kitchen'))
+    from app import app
+    from api.api import schedules
+
+    ids = preload_kitchen(schedules, args.size, rng)
+    operations = choose_operations(mix, 'kitchen', args.warmup + args.requests, rng)
+    latencies, errors = {}, {}
+    lock = threading.Lock()
+
+    client = app.test_client()
+    for operation in operations[:args.warmup]:
+        kitchen_request(client, operation, ids, rng)
+    queue = iter(operations[args.warmup:])
+
+    def worker():
+        client = app.test_client()
+        while True:
+            with lock:
+                operation = next(queue, None)
+            if operation is None:
+                return
+            start = time.perf_counter_ns()
+            ok = kitchen_request(client, operation, ids, rng)
+            elapsed = time.perf_counter_ns() - start
+            with lock:
+                latencies.setdefault(operation, []).append(elapsed)
+                if not ok:
+                    errors[operation] = errors.get(operation, 0) + 1
+
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+# 結果の比較
+
+def compare(results, baseline, threshold):
+    # p95 のレイテンシが (1 + threshold) 倍を超えるか、スループットが (1 - threshold) 倍を
+    # 下回ったエンドポイントを悪化として報告する
+    for key in ('mix', 'requests', 'concurrency'):
+        if baseline['meta'].get(key) != results['meta'][key]:
+            print(f'warning: baseline was recorded with a different {key}', file=sys.stderr)
+    previous = {
+        (result['service'], result['size']): result for result in baseline['results']
+    }
+    regressions = []
+    print(f'{"service":>8} {"size":>9} {"endpoint":>8} {"p95 (ms)":>18} {"throughput (req/s)":>22}')
+    for result in results['results']:
+        before = previous.get((result['service'], result['size']))
+        if before is None:
+            continue
+        for endpoint, current in result['endpoints'].items():
+            old = before['endpoints'].get(endpoint)
+            if old is None:
+                continue
+            regressed = (
+                current['p95_ms'] > old['p95_ms'] * (1 + threshold)
+                or current['throughput'] < old['throughput'] * (1 - threshold)
+            )
+            print(
+                f'{result["service"]:>8} {result["size"]:>9} {endpoint:>8} '
+                f'{old["p95_ms"]:>8.3f} -> {current["p95_ms"]:>7.3f} '
+                f'{old["throughput"]:>10.1f} -> {current["throughput"]:>9.1f}'
+                f'{"  REGRESSION" if regressed else ""}'
+            )
+            if regressed:
+                regressions.append((result['service'], result['size'], endpoint))
+    return regressions
+
+
+def run_worker(args):
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    if args.worker == 'orders':
+        summary = asyncio.run(run_orders(args, mix, rng))
+    else:
+        summary = run_kitchen(args, mix, rng)
+    json.dump({'service': args.worker, 'size': args.size, **summary}, sys.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--services', nargs='+', choices=OPERATIONS, default=list(OPERATIONS))
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument('--mix', default=DEFAULT_MIX)
+    parser.add_argument('--requests', type=int, default=2_000)
+    parser.add_argument('--warmup', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='compare against results saved with --output')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    # サイズごとに起動する子プロセスで使う
+    parser.add_argument('--worker', choices=OPERATIONS, help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    results = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'mix': parse_mix(args.mix),
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+        },
+        'results': [],
+    }
+    for service in args.services:
+        for size in args.sizes:
+            # ストアの状態とメモリを持ち越さないように、サイズごとに別のプロセスで計測する
+            output = subprocess.run(
+                [
+                    sys.executable, __file__, '--worker', service, '--size', str(size),
+                    '--mix', args.mix, '--requests', str(args.requests),
+                    '--warmup', str(args.warmup), '--concurrency', str(args.concurrency),
+                    '--seed', str(args.seed),
+                ],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(output)
+            results['results'].append(result)
+            print(
+                f'{service:>8} {size:>9} {result["throughput"]:>10.1f} req/s',
+                file=sys.stderr,
+            )
+            for endpoint, stats in result['endpoints'].items():
+                print(
+                    f'{"":>19} {endpoint:>8} p50 {stats["p50_ms"]:>8.3f} ms '
+                    f'p95 {stats["p95_ms"]:>8.3f} ms p99 {stats["p99_ms"]:>8.3f} ms '
+                    f'errors {stats["errors"]}',
+                    file=sys.stderr,
+                )
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.threshold)
+        if regressions:
+            print(f'{len(regressions)} endpoint(s) regressed', file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+import json
+import random
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from bench_suite import OPERATIONS, choose_operations, compare, parse_mix, percentile, summarize  # noqa: E402
+
+
+def make_result(p95_ms, throughput):
+    return {
+        'service': 'orders',
+        'size': 1_000,
+        'endpoints': {'get': {'p95_ms': p95_ms, 'throughput': throughput}},
+    }
+
+
+def make_results(*results):
+    meta = {'mix': {'get': 1.0}, 'requests': 100, 'concurrency': 1}
+    return {'meta': meta, 'results': list(results)}
+
+
+def test_parses_mix_with_default_weights():
+    assert parse_mix('get=4, list=2,pay') == {'get': 4.0, 'list': 2.0, 'pay': 1.0}
+
+
+def test_chooses_only_weighted_operations_of_the_service():
+    operations = choose_operations({'get': 1, 'pay': 1, 'status': 0}, 'kitchen', 200, random.Random(0))
+
+    assert set(operations) == {'get'}
+    assert set(choose_operations(parse_mix('get=1,pay=1'), 'orders', 200, random.Random(0))) == {'get', 'pay'}
+
+
+def test_summarizes_latency_percentiles():
+    latencies = {'get': [(100 - n) * 1_000_000 for n in range(100)]}
+
+    summary = summarize(latencies, {'get': 2}, elapsed=2)
+
+    assert summary['requests'] == 100
+    assert summary['throughput'] == 50
+    get = summary['endpoints']['get']
+    assert (get['count'], get['errors']) == (100, 2)
+    assert (get['p50_ms'], get['p95_ms'], get['p99_ms']) == (51, 96, 100)
+    assert percentile([1, 2, 3], 0.99) == 3
+
+
+@pytest.mark.parametrize('p95_ms, throughput, regressed', [
+    (10.0, 1000.0, False),
+    (11.9, 850.0, False),
+    (12.5, 1000.0, True),
+    (10.0, 750.0, True),
+])
+def test_reports_regressions_beyond_threshold(capsys, p95_ms, throughput, regressed):
+    baseline = make_results(make_result(10.0, 1000.0))
+
+    regressions = compare(make_results(make_result(p95_ms, throughput)), baseline, 0.2)
+
+    assert regressions == ([('orders', 1_000, 'get')] if regressed else [])
+    assert ('REGRESSION' in capsys.readouterr().out) is regressed
+
+
+def test_skips_endpoints_missing_from_baseline(capsys):
+    current = make_results({**make_result(50.0, 1.0), 'size': 10_000})
+
+    assert compare(current, make_results(make_result(10.0, 1000.0)), 0.2) == []
+
+
+@pytest.mark.parametrize('service', list(OPERATIONS))
+def test_runs_a_small_suite(tmp_path, service):
+    output = tmp_path / 'results.json'
+    subprocess.run(
+        [
+            sys.executable, str(Path(__file__).parent.parent / 'bench_suite.py'),
+            '--services', service, '--sizes', '50', '--requests', '60', '--warmup', '5',
+            '--output', str(output),
+        ],
+        check=True, capture_output=True,
+    )
+
+    results = json.loads(output.read_text())
+    [result] = results['results']
+    assert (result['service'], result['size'], result['requests']) == (service, 50, 60)
+    assert set(result['endpoints']) <= set(OPERATIONS[service])
+    assert sum(stats['count'] for stats in result['endpoints'].values()) == 60
+
+    subprocess.run(
+        [
+            sys.executable, str(Path(__file__).parent.parent / 'bench_suite.py'),
+            '--services', service, '--sizes', '50', '--requests', '60', '--warmup', '5',
+            '--baseline', str(output), '--threshold', '1000',
+        ],
+        check=True, capture_output=True,
+    )
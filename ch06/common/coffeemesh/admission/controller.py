@@ -0,0 +1,215 @@
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+# 優先度。小さいほど優先する
+# HIGH: 1 件の読み取りなど安価なリクエスト、NORMAL: 書き込み、
+# LOW: 一覧やエクスポートなど、ストアのサイズに応じて重くなるリクエスト
+HIGH, NORMAL, LOW = 0, 1, 2
+PRIORITIES = (HIGH, NORMAL, LOW)
+
+# acquire() の結果
+GRANTED = 'granted'
+QUEUED = 'queued'
+SHED = 'shed'
+
+# 処理時間の指数移動平均の重み
+_SMOOTHING = 0.1
+
+
+# クライアントごとのトークンバケット
+class _Bucket:
+
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+
+
+# クライアントごとのトークンバケットによるレート制限
+# バケットは毎秒 rate 個のトークンが burst 個まで溜まり、リクエストごとに 1 個使う。
+# トークンは参照したときに経過時間の分だけ補充するので、タイマーは要らない。
+# バケットは最近使った順の OrderedDict に max_clients 件まで保持し、
+# 長く使われていないクライアントのバケットから追い出す
+class RateLimiter:
+
+    def __init__(self, rate, burst, max_clients=10_000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, client, cost=1):
+        # 許可した場合は 0、そうでなければトークンが溜まるまでの秒数を返す
+        now = self._clock()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = _Bucket(self.burst, now)
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+                bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+                bucket.updated = now
+            if bucket.tokens >= cost:
+                bucket.tokens -= cost
+                return 0.0
+            return (cost - bucket.tokens) / self.rate
+
+
+class Waiter:
+
+    __slots__ = ('route', 'priority', 'granted', 'notify')
+
+    def __init__(self, route, priority, notify):
+        self.route = route
+        self.priority = priority
+        self.granted = False
+        # 処理を許可したときに呼び出す関数。待っているスレッドやタスクを起こす
+        self.notify = notify
+
+
+# 同時に処理するリクエストの数を制限する
+# 全体の上限 capacity に加えて、ルートごとの上限 route_limits を設ける。
+# LOW のリクエストは capacity * low_priority_share までしか同時に処理せず、
+# 残りは安価な読み取りと書き込みのために空けておく。
+# 上限に達している間は優先度ごとの待ち行列に入れ、空きができたら優先度の高い順に
+# 処理を許可する。待ち行列が max_queue 件に達した場合と、前に並んでいる件数と
+# 優先度ごとの処理時間の移動平均から見積もった待ち時間が queue_timeout 秒を超える場合は、
+# 待たせずにすぐ断る。待ち行列に入れたリクエストも queue_timeout 秒待って
+# 許可されなければ断る
+class AdmissionController:
+
+    def __init__(
+        self,
+        capacity=64,
+        route_limits=None,
+        low_priority_share=0.5,
+        max_queue=256,
+        queue_timeout=0.5,
+        clock=time.monotonic,
+    ):
+        self.capacity = capacity
+        self.route_limits = dict(route_limits or {})
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._clock = clock
+        # 優先度ごとの同時に処理できる数の上限
+        self._priority_limits = (capacity, capacity, max(1, int(capacity * low_priority_share)))
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._priority_in_flight = [0] * len(PRIORITIES)
+        self._route_in_flight = {}
+        self._queues = tuple(deque() for _ in PRIORITIES)
+        self._queued = 0
+        # 優先度ごとの 1 件のリクエストの処理時間（秒）の指数移動平均
+        self._service_times = [None] * len(PRIORITIES)
+        self.admitted = 0
+        self.shed = 0
+
+    def acquire(self, route, priority, notify=None):
+        # (結果, Waiter) を返す。QUEUED の場合は、Waiter の notify が呼び出されるまで
+        # queue_timeout 秒待ち、呼び出されなければ cancel() を呼び出す。
+        # GRANTED の場合と、待って許可された場合は、処理の後に release() を呼び出す
+        with self._lock:
+            if self._can_run(route, priority):
+                self._start(route, priority)
+                return GRANTED, None
+            if self._queued >= self.max_queue or self._expected_wait(priority) > self.queue_timeout:
+                self.shed += 1
+                return SHED, None
+            waiter = Waiter(route, priority, notify)
+            self._queues[priority].append(waiter)
+            self._queued += 1
+            return QUEUED, waiter
+
+    def cancel(self, waiter):
+        # 待ち時間を過ぎたリクエストを待ち行列から取り除く。タイムアウトと同時に
+        # 許可されていた場合は True を返し、そのまま処理させる
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._queues[waiter.priority].remove(waiter)
+            self._queued -= 1
+            self.shed += 1
+            return False
+
+    def release(self, route, priority, elapsed):
+        # elapsed は許可されてから処理を終えるまでの秒数。処理しなかった場合は None
+        with self._lock:
+            self._in_flight -= 1
+            self._priority_in_flight[priority] -= 1
+            if route is not None:
+                self._route_in_flight[route] -= 1
+            service_time = self._service_times[priority]
+            if elapsed is not None:
+                self._service_times[priority] = (
+                    elapsed if service_time is None
+                    else service_time + _SMOOTHING * (elapsed - service_time)
+                )
+            self._dispatch()
+
+    def retry_after(self):
+        # 断ったリクエストに返す Retry-After の秒数
+        return max(1, math.ceil(self.queue_timeout))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': self._in_flight,
+                'queued': self._queued,
+                'admitted': self.admitted,
+                'shed': self.shed,
+            }
+
+    def _can_run(self, route, priority):
+        if self._in_flight >= self.capacity:
+            return False
+        if self._priority_in_flight[priority] >= self._priority_limits[priority]:
+            return False
+        limit = self.route_limits.get(route)
+        return limit is None or self._route_in_flight.get(route, 0) < limit
+
+    def _start(self, route, priority):
+        self._in_flight += 1
+        self._priority_in_flight[priority] += 1
+        if route is not None:
+            self._route_in_flight[route] = self._route_in_flight.get(route, 0) + 1
+        self.admitted += 1
+
+    def _expected_wait(self, priority):
+        # 同じか高い優先度で前に並んでいるリクエストと自身が、空いた枠で順に
+        # 処理されるまでの時間。処理時間の分からない優先度は数えない
+        total = 0.0
+        for queued, queue in enumerate(self._queues[:priority + 1]):
+            service_time = self._service_times[queued]
+            if service_time is not None:
+                total += (len(queue) + (queued == priority)) * service_time
+        return total / self._priority_limits[priority]
+
+    def _dispatch(self):
+        # 待ち行列を優先度の高い順に調べ、処理できるリクエストを許可する。
+        # ルートの上限で待っているリクエストは飛ばすので、待ち行列を走査するが、
+        # 待ち行列の長さは max_queue で抑えている
+        for queue in self._queues:
+            if self._in_flight >= self.capacity:
+                return
+            if not queue:
+                continue
+            waiting = []
+            while queue:
+                waiter = queue.popleft()
+                if self._in_flight < self.capacity and self._can_run(waiter.route, waiter.priority):
+                    self._start(waiter.route, waiter.priority)
+                    self._queued -= 1
+                    waiter.granted = True
+                    waiter.notify()
+                else:
+                    waiting.append(waiter)
+            queue.extend(waiting)
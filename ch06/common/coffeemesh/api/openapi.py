@@ -0,0 +1,81 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+
+# コンパイルした仕様書を置くディレクトリ。仕様書と同じディレクトリに作る
+CACHE_DIR = '.openapi-cache'
+
+
+# YAML の API 仕様書をエンコード済みの JSON のバイト列にコンパイルする。
+# コンパイルした結果は仕様書の内容の SHA-256 を名前に含むファイルに保存するので、
+# 仕様書を変更すると古いファイルは使われず、次に読み込むときにコンパイルし直す。
+# ビルド時に compile() を呼び出しておけば、起動時にも最初のリクエストでも
+# YAML をパースせずに済む。起動時には何も読み込まず、最初に content() か
+# document() が呼び出されたときに読み込む
+class OpenAPIDocument:
+
+    def __init__(self, source):
+        self.source = Path(source)
+        self._lock = threading.Lock()
+        self._content = None
+        self._document = None
+
+    def content(self):
+        # レスポンスのボディとしてそのまま返せるバイト列
+        if self._content is None:
+            with self._lock:
+                if self._content is None:
+                    self._content = self.compile()
+        return self._content
+
+    def document(self):
+        # フレームワークが仕様書をディクショナリとして必要とする場合のため
+        if self._document is None:
+            self._document = json.loads(self.content())
+        return self._document
+
+    def cache_path(self, source):
+        digest = hashlib.sha256(source).hexdigest()
+        return self.source.parent / CACHE_DIR / f'{self.source.stem}.{digest}.json'
+
+    def compile(self):
+        source = self.source.read_bytes()
+        path = self.cache_path(source)
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            pass
+        # PyYAML はコンパイルするときにだけ読み込み、起動時のインポートの時間を減らす
+        import yaml
+        content = json.dumps(yaml.safe_load(source), separators=(',', ':')).encode()
+        try:
+            path.parent.mkdir(exist_ok=True)
+            # 別のプロセスが同時にコンパイルしても、読み込む側が書きかけのファイルを
+            # 見ないように、一時ファイルに書いてから置き換える
+            temporary = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+            temporary.write_bytes(content)
+            os.replace(temporary, path)
+            for stale in path.parent.glob(f'{self.source.stem}.*.json'):
+                if stale != path:
+                    stale.unlink(missing_ok=True)
+        except OSError:
+            # 書き込めない場合は保存せず、このプロセスの中だけで使う
+            pass
+        return content
+
+
+# ビルド時に仕様書をコンパイルしておく
+#
+#   cd ch06/orders && python -m coffeemesh.api.openapi oas.yaml
+#   cd ch06/kitchen && python -m coffeemesh.api.openapi oas.yaml
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('source', type=Path)
+    args = parser.parse_args()
+    document = OpenAPIDocument(args.source)
+    content = document.compile()
+    print(f'{document.cache_path(document.source.read_bytes())} ({len(content)} bytes)')
@@ -0,0 +1,86 @@
+import json
+import threading
+import time
+
+
+# 変更イベントを保持する固定長のリングバッファ
+# イベント ID は連番なので、ID からバッファ内の位置を O(1) で求められる。
+# 容量を超えると最も古いイベントから上書きされる。イベントは発行時に一度だけ
+# SSE のフレームと JSON にエンコードし、接続しているすべてのクライアントで共有する
+class ChangeFeed:
+
+    def __init__(self, capacity=10_000):
+        self._capacity = capacity
+        self._events = [None] * capacity
+        # 再起動しても以前のイベント ID と重ならないように、起動時刻（マイクロ秒）から数え始める
+        self.last_event_id = time.time_ns() // 1000
+        self._oldest_event_id = self.last_event_id + 1
+        # 発行と読み出しは複数のスレッドから行われるので、条件変数で同期する
+        self._published = threading.Condition()
+
+    def publish(self, event_type, payload):
+        data = json.dumps(payload, separators=(',', ':'))
+        with self._published:
+            event_id = self.last_event_id + 1
+            frame = f'id: {event_id}\nevent: {event_type}\ndata: {data}\n\n'.encode()
+            record = f'{{"id":{event_id},"type":"{event_type}","data":{data}}}'.encode()
+            self._append((event_id, frame, record))
+            self._notify()
+        return event_id
+
+    def extend(self, events):
+        # 別のフィードの since() が返したイベントを、同じ ID のまま追加する。
+        # 続きでないイベントを受け取った場合は、それより前のイベントからは
+        # 続けて返せないので破棄する
+        if not events:
+            return
+        with self._published:
+            if events[0][0] != self.last_event_id + 1:
+                self._oldest_event_id = events[0][0]
+            for event in events:
+                self._append(event)
+            self._notify()
+
+    def reset(self, last_event_id):
+        # 保持しているイベントを破棄し、last_event_id の続きからイベントを受け付ける
+        with self._published:
+            self.last_event_id = last_event_id
+            self._oldest_event_id = last_event_id + 1
+            self._notify()
+
+    def position(self):
+        # プロキシ経由では属性を読み出せないので、最後のイベント ID をメソッドで返す
+        return self.last_event_id
+
+    def _append(self, event):
+        event_id = event[0]
+        self._events[event_id % self._capacity] = event
+        self.last_event_id = event_id
+        self._oldest_event_id = max(self._oldest_event_id, event_id - self._capacity + 1)
+
+    def _notify(self):
+        # ロックを保持した状態で呼び出す
+        self._published.notify_all()
+
+    def since(self, last_event_id, limit=None):
+        # last_event_id より後のイベントを (ID, SSE フレーム, JSON) のタプルで古い順に返す。
+        # 続きのイベントがすでに上書きされている場合と、このフィードが知らない
+        # イベント ID の場合は、続きから返せないので None を返す
+        with self._published:
+            if last_event_id < self._oldest_event_id - 1 or last_event_id > self.last_event_id:
+                return None
+            end = self.last_event_id
+            if limit is not None:
+                end = min(end, last_event_id + limit)
+            return [
+                self._events[event_id % self._capacity]
+                for event_id in range(last_event_id + 1, end + 1)
+            ]
+
+    def wait(self, last_event_id, timeout):
+        # last_event_id より後のイベントが発行されるまで待つ。
+        # タイムアウトした場合は False を返す
+        with self._published:
+            return self._published.wait_for(
+                lambda: self.last_event_id != last_event_id, timeout
+            )
@@ -0,0 +1,56 @@
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+# 共有ストアのサーバーのフィードを、ワーカーのフィードに写すリレー
+# ワーカーごとのフィードには、そのワーカーで発行したイベントしか入らず、イベント ID も
+# ワーカーごとに異なる。共有ストアを使う場合はイベントをサーバーのフィードに発行し、
+# 各ワーカーはこのリレーのスレッドでサーバーのフィードを長ポーリングして、
+# 同じ ID のまま自分のフィードに追加する。クライアントの接続はワーカーのフィードで
+# 待つので、サーバーへの接続はワーカーごとに 1 つで済み、どのワーカーに接続し直しても
+# 同じイベント ID から続きを受け取れる
+class FeedRelay:
+
+    def __init__(self, remote, feed, batch_size=1000, timeout=1.0, retry_interval=1.0):
+        self._remote = remote
+        self._feed = feed
+        self._batch_size = batch_size
+        self._timeout = timeout
+        self._retry_interval = retry_interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        # リクエストを受け付ける前に、ワーカーのフィードの位置をサーバーにそろえる
+        self._feed.reset(self._remote.position())
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='feed-relay', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        position = self._feed.last_event_id
+        while not self._stopped.is_set():
+            try:
+                events = self._remote.since(position, self._batch_size)
+                if events is None:
+                    # 読み出す前にサーバーのフィードで上書きされたので、ワーカーの
+                    # フィードも捨てて、待っているクライアントに reset を送らせる
+                    position = self._remote.position()
+                    self._feed.reset(position)
+                elif events:
+                    self._feed.extend(events)
+                    position = events[-1][0]
+                else:
+                    self._remote.wait(position, self._timeout)
+            except Exception:
+                logger.exception('Failed to relay the change feed')
+                self._stopped.wait(self._retry_interval)
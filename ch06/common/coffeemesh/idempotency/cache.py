@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# begin() の結果
+# NEW: 初めてのキー。リクエストを処理し、complete() か abandon() を呼び出す
+# REPLAY: 保存したレスポンスを返す
+# IN_PROGRESS: 同じキーのリクエストを処理中
+# MISMATCH: 同じキーが別のリクエストボディで使われた
+NEW = 'new'
+REPLAY = 'replay'
+IN_PROGRESS = 'in_progress'
+MISMATCH = 'mismatch'
+
+
+class _Entry:
+
+    __slots__ = ('fingerprint', 'expires', 'response')
+
+    def __init__(self, fingerprint, expires):
+        self.fingerprint = fingerprint
+        self.expires = expires
+        # 処理中は None、処理が終わると保存したレスポンス
+        self.response = None
+
+
+# 冪等キー -> 保存したレスポンスの LRU キャッシュ
+# OrderedDict を最近使った順に並べ、参照は move_to_end、追い出しは先頭から行う。
+# 件数が max_size を超えると最も長く使われていない処理済みのキーを追い出し、
+# ttl 秒を過ぎたキーは参照したときに取り除く。
+# キーは最初のリクエストの受付時に処理中として登録するので、処理中の再送を
+# 二重に処理することもない
+class IdempotencyCache:
+
+    def __init__(self, max_size=10_000, ttl=86_400.0, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # 保存したレスポンスを返した回数
+        self.replayed = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        # プロキシ経由では len() と属性を使えないので、メソッドでまとめて返す
+        with self._lock:
+            return {'keys': len(self._entries), 'replayed': self.replayed}
+
+    def begin(self, key, fingerprint):
+        # (結果, 保存したレスポンス) を返す。レスポンスは REPLAY の場合だけ
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= now:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._entries[key] = _Entry(fingerprint, now + self.ttl)
+                self._evict(now)
+                return NEW, None
+            if entry.fingerprint != fingerprint:
+                return MISMATCH, None
+            if entry.response is None:
+                return IN_PROGRESS, None
+            self._entries.move_to_end(key)
+            self.replayed += 1
+            return REPLAY, entry.response
+
+    def complete(self, key, response):
+        with self._lock:
+            entry = self._entries.get(key)
+            # 処理中に期限切れで取り除かれたキーは保存しない
+            if entry is not None and entry.response is None:
+                entry.response = response
+
+    def abandon(self, key):
+        # 処理に失敗したキーを取り除き、再送で処理し直せるようにする
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.response is None:
+                del self._entries[key]
+
+    def _evict(self, now):
+        entries = self._entries
+        # 処理中のキーは追い出さない。追い出すと、処理中の再送が NEW になり、
+        # 同じリクエストを二重に処理してしまう。処理中のキーの数は同時に処理している
+        # リクエストの数までなので、その分だけ max_size を超えることがある
+        excess = len(entries) - self.max_size
+        if excess > 0:
+            evicted = []
+            for key, entry in entries.items():
+                if entry.response is not None:
+                    evicted.append(key)
+                    if len(evicted) == excess:
+                        break
+            for key in evicted:
+                del entries[key]
+        # 先頭から期限切れのキーを取り除く。参照されたキーは末尾に移るので、
+        # 先頭に期限の残っているキーがあればそこで止め、1 回あたりの処理を抑える
+        while entries:
+            key, entry = next(iter(entries.items()))
+            if entry.expires > now:
+                break
+            del entries[key]
@@ -0,0 +1,229 @@
+import threading
+from bisect import bisect_left
+from time import perf_counter
+
+
+# レイテンシーのヒストグラムのバケットの上限（秒）
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PHASES = ('validation', 'handler', 'serialization')
+
+# どのルートにも一致しなかったリクエストのルートのラベル。
+# パスをそのままラベルにすると、時系列の数が際限なく増えるので使わない
+UNMATCHED = '<unmatched>'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _Histogram:
+
+    __slots__ = ('counts', 'sum')
+
+    def __init__(self):
+        # バケットごとの件数（累積ではない）。最後の要素は +Inf のバケット
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+
+
+# 1 つのスレッドが記録する、ルートごとのメトリクス
+class _RouteStats:
+
+    __slots__ = ('in_flight', 'responses', 'duration', 'phases')
+
+    def __init__(self):
+        self.in_flight = 0
+        # ステータスコード -> 件数
+        self.responses = {}
+        self.duration = _Histogram()
+        self.phases = tuple(_Histogram() for _ in PHASES)
+
+
+# 1 件のリクエストの各フェーズの開始と終了の時刻
+# dispatch_start から handler_start までを検証、handler_start から handler_end までを
+# ハンドラー、handler_end から dispatch_end までをシリアライズとして記録する。
+# serialization にはハンドラーの中でエンコードにかかった時間を加算し、
+# ハンドラーの時間から差し引く
+class RequestTimer:
+
+    __slots__ = (
+        'registry', 'route', 'status', 'start', 'dispatch_start', 'handler_start',
+        'handler_end', 'dispatch_end', 'serialization', 'serializing',
+    )
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.route = None
+        self.status = 500
+        self.start = perf_counter()
+        self.dispatch_start = None
+        self.handler_start = None
+        self.handler_end = None
+        self.dispatch_end = None
+        self.serialization = 0.0
+        self.serializing = False
+
+    def dispatch(self, method, route):
+        # ルーティングの後、リクエストの検証を始める前に呼び出す
+        self.route = self.registry.route(method, route)
+        self.route.in_flight += 1
+        self.dispatch_start = perf_counter()
+
+    def dispatched(self):
+        self.dispatch_end = perf_counter()
+        self.route.in_flight -= 1
+
+    def finish(self, method, route=UNMATCHED):
+        # レスポンスを返し終えた後に呼び出す。dispatch() を呼び出していないリクエストは
+        # route のラベルで件数とレイテンシーだけを記録する
+        if self.route is None:
+            self.route = self.registry.route(method, route)
+        self.registry.record(self)
+
+
+# リクエストのメトリクスを集計し、Prometheus のテキスト形式で出力する
+# 記録はスレッドごとのシャードに対して行うので、ロックを取らずに整数と浮動小数点数を
+# 加算するだけで済む。各シャードに書き込むのはそのシャードのスレッドだけで、
+# 出力時にすべてのシャードを合計する。読み取る値は加算の途中で多少古くなることがあるが、
+# ディクショナリのコピーは GIL の下でアトミックに行われるので、一貫しない状態にはならない
+class MetricsRegistry:
+
+    def __init__(self):
+        self._local = threading.local()
+        # (スレッド, シャード) のリスト。シャードは (メソッド, ルート) -> _RouteStats
+        self._shards = []
+        # 終了したスレッドのシャードを合計したもの
+        self._retired = {}
+        # シャードの追加と、終了したスレッドのシャードの合計にだけ使う
+        self._lock = threading.Lock()
+
+    def route(self, method, route):
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._local.shard = self._add_shard()
+        stats = shard.get((method, route))
+        if stats is None:
+            stats = shard[(method, route)] = _RouteStats()
+        return stats
+
+    def _add_shard(self):
+        # リクエストごとにスレッドを作るサーバーではシャードが増え続けるので、
+        # 新しいシャードを追加するときに、終了したスレッドのシャードを合計しておく
+        shard = {}
+        with self._lock:
+            live = []
+            for thread, existing in self._shards:
+                if thread.is_alive():
+                    live.append((thread, existing))
+                else:
+                    _merge(self._retired, existing)
+            live.append((threading.current_thread(), shard))
+            self._shards = live
+        return shard
+
+    def record(self, timer):
+        end = perf_counter()
+        stats = timer.route
+        stats.responses[timer.status] = stats.responses.get(timer.status, 0) + 1
+        stats.duration.observe(end - timer.start)
+        if timer.dispatch_start is None:
+            return
+        dispatch_end = timer.dispatch_end or end
+        validation, handler, serialization = stats.phases
+        if timer.handler_start is None:
+            # 検証に失敗し、ハンドラーまで到達しなかった
+            validation.observe(dispatch_end - timer.dispatch_start)
+            return
+        validation.observe(timer.handler_start - timer.dispatch_start)
+        if timer.handler_end is None:
+            # ストリーミングのレスポンスなど、ハンドラーの終了を記録しないビュー
+            handler.observe(dispatch_end - timer.handler_start)
+            return
+        handler.observe(timer.handler_end - timer.handler_start - timer.serialization)
+        serialization.observe(dispatch_end - timer.handler_end + timer.serialization)
+
+    def _collect(self):
+        # すべてのシャードを (メソッド, ルート) ごとに合計する
+        totals = {}
+        with self._lock:
+            _merge(totals, self._retired)
+            for _, shard in self._shards:
+                _merge(totals, shard)
+        return sorted(totals.items())
+
+    def render(self, gauges=(), counters=()):
+        # gauges と counters には (メトリクス名, 説明, 値) のタプルを渡す
+        totals = self._collect()
+        lines = [
+            '# HELP http_requests_total Total HTTP requests by route and status code.',
+            '# TYPE http_requests_total counter',
+        ]
+        for (method, route), stats in totals:
+            for status, count in sorted(stats.responses.items()):
+                lines.append(
+                    f'http_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}'
+                )
+        lines += [
+            '# HELP http_requests_in_flight HTTP requests currently being processed.',
+            '# TYPE http_requests_in_flight gauge',
+        ]
+        for (method, route), stats in totals:
+            if route != UNMATCHED:
+                lines.append(
+                    f'http_requests_in_flight{{method="{method}",route="{route}"}} {stats.in_flight}'
+                )
+        lines += [
+            '# HELP http_request_duration_seconds HTTP request latency.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for (method, route), stats in totals:
+            _render_histogram(
+                lines, 'http_request_duration_seconds',
+                f'method="{method}",route="{route}"', stats.duration,
+            )
+        lines += [
+            '# HELP http_request_phase_duration_seconds HTTP request latency by processing phase.',
+            '# TYPE http_request_phase_duration_seconds histogram',
+        ]
+        for (method, route), stats in totals:
+            for phase, histogram in zip(PHASES, stats.phases):
+                if any(histogram.counts):
+                    _render_histogram(
+                        lines, 'http_request_phase_duration_seconds',
+                        f'method="{method}",route="{route}",phase="{phase}"', histogram,
+                    )
+        for metric_type, metrics in (('gauge', gauges), ('counter', counters)):
+            for name, description, value in metrics:
+                lines += [
+                    f'# HELP {name} {description}', f'# TYPE {name} {metric_type}', f'{name} {value}'
+                ]
+        return ('\n'.join(lines) + '\n').encode()
+
+
+def _merge(totals, shard):
+    for key, stats in list(shard.items()):
+        total = totals.get(key)
+        if total is None:
+            total = totals[key] = _RouteStats()
+        total.in_flight += stats.in_flight
+        for status, count in dict(stats.responses).items():
+            total.responses[status] = total.responses.get(status, 0) + count
+        for target, source in zip((total.duration, *total.phases), (stats.duration, *stats.phases)):
+            target.counts = [a + b for a, b in zip(target.counts, source.counts)]
+            target.sum += source.sum
+
+
+def _render_histogram(lines, name, labels, histogram):
+    # Prometheus のバケットは上限以下の件数の累積
+    cumulative = 0
+    for bound, count in zip(BUCKETS, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    cumulative += histogram.counts[-1]
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+    lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+    lines.append(f'{name}_count{{{labels}}} {cumulative}')
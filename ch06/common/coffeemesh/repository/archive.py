@@ -0,0 +1,162 @@
+import json
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+
+
+# 1 つの圧縮ブロックにまとめるレコードの件数
+BLOCK_RECORDS = 256
+
+# 展開したブロックをキャッシュする件数
+_CACHED_BLOCKS = 16
+
+# インデックスで削除を表すオフセット
+_DELETED = -1
+
+
+# 保持期間を過ぎた終了状態のレコードを保存する、圧縮された追記専用のアーカイブ
+#
+# ディレクトリには次のファイルを置く:
+#   archive.data   BLOCK_RECORDS 件までのレコードの NDJSON を zlib で圧縮したブロックを
+#                  追記したもの
+#   archive.index  "ID オフセット 長さ" の行を追記したもの。同じ ID は後の行が優先し、
+#                  オフセットが -1 の行は削除を表す
+# インデックスは最初の読み取りのときに ID -> (オフセット, 長さ) のディクショナリに
+# 読み込み、1 件の読み取りはブロック 1 つの読み込みと展開で済ませる。
+# 書き込むのは 1 つのプロセスだけで、他のプロセスは読み取りだけを行う。
+# 読み取りのたびに、インデックスの追記された分だけを読み直す
+class Archive:
+
+    def __init__(self, directory):
+        self._directory = Path(directory)
+        self._data_path = self._directory / 'archive.data'
+        self._index_path = self._directory / 'archive.index'
+        self._lock = threading.Lock()
+        # ID -> (オフセット, 長さ)。削除された ID は含めない
+        self._index = {}
+        # インデックスファイルの読み込み済みの位置と、インデックスが参照する
+        # データファイルの末尾
+        self._index_position = 0
+        self._data_end = 0
+        # (オフセット, 長さ) -> {ID: レコード} の LRU キャッシュ
+        self._blocks = OrderedDict()
+        self._recovered = False
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._index)
+
+    def __contains__(self, record_id):
+        with self._lock:
+            self._refresh()
+            return record_id in self._index
+
+    def get(self, record_id):
+        with self._lock:
+            self._refresh()
+            entry = self._index.get(record_id)
+            if entry is None:
+                return None
+            return self._block(entry).get(record_id)
+
+    def append(self, records):
+        # records には ID を 'id' に持つ、JSON に変換できるディクショナリを渡す。
+        # データを fsync してからインデックスを追記するので、インデックスに載った
+        # レコードは必ず読み出せる
+        if not records:
+            return
+        with self._lock:
+            self._recover()
+            entries = []
+            with open(self._data_path, 'ab') as file:
+                offset = self._data_end
+                for start in range(0, len(records), BLOCK_RECORDS):
+                    block = records[start:start + BLOCK_RECORDS]
+                    data = zlib.compress(b''.join(
+                        json.dumps(record, separators=(',', ':')).encode() + b'\n'
+                        for record in block
+                    ))
+                    file.write(data)
+                    entries += [(record['id'], offset, len(data)) for record in block]
+                    offset += len(data)
+                file.flush()
+                os.fsync(file.fileno())
+            self._data_end = offset
+            self._write_index(entries)
+
+    def remove(self, record_ids):
+        # アーカイブから取り除く。データは残し、インデックスに削除の行を追記する
+        if not record_ids:
+            return
+        with self._lock:
+            self._recover()
+            self._write_index([(record_id, _DELETED, 0) for record_id in record_ids])
+
+    def _write_index(self, entries):
+        lines = b''.join(
+            f'{record_id} {offset} {length}\n'.encode() for record_id, offset, length in entries
+        )
+        with open(self._index_path, 'ab') as file:
+            file.write(lines)
+            file.flush()
+            os.fsync(file.fileno())
+        self._index_position += len(lines)
+        for record_id, offset, length in entries:
+            self._apply(record_id, offset, length)
+
+    def _refresh(self):
+        # インデックスファイルの読み込み済みの位置より後の、書き終えた行を読み込む。
+        # 追記がなければファイルのサイズを確かめるだけで済む
+        try:
+            if os.stat(self._index_path).st_size <= self._index_position:
+                return
+            with open(self._index_path, 'rb') as file:
+                file.seek(self._index_position)
+                data = file.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            record_id, offset, length = line.decode().split(' ')
+            self._apply(record_id, int(offset), int(length))
+        self._index_position += end
+
+    def _apply(self, record_id, offset, length):
+        if offset == _DELETED:
+            self._index.pop(record_id, None)
+        else:
+            self._index[record_id] = (offset, length)
+            self._data_end = max(self._data_end, offset + length)
+
+    def _recover(self):
+        # 書き込む前に一度だけ、クラッシュで途中まで書かれたインデックスの行と、
+        # インデックスに載らなかったデータを切り詰める
+        if self._recovered:
+            return
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._refresh()
+        for path, size in ((self._index_path, self._index_position), (self._data_path, self._data_end)):
+            if path.exists() and path.stat().st_size > size:
+                os.truncate(path, size)
+        self._recovered = True
+
+    def _block(self, entry):
+        block = self._blocks.get(entry)
+        if block is not None:
+            self._blocks.move_to_end(entry)
+            return block
+        offset, length = entry
+        with open(self._data_path, 'rb') as file:
+            file.seek(offset)
+            data = zlib.decompress(file.read(length))
+        block = {}
+        for line in data.splitlines():
+            record = json.loads(line)
+            block[record['id']] = record
+        self._blocks[entry] = block
+        if len(self._blocks) > _CACHED_BLOCKS:
+            self._blocks.popitem(last=False)
+        return block
@@ -0,0 +1,179 @@
+import json
+import mmap
+import os
+import threading
+import time
+from pathlib import Path
+
+
+# 追記専用のジャーナル（ログ先行書き込み）とスナップショット
+#
+# ディレクトリには次の世代別のファイルを置く:
+#   snapshot.<世代>.ndjson  世代の開始時点のストアの全レコード
+#   journal.<世代>.ndjson   その世代の開始以降の変更レコード
+# 起動時は最新のスナップショットを読み込み、同じ世代以降のジャーナルを再生する。
+# レコードは同じキーに対して冪等（put はレコード全体、delete は ID のみ）なので、
+# スナップショットの書き出し中に行われた変更が含まれていても、再生結果は変わらない
+class Journal:
+
+    def __init__(self, directory, sync_interval=0):
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        # グループコミット: fsync の実行中に追記されたレコードは、次の 1 回の fsync で
+        # まとめて書き込む。sync_interval（秒）を指定すると、fsync の前にその時間だけ待つ
+        self._sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._synced = threading.Condition(self._lock)
+        self._pending = threading.Condition(self._lock)
+        # スナップショットによるファイルの切り替えと fsync が重ならないようにする
+        self._fsync_lock = threading.Lock()
+        self._written = 0
+        self._flushed = 0
+        self._error = None
+        self._closed = False
+        self.records_since_snapshot = 0
+
+        generations = self._generations('journal') | self._generations('snapshot')
+        self._generation = max(generations, default=0)
+        path = self._path('journal', self._generation)
+        # クラッシュで途中まで書かれた最後の行に続けて追記しないように、先に切り詰める
+        _truncate_torn_tail(path)
+        self._file = open(path, 'ab')
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+
+    def _path(self, kind, generation):
+        return self._directory / f'{kind}.{generation}.ndjson'
+
+    def _generations(self, kind):
+        return {
+            int(path.name.split('.')[1])
+            for path in self._directory.glob(f'{kind}.*.ndjson')
+        }
+
+    def load(self):
+        # 最新のスナップショットをメモリマップで読み込み、続けてジャーナルを再生する
+        snapshots = self._generations('snapshot')
+        start = max(snapshots, default=0)
+        if snapshots:
+            yield from _read_records(self._path('snapshot', start))
+        for generation in sorted(self._generations('journal')):
+            if generation >= start:
+                yield from _read_records(self._path('journal', generation))
+
+    def append(self, record):
+        # レコードをバッファに書き込み、fsync を待つための位置を返す
+        line = json.dumps(record, separators=(',', ':')).encode() + b'\n'
+        with self._lock:
+            self._file.write(line)
+            self._written += 1
+            self.records_since_snapshot += 1
+            self._pending.notify()
+            return self._written
+
+    def wait(self, position):
+        # 指定した位置までのレコードが fsync されるまで待つ
+        with self._synced:
+            while self._flushed < position and self._error is None:
+                self._synced.wait()
+            if self._error is not None:
+                raise self._error
+
+    def _flush_loop(self):
+        while True:
+            with self._pending:
+                while self._written == self._flushed and not self._closed:
+                    self._pending.wait()
+                if self._written == self._flushed:
+                    return
+            if self._sync_interval:
+                time.sleep(self._sync_interval)
+            with self._fsync_lock:
+                with self._lock:
+                    position = self._written
+                    self._file.flush()
+                    descriptor = self._file.fileno()
+                # fsync はロックの外で行い、その間も追記を受け付ける
+                try:
+                    os.fsync(descriptor)
+                except OSError as error:
+                    with self._synced:
+                        self._error = error
+                        self._synced.notify_all()
+                    return
+            with self._synced:
+                self._flushed = max(self._flushed, position)
+                self._synced.notify_all()
+
+    def rotate(self):
+        # 新しい世代のジャーナルに切り替え、その世代の番号を返す。
+        # 呼び出し元はストアへの変更を止めた状態で切り替え、同じロックの中でスナップショットに
+        # 含めるレコードを確定させる。切り替えより前の変更はすべてスナップショットに、
+        # 後の変更はすべて新しい世代のジャーナルに含まれる
+        with self._fsync_lock, self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._generation += 1
+            generation = self._generation
+            self._file = open(self._path('journal', generation), 'ab')
+            self.records_since_snapshot = 0
+            self._flushed = self._written
+            self._synced.notify_all()
+        return generation
+
+    def write_snapshot(self, generation, records):
+        # rotate() で切り替えた時点のストアの内容を書き出し、古い世代のファイルを削除する
+        path = self._path('snapshot', generation)
+        temporary = path.with_suffix('.tmp')
+        with open(temporary, 'wb') as file:
+            for record in records:
+                file.write(json.dumps(record, separators=(',', ':')).encode() + b'\n')
+            file.flush()
+            os.fsync(file.fileno())
+        # 書き出しが完了したスナップショットだけが読み込まれるように、リネームで公開する
+        os.replace(temporary, path)
+
+        # 新しいスナップショットより古い世代のファイルは不要になる
+        for kind in ('snapshot', 'journal'):
+            for old in self._generations(kind):
+                if old < generation:
+                    self._path(kind, old).unlink(missing_ok=True)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._pending.notify()
+        self._flusher.join()
+        with self._lock:
+            self._file.close()
+
+
+def _read_records(path):
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for line in iter(mapped.readline, b''):
+                # クラッシュで途中まで書かれた最後の行は読み飛ばす
+                if not line.endswith(b'\n'):
+                    break
+                yield json.loads(line)
+
+
+def _truncate_torn_tail(path):
+    try:
+        file = open(path, 'r+b')
+    except FileNotFoundError:
+        return
+    with file:
+        size = os.fstat(file.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if mapped[-1:] == b'\n':
+                return
+            end = mapped.rfind(b'\n') + 1
+        file.truncate(end)
+        file.flush()
+        os.fsync(file.fileno())
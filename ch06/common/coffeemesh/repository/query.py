@@ -0,0 +1,250 @@
+import bisect
+import heapq
+from itertools import islice
+
+
+_EMPTY = {}
+
+
+# 一覧とエクスポートの絞り込み条件
+# status、exclude_status、product、size は値の集合（1 つの値でもよい）で指定し、
+# いずれかの値に一致するレコードを返す。None の条件は絞り込まない。
+# product と size は明細のいずれかが一致すればよく、同じ明細である必要はない。
+# start と end は並び順のキー（注文の作成日時、スケジュールの予定日時）の範囲で、
+# start 以上 end 未満のレコードを返す。すべての条件を満たすレコードだけを返す
+class Query:
+
+    __slots__ = ('status', 'exclude_status', 'start', 'end', 'product', 'size')
+
+    def __init__(
+        self, status=None, exclude_status=None, start=None, end=None, product=None, size=None
+    ):
+        self.status = _as_set(status)
+        self.exclude_status = _as_set(exclude_status)
+        self.start = start
+        self.end = end
+        self.product = _as_set(product)
+        self.size = _as_set(size)
+
+    def __repr__(self):
+        conditions = ', '.join(
+            f'{name}={getattr(self, name)!r}' for name in self.__slots__
+            if getattr(self, name) is not None
+        )
+        return f'Query({conditions})'
+
+    def hash_conditions(self):
+        # ハッシュインデックスで調べられる条件の (インデックス名, 値の集合)
+        return [
+            (name, values)
+            for name, values in (
+                ('status', self.status), ('product', self.product), ('size', self.size)
+            )
+            if values is not None
+        ]
+
+
+# 値 -> {レコード ID: None} のハッシュインデックス
+# dict を挿入順序付きの集合として使い、O(1) で追加と削除を行う。
+# 1 つのレコードが複数の値を持つ場合（注文に含まれる商品名など）は、値ごとに登録する
+class HashIndex:
+
+    __slots__ = ('_ids',)
+
+    def __init__(self):
+        self._ids = {}
+
+    def add(self, record_id, values):
+        for value in values:
+            ids = self._ids.get(value)
+            if ids is None:
+                ids = self._ids[value] = {}
+            ids[record_id] = None
+
+    def remove(self, record_id, values):
+        for value in values:
+            ids = self._ids.get(value)
+            if ids is not None:
+                ids.pop(record_id, None)
+                if not ids:
+                    del self._ids[value]
+
+    def ids(self, value):
+        return self._ids.get(value, _EMPTY)
+
+    def cost(self, values):
+        # 値の集合に一致する ID の件数（重複を含む）。実行計画の比較に使う
+        return sum(len(self._ids.get(value, _EMPTY)) for value in values)
+
+    def contains(self, record_id, values):
+        for value in values:
+            ids = self._ids.get(value)
+            if ids is not None and record_id in ids:
+                return True
+        return False
+
+
+# インメモリのリポジトリの絞り込みを実行するクエリエンジン
+# 並び順のソート済みインデックスの範囲と、条件ごとのハッシュインデックスのうち、
+# 候補の少ないものから走査する（インデックスへのプッシュダウン）。
+# 残りの条件は候補ごとにハッシュインデックスの所属を O(1) で確かめるだけなので、
+# 条件をいくつ組み合わせても 1 回の走査で済む。
+# ソート済みインデックスの範囲は並び順に走査できるので、limit 件に達した時点で
+# 打ち切れる。ハッシュインデックスの候補は全件を調べてからヒープで上位 limit 件を
+# 選ぶ必要があるので、候補が範囲より少なくても、よく一致する条件なら範囲の走査の方が
+# 速い。そこで limit がある場合は、ハッシュインデックスの候補の件数までを上限に
+# 範囲を走査し、それまでに limit 件そろわなければハッシュインデックスに切り替える。
+# どちらの場合も、候補の少ない方を 1 回走査する時間の 2 倍以内に収まる
+class QueryEngine:
+
+    # records: レコード ID -> レコード
+    # sorted_keys: (並び順のキー, レコード ID) の昇順のリストを返す関数
+    # key: レコードの (並び順のキー, レコード ID) を返す関数
+    # indexes: 'status'、'product'、'size' -> HashIndex
+    # to_key: Query の start と end を並び順のキーの型に変換する関数
+    def __init__(self, records, sorted_keys, key, indexes, to_key=None):
+        self._records = records
+        self._sorted_keys = sorted_keys
+        self._key = key
+        self._indexes = indexes
+        self._to_key = to_key or (lambda value: value)
+
+    def list(self, query=None, after=None, limit=None):
+        # after にはインデックスのキーの形の (並び順のキー, レコード ID) を指定し、
+        # その次のレコードから返す（キーセットページネーション）
+        if limit is not None and limit <= 0:
+            return []
+        query = query or Query()
+        keys = self._sorted_keys()
+        start, end = self._bounds(query, keys, after)
+        pushed, cost = self._pushdown(query, end - start)
+        if pushed is None:
+            return list(islice(self._scan(query, keys, start), limit))
+
+        if limit is not None:
+            # 候補の件数までを上限に範囲を走査し、limit 件そろえば打ち切る
+            conditions = self._conditions(query, ())
+            results = []
+            entries = self._entries(query, keys, start)
+            for record_id, record in islice(entries, cost):
+                if self._accepts(conditions, record_id):
+                    results.append(record)
+                    if len(results) == limit:
+                        return results
+            if next(entries, None) is None:
+                return results
+
+        name, values = pushed
+        candidates = self._candidates(query, name, values, after)
+        if limit is not None:
+            return heapq.nsmallest(limit, candidates, key=self._key)
+        return sorted(candidates, key=self._key)
+
+    def scan(self, query=None, after=None):
+        # レコードを並び順に 1 件ずつ返すジェネレータ。結果をリストに溜めないように、
+        # 常にソート済みインデックスを走査し、一定のメモリで全件を返せるようにする
+        query = query or Query()
+        keys = self._sorted_keys()
+        start, _ = self._bounds(query, keys, after)
+        return self._scan(query, keys, start)
+
+    def _bounds(self, query, keys, after):
+        # 範囲と after の条件を、ソート済みインデックスの位置の範囲に変換する
+        start, end = 0, len(keys)
+        if query.start is not None:
+            start = bisect.bisect_left(keys, (self._to_key(query.start),))
+        if after is not None:
+            start = max(start, bisect.bisect_right(keys, after))
+        if query.end is not None:
+            end = bisect.bisect_left(keys, (self._to_key(query.end),))
+        return start, max(start, end)
+
+    def _pushdown(self, query, range_cost):
+        # 候補の件数が最も少ないハッシュインデックスの条件とその件数を返す。
+        # ソート済みインデックスの範囲の方が少なければ None を返し、範囲を走査する
+        best, best_cost = None, range_cost
+        for name, values in query.hash_conditions():
+            cost = self._indexes[name].cost(values)
+            if cost < best_cost:
+                best, best_cost = (name, values), cost
+        return best, best_cost
+
+    def _conditions(self, query, pushed):
+        # 走査に使っていない条件の (インデックス, 値の集合, 含まれるべきか) のリスト
+        conditions = [
+            (self._indexes[name], values, True)
+            for name, values in query.hash_conditions() if name not in pushed
+        ]
+        if query.exclude_status is not None:
+            conditions.append((self._indexes['status'], query.exclude_status, False))
+        return conditions
+
+    def _accepts(self, conditions, record_id):
+        for index, values, included in conditions:
+            if index.contains(record_id, values) is not included:
+                return False
+        return True
+
+    def _entries(self, query, keys, start):
+        # ソート済みインデックスを start の位置から end の手前まで走査し、
+        # 現在のレコードの (レコード ID, レコード) を返す
+        records = self._records
+        # 走査中にレコードが追加・削除されてインデックスがずれる場合があるので、
+        # 終了位置ではなく end のキーと比べて打ち切る
+        end_key = self._to_key(query.end) if query.end is not None else None
+        index = start
+        while index < len(keys):
+            entry = keys[index]
+            if end_key is not None and entry[0] >= end_key:
+                return
+            record = records.get(entry[1])
+            # 削除済みのレコードや、並び順のキーが変わったレコードの古いエントリは読み飛ばす
+            if record is not None and self._key(record) == entry:
+                yield entry[1], record
+            # インデックスがずれた場合は、最後に読んだキーの位置を二分探索し直す
+            if index < len(keys) and keys[index] == entry:
+                index += 1
+            else:
+                index = bisect.bisect_right(keys, entry)
+
+    def _scan(self, query, keys, start):
+        conditions = self._conditions(query, ())
+        for record_id, record in self._entries(query, keys, start):
+            if self._accepts(conditions, record_id):
+                yield record
+
+    def _candidates(self, query, name, values, after):
+        records = self._records
+        index = self._indexes[name]
+        conditions = self._conditions(query, (name,))
+        # 複数の値を持つレコードは、値ごとのインデックスに重複して含まれる
+        if len(values) == 1:
+            ids = list(index.ids(next(iter(values))))
+        else:
+            ids = list(dict.fromkeys(
+                record_id for value in values for record_id in index.ids(value)
+            ))
+        # 範囲の条件は候補ごとにキーで直接確かめる
+        start_key = self._to_key(query.start) if query.start is not None else None
+        end_key = self._to_key(query.end) if query.end is not None else None
+        for record_id in ids:
+            record = records.get(record_id)
+            if record is None:
+                continue
+            key = self._key(record)
+            if start_key is not None and key[0] < start_key:
+                continue
+            if end_key is not None and key[0] >= end_key:
+                continue
+            if after is not None and key <= after:
+                continue
+            if self._accepts(conditions, record_id):
+                yield record
+
+
+def _as_set(values):
+    if values is None:
+        return None
+    if isinstance(values, str):
+        return frozenset((values,))
+    return frozenset(values)
@@ -0,0 +1,98 @@
+import abc
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from coffeemesh.repository.query import Query
+
+
+logger = logging.getLogger(__name__)
+
+
+# 並び順のキーから age 秒を過ぎた終了状態のレコードを、リポジトリからアーカイブに移す
+# バックグラウンドのスレッドが interval 秒ごとに batch_size 件ずつ移し、
+# リポジトリとそのインデックスには処理中のレコードだけが残るようにする。
+# アーカイブへの書き込みが終わってから、読み出したときの版数を If-Match にして
+# リポジトリから削除する。その間に変更・削除されたレコードは、アーカイブから取り除いて
+# リポジトリの状態を優先する。
+# サービスごとの違いはサブクラスで指定する。statuses は終了状態のステータス、
+# conflict はリポジトリが版数の不一致で送出する例外。dump() はアーカイブに保存する
+# レコード、identity() は delete() に渡す ID、cursor() は list() の after に渡す
+# 並び順のキーを返す抽象メソッドで、実装していないサブクラスはインスタンス化できない
+class Retention(abc.ABC):
+
+    statuses = ()
+    conflict = ()
+    name = 'retention'
+
+    def __init__(self, repository, archive, age, interval=60.0, batch_size=1000):
+        self._repository = repository
+        self._archive = archive
+        self._age = age
+        self._interval = interval
+        self._batch_size = batch_size
+        self._stopped = threading.Event()
+        self._thread = None
+        self.archived = 0
+
+    @abc.abstractmethod
+    def dump(self, item):
+        pass
+
+    @abc.abstractmethod
+    def identity(self, item):
+        pass
+
+    @abc.abstractmethod
+    def cursor(self, item):
+        pass
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception('Failed to archive records (%s)', self.name)
+            self._stopped.wait(self._interval)
+
+    def sweep(self):
+        # 移したレコードの件数を返す
+        query = Query(
+            status=self.statuses, end=datetime.utcnow() - timedelta(seconds=self._age)
+        )
+        archived, after = 0, None
+        while not self._stopped.is_set():
+            items = self._repository.list(query, after=after, limit=self._batch_size)
+            if not items:
+                break
+            records = [self.dump(item) for item in items]
+            self._archive.append(records)
+            changed = []
+            for item, record in zip(items, records):
+                try:
+                    deleted = self._repository.delete(
+                        self.identity(item), if_match={record['version']}
+                    )
+                except self.conflict:
+                    deleted = False
+                if deleted:
+                    archived += 1
+                else:
+                    changed.append(record['id'])
+            self._archive.remove(changed)
+            after = self.cursor(items[-1])
+            if len(items) < self._batch_size:
+                break
+        self.archived += archived
+        return archived
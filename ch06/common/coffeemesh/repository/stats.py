@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+# 件数を数える時間帯の幅（マイクロ秒）。注文は作成日時、スケジュールは予定日時の
+# 1 時間ごとに数える
+BUCKET_SIZE = 3600 * 1_000_000
+
+# 集計の種類: ステータスごとの件数、商品名ごと・サイズごとの数量、時間帯ごとの件数
+KINDS = ('status', 'product', 'size', 'bucket')
+
+
+# 日時（UTC の naive な datetime）を含む時間帯の番号
+def bucket_of(value):
+    return (value - _EPOCH) // timedelta(microseconds=BUCKET_SIZE)
+
+
+# 追加・変更・削除のたびに差分だけを加減する集計
+# 加減する値は、各サービスが 1 件ごとに (種類, キー, 値) のリストとして作る。
+# 読み取りはストアのサイズに関係なく、キー（ステータス、商品名、サイズ、時間帯）の数だけで済む。
+# 書き込みと同じロックの中で加減し、読み取りはディクショナリのコピーだけで行う
+class Aggregates:
+
+    def __init__(self):
+        self._counts = {kind: {} for kind in KINDS}
+
+    def apply(self, contributions, sign=1):
+        for kind, key, value in contributions:
+            counts = self._counts[kind]
+            total = counts.get(key, 0) + sign * value
+            if total:
+                counts[key] = total
+            else:
+                counts.pop(key, None)
+
+    def counts(self, kind):
+        return dict(self._counts[kind])
+
+    def buckets(self, first, last):
+        # first から last までの時間帯の件数。件数のない時間帯は 0 として返す
+        counts = self._counts['bucket']
+        return [(bucket, counts.get(bucket, 0)) for bucket in range(first, last + 1)]
+
+
+# 集計をレスポンスの形に変換する
+# counts は種類 -> {キー: 値}、buckets は (時間帯, 件数) のリスト。
+# 時間帯ごとの件数は noun（'orders' や 'schedules'）のフィールドに入れる
+def render_stats(counts, buckets, noun):
+    return {
+        'total': sum(counts['status'].values()),
+        'status': counts['status'],
+        'quantity': {'product': counts['product'], 'size': counts['size']},
+        'buckets': [
+            {
+                'start': _EPOCH + timedelta(microseconds=bucket * BUCKET_SIZE),
+                'end': _EPOCH + timedelta(microseconds=(bucket + 1) * BUCKET_SIZE),
+                noun: count,
+            }
+            for bucket, count in buckets
+        ],
+    }
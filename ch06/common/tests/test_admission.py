@@ -0,0 +1,129 @@
+from coffeemesh.admission.controller import (
+    GRANTED,
+    HIGH,
+    LOW,
+    NORMAL,
+    QUEUED,
+    SHED,
+    AdmissionController,
+    RateLimiter,
+)
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_rate_limiter_refills_tokens_over_time():
+    clock = Clock()
+    limiter = RateLimiter(rate=2, burst=2, clock=clock)
+
+    assert limiter.acquire('a') == 0
+    assert limiter.acquire('a') == 0
+    assert limiter.acquire('a') == 0.5
+    clock.now = 0.5
+    assert limiter.acquire('a') == 0
+
+
+def test_rate_limiter_keeps_separate_buckets_per_client():
+    limiter = RateLimiter(rate=1, burst=1, clock=Clock())
+
+    assert limiter.acquire('a') == 0
+    assert limiter.acquire('a') > 0
+    assert limiter.acquire('b') == 0
+
+
+def test_rate_limiter_evicts_least_recently_used_client():
+    limiter = RateLimiter(rate=1, burst=1, max_clients=2, clock=Clock())
+    limiter.acquire('a')
+    limiter.acquire('b')
+    limiter.acquire('a')
+    limiter.acquire('c')
+
+    # b のバケットが追い出されたので、b は満杯のバケットから始め直す
+    assert limiter.acquire('b') == 0
+    assert limiter.acquire('c') > 0
+
+
+def test_grants_up_to_capacity_and_queues_the_rest():
+    controller = AdmissionController(capacity=2, queue_timeout=1)
+    notified = []
+
+    assert controller.acquire('get', HIGH)[0] == GRANTED
+    assert controller.acquire('get', HIGH)[0] == GRANTED
+    result, waiter = controller.acquire('get', HIGH, notify=lambda: notified.append(True))
+    assert result == QUEUED
+
+    controller.release('get', HIGH, 0.01)
+    assert waiter.granted and notified == [True]
+    assert controller.stats() == {'in_flight': 2, 'queued': 0, 'admitted': 3, 'shed': 0}
+
+
+def test_dispatches_higher_priority_first():
+    controller = AdmissionController(capacity=1, queue_timeout=1)
+    order = []
+    controller.acquire('a', NORMAL)
+    _, low = controller.acquire('list', LOW, notify=lambda: order.append('low'))
+    _, high = controller.acquire('get', HIGH, notify=lambda: order.append('high'))
+
+    controller.release('a', NORMAL, 0.01)
+    assert order == ['high']
+    controller.release('get', HIGH, 0.01)
+    assert order == ['high', 'low']
+
+
+def test_low_priority_is_limited_to_its_share():
+    controller = AdmissionController(capacity=4, low_priority_share=0.5, queue_timeout=1)
+
+    assert controller.acquire('list', LOW)[0] == GRANTED
+    assert controller.acquire('list', LOW)[0] == GRANTED
+    assert controller.acquire('list', LOW)[0] == QUEUED
+    assert controller.acquire('get', HIGH)[0] == GRANTED
+
+
+def test_route_limit_skips_blocked_waiters():
+    controller = AdmissionController(capacity=2, route_limits={'export': 1}, queue_timeout=1)
+    controller.acquire('export', LOW)
+    _, blocked = controller.acquire('export', LOW, notify=lambda: None)
+    controller.acquire('get', HIGH)
+    _, waiting = controller.acquire('get', HIGH, notify=lambda: None)
+
+    controller.release('get', HIGH, 0.01)
+    assert waiting.granted and not blocked.granted
+
+
+def test_sheds_when_queue_is_full():
+    controller = AdmissionController(capacity=1, max_queue=1, queue_timeout=1)
+    controller.acquire('a', NORMAL)
+    assert controller.acquire('a', NORMAL, notify=lambda: None)[0] == QUEUED
+
+    assert controller.acquire('a', NORMAL, notify=lambda: None)[0] == SHED
+    assert controller.stats()['shed'] == 1
+
+
+def test_sheds_when_expected_wait_exceeds_timeout():
+    controller = AdmissionController(capacity=1, queue_timeout=0.5)
+    controller.acquire('a', NORMAL)
+    controller.release('a', NORMAL, 1.0)
+    controller.acquire('a', NORMAL)
+
+    # 処理時間の移動平均が 1 秒なので、待ち時間の見積もりが queue_timeout を超える
+    assert controller.acquire('a', NORMAL, notify=lambda: None)[0] == SHED
+
+
+def test_cancel_removes_waiter_unless_already_granted():
+    controller = AdmissionController(capacity=1, queue_timeout=1)
+    controller.acquire('a', NORMAL)
+    _, waiter = controller.acquire('a', NORMAL, notify=lambda: None)
+
+    assert controller.cancel(waiter) is False
+    assert controller.stats()['queued'] == 0
+
+    _, waiter = controller.acquire('a', NORMAL, notify=lambda: None)
+    controller.release('a', NORMAL, 0.01)
+    assert controller.cancel(waiter) is True
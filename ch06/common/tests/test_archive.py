@@ -0,0 +1,55 @@
+from coffeemesh.repository import archive as archive_module
+from coffeemesh.repository.archive import Archive
+
+
+def record(record_id, status='delivered'):
+    return {'id': record_id, 'status': status}
+
+
+def test_reads_appended_records_across_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive_module, 'BLOCK_RECORDS', 2)
+    archive = Archive(tmp_path)
+    archive.append([record(str(index)) for index in range(5)])
+
+    assert len(archive) == 5
+    assert '4' in archive
+    assert archive.get('3') == record('3')
+    assert archive.get('missing') is None
+
+
+def test_removed_records_are_not_read(tmp_path):
+    archive = Archive(tmp_path)
+    archive.append([record('a'), record('b')])
+    archive.remove(['a'])
+
+    assert 'a' not in archive
+    assert archive.get('a') is None
+    assert Archive(tmp_path).get('b') == record('b')
+    assert 'a' not in Archive(tmp_path)
+
+
+def test_readers_see_records_appended_by_the_writer(tmp_path):
+    writer = Archive(tmp_path)
+    reader = Archive(tmp_path)
+    assert 'a' not in reader
+
+    writer.append([record('a')])
+    assert reader.get('a') == record('a')
+
+
+def test_truncates_torn_tail_before_writing(tmp_path):
+    archive = Archive(tmp_path)
+    archive.append([record('a')])
+    # クラッシュで途中まで書かれたインデックスの行とデータ
+    with open(tmp_path / 'archive.index', 'ab') as file:
+        file.write(b'b 9999')
+    with open(tmp_path / 'archive.data', 'ab') as file:
+        file.write(b'garbage')
+
+    reopened = Archive(tmp_path)
+    assert 'b' not in reopened
+    reopened.append([record('c')])
+
+    assert Archive(tmp_path).get('a') == record('a')
+    assert Archive(tmp_path).get('c') == record('c')
+    assert len(Archive(tmp_path)) == 2
@@ -0,0 +1,94 @@
+import threading
+import time
+
+from coffeemesh.feed.change_feed import ChangeFeed
+from coffeemesh.feed.relay import FeedRelay
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_returns_events_after_position():
+    feed = ChangeFeed(capacity=4)
+    start = feed.last_event_id
+    ids = [feed.publish('order.paid', {'id': str(index)}) for index in range(6)]
+
+    assert [event[0] for event in feed.since(ids[1])] == ids[2:]
+    event_id, frame, record = feed.since(ids[1], limit=2)[1]
+    assert event_id == ids[3]
+    assert frame == f'id: {ids[3]}\nevent: order.paid\ndata: {{"id":"3"}}\n\n'.encode()
+    assert record == f'{{"id":{ids[3]},"type":"order.paid","data":{{"id":"3"}}}}'.encode()
+    # 上書きされた位置と、知らない位置からは続けられない
+    assert feed.since(start) is None
+    assert feed.since(ids[-1] + 1) is None
+    assert feed.since(ids[-1]) == []
+
+
+def test_wait_returns_when_event_is_published():
+    feed = ChangeFeed()
+    position = feed.last_event_id
+    assert not feed.wait(position, 0.01)
+
+    threading.Timer(0.05, feed.publish, ('order.paid', {})).start()
+    assert feed.wait(position, 5)
+
+
+def test_extend_keeps_event_ids():
+    source, mirror = ChangeFeed(), ChangeFeed()
+    mirror.reset(source.position())
+    position = source.position()
+    source.publish('order.paid', {'id': 'a'})
+    source.publish('order.paid', {'id': 'b'})
+
+    mirror.extend(source.since(position))
+    assert mirror.since(position) == source.since(position)
+
+    # 続きでないイベントを受け取ると、それより前からは続けられない
+    skipped = source.publish('order.paid', {'id': 'c'})
+    source.publish('order.paid', {'id': 'd'})
+    mirror.extend(source.since(skipped))
+    assert mirror.since(position) is None
+    assert mirror.since(skipped) == source.since(skipped)
+
+
+def test_workers_relay_the_same_events():
+    server = ChangeFeed()
+    workers = [ChangeFeed(), ChangeFeed()]
+    relays = [FeedRelay(server, worker, timeout=0.1) for worker in workers]
+    for relay in relays:
+        relay.start()
+    position = workers[0].last_event_id
+    assert workers[1].last_event_id == position
+
+    for index in range(10):
+        server.publish('order.paid', {'id': str(index)})
+    assert all(
+        wait_until(lambda worker=worker: worker.last_event_id == server.last_event_id)
+        for worker in workers
+    )
+    for relay in relays:
+        relay.stop()
+    assert workers[0].since(position) == workers[1].since(position) == server.since(position)
+
+
+def test_relay_resets_worker_feed_after_falling_behind():
+    server, worker = ChangeFeed(capacity=4), ChangeFeed()
+    relay = FeedRelay(server, worker, timeout=0.1)
+    worker.reset(server.position())
+    position = worker.last_event_id
+    for index in range(10):
+        server.publish('order.paid', {'id': str(index)})
+
+    # 追いつく前に上書きされたイベントは写さず、サーバーの最新の位置から続ける
+    relay._thread = threading.Thread(target=relay._run, daemon=True)
+    relay._thread.start()
+    assert wait_until(lambda: worker.last_event_id == server.last_event_id)
+    relay.stop()
+    assert worker.since(position) is None
+    assert worker.since(server.last_event_id) == []
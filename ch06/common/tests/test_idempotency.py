@@ -0,0 +1,77 @@
+from coffeemesh.idempotency.cache import IN_PROGRESS, MISMATCH, NEW, REPLAY, IdempotencyCache
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_replays_completed_response():
+    cache = IdempotencyCache()
+
+    assert cache.begin('a', b'body') == (NEW, None)
+    assert cache.begin('a', b'body') == (IN_PROGRESS, None)
+    cache.complete('a', {'status': 201})
+    assert cache.begin('a', b'body') == (REPLAY, {'status': 201})
+    assert cache.begin('a', b'other') == (MISMATCH, None)
+
+
+def test_abandoned_key_can_be_processed_again():
+    cache = IdempotencyCache()
+    cache.begin('a', b'body')
+    cache.abandon('a')
+
+    assert cache.begin('a', b'body') == (NEW, None)
+
+
+def test_evicts_least_recently_used_completed_keys():
+    cache = IdempotencyCache(max_size=2)
+    for key in 'ab':
+        cache.begin(key, b'body')
+        cache.complete(key, key)
+    cache.begin('a', b'body')
+    cache.begin('c', b'body')
+
+    assert len(cache) == 2
+    assert cache.begin('a', b'body') == (REPLAY, 'a')
+    assert cache.begin('b', b'body') == (NEW, None)
+
+
+def test_does_not_evict_keys_in_progress():
+    cache = IdempotencyCache(max_size=2)
+    cache.begin('a', b'body')
+    cache.begin('b', b'body')
+    cache.begin('c', b'body')
+
+    # 処理中のキーだけなので追い出さず、再送は処理中として扱う
+    assert len(cache) == 3
+    assert cache.begin('a', b'body') == (IN_PROGRESS, None)
+    cache.complete('a', 'a')
+    cache.begin('d', b'body')
+    assert len(cache) == 3
+    assert cache.begin('b', b'body') == (IN_PROGRESS, None)
+    assert cache.begin('a', b'body') == (NEW, None)
+
+
+def test_expires_keys_after_ttl():
+    clock = Clock()
+    cache = IdempotencyCache(ttl=10, clock=clock)
+    cache.begin('a', b'body')
+    cache.complete('a', 'a')
+    clock.now = 10
+
+    assert cache.begin('a', b'body') == (NEW, None)
+
+
+def test_reports_keys_and_replays():
+    cache = IdempotencyCache()
+    cache.begin('a', b'body')
+    cache.complete('a', {'status': 201})
+    cache.begin('a', b'body')
+    cache.begin('b', b'body')
+
+    assert cache.stats() == {'keys': 2, 'replayed': 1}
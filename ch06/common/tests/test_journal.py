@@ -0,0 +1,127 @@
+from coffeemesh.repository.journal import Journal
+
+
+def put(key, value):
+    return {'op': 'put', 'id': key, 'value': value}
+
+
+def replay(directory):
+    journal = Journal(directory)
+    try:
+        state = {}
+        for record in journal.load():
+            if record['op'] == 'delete':
+                state.pop(record['id'], None)
+            else:
+                state[record['id']] = record['value']
+        return state
+    finally:
+        journal.close()
+
+
+def test_replays_committed_records(tmp_path):
+    journal = Journal(tmp_path)
+    journal.append(put('a', 1))
+    journal.append(put('b', 2))
+    journal.wait(journal.append({'op': 'delete', 'id': 'a'}))
+    journal.close()
+
+    assert replay(tmp_path) == {'b': 2}
+
+
+def test_wait_returns_after_fsync_without_close(tmp_path):
+    # close() を呼ばずにプロセスが終了しても、wait() から戻ったレコードは読み込める
+    journal = Journal(tmp_path)
+    journal.wait(journal.append(put('a', 1)))
+
+    assert replay(tmp_path) == {'a': 1}
+    journal.close()
+
+
+def test_skips_torn_last_record_after_crash(tmp_path):
+    journal = Journal(tmp_path)
+    journal.wait(journal.append(put('a', 1)))
+    journal.close()
+    # クラッシュで最後の行が途中まで書かれた状態
+    with open(tmp_path / 'journal.0.ndjson', 'ab') as file:
+        file.write(b'{"op":"put","id":"b","va')
+
+    assert replay(tmp_path) == {'a': 1}
+
+
+def test_appends_after_torn_record_are_kept_on_next_restart(tmp_path):
+    journal = Journal(tmp_path)
+    journal.wait(journal.append(put('a', 1)))
+    journal.close()
+    with open(tmp_path / 'journal.0.ndjson', 'ab') as file:
+        file.write(b'{"op":"put"')
+
+    # 再起動後の追記が、途中まで書かれた行に続けて書かれないこと
+    journal = Journal(tmp_path)
+    journal.wait(journal.append(put('b', 2)))
+    journal.close()
+
+    assert replay(tmp_path) == {'a': 1, 'b': 2}
+
+
+def test_snapshot_compacts_older_generations(tmp_path):
+    journal = Journal(tmp_path)
+    journal.append(put('a', 1))
+    journal.wait(journal.append(put('a', 2)))
+    generation = journal.rotate()
+    journal.wait(journal.append(put('b', 3)))
+    journal.write_snapshot(generation, [put('a', 2)])
+    journal.close()
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        'journal.1.ndjson', 'snapshot.1.ndjson',
+    ]
+    assert replay(tmp_path) == {'a': 2, 'b': 3}
+
+
+def test_rotate_resets_records_since_snapshot(tmp_path):
+    journal = Journal(tmp_path)
+    journal.append(put('a', 1))
+    journal.append(put('b', 2))
+    assert journal.records_since_snapshot == 2
+    journal.rotate()
+    assert journal.records_since_snapshot == 0
+    journal.close()
+
+
+def test_crash_between_rotate_and_snapshot_replays_all_generations(tmp_path):
+    # 世代を切り替えた後、スナップショットを書き終える前にクラッシュした状態。
+    # 書きかけの一時ファイルは読まず、前の世代からジャーナルを再生する
+    journal = Journal(tmp_path)
+    journal.wait(journal.append(put('a', 1)))
+    journal.rotate()
+    journal.wait(journal.append(put('b', 2)))
+    journal.close()
+    (tmp_path / 'snapshot.1.tmp').write_bytes(b'{"op":"put","id":"a","value":0}\n{"op"')
+
+    assert replay(tmp_path) == {'a': 1, 'b': 2}
+
+
+def test_records_changed_during_snapshot_are_replayed_after_it(tmp_path):
+    # スナップショットに古い内容が含まれていても、新しい世代のジャーナルの方が後に再生される
+    journal = Journal(tmp_path)
+    generation = journal.rotate()
+    journal.wait(journal.append(put('a', 2)))
+    journal.write_snapshot(generation, [put('a', 1)])
+    journal.close()
+
+    assert replay(tmp_path) == {'a': 2}
+
+
+def test_new_journal_continues_from_latest_generation(tmp_path):
+    journal = Journal(tmp_path)
+    generation = journal.rotate()
+    journal.write_snapshot(generation, [put('a', 1)])
+    journal.close()
+
+    journal = Journal(tmp_path)
+    journal.wait(journal.append(put('b', 2)))
+    journal.close()
+
+    assert (tmp_path / 'journal.1.ndjson').exists()
+    assert replay(tmp_path) == {'a': 1, 'b': 2}
@@ -0,0 +1,62 @@
+import threading
+
+from coffeemesh.metrics.registry import UNMATCHED, MetricsRegistry, RequestTimer
+
+
+def record(registry, method, route, status=200, handler=True):
+    timer = RequestTimer(registry)
+    timer.dispatch(method, route)
+    if handler:
+        timer.handler_start = timer.dispatch_start
+        timer.handler_end = timer.handler_start
+    timer.dispatched()
+    timer.status = status
+    timer.finish(method)
+
+
+def test_counts_requests_by_route_and_status():
+    registry = MetricsRegistry()
+    record(registry, 'GET', '/orders/{order_id}')
+    record(registry, 'GET', '/orders/{order_id}', status=404)
+    record(registry, 'GET', '/orders/{order_id}')
+    RequestTimer(registry).finish('GET')
+
+    text = registry.render(
+        [('orders_repository_size', 'Number of stored orders.', 3)],
+        [('orders_dispatched_total', 'Orders dispatched.', 5)],
+    ).decode()
+
+    assert 'http_requests_total{method="GET",route="/orders/{order_id}",status="200"} 2' in text
+    assert 'http_requests_total{method="GET",route="/orders/{order_id}",status="404"} 1' in text
+    assert f'http_requests_total{{method="GET",route="{UNMATCHED}",status="500"}} 1' in text
+    assert 'http_requests_in_flight{method="GET",route="/orders/{order_id}"} 0' in text
+    assert not any(
+        line.startswith('http_requests_in_flight') and UNMATCHED in line for line in text.splitlines()
+    )
+    assert 'http_request_duration_seconds_count{method="GET",route="/orders/{order_id}"} 3' in text
+    assert '# TYPE orders_repository_size gauge\norders_repository_size 3\n' in text
+    assert '# TYPE orders_dispatched_total counter\norders_dispatched_total 5\n' in text
+
+
+def test_records_phases_reached_by_request():
+    registry = MetricsRegistry()
+    record(registry, 'POST', '/orders', status=422, handler=False)
+    record(registry, 'POST', '/orders', status=201)
+
+    text = registry.render().decode()
+
+    labels = 'method="POST",route="/orders"'
+    assert f'http_request_phase_duration_seconds_count{{{labels},phase="validation"}} 2' in text
+    assert f'http_request_phase_duration_seconds_count{{{labels},phase="handler"}} 1' in text
+    assert f'http_request_phase_duration_seconds_count{{{labels},phase="serialization"}} 1' in text
+
+
+def test_keeps_counts_of_finished_threads():
+    registry = MetricsRegistry()
+    for _ in range(3):
+        thread = threading.Thread(target=record, args=(registry, 'GET', '/orders'))
+        thread.start()
+        thread.join()
+    record(registry, 'GET', '/orders')
+
+    assert 'http_requests_total{method="GET",route="/orders",status="200"} 4' in registry.render().decode()
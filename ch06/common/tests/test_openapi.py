@@ -0,0 +1,40 @@
+import json
+
+from coffeemesh.api.openapi import CACHE_DIR, OpenAPIDocument
+
+
+SPEC = 'openapi: 3.0.3\ninfo:\n  title: {title}\n  version: 1.0.0\npaths: {{}}\n'
+
+
+def write_spec(tmp_path, title):
+    source = tmp_path / 'oas.yaml'
+    source.write_text(SPEC.format(title=title))
+    return source
+
+
+def test_compiles_yaml_to_compact_json(tmp_path):
+    document = OpenAPIDocument(write_spec(tmp_path, 'orders'))
+
+    content = document.content()
+    assert json.loads(content)['info']['title'] == 'orders'
+    assert b' ' not in content
+    assert document.document() == json.loads(content)
+
+
+def test_loads_nothing_until_first_use(tmp_path):
+    document = OpenAPIDocument(tmp_path / 'missing.yaml')
+    assert document.source.name == 'missing.yaml'
+
+
+def test_reuses_cache_until_the_spec_changes(tmp_path):
+    source = write_spec(tmp_path, 'orders')
+    OpenAPIDocument(source).compile()
+    cached, = (tmp_path / CACHE_DIR).iterdir()
+    # キャッシュがあれば YAML をパースせずに読み込む
+    cached.write_bytes(b'{"cached":true}')
+    assert OpenAPIDocument(source).document() == {'cached': True}
+
+    write_spec(tmp_path, 'kitchen')
+    assert OpenAPIDocument(source).document()['info']['title'] == 'kitchen'
+    # 古い仕様書のキャッシュは削除する
+    assert len(list((tmp_path / CACHE_DIR).iterdir())) == 1
@@ -0,0 +1,111 @@
+import random
+
+import pytest
+
+from coffeemesh.repository.query import HashIndex, Query, QueryEngine
+
+
+STATUSES = ['created', 'progress', 'cancelled']
+PRODUCTS = ['latte', 'mocha', 'espresso']
+SIZES = ['small', 'medium', 'big']
+
+
+class Records:
+
+    def __init__(self, count, seed=0):
+        rng = random.Random(seed)
+        self.records = {}
+        self.keys = []
+        self.indexes = {'status': HashIndex(), 'product': HashIndex(), 'size': HashIndex()}
+        for number in range(count):
+            record = {
+                'id': number,
+                'key': number * 10,
+                'status': rng.choice(STATUSES),
+                'product': set(rng.sample(PRODUCTS, rng.randint(1, 2))),
+                'size': {rng.choice(SIZES)},
+            }
+            self.records[number] = record
+            self.keys.append((record['key'], number))
+            self.indexes['status'].add(number, (record['status'],))
+            self.indexes['product'].add(number, record['product'])
+            self.indexes['size'].add(number, record['size'])
+        self.engine = QueryEngine(self.records, lambda: self.keys, record_key, self.indexes)
+
+    def brute_force(self, query, after=None):
+        # すべてのレコードを並び順に調べて条件を確かめる
+        return [
+            record for record in sorted(self.records.values(), key=record_key)
+            if (query.status is None or record['status'] in query.status)
+            and (query.exclude_status is None or record['status'] not in query.exclude_status)
+            and (query.start is None or record['key'] >= query.start)
+            and (query.end is None or record['key'] < query.end)
+            and (query.product is None or record['product'] & query.product)
+            and (query.size is None or record['size'] & query.size)
+            and (after is None or record_key(record) > after)
+        ]
+
+
+def record_key(record):
+    return record['key'], record['id']
+
+
+QUERIES = [
+    Query(),
+    Query(status='cancelled'),
+    Query(exclude_status={'cancelled', 'progress'}),
+    Query(start=500, end=1500),
+    Query(product='mocha', size={'small', 'big'}),
+    Query(status={'created', 'progress'}, product='latte', start=200),
+    Query(product='missing'),
+    Query(status='created', end=100),
+]
+
+
+@pytest.mark.parametrize('query', QUERIES, ids=repr)
+@pytest.mark.parametrize('limit', [None, 1, 5, 1000])
+def test_matches_brute_force(query, limit):
+    records = Records(300)
+    expected = records.brute_force(query)
+
+    assert records.engine.list(query, limit=limit) == expected[:limit]
+    assert list(records.engine.scan(query)) == expected
+
+
+@pytest.mark.parametrize('query', QUERIES, ids=repr)
+def test_pages_with_after_cursor(query):
+    records = Records(300)
+    after, pages = None, []
+    while True:
+        page = records.engine.list(query, after=after, limit=7)
+        pages += page
+        if len(page) < 7:
+            break
+        after = record_key(page[-1])
+
+    assert pages == records.brute_force(query)
+
+
+def test_skips_stale_sorted_entries():
+    records = Records(20)
+    # 削除されたレコードと、並び順のキーが変わったレコードの古いエントリが残っている
+    del records.records[3]
+    records.records[5]['key'] = 1000
+    records.keys.append((1000, 5))
+
+    keys = [record_key(record) for record in records.engine.list()]
+    assert keys == [record_key(record) for record in records.brute_force(Query())]
+    assert keys.count((1000, 5)) == 1
+
+
+def test_hash_index_tracks_values():
+    index = HashIndex()
+    index.add(1, {'latte', 'mocha'})
+    index.add(2, {'latte'})
+    index.remove(1, {'latte', 'mocha'})
+
+    assert list(index.ids('latte')) == [2]
+    assert index.ids('mocha') == {}
+    assert index.cost({'latte', 'mocha'}) == 1
+    assert index.contains(2, {'mocha', 'latte'})
+    assert not index.contains(1, {'latte'})
@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from coffeemesh.repository.archive import Archive
+from coffeemesh.repository.retention import Retention
+
+
+class Conflict(Exception):
+    pass
+
+
+class Repository:
+
+    # 並び順のキーを 'at' に持つレコードを保存する、テスト用のリポジトリ
+    def __init__(self, records):
+        self.records = {record['id']: record for record in records}
+        # delete() の直前に変更されるレコードの ID
+        self.changing = set()
+
+    def list(self, query, after=None, limit=None):
+        records = sorted(
+            (
+                record for record in self.records.values()
+                if record['status'] in query.status and record['at'] < query.end
+                and (after is None or (record['at'], record['id']) > after)
+            ),
+            key=lambda record: (record['at'], record['id']),
+        )
+        return records[:limit]
+
+    def delete(self, record_id, if_match=None):
+        record = self.records.get(record_id)
+        if record is None:
+            return False
+        if record_id in self.changing:
+            record['version'] += 1
+        if if_match is not None and record['version'] not in if_match:
+            raise Conflict(record_id)
+        del self.records[record_id]
+        return True
+
+
+class RecordRetention(Retention):
+
+    statuses = ('delivered',)
+    conflict = Conflict
+
+    def dump(self, record):
+        return {key: value for key, value in record.items() if key != 'at'}
+
+    def identity(self, record):
+        return record['id']
+
+    def cursor(self, record):
+        return (record['at'], record['id'])
+
+
+def make_record(record_id, status, age):
+    return {
+        'id': record_id,
+        'status': status,
+        'version': 1,
+        'at': datetime.utcnow() - timedelta(seconds=age),
+    }
+
+
+def test_subclasses_must_implement_record_methods(tmp_path):
+    class Incomplete(Retention):
+
+        def dump(self, record):
+            return record
+
+    with pytest.raises(TypeError):
+        Incomplete(Repository([]), Archive(tmp_path), age=60)
+
+
+def test_moves_old_terminal_records_to_archive(tmp_path):
+    repository = Repository([
+        make_record(str(index), 'delivered', 120) for index in range(5)
+    ] + [
+        make_record('pending', 'pending', 120),
+        make_record('recent', 'delivered', 0),
+    ])
+    archive = Archive(tmp_path)
+    retention = RecordRetention(repository, archive, age=60, batch_size=2)
+
+    assert retention.sweep() == 5
+    assert retention.archived == 5
+    assert sorted(repository.records) == ['pending', 'recent']
+    assert archive.get('3') == {'id': '3', 'status': 'delivered', 'version': 1}
+    assert 'pending' not in archive and 'recent' not in archive
+
+
+def test_keeps_records_changed_during_sweep(tmp_path):
+    repository = Repository([
+        make_record('a', 'delivered', 120), make_record('b', 'delivered', 120),
+    ])
+    repository.changing.add('b')
+    archive = Archive(tmp_path)
+
+    assert RecordRetention(repository, archive, age=60).sweep() == 1
+    # 変更されたレコードはリポジトリの状態を優先し、アーカイブから取り除く
+    assert list(repository.records) == ['b']
+    assert 'a' in archive and 'b' not in archive
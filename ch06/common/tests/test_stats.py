@@ -0,0 +1,51 @@
+from datetime import datetime
+
+from coffeemesh.repository.stats import Aggregates, bucket_of, render_stats
+
+
+def test_applies_and_reverts_contributions():
+    stats = Aggregates()
+    order = [('status', 'created', 1), ('product', 'latte', 2), ('size', 'small', 2)]
+    stats.apply(order)
+    stats.apply([('status', 'created', 1), ('product', 'mocha', 1), ('size', 'small', 1)])
+
+    assert stats.counts('status') == {'created': 2}
+    assert stats.counts('product') == {'latte': 2, 'mocha': 1}
+
+    stats.apply(order, -1)
+    # 0 になったキーは残さない
+    assert stats.counts('product') == {'mocha': 1}
+    assert stats.counts('size') == {'small': 1}
+
+
+def test_counts_are_copies():
+    stats = Aggregates()
+    stats.apply([('status', 'created', 1)])
+    stats.counts('status')['created'] = 10
+    assert stats.counts('status') == {'created': 1}
+
+
+def test_fills_empty_buckets_with_zero():
+    stats = Aggregates()
+    stats.apply([('bucket', 10, 1), ('bucket', 12, 1), ('bucket', 12, 1)])
+    assert stats.buckets(9, 12) == [(9, 0), (10, 1), (11, 0), (12, 2)]
+
+
+def test_buckets_are_hours_since_epoch():
+    assert bucket_of(datetime(1970, 1, 1, 0, 59)) == 0
+    assert bucket_of(datetime(1970, 1, 2, 1)) == 25
+
+
+def test_renders_stats_with_bucket_ranges():
+    counts = {
+        'status': {'created': 2, 'cancelled': 1},
+        'product': {'latte': 3},
+        'size': {'small': 3},
+    }
+    rendered = render_stats(counts, [(bucket_of(datetime(2024, 1, 1, 5, 30)), 3)], 'orders')
+
+    assert rendered['total'] == 3
+    assert rendered['quantity'] == {'product': {'latte': 3}, 'size': {'small': 3}}
+    assert rendered['buckets'] == [
+        {'start': datetime(2024, 1, 1, 5), 'end': datetime(2024, 1, 1, 6), 'orders': 3},
+    ]
@@ -0,0 +1,78 @@
+import math
+import threading
+from time import perf_counter
+
+from flask import g, request
+from flask_smorest import abort
+
+from coffeemesh.admission.controller import GRANTED, NORMAL, QUEUED
+
+
+# リクエストの受け付けを制御する
+# クライアントごとのレート制限を超えたリクエストには 429、同時に処理できる数の
+# 上限で待ちきれないリクエストには 503 を、どちらも Retry-After を付けてすぐに返す。
+# 待ち行列で待つのはリクエストを処理するワーカースレッドで、待つ時間は
+# queue_timeout 秒までに抑える。
+# routes には (メソッド, ルールのパス) -> 優先度 のディクショナリを渡す。
+# 登録していないルートは NORMAL とし、優先度が None のルート（SSE など接続を
+# 保ち続けるもの）は同時に処理する数に数えず、レート制限だけを行う。
+# レート制限はクライアントを接続元のアドレスで区別する。principal にリクエストから
+# 認証済みのクライアントの ID（認証されていなければ None）を返す関数を渡すと、
+# 認証されたリクエストはその ID で区別する。検証していない Authorization ヘッダーは
+# 送るたびに変えられ、制限を回避できてしまうので使わない。
+# RequestMetrics の後、Idempotency の前に init_app() を呼び出し、断ったリクエストも
+# メトリクスに記録させ、再送も制限する
+class AdmissionControl:
+
+    def __init__(self, controller, routes, limiter=None, principal=None):
+        self.controller = controller
+        self.routes = dict(routes)
+        self.limiter = limiter
+        self.principal = principal
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        route = request.url_rule.rule if request.url_rule is not None else None
+        priority = self.routes.get((request.method, route), NORMAL)
+
+        if self.limiter is not None:
+            wait = self.limiter.acquire(self._client())
+            if wait:
+                abort(429, message='Too many requests', headers={'Retry-After': str(math.ceil(wait))})
+        if priority is None:
+            return
+
+        key = (request.method, route)
+        if not self._admit(key, priority):
+            abort(
+                503,
+                message='The server is overloaded',
+                headers={'Retry-After': str(self.controller.retry_after())},
+            )
+        g.admission = (key, priority, perf_counter())
+
+    def _client(self):
+        if self.principal is not None:
+            principal = self.principal(request)
+            if principal is not None:
+                return ('principal', principal)
+        return request.remote_addr
+
+    def _admit(self, key, priority):
+        granted = threading.Event()
+        state, waiter = self.controller.acquire(key, priority, granted.set)
+        if state != QUEUED:
+            return state == GRANTED
+        if granted.wait(self.controller.queue_timeout):
+            return True
+        return self.controller.cancel(waiter)
+
+    def _teardown_request(self, exception):
+        # ストリーミングのレスポンスは、最後まで送り終えた後に呼び出される
+        admission = g.pop('admission', None)
+        if admission is not None:
+            key, priority, start = admission
+            self.controller.release(key, priority, perf_counter() - start)
@@ -1,38 +1,211 @@
-import copy
+import hashlib
+import json
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 
-from flask import abort
+from flask import Response, abort, request, stream_with_context
 
 from flask.views import MethodView
-from flask_smorest import Blueprint
 # marshmallow から ValidationError クラスをインポート
 from marshmallow import ValidationError
 
+from coffeemesh.feed.change_feed import ChangeFeed
+from coffeemesh.feed.relay import FeedRelay
+from coffeemesh.idempotency.cache import IN_PROGRESS, MISMATCH, REPLAY, IdempotencyCache
+from coffeemesh.repository.archive import Archive
+from coffeemesh.repository.query import Query
+
 # marshmallow モデルをインポート
 from api.schemas import (
     GetScheduledOrderSchema,
     ScheduleOrderSchema,
+    ScheduleBatchItemSchema,
     GetScheduledOrdersSchema,
     ScheduleStatusSchema,
     # URL クエリパラメータの marshmallow モデルをインポート
-    GetKitchenScheduleParameters
+    GetKitchenScheduleParameters,
+    ExportKitchenSchedulesParameters,
+    ScheduleOrdersBatchSchema,
+    ScheduleOrdersBatchResultSchema,
+    ChangeFeedParameters,
+    PollChangeFeedParameters,
+    ScheduleStatsSchema,
+    ScheduleStatsParameters,
 )
+from api.etags import etag_matches, make_etag, parse_if_match
+from api.pagination import decode_cursor, encode_cursor
+from config import BaseConfig
+from engine.kitchen_engine import KitchenEngine
+from metrics.middleware import InstrumentedBlueprint
+from repository.codec import load_schedule
+from repository.factory import create_schedule_repository
+from repository.retention import ScheduleRetention
+from repository.schedules_repository import VersionConflict
 
 # flask-smorest の Bluepring クラスのインスタンスを作成
-blueprint = Blueprint('kitchen', __name__, description='Kitchen API')
+# ビュー関数の検証、ハンドラー、シリアライズの各フェーズの時間を記録する
+# InstrumentedBlueprint を使う
+blueprint = InstrumentedBlueprint('kitchen', __name__, description='Kitchen API')
+
+# 設定に応じて、インメモリまたは SQLite のスケジュールリポジトリを使う
+schedules = create_schedule_repository(BaseConfig)
+
+# スケジュールの変更イベントの変更フィード。クライアントはポーリングの代わりに
+# /kitchen/schedules/events の SSE または /kitchen/schedules/events/poll の長ポーリングで
+# 変更を受け取る
+feed = ChangeFeed(BaseConfig.CHANGE_FEED_SIZE)
+
+# 保存先が 'shared' の場合は、イベントをストアのサーバーのフィードに発行し、
+# リレーのスレッドでこのワーカーのフィードに写す。ワーカーを複数起動しても、
+# すべてのワーカーのクライアントが同じイベント ID で同じイベントを受け取る。
+# リレーのスレッドは app モジュールで起動する
+publisher, feed_relay = feed, None
+if BaseConfig.STORAGE_BACKEND == 'shared':
+    publisher = schedules.feed()
+    feed_relay = FeedRelay(publisher, feed)
+
+# SSE の接続を維持するためにコメント行を送る間隔（秒）。切断したクライアントは
+# コメント行の書き込みに失敗した時点で検出され、ワーカースレッドが解放される
+HEARTBEAT_INTERVAL = 15
+
+# スキーマは呼び出しごとに生成せず、モジュールレベルのインスタンスを再利用する
+schedule_batch_item_schema = ScheduleBatchItemSchema()
+scheduled_order_schema = GetScheduledOrderSchema()
+schedule_batch_result_schema = ScheduleOrdersBatchResultSchema()
+scheduled_orders_schema = GetScheduledOrdersSchema()
+schedule_status_schema = ScheduleStatusSchema()
 
-schedules = [] # スケジュールをからのリストで初期化
+# Idempotency-Key ヘッダーと、バッチの各スケジュールの idempotency_key で
+# 再送されたリクエストの結果を保存する。保存先が 'shared' の場合は、ストアのサーバーの
+# キャッシュを使い、別のワーカーに届いた再送も重複排除する
+if BaseConfig.STORAGE_BACKEND == 'shared':
+    idempotency_cache = schedules.idempotency()
+else:
+    idempotency_cache = IdempotencyCache(
+        BaseConfig.IDEMPOTENCY_CACHE_SIZE, BaseConfig.IDEMPOTENCY_TTL
+    )
 
 # データ検証コードを関数としてリファクタリング
+# スケジュールは作成時と更新時に一度だけ検証し、検証済みの形でリポジトリに保存する。
+# 読み取り時は保存済みのスケジュールを信頼し、そのままシリアライズする
 def validate_schedule(schedule):
-    schedule = copy.deepcopy
-    schedule['scheduled'] = schedule['scheduled'].isoformat()
-    errors = GetScheduledOrderSchema().validate(schedule)
+    errors = scheduled_order_schema.validate(
+        {**schedule, 'scheduled': schedule['scheduled'].isoformat()}
+    )
     if errors:
         raise ValidationError(errors)
 
 
+def publish(event_type, schedule):
+    publisher.publish(event_type, {
+        'id': schedule['id'],
+        'status': schedule['status'],
+        'version': schedule['version'],
+    })
+
+
+# 保留中のスケジュールを調理ステーションの数だけ並行して調理し、ステータスを進める
+# 実行エンジン。スレッドは app モジュールで起動する
+# 保存先が 'shared' の場合は、ストアのサーバーで動いている実行エンジンを使う
+engine = None
+if BaseConfig.STATIONS > 0 and BaseConfig.STORAGE_BACKEND == 'shared':
+    engine = schedules.engine()
+elif BaseConfig.STATIONS > 0:
+    engine = KitchenEngine(
+        schedules,
+        stations=BaseConfig.STATIONS,
+        preparation_time=BaseConfig.PREPARATION_TIME,
+        time_per_item=BaseConfig.TIME_PER_ITEM,
+        publish=publish,
+    )
+
+
+# 保持期間を過ぎた終了状態のスケジュールを移すアーカイブ。リポジトリにない
+# スケジュールはアーカイブから読み出す。移す処理のスレッドは app モジュールで起動し、
+# 保存先が 'shared' の場合はストアのサーバーで動かす
+archive = Archive(BaseConfig.ARCHIVE_DIR)
+retention = None
+if BaseConfig.RETENTION_AGE > 0 and BaseConfig.STORAGE_BACKEND != 'shared':
+    retention = ScheduleRetention(
+        schedules,
+        archive,
+        BaseConfig.RETENTION_AGE,
+        interval=BaseConfig.RETENTION_INTERVAL,
+        batch_size=BaseConfig.RETENTION_BATCH_SIZE,
+    )
+
+
+def get_schedule(schedule_id):
+    schedule = schedules.get(schedule_id)
+    if schedule is None:
+        record = archive.get(schedule_id)
+        if record is not None:
+            schedule = load_schedule(record)
+    return schedule
+
+
+def not_found(schedule_id):
+    # アーカイブに移したスケジュールは終了状態なので、変更も削除もできない
+    if schedule_id in archive:
+        abort(
+            409,
+            description=f'Schedule with ID {schedule_id} has been archived and can no longer be changed',
+        )
+    abort(404, description=f'Resource with ID {schedule_id} not found')
+
+
+def resume_position(parameters):
+    # 再開位置はクエリパラメータ after または Last-Event-ID ヘッダーで指定する。
+    # どちらもない場合は、これから発行されるイベントを返す
+    after = parameters.get('after')
+    last_event_id = request.headers.get('Last-Event-ID')
+    if after is None and last_event_id is not None:
+        try:
+            after = int(last_event_id)
+        except ValueError:
+            abort(422, description=f'Invalid Last-Event-ID {last_event_id}')
+    return feed.last_event_id if after is None else after
+
+
+def utc(value):
+    # scheduled は UTC の naive な datetime で保存しているので、比較できる形にそろえる
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+# 一覧とエクスポートに共通の絞り込み条件のクエリパラメータを Query に変換する
+def schedule_filters(parameters):
+    statuses = set(parameters['status']) if parameters.get('status') else None
+    in_progress = parameters.get('progress')
+    if in_progress:
+        statuses = {'progress'} if statuses is None else statuses & {'progress'}
+    return Query(
+        status=statuses,
+        exclude_status='progress' if in_progress is False else None,
+        start=utc(parameters.get('since')),
+        end=utc(parameters.get('until')),
+        product=parameters.get('product') or None,
+        size=parameters.get('size') or None,
+    )
+
+
+def not_modified(etag):
+    return Response(status=304, headers={'ETag': etag})
+
+
+# 変更操作は If-Match ヘッダーの ETag で楽観的排他制御を行い、
+# 版数が一致しない場合は 412 レスポンスを返す
+def update_schedule(schedule_id, **fields):
+    try:
+        schedule = schedules.update(schedule_id, if_match=parse_if_match(), **fields)
+    except VersionConflict as error:
+        abort(412, description=f'Schedule has been modified (current version {error.version})')
+    if schedule is None:
+        not_found(schedule_id)
+    return schedule
+
+
 # Blueprint の route() でこれーたを使って、クラスまたは関数を URL パスとして登録
 @blueprint.route('/kitchen/schedules')
 # URL パス /kitchen/schedukes をクラスベースのビューとして実装
@@ -42,123 +215,260 @@ class KitchenSchedules(MethodView):
     @blueprint.arguments(GetKitchenScheduleParameters, location='query')
     # Blueprint の response() デコレートを使って、
     # レスポンスペイロードのmarshmallow モデルを登録
-    @blueprint.response(status_code=200, schema=GetScheduledOrdersSchema)
+    @blueprint.response(status_code=200, schema=scheduled_orders_schema)
     # クラスベースのビューの各メソッドビューは実装する HTTP メソッドに基づいて命名
     def get(self, parameters):
-        for schedule in schedules:
-            validate_schedule(schedule)
-            schedule = copy.deepcopy(schedule)
-            schedule['scheduled'] = schedule['scheduled'].isoformat()
-            # 検証エラーを errors 変数にキャプチャ
-            errors = GetDcheduledOrderSchema().validate(schedule)
-            if errors:
-                # validate() エラーが検出された場合は ValidationError 例外を生成
-                raise ValidationError(errors)
-
-
-        # パラメータが設定されていない場合はスケジュールの完全なリストを返す
-        if not parameters:
-            return {'schedules': schedules}
-        # ユーザーが URL クエリパラメータを設定した場合は,
-        # それらを使ってスケジュールのリストをフィルタリング
-        query_set = [schedule for schedule in schedules]
-
-        # ディ区処なりの get() メソッドを使って、
-        # 各 URL クエリパラメータの有無をチェック
-        in_progress = parameters.get(progress)
-        if in_progress is not None:
-            if in_progress:
-                query_set = [
-                    scheduke for schedule in schedules
-                    if schedule['status'] == 'progress'
-                ]
-            else:
-                query_set = [
-                    schedule for schedule in schedules
-                    if schedule['status'] != 'progress'
-                ]
-        
-        since = parameters.get('since')
-        if since is not None:
-            query_set = [
-                schedule for schedule in schedules
-                if schedule['scheduled'] >= since
-            ]
-        
-        limit = parametrers.get('limit')
-        # limit が設定されていて、その値が query_Set のサイズよりも小さい場合は、
-        # query_set のサブ設定を返す
+        # コレクション全体の版数が変わっていなければ、一覧を取り出さずに 304 を返す
+        etag = make_etag(schedules.version())
+        if etag_matches(etag):
+            return not_modified(etag)
+
+        # after が設定されている場合は、カーソルの次のスケジュールから返す
+        after = parameters.get('after')
+        try:
+            after_key = decode_cursor(after) if after is not None else None
+        except ValueError as error:
+            abort(422, description=str(error))
+
+        # 絞り込み条件はリポジトリのインデックスで候補の最も少ないものから調べ、
+        # 一度の走査で絞り込んで limit に達した時点で打ち切る。
+        # 次のページがあるかどうかを判定するために、limit より 1 件多く取り出す
+        limit = parameters.get('limit')
+        query_set = schedules.list(
+            query=schedule_filters(parameters),
+            after=after_key,
+            limit=limit + 1 if limit is not None else None,
+        )
+
+        # limit が設定されていて、まだ続きがある場合は次のページのカーソルを返す
+        next_cursor = None
         if limit is not None and len(query_set) > limit:
             query_set = query_set[:limit]
-        
+            next_cursor = encode_cursor(query_set[-1]) if query_set else None
+
         # フィルタリングされたスケジュールのリストを返す
-        return {'schedules': query_set}
+        return {'schedules': query_set, 'next_cursor': next_cursor}, 200, {'ETag': etag}
     
     # Blueprint の arguments() のデコレータを使って、
     # リクエストペイロードの marshmallow モデルを登録
     @blueprint.arguments(ScheduleOrderSchema)
     # status_code パラメータの値を目的のステータスコードに設定
-    @blueprint.response(status_code=201, schema=GetScheduledOrderSchema)
+    @blueprint.response(status_code=201, schema=scheduled_order_schema)
     def post(self, payload):
         # ID などのサーバー側のスケジュールの属性を設定
         payload['id'] = str(uuid.uuid4())
         payload['scheduled'] = datetime.utcnow()
         payload['status'] = 'pending'
-        schedules.append(payload)
         validate_schedule(payload)
-        return payload
+        schedules.add(payload)
+        if engine is not None:
+            engine.submit(payload)
+        return payload, 201, {'ETag': make_etag(payload['version'])}
+
+# 複数のスケジュールを 1 回のリクエストで作成する
+@blueprint.route('/kitchen/schedules/batch', methods=['POST'])
+@blueprint.arguments(ScheduleOrdersBatchSchema)
+@blueprint.response(status_code=201, schema=schedule_batch_result_schema)
+def schedule_orders(payload):
+    # 各スケジュールを検証し、有効なスケジュールだけを作成する。
+    # 無効なスケジュールはインデックスとエラーを報告する。
+    # idempotency_key の付いたスケジュールは、同じキーで作成済みなら作成し直さずに
+    # 最初の結果を返し、同じキーのスケジュールを作成中なら 409 を報告する。
+    # 注文サービスは送信の結果が分からない場合にバッチを再送するので、
+    # 同じ注文のスケジュールが二重に作成されないようにする
+    results, created, keys = [], [], []
+    for index, item in enumerate(payload['schedules']):
+        try:
+            schedule = schedule_batch_item_schema.load(item)
+        except ValidationError as error:
+            results.append({'index': index, 'status': 422, 'errors': error.messages})
+            continue
+        key = schedule.pop('idempotency_key', None)
+        if key is not None:
+            # Idempotency-Key ヘッダーと同じキャッシュに保存するので、バッチのキーと区別する
+            key = ('batch', key)
+            fingerprint = hashlib.sha256(
+                json.dumps(schedule['order'], sort_keys=True).encode()
+            ).digest()
+            state, result = idempotency_cache.begin(key, fingerprint)
+            if state == REPLAY:
+                results.append({**result, 'index': index})
+                continue
+            if state == MISMATCH:
+                results.append({'index': index, 'status': 422, 'errors': {
+                    'idempotency_key': ['Already used with a different order'],
+                }})
+                continue
+            if state == IN_PROGRESS:
+                results.append({'index': index, 'status': 409, 'errors': {
+                    'idempotency_key': ['A schedule with this key is being created'],
+                }})
+                continue
+        try:
+            schedule['id'] = str(uuid.uuid4())
+            schedule['scheduled'] = datetime.utcnow()
+            schedule['status'] = 'pending'
+            validate_schedule(schedule)
+        except ValidationError as error:
+            if key is not None:
+                idempotency_cache.abandon(key)
+            results.append({'index': index, 'status': 422, 'errors': error.messages})
+            continue
+        created.append(schedule)
+        keys.append(key)
+        results.append({'index': index, 'status': 201, 'schedule': schedule})
+
+    # 有効なスケジュールは 1 回の操作でまとめてリポジトリに追加する
+    try:
+        schedules.add_many(created)
+    except Exception:
+        for key in keys:
+            if key is not None:
+                idempotency_cache.abandon(key)
+        raise
+    for key, schedule in zip(keys, created):
+        if key is not None:
+            idempotency_cache.complete(key, {'status': 201, 'schedule': dict(schedule)})
+    if engine is not None:
+        for schedule in created:
+            engine.submit(schedule)
+
+    # すべて作成できた場合は 201、一部が失敗した場合は 207 (Multi-Status) を返す
+    succeeded = sum(result['status'] == 201 for result in results)
+    return {'results': results}, 201 if succeeded == len(results) else 207
+
+# スケジュールを 1 行 1 件の NDJSON としてストリーミングでエクスポートする
+@blueprint.route('/kitchen/schedules/export', methods=['GET'])
+@blueprint.arguments(ExportKitchenSchedulesParameters, location='query')
+def export_schedules(parameters):
+    records = schedules.scan(query=schedule_filters(parameters))
+    # ジェネレータから 1 件ずつシリアライズするので、メモリ使用量は一定
+    return Response(
+        stream_with_context(
+            json.dumps(scheduled_order_schema.dump(schedule)) + '\n'
+            for schedule in records
+        ),
+        mimetype='application/x-ndjson',
+    )
+
+def event_stream(last_event_id):
+    while True:
+        events = feed.since(last_event_id)
+        if events is None:
+            # 再開位置のイベントがすでに破棄されている場合は reset イベントを送り、
+            # クライアントにスケジュールを取得し直してもらってから最新の位置で続ける
+            last_event_id = feed.last_event_id
+            yield f'id: {last_event_id}\nevent: reset\ndata: {{}}\n\n'.encode()
+        elif events:
+            last_event_id = events[-1][0]
+            yield b''.join(frame for _, frame, _ in events)
+        elif not feed.wait(last_event_id, HEARTBEAT_INTERVAL):
+            yield b': keepalive\n\n'
+
+# スケジュールのステータスの変更を Server-Sent Events でストリーミングする
+@blueprint.route('/kitchen/schedules/events', methods=['GET'])
+@blueprint.arguments(ChangeFeedParameters, location='query')
+def stream_schedule_events(parameters):
+    return Response(
+        event_stream(resume_position(parameters)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+# SSE を使えないクライアントのための長ポーリング
+# after より後のイベントがあればすぐに返し、なければ timeout 秒まで待つ
+@blueprint.route('/kitchen/schedules/events/poll', methods=['GET'])
+@blueprint.arguments(PollChangeFeedParameters, location='query')
+def poll_schedule_events(parameters):
+    after = resume_position(parameters)
+    events = feed.since(after, parameters['limit'])
+    if events == []:
+        feed.wait(after, parameters['timeout'])
+        events = feed.since(after, parameters['limit'])
+    reset = events is None
+    if reset:
+        events, after = [], feed.last_event_id
+    last_event_id = events[-1][0] if events else after
+    body = b''.join((
+        b'{"events":[',
+        b','.join(record for _, _, record in events),
+        b'],"last_event_id":%d,"reset":%s}' % (last_event_id, b'true' if reset else b'false'),
+    ))
+    return Response(body, mimetype='application/json')
 
 # URL パラメータを山かっこで囲んで定義
 @blueprint.route('/kitchen/schedules/<schedule_id>')
 class KitchenSchedule(MethodView):
 
-    @blueprint.response(status_code=200, schema=GetScheduledOrderSchema)
+    @blueprint.response(status_code=200, schema=scheduled_order_schema)
     def get(self, schedule_id):
-        for schedule in schedules:
-            if schedule['id'] == schedule_id:
-                validate_schedule(schedule)
-                return schedule
-        # スケジュールが見つからない場合は 404 レスポンスを返す
-        abort(404, description=f'Resorce with ID {schedule_id} not found')
+        schedule = get_schedule(schedule_id)
+        if schedule is None:
+            # スケジュールが見つからない場合は 404 レスポンスを返す
+            abort(404, description=f'Resorce with ID {schedule_id} not found')
+        # 版数が変わっていなければ、シリアライズせずに 304 を返す
+        etag = make_etag(schedule['version'])
+        if etag_matches(etag):
+            return not_modified(etag)
+        return schedule, 200, {'ETag': etag}
 
     @blueprint.arguments(ScheduleOrderSchema)
-    @blueprint.response(status_code=200, schema=GetScheduledOrderSchema)
+    @blueprint.response(status_code=200, schema=scheduled_order_schema)
     def put(self, payload, schedule_id): # 関数シグネチャに URL パスパラメータを追加
-        for schedule in schedules:
-            if schedule['id'] == schedule_id:
-                # ユーザーがスケジュールを更新したら、
-                # ペイロードの内容に基づいてスケジュールのプロパティを更新
-                schedule.update(payload)
-                validate_schedule(schedule)
-                return schedule
-        abort(404, description=f'Resource with ID {schedule_id} not found')
+        schedule = schedules.get(schedule_id)
+        if schedule is None:
+            not_found(schedule_id)
+        # 更新後のスケジュールを保存する前に検証する
+        validate_schedule({**schedule, **payload})
+        # ユーザーがスケジュールを更新したら、
+        # ペイロードの内容に基づいてスケジュールのプロパティを更新
+        schedule = update_schedule(schedule_id, **payload)
+        publish('schedule.updated', schedule)
+        # 品数が変わると調理の順番も変わるので、待ち行列に入れ直す
+        if engine is not None and schedule['status'] == 'pending':
+            engine.submit(schedule)
+        return schedule, 200, {'ETag': make_etag(schedule['version'])}
 
     @blueprint.response(status_code=204)
     def delete(self, schedule_id):
-        for index, schedule in enumerate(schedule):
-            if schedule['id'] == schedule_id:
-                # リストからスケジュールを削除し、空のレスポンスを返す
-                schedules.pop(index)
-                return 
-        abort(404, description=f'Resource with ID {schedule_id} not found')
+        # リポジトリからスケジュールを削除し、空のレスポンスを返す
+        try:
+            deleted = schedules.delete(schedule_id, if_match=parse_if_match())
+        except VersionConflict as error:
+            abort(412, description=f'Schedule has been modified (current version {error.version})')
+        if not deleted:
+            not_found(schedule_id)
+        if engine is not None:
+            engine.cancel(schedule_id)
+
+# ステータスごとの件数、商品名ごと・サイズごとの数量、1 時間ごとの予定件数を返す
+# リポジトリが変更のたびに差分を加減している集計を読み出すだけなので、
+# スケジュールの件数に関係なく一定の時間で返せる
+@blueprint.route('/kitchen/stats', methods=['GET'])
+@blueprint.arguments(ScheduleStatsParameters, location='query')
+@blueprint.response(status_code=200, schema=ScheduleStatsSchema)
+def get_schedule_stats(parameters):
+    return schedules.stats(parameters['buckets'])
 
-@blueprint.response(status_code=200, schema=GetScheduledOrderSchema)
 # URL パス /kitchen/schedules/<schedule_id>/cancel を関数ベースのビューとして実装
 @blueprint.route('/kitchen/schedules/<schedule_id>/cancel', methods=['POST'])
+@blueprint.response(status_code=200, schema=scheduled_order_schema)
 def cancel_schedule(schedule_id):
-    for schedule in schedules:
-        if schedule['id'] == schedule_id:
-            # スケジュールのステータスをキャンセルに設定
-            schedule['status'] = 'cancelled'
-            validate_schedule(schedule)
-            return schedule
-    abort(404, description=f'Resource with ID {schedule_id} not found')
+    # スケジュールのステータスをキャンセルに設定
+    schedule = update_schedule(schedule_id, status='cancelled')
+    # 待ち行列のスケジュールは取り消し、調理中のスケジュールはステーションを空ける
+    if engine is not None:
+        engine.cancel(schedule_id)
+    publish('schedule.cancelled', schedule)
+    return schedule, 200, {'ETag': make_etag(schedule['version'])}
 
-@blueprint.response(status_code=200, schema=ScheduleStatusSchema)
-@blueprint.route('/kitchen/schedues/<schedule_id>/status', methods=['GET'])
+@blueprint.route('/kitchen/schedules/<schedule_id>/status', methods=['GET'])
+@blueprint.response(status_code=200, schema=schedule_status_schema)
 def get_schedule_status(schedule_id):
-    for schedule in schedules:
-        if schedule['id'] == schedule_id:
-            validate_schedule(schedule)
-            return {'status': schedule['status']}
-    abort(404, description=f'Resource with ID {schedule_id} not found')
\ No newline at end of file
+    schedule = get_schedule(schedule_id)
+    if schedule is None:
+        abort(404, description=f'Resource with ID {schedule_id} not found')
+    etag = make_etag(schedule['version'])
+    if etag_matches(etag):
+        return not_modified(etag)
+    return {'status': schedule['status']}, 200, {'ETag': etag}
@@ -0,0 +1,22 @@
+from flask import request
+
+
+# ETag は版数をそのまま引用符で囲んだ強い ETag として表現する
+def make_etag(version):
+    return f'"{version}"'
+
+
+# リクエストの If-None-Match ヘッダーが etag に一致するかどうかを判定する
+# GET の条件付きリクエストでは弱い比較を使う
+def etag_matches(etag):
+    return request.if_none_match.contains_weak(etag.strip('"'))
+
+
+# If-Match ヘッダーを、リポジトリの update() と delete() に渡す版数の集合に変換する
+# ヘッダーがない場合と * の場合は None を返し、版数を確認しない。
+# 書き込みの条件付きリクエストでは強い比較を使うので、弱い ETag と不正な ETag は
+# どの版数にも一致しない
+def parse_if_match():
+    if 'If-Match' not in request.headers or request.if_match.star_tag:
+        return None
+    return {int(tag) for tag in request.if_match.as_set() if tag.isdigit()}
@@ -0,0 +1,20 @@
+import base64
+import json
+from datetime import datetime
+
+
+# カーソルは最後に返したスケジュールの (scheduled, ID) を URL セーフな Base64 で
+# エンコードした不透明な文字列として表現する
+def encode_cursor(schedule):
+    payload = json.dumps([schedule['scheduled'].isoformat(), schedule['id']])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+# 不正なカーソルの場合は ValueError を送出する
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        scheduled, schedule_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(scheduled), str(schedule_id)
+    except (TypeError, ValueError) as error:
+        raise ValueError(f'Invalid cursor {cursor}') from error
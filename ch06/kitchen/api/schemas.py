@@ -5,7 +5,7 @@ class OrderItemSchema(Schema):
     class Meta:
         unknown = EXCLUDE
     
-    produlct = fields.String(required=True)
+    product = fields.String(required=True)
     size = fields.String(
         required=True,
         validate=validate.OneOf(['small', 'medium', 'big'])
@@ -29,6 +29,30 @@ class GetScheduledOrderSchema(ScheduleOrderSchema):
         validate=validate.OneOf(['pending', 'progress', 'cancelled', "finished"])
     )
 
+# バッチの各スケジュール。idempotency_key を指定すると、同じキーで再送された
+# スケジュールは作成し直さず、最初に作成したスケジュールを返す
+class ScheduleBatchItemSchema(ScheduleOrderSchema):
+    idempotency_key = fields.String(validate=validate.Length(min=1, max=255))
+
+class ScheduleOrdersBatchSchema(Schema):
+    class Meta:
+        unknown = EXCLUDE
+
+    # 各スケジュールは ScheduleBatchItemSchema で個別に検証し、
+    # 失敗したスケジュールだけをエラーとして報告する
+    schedules = fields.List(
+        fields.Raw(), required=True, validate=validate.Length(min=1, max=1000)
+    )
+
+class ScheduleBatchResultSchema(Schema):
+    index = fields.Integer(required=True)
+    status = fields.Integer(required=True)
+    schedule = fields.Nested(GetScheduledOrderSchema)
+    errors = fields.Raw()
+
+class ScheduleOrdersBatchResultSchema(Schema):
+    results = fields.List(fields.Nested(ScheduleBatchResultSchema), required=True)
+
 class GetScheduledOrdersSchema(Schema):
     class Meta:
         unknown = EXCLUDE
@@ -36,6 +60,8 @@ class GetScheduledOrdersSchema(Schema):
     schedules = fields.List(
         fields.Nested(GetScheduledOrderSchema), required=True
     )
+    # 次のページを取得するためのカーソル。続きがない場合は None
+    next_cursor = fields.String(allow_none=True)
 
 class ScheduleStatusSchema(Schema):
     class Meta:
@@ -46,11 +72,61 @@ class ScheduleStatusSchema(Schema):
         validate=validate.OneOf(['pending', 'progress', 'cancelled', 'finished'])
     )
 
-class GetKitchenScheduleParameters(Schema):
+# 一覧とエクスポートに共通の絞り込み条件
+# status、product、size は繰り返し指定でき、いずれかに一致するスケジュールを返す。
+# since 以上 until 未満に予定されたスケジュールを返す
+# エクスポートでは全件をストリーミングするので、limit と after は受け付けない
+class ExportKitchenSchedulesParameters(Schema):
     class Meta:
         unknown = EXCLUDE
-    
+
     # URL クエリパラメータのフィールドを定義
     progress = fields.Boolean()
+    since = fields.DateTime()
+    until = fields.DateTime()
+    status = fields.List(
+        fields.String(validate=validate.OneOf(['pending', 'progress', 'cancelled', 'finished']))
+    )
+    product = fields.List(fields.String())
+    size = fields.List(fields.String(validate=validate.OneOf(['small', 'medium', 'big'])))
+
+class GetKitchenScheduleParameters(ExportKitchenSchedulesParameters):
     limit = fields.Integer()
-    since = fields.DateTime()
\ No newline at end of file
+    # 前のページのレスポンスで返された next_cursor
+    after = fields.String()
+
+# 商品名ごと、サイズごとの数量の合計
+class ItemQuantitiesSchema(Schema):
+    product = fields.Dict(keys=fields.String(), values=fields.Integer(), required=True)
+    size = fields.Dict(keys=fields.String(), values=fields.Integer(), required=True)
+
+# start 以上 end 未満に予定されたスケジュールの件数
+class SchedulesBucketSchema(Schema):
+    start = fields.DateTime(required=True)
+    end = fields.DateTime(required=True)
+    schedules = fields.Integer(required=True)
+
+class ScheduleStatsSchema(Schema):
+    total = fields.Integer(required=True)
+    status = fields.Dict(keys=fields.String(), values=fields.Integer(), required=True)
+    quantity = fields.Nested(ItemQuantitiesSchema, required=True)
+    buckets = fields.List(fields.Nested(SchedulesBucketSchema), required=True)
+
+class ScheduleStatsParameters(Schema):
+    class Meta:
+        unknown = EXCLUDE
+
+    # 返す 1 時間ごとの時間帯の数（現在の時間帯まで）
+    buckets = fields.Integer(load_default=24, validate=validate.Range(min=1, max=744))
+
+# 変更フィードの再開位置。Last-Event-ID ヘッダーの代わりに指定できる
+class ChangeFeedParameters(Schema):
+    class Meta:
+        unknown = EXCLUDE
+
+    after = fields.Integer()
+
+class PollChangeFeedParameters(ChangeFeedParameters):
+    # イベントがない場合に待つ最大の時間（秒）
+    timeout = fields.Float(load_default=30, validate=validate.Range(min=0, max=60))
+    limit = fields.Integer(load_default=1000, validate=validate.Range(min=1, max=1000))
@@ -1,15 +1,21 @@
+import atexit
 from pathlib import Path
-import yaml
-from apispec import APISpec
 
 from flask import Flask
 from flask_smorest import Api
 
+from coffeemesh.admission.controller import HIGH, LOW, AdmissionController, RateLimiter
+from coffeemesh.api.openapi import OpenAPIDocument
+from coffeemesh.metrics.registry import MetricsRegistry
+
 # 先ほど定義して Blueprint をインポート
-from api.api import blueprint
+from api.api import blueprint, engine, feed_relay, idempotency_cache, retention, schedules
 
 # 先ほど定義した BaseConfig クラスをインポート
+from admission.middleware import AdmissionControl
 from config import BaseConfig
+from idempotency.middleware import Idempotency
+from metrics.middleware import RequestMetrics
 
 # Flask アプリケーションオブジェクトのインスタンスを作成
 app = Flask(__name__)
@@ -23,11 +29,125 @@ kitchen_api = Api(app)
 # Blueprint を厨房 API オブジェクトに登録
 kitchen_api.register_blueprint(blueprint)
 
-api_spec = yaml.safe_load((Path(__file__).parent / "oas.yaml").read_text())
-spec = APISpec(
-    title=api_spec['info']['title'],
-    version=api_spec['info']['version'],
-    openapi_version=api_spec['openapi']
+# 実行エンジンの調理ステーションのスレッドを起動し、終了時に調理中のスケジュールを
+# 保留中に戻す。保存先が 'shared' の場合は、ストアのサーバーがエンジンを起動する
+if engine is not None and BaseConfig.STORAGE_BACKEND != 'shared':
+    engine.start()
+    atexit.register(engine.stop)
+
+# ストアのサーバーの変更フィードをこのワーカーのフィードに写すスレッドを起動する
+if feed_relay is not None:
+    feed_relay.start()
+    atexit.register(feed_relay.stop)
+
+# 保持期間を過ぎた終了状態のスケジュールをアーカイブに移すスレッドを起動する
+if retention is not None:
+    retention.start()
+    atexit.register(retention.stop)
+
+
+# Idempotency-Key を付けて再送されたスケジュールの作成には、最初のレスポンスを返す
+idempotency = Idempotency(idempotency_cache, routes=[('POST', '/kitchen/schedules')])
+
+
+# 過負荷のときは、同時に処理するリクエストの数とクライアントごとのレートを制限し、
+# 超えたリクエストはすぐに 429 や 503 で断る。スケジュール 1 件の読み取りと
+# ステータスの確認は、一覧より優先して処理する
+admission_controller = AdmissionController(
+    capacity=BaseConfig.ADMISSION_CAPACITY,
+    route_limits={
+        ('GET', '/kitchen/schedules'): 8,
+        ('GET', '/kitchen/schedules/export'): 2,
+        ('POST', '/kitchen/schedules/batch'): 4,
+    },
+    low_priority_share=BaseConfig.ADMISSION_LOW_PRIORITY_SHARE,
+    max_queue=BaseConfig.ADMISSION_QUEUE_SIZE,
+    queue_timeout=BaseConfig.ADMISSION_QUEUE_TIMEOUT,
+)
+admission = AdmissionControl(
+    admission_controller,
+    routes={
+        ('GET', '/metrics'): HIGH,
+        ('GET', '/kitchen/stats'): HIGH,
+        ('GET', '/kitchen/schedules/<schedule_id>'): HIGH,
+        ('GET', '/kitchen/schedules/<schedule_id>/status'): HIGH,
+        ('GET', '/kitchen/schedules/events'): None,
+        ('GET', '/kitchen/schedules/events/poll'): None,
+        ('GET', '/kitchen/schedules'): LOW,
+        ('GET', '/kitchen/schedules/export'): LOW,
+        ('POST', '/kitchen/schedules/batch'): LOW,
+    },
+    limiter=(
+        RateLimiter(BaseConfig.ADMISSION_RATE, BaseConfig.ADMISSION_BURST)
+        if BaseConfig.ADMISSION_RATE > 0 else None
+    ),
 )
-spec.to_dict = lambda: api_spec
-kitchen_api.spec = spec
\ No newline at end of file
+
+
+def metrics_gauges():
+    admission_stats = admission_controller.stats()
+    gauges = [
+        ('kitchen_repository_size', 'Number of stored schedules.', schedules.count()),
+        (
+            'kitchen_idempotency_keys',
+            'Stored Idempotency-Key responses.',
+            idempotency_cache.stats()['keys'],
+        ),
+        ('kitchen_admission_in_flight', 'Requests admitted and being processed.', admission_stats['in_flight']),
+        ('kitchen_admission_queued', 'Requests waiting for admission.', admission_stats['queued']),
+    ]
+    if engine is not None:
+        stats = engine.stats()
+        gauges += [
+            ('kitchen_queue_depth', 'Schedules waiting for a station.', stats['queue_depth']),
+            ('kitchen_stations_busy', 'Stations preparing a schedule.', stats['busy_stations']),
+            ('kitchen_stations', 'Configured number of stations.', stats['stations']),
+            (
+                'kitchen_throughput_per_second',
+                'Schedules finished per second over the last minute.',
+                stats['throughput'],
+            ),
+        ]
+    return gauges
+
+
+def metrics_counters():
+    admission_stats = admission_controller.stats()
+    counters = [
+        (
+            'kitchen_idempotent_replays_total',
+            'Retried requests answered with a stored response.',
+            idempotency_cache.stats()['replayed'],
+        ),
+        ('kitchen_admission_admitted_total', 'Requests admitted.', admission_stats['admitted']),
+        ('kitchen_admission_shed_total', 'Requests rejected with 503 by load shedding.', admission_stats['shed']),
+    ]
+    if engine is None:
+        return counters
+    stats = engine.stats()
+    return counters + [
+        ('kitchen_schedules_started_total', 'Schedules moved to progress.', stats['started']),
+        ('kitchen_schedules_finished_total', 'Schedules finished.', stats['finished']),
+        ('kitchen_schedules_cancelled_total', 'Queued or running schedules cancelled.', stats['cancelled']),
+    ]
+
+
+# ルートごとのリクエスト数とレイテンシー、スケジュールの件数と実行エンジンの
+# 待ち行列の長さ、スループットを /metrics で公開する
+metrics = RequestMetrics(MetricsRegistry(), gauges=metrics_gauges, counters=metrics_counters)
+metrics.init_app(app)
+admission.init_app(app)
+idempotency.init_app(app)
+
+# API 仕様書はビルド時にコンパイルした JSON を最初のリクエストで読み込み、
+# エンコード済みのバイト列のまま返す。flask-smorest が登録するビュー関数は
+# リクエストのたびにディクショナリを JSON にエンコードするので、差し替える
+openapi_document = OpenAPIDocument(Path(__file__).parent / 'oas.yaml')
+kitchen_api.spec.to_dict = openapi_document.document
+
+
+def openapi_json():
+    return app.response_class(openapi_document.content(), mimetype='application/json')
+
+
+app.view_functions['api-docs.openapi_json'] = openapi_json
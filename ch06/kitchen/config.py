@@ -1,3 +1,6 @@
+import os
+
+
 class BaseConfig:
     API_TITLE = 'Kitchen API'
     API_VERSION = 'v1'
@@ -8,6 +11,47 @@ class BaseConfig:
     OPENAPI_REDOC_URL = 'https://cdn.jsdelivr.net/npm/redoc@next/bundles/redoc.standalone.js'  # noqa: E501
     OPENAPI_SWAGGER_UI_PATH = '/docs/kitchen'
     OPENAPI_SWAGGER_UI_URL = 'https://cdn.jsdelivr.net/npm/swagger-ui-dist/'
+    # スケジュールの保存先: 'memory'（インメモリ）、'journal'（ジャーナルで永続化する
+    # インメモリ）、'sqlite' または 'shared'（共有ストアのサーバー）
+    STORAGE_BACKEND = os.getenv('KITCHEN_STORAGE_BACKEND', 'memory')
+    SQLITE_PATH = os.getenv('KITCHEN_SQLITE_PATH', 'kitchen.db')
+    JOURNAL_DIR = os.getenv('KITCHEN_JOURNAL_DIR', 'kitchen-journal')
+    # この件数のレコードを追記するごとにスナップショットを書き出す
+    JOURNAL_SNAPSHOT_EVERY = int(os.getenv('KITCHEN_JOURNAL_SNAPSHOT_EVERY', 100_000))
+    # Idempotency-Key ヘッダーとバッチの冪等キーごとに保存する結果の最大件数と保存期間（秒）
+    IDEMPOTENCY_CACHE_SIZE = int(os.getenv('KITCHEN_IDEMPOTENCY_CACHE_SIZE', 10_000))
+    IDEMPOTENCY_TTL = float(os.getenv('KITCHEN_IDEMPOTENCY_TTL', 86_400))
+    # 複数のワーカープロセスでスケジュールを共有するストアのサーバーの UNIX ソケットと
+    # 認証キー。サーバー自身の保存先は SHARED_STORE_BACKEND（'memory' または 'journal'）
+    SHARED_STORE_SOCKET = os.getenv('KITCHEN_SHARED_STORE_SOCKET', 'kitchen-store.sock')
+    SHARED_STORE_AUTHKEY = os.getenv('KITCHEN_SHARED_STORE_AUTHKEY', 'kitchen-store').encode()
+    SHARED_STORE_BACKEND = os.getenv('KITCHEN_SHARED_STORE_BACKEND', 'memory')
+    # 変更フィードのリングバッファに保持するイベントの件数
+    CHANGE_FEED_SIZE = int(os.getenv('KITCHEN_CHANGE_FEED_SIZE', 10_000))
+    # 終了状態のスケジュールを移す圧縮アーカイブのディレクトリ。スケジュールは予定日時から
+    # RETENTION_AGE 秒を過ぎたものを RETENTION_INTERVAL 秒ごとに移す。0 の場合は移さない
+    ARCHIVE_DIR = os.getenv('KITCHEN_ARCHIVE_DIR', 'kitchen-archive')
+    RETENTION_AGE = float(os.getenv('KITCHEN_RETENTION_AGE', 0))
+    RETENTION_INTERVAL = float(os.getenv('KITCHEN_RETENTION_INTERVAL', 60))
+    RETENTION_BATCH_SIZE = int(os.getenv('KITCHEN_RETENTION_BATCH_SIZE', 1000))
+    # 同時に処理するリクエストの数の上限と、一覧などの重いリクエストに使える割合。
+    # 待ち行列で待つのはワーカースレッドなので、サーバーのスレッド数以下に設定する
+    ADMISSION_CAPACITY = int(os.getenv('KITCHEN_ADMISSION_CAPACITY', 32))
+    ADMISSION_LOW_PRIORITY_SHARE = float(os.getenv('KITCHEN_ADMISSION_LOW_PRIORITY_SHARE', 0.5))
+    # 上限に達している間に待たせるリクエストの件数と、待たせる時間（秒）の上限
+    ADMISSION_QUEUE_SIZE = int(os.getenv('KITCHEN_ADMISSION_QUEUE_SIZE', 64))
+    ADMISSION_QUEUE_TIMEOUT = float(os.getenv('KITCHEN_ADMISSION_QUEUE_TIMEOUT', 0.5))
+    # クライアントごとの 1 秒あたりのリクエスト数と、一度に送れるリクエスト数。
+    # ADMISSION_RATE が 0（既定値）の場合はレート制限を行わない
+    ADMISSION_RATE = float(os.getenv('KITCHEN_ADMISSION_RATE', 0))
+    ADMISSION_BURST = int(os.getenv('KITCHEN_ADMISSION_BURST', 200))
+    # 同時に調理できるスケジュールの数（調理ステーションの数）。0 の場合は
+    # 実行エンジンを起動せず、スケジュールは保留中のままになる。
+    # 保存先が 'shared' の場合は、ストアのサーバーとワーカーで同じ値を設定する
+    STATIONS = int(os.getenv('KITCHEN_STATIONS', 4))
+    # 1 件のスケジュールの調理時間（秒）は PREPARATION_TIME + TIME_PER_ITEM * 品数
+    PREPARATION_TIME = float(os.getenv('KITCHEN_PREPARATION_TIME', 60))
+    TIME_PER_ITEM = float(os.getenv('KITCHEN_TIME_PER_ITEM', 30))
 
 
 class Production(BaseConfig):
@@ -0,0 +1,203 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+
+from coffeemesh.repository.query import Query
+
+from repository.schedules_repository import VersionConflict
+
+
+logger = logging.getLogger(__name__)
+
+
+# 保留中のスケジュールを調理ステーションで順に調理し、ステータスを
+# pending -> progress -> finished と進める実行エンジン
+# 待ち行列は scheduled の早い順、同じ時刻なら品数の少ない順に並べたヒープで、
+# ステーションの数だけのワーカースレッドが取り出して調理する。
+# 調理時間は preparation_time + time_per_item * 品数（秒）でモデル化する
+class KitchenEngine:
+
+    def __init__(
+        self,
+        repository,
+        stations=4,
+        preparation_time=60.0,
+        time_per_item=30.0,
+        publish=None,
+        throughput_window=60.0,
+    ):
+        self._repository = repository
+        self.stations = stations
+        self._preparation_time = preparation_time
+        self._time_per_item = time_per_item
+        # ステータスを変更したときに (イベントの種類, スケジュール) で呼び出す関数
+        self._publish = publish
+        self._throughput_window = throughput_window
+        self._condition = threading.Condition()
+        # [scheduled, 品数, 追加順, スケジュール ID] のヒープ。
+        # 取り消したエントリは ID を None にして残し、取り出したときに読み飛ばす
+        self._queue = []
+        # スケジュール ID -> 待ち行列のエントリ
+        self._queued = {}
+        # 調理中のスケジュール ID -> 調理を中断するためのイベント
+        self._running = {}
+        self._sequence = itertools.count()
+        self._stopped = False
+        self._threads = []
+        # 直近 throughput_window 秒に調理を終えた時刻（time.monotonic()）
+        self._finished_at = deque()
+        self.started = 0
+        self.finished = 0
+        self.cancelled = 0
+
+    def start(self):
+        self._stopped = False
+        # 再起動前に調理中だったスケジュールは保留中に戻し、保留中のスケジュールと
+        # 合わせて待ち行列に入れ直す
+        for schedule in list(self._repository.scan(Query(status='progress'))):
+            self._transition(schedule['id'], 'progress', 'pending')
+        for schedule in list(self._repository.scan(Query(status='pending'))):
+            self.submit(schedule)
+        for number in range(self.stations):
+            thread = threading.Thread(
+                target=self._run, name=f'kitchen-station-{number}', daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            # 調理中のスケジュールを中断し、保留中に戻させる
+            for interrupted in self._running.values():
+                interrupted.set()
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+
+    def submit(self, schedule):
+        # 保留中のスケジュールを待ち行列に入れる。すでに入っている場合は
+        # 品数が変わっている可能性があるので、古いエントリを取り消して入れ直す
+        items = sum(item['quantity'] for item in schedule['order'])
+        with self._condition:
+            previous = self._queued.get(schedule['id'])
+            if previous is not None:
+                previous[-1] = None
+            entry = [schedule['scheduled'], items, next(self._sequence), schedule['id']]
+            self._queued[schedule['id']] = entry
+            heapq.heappush(self._queue, entry)
+            self._condition.notify()
+
+    def cancel(self, schedule_id):
+        # 待ち行列のスケジュールは取り消し、調理中のスケジュールは中断して
+        # ステーションを空ける。どちらでもなければ False を返す
+        with self._condition:
+            entry = self._queued.pop(schedule_id, None)
+            if entry is not None:
+                entry[-1] = None
+                self.cancelled += 1
+                return True
+            interrupted = self._running.get(schedule_id)
+            if interrupted is not None:
+                interrupted.set()
+                self.cancelled += 1
+                return True
+        return False
+
+    def stats(self):
+        with self._condition:
+            self._expire_finished(time.monotonic())
+            return {
+                'queue_depth': len(self._queued),
+                'busy_stations': len(self._running),
+                'stations': self.stations,
+                'started': self.started,
+                'finished': self.finished,
+                'cancelled': self.cancelled,
+                # 直近 throughput_window 秒に調理を終えたスケジュールの件数（1 秒あたり）
+                'throughput': len(self._finished_at) / self._throughput_window,
+            }
+
+    def _run(self):
+        while True:
+            with self._condition:
+                entry = self._next_entry()
+                if entry is None:
+                    return
+                _, items, _, schedule_id = entry
+                del self._queued[schedule_id]
+                # 取り出した後、ステータスを変更する前に更新されたスケジュールは待ち行列に
+                # 入れ直されるので、別のステーションが調理中の場合は読み飛ばす
+                if schedule_id in self._running:
+                    continue
+                interrupted = self._running[schedule_id] = threading.Event()
+            try:
+                self._prepare(schedule_id, items, interrupted)
+            except Exception:
+                logger.exception('Failed to prepare schedule %s', schedule_id)
+            finally:
+                with self._condition:
+                    if self._running.get(schedule_id) is interrupted:
+                        del self._running[schedule_id]
+
+    def _next_entry(self):
+        # 取り消されていないエントリが入るか、停止するまで待つ
+        while not self._stopped:
+            while self._queue:
+                entry = heapq.heappop(self._queue)
+                if entry[-1] is not None:
+                    return entry
+            self._condition.wait()
+        return None
+
+    def _prepare(self, schedule_id, items, interrupted):
+        # 待ち行列にある間に API からキャンセルや削除された場合は調理しない
+        schedule = self._transition(schedule_id, 'pending', 'progress')
+        if schedule is None:
+            return
+        with self._condition:
+            self.started += 1
+        self._notify('schedule.started', schedule)
+
+        if interrupted.wait(self._preparation_time + self._time_per_item * items):
+            # cancel() による中断の場合は、API がすでにステータスを変更している。
+            # 停止による中断の場合は、再起動後に調理し直せるように保留中に戻す
+            if self._stopped:
+                self._transition(schedule_id, 'progress', 'pending')
+            return
+
+        schedule = self._transition(schedule_id, 'progress', 'finished')
+        if schedule is None:
+            return
+        with self._condition:
+            self.finished += 1
+            now = time.monotonic()
+            self._finished_at.append(now)
+            self._expire_finished(now)
+        self._notify('schedule.finished', schedule)
+
+    def _transition(self, schedule_id, current, status):
+        # ステータスが current のままの場合だけ status に変更する。
+        # 読み取りから変更までの間に API から変更された場合は、読み直してやり直す
+        while True:
+            schedule = self._repository.get(schedule_id)
+            if schedule is None or schedule['status'] != current:
+                return None
+            try:
+                return self._repository.update(
+                    schedule_id, if_match={schedule['version']}, status=status
+                )
+            except VersionConflict:
+                continue
+
+    def _notify(self, event_type, schedule):
+        if self._publish is not None:
+            self._publish(event_type, schedule)
+
+    def _expire_finished(self, now):
+        while self._finished_at and self._finished_at[0] < now - self._throughput_window:
+            self._finished_at.popleft()
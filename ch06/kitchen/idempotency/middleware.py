@@ -0,0 +1,75 @@
+import hashlib
+
+from flask import Response, g, request
+from flask_smorest import abort
+
+from coffeemesh.idempotency.cache import IN_PROGRESS, MISMATCH, NEW
+
+
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+
+# Idempotency-Key ヘッダーの付いたリクエストのレスポンスを保存し、同じキーの再送には
+# 保存したレスポンスをそのまま返す
+# before_request はビュー関数のデコレーターより前に呼び出されるので、再送では
+# リクエストボディの検証もビュー関数も実行しない。キーはメソッド、パス、
+# Authorization ヘッダーごとに区別し、同じキーで別のボディを送った場合は 422、
+# 最初のリクエストの処理中に再送した場合は 409 を返す。5xx のレスポンスは保存せず、
+# 再送で処理し直す。
+# routes には (メソッド, ルールのパス) のリストを渡す。RequestMetrics の後に
+# init_app() を呼び出し、再送のレスポンスもメトリクスに記録させる
+class Idempotency:
+
+    def __init__(self, cache, routes):
+        self.cache = cache
+        self.routes = set(routes)
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        if request.url_rule is None or (request.method, request.url_rule.rule) not in self.routes:
+            return None
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            return None
+        if len(key) > MAX_KEY_LENGTH:
+            abort(400, message=f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters')
+
+        cache_key = (request.method, request.path, request.headers.get('Authorization'), key)
+        state, response = self.cache.begin(cache_key, hashlib.sha256(request.get_data()).digest())
+        if state == NEW:
+            g.idempotency_key = cache_key
+            return None
+        if state == MISMATCH:
+            abort(422, message='Idempotency-Key was already used with a different request body')
+        if state == IN_PROGRESS:
+            abort(
+                409,
+                message='A request with this Idempotency-Key is being processed',
+                headers={'Retry-After': '1'},
+            )
+        status_code, headers, content = response
+        return Response(content, status_code, headers + [(REPLAYED_HEADER, 'true')])
+
+    def _after_request(self, response):
+        cache_key = g.pop('idempotency_key', None)
+        if cache_key is None:
+            return response
+        if response.status_code >= 500 or response.is_streamed:
+            self.cache.abandon(cache_key)
+        else:
+            self.cache.complete(
+                cache_key,
+                (response.status_code, list(response.headers.items()), response.get_data()),
+            )
+        return response
+
+    def _teardown_request(self, exception):
+        # 処理されなかった例外で終わったリクエストは after_request が呼び出されない
+        cache_key = g.pop('idempotency_key', None)
+        if cache_key is not None:
+            self.cache.abandon(cache_key)
@@ -0,0 +1,108 @@
+import functools
+from contextvars import ContextVar
+from time import perf_counter
+
+from flask import Response, request
+from flask_smorest import Blueprint
+
+from coffeemesh.metrics.registry import CONTENT_TYPE, RequestTimer
+
+
+# 処理中のリクエストの RequestTimer。before_request で設定し、
+# InstrumentedBlueprint のデコレーターがハンドラーの開始と終了の時刻を書き込む
+current_timer = ContextVar('current_timer', default=None)
+
+
+# ルートごとのリクエスト数、処理中のリクエスト数とレイテンシーを記録し、
+# /metrics で Prometheus のテキスト形式で公開する
+# gauges と counters には、/metrics の出力時に (メトリクス名, 説明, 値) のタプルの
+# リストを返す関数を渡す
+class RequestMetrics:
+
+    def __init__(self, registry, gauges=None, counters=None):
+        self.registry = registry
+        self._gauges = gauges
+        self._counters = counters
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule('/metrics', 'metrics', self._metrics)
+
+    def _before_request(self):
+        # ルーティングの後、ビュー関数のデコレーターが引数を検証する前に呼び出される
+        timer = RequestTimer(self.registry)
+        current_timer.set(timer)
+        if request.url_rule is not None:
+            timer.dispatch(request.method, request.url_rule.rule)
+
+    def _after_request(self, response):
+        timer = current_timer.get()
+        if timer is not None:
+            timer.status = response.status_code
+        return response
+
+    def _teardown_request(self, exception):
+        # 処理されなかった例外で終わったリクエストは after_request が呼び出されないので、
+        # ステータスコードは 500 のまま記録する
+        timer = current_timer.get()
+        if timer is None:
+            return
+        current_timer.set(None)
+        if timer.dispatch_start is not None:
+            timer.dispatched()
+        timer.finish(request.method)
+
+    def _metrics(self):
+        gauges = self._gauges() if self._gauges is not None else ()
+        counters = self._counters() if self._counters is not None else ()
+        return Response(self.registry.render(gauges, counters), content_type=CONTENT_TYPE)
+
+
+# ビュー関数の開始と終了の時刻を記録する Blueprint
+# arguments() で登録したモデルによる検証が終わった時点をハンドラーの開始、
+# ビュー関数が戻った時点をハンドラーの終了とし、その後の response() のスキーマによる
+# ダンプと JSON への変換をシリアライズのフェーズとして記録する
+class InstrumentedBlueprint(Blueprint):
+
+    def arguments(self, schema, **kwargs):
+        decorator = super().arguments(schema, **kwargs)
+        return lambda func: decorator(_mark_handler_start(func))
+
+    def response(self, status_code, schema=None, **kwargs):
+        decorator = super().response(status_code, schema, **kwargs)
+        return lambda func: decorator(_mark_handler(func))
+
+
+def _mark_handler_start(func):
+    @functools.wraps(func)
+    def marked(*args, **kwargs):
+        timer = current_timer.get()
+        if timer is not None:
+            timer.handler_start = perf_counter()
+        return func(*args, **kwargs)
+
+    # response() のデコレーターに、引数の検証の後でハンドラーの開始を記録することを知らせる
+    marked._marks_handler_start = True
+    return marked
+
+
+def _mark_handler(func):
+    # arguments() を付けていないビュー関数は、呼び出した時点をハンドラーの開始とする
+    marks_start = getattr(func, '_marks_handler_start', False)
+
+    @functools.wraps(func)
+    def marked(*args, **kwargs):
+        timer = current_timer.get()
+        if timer is None:
+            return func(*args, **kwargs)
+        if not marks_start:
+            timer.handler_start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if timer.handler_start is not None:
+                timer.handler_end = perf_counter()
+
+    return marked
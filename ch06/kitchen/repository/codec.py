@@ -0,0 +1,16 @@
+from datetime import datetime
+
+
+# 保存用に、スケジュールを JSON に変換できるディクショナリに変換する
+def dump_schedule(schedule):
+    return {**schedule, 'scheduled': schedule['scheduled'].isoformat()}
+
+
+# dump_schedule() で変換したディクショナリからスケジュールを復元する
+def load_schedule(data):
+    return {
+        # 版数を導入する前に保存されたスケジュールは版数 1 として扱う
+        'version': 1,
+        **data,
+        'scheduled': datetime.fromisoformat(data['scheduled']),
+    }
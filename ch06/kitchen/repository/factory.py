@@ -0,0 +1,21 @@
+from repository.journaled_repository import JournaledScheduleRepository
+from repository.schedules_repository import ScheduleRepository
+from repository.shared_repository import SharedScheduleRepository
+from repository.sqlite_repository import SqliteScheduleRepository
+
+
+# 設定の STORAGE_BACKEND に応じてスケジュールリポジトリを生成する
+# backend を指定すると、設定の代わりにその保存先を使う
+def create_schedule_repository(config, backend=None):
+    backend = backend or config.STORAGE_BACKEND
+    if backend == 'memory':
+        return ScheduleRepository()
+    if backend == 'journal':
+        return JournaledScheduleRepository(
+            config.JOURNAL_DIR, snapshot_every=config.JOURNAL_SNAPSHOT_EVERY
+        )
+    if backend == 'sqlite':
+        return SqliteScheduleRepository(config.SQLITE_PATH)
+    if backend == 'shared':
+        return SharedScheduleRepository(config.SHARED_STORE_SOCKET, config.SHARED_STORE_AUTHKEY)
+    raise ValueError(f'Unknown storage backend {backend}')
@@ -0,0 +1,98 @@
+import threading
+
+from coffeemesh.repository.journal import Journal
+
+from repository.codec import dump_schedule, load_schedule
+from repository.schedules_repository import ScheduleRepository
+
+
+# ジャーナルで永続化するインメモリのスケジュールリポジトリ
+# 読み取りは ScheduleRepository のインデックスをそのまま使い、変更操作だけを
+# ジャーナルに追記する。起動時はスナップショットとジャーナルから状態を復元する
+class JournaledScheduleRepository(ScheduleRepository):
+
+    def __init__(self, directory, snapshot_every=100_000, sync_interval=0):
+        super().__init__()
+        self._journal = Journal(directory, sync_interval=sync_interval)
+        self._snapshot_every = snapshot_every
+        self._snapshot_thread = None
+        for record in self._journal.load():
+            self._replay(record)
+
+    def _replay(self, record):
+        if record['op'] == 'delete':
+            super().delete(record['id'])
+            return
+        schedule = load_schedule(record['schedule'])
+        if schedule['id'] in self:
+            # 版数は再生中に数え直さず、記録された値をそのまま使う
+            super().update(schedule['id'], **schedule)['version'] = schedule['version']
+        else:
+            super().add(schedule)
+
+    def _commit(self, position):
+        # グループコミットで fsync されるまで待ってから呼び出し元に戻る
+        self._journal.wait(position)
+        if self._journal.records_since_snapshot >= self._snapshot_every:
+            self.snapshot(wait=False)
+
+    # インメモリの変更とジャーナルへの追記は同じロックの中で行い、順序をそろえる
+    def add(self, schedule):
+        with self._lock:
+            super().add(schedule)
+            position = self._journal.append({'op': 'put', 'schedule': dump_schedule(schedule)})
+        self._commit(position)
+        return schedule
+
+    def add_many(self, schedules):
+        # まとめて追記し、最後のレコードの fsync を 1 回だけ待つ
+        if not schedules:
+            return schedules
+        with self._lock:
+            super().add_many(schedules)
+            for schedule in schedules:
+                position = self._journal.append({'op': 'put', 'schedule': dump_schedule(schedule)})
+        self._commit(position)
+        return schedules
+
+    def update(self, schedule_id, if_match=None, **fields):
+        with self._lock:
+            schedule = super().update(schedule_id, if_match=if_match, **fields)
+            if schedule is None:
+                return None
+            position = self._journal.append({'op': 'put', 'schedule': dump_schedule(schedule)})
+        self._commit(position)
+        return schedule
+
+    def delete(self, schedule_id, if_match=None):
+        with self._lock:
+            if not super().delete(schedule_id, if_match=if_match):
+                return False
+            position = self._journal.append({'op': 'delete', 'id': schedule_id})
+        self._commit(position)
+        return True
+
+    def snapshot(self, wait=True):
+        # スナップショットはバックグラウンドのスレッドで書き出し、ジャーナルを圧縮する。
+        # 世代の切り替えと、スナップショットに含めるスケジュールのコピーは同じロックの
+        # 中で行い、その間の変更がどちらにも記録されない状態を作らない
+        with self._lock:
+            if self._snapshot_thread is None or not self._snapshot_thread.is_alive():
+                generation = self._journal.rotate()
+                schedules = list(self._schedules.values())
+                records = (
+                    {'op': 'put', 'schedule': dump_schedule(schedule)}
+                    for schedule in schedules
+                )
+                self._snapshot_thread = threading.Thread(
+                    target=self._journal.write_snapshot, args=(generation, records), daemon=True
+                )
+                self._snapshot_thread.start()
+            thread = self._snapshot_thread
+        if wait:
+            thread.join()
+
+    def close(self):
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join()
+        self._journal.close()
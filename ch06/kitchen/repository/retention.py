@@ -0,0 +1,21 @@
+from coffeemesh.repository.retention import Retention
+
+from repository.codec import dump_schedule
+from repository.schedules_repository import VersionConflict
+
+
+# 予定日時から age 秒を過ぎた、これ以上変更されることのないスケジュールをアーカイブに移す
+class ScheduleRetention(Retention):
+
+    statuses = ('cancelled', 'finished')
+    conflict = VersionConflict
+    name = 'kitchen-retention'
+
+    def dump(self, schedule):
+        return dump_schedule(schedule)
+
+    def identity(self, schedule):
+        return schedule['id']
+
+    def cursor(self, schedule):
+        return (schedule['scheduled'], schedule['id'])
@@ -0,0 +1,204 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from coffeemesh.repository.query import HashIndex, QueryEngine
+from coffeemesh.repository.stats import Aggregates, bucket_of, render_stats
+from repository.stats import schedule_contributions
+
+
+# If-Match で指定された版数が、スケジュールの現在の版数と一致しない場合の例外
+class VersionConflict(Exception):
+
+    def __init__(self, version):
+        super().__init__(f'Schedule version {version} does not match')
+        self.version = version
+
+    # 共有ストアのサーバーからワーカーに送り返せるように、版数から復元する
+    def __reduce__(self):
+        return type(self), (self.version,)
+
+
+# インメモリのスケジュールリポジトリ
+# ID のハッシュインデックス、ステータス、商品名、サイズのインデックス、scheduled の
+# ソート済みインデックスを持ち、すべての変更操作で同期する
+class ScheduleRepository:
+
+    def __init__(self):
+        # 変更操作でインデックスと版数を同期している間、他のスレッドからの変更を待たせる
+        self._lock = threading.RLock()
+        # コレクション全体の版数。変更操作のたびに 1 ずつ増やす。
+        # 再起動しても以前の版数と重ならないように、起動時刻（マイクロ秒）から数え始める
+        self._version = time.time_ns() // 1000
+        # ID -> スケジュール
+        self._schedules = {}
+        # ステータス、明細の商品名、明細のサイズ -> {ID: None}
+        self._status_index = HashIndex()
+        self._product_index = HashIndex()
+        self._size_index = HashIndex()
+        # (scheduled, ID) のタプルを scheduled の昇順で保持する。リストの途中の削除は O(n) なので、
+        # 削除や scheduled の変更では古いエントリを墓石として残し、走査時に読み飛ばす。墓石が増えたら詰め直す
+        self._scheduled_index = []
+        self._tombstones = 0
+        # ステータスごとの件数などの集計。変更操作のたびに差分だけを加減する
+        self._stats = Aggregates()
+        # 一覧の絞り込みは、これらのインデックスを使ってクエリエンジンで実行する。
+        # クエリエンジンも墓石を読み飛ばす
+        self._query = QueryEngine(
+            self._schedules,
+            lambda: self._scheduled_index,
+            _scheduled_key,
+            {
+                'status': self._status_index,
+                'product': self._product_index,
+                'size': self._size_index,
+            },
+        )
+
+    @contextmanager
+    def batch(self):
+        # インメモリのリポジトリでは、書き込みはその場で反映される
+        yield self
+
+    def __len__(self):
+        return len(self._schedules)
+
+    def __contains__(self, schedule_id):
+        return schedule_id in self._schedules
+
+    def version(self):
+        return self._version
+
+    def add(self, schedule):
+        with self._lock:
+            # スケジュールごとの版数は 1 から始め、変更のたびに 1 ずつ増やす
+            schedule.setdefault('version', 1)
+            self._version += 1
+            self._index_scheduled(_scheduled_key(schedule))
+            self._schedules[schedule['id']] = schedule
+            self._status_index.add(schedule['id'], (schedule['status'],))
+            self._index_items(schedule)
+            self._stats.apply(schedule_contributions(schedule))
+        return schedule
+
+    def add_many(self, schedules):
+        with self._lock:
+            for schedule in schedules:
+                ScheduleRepository.add(self, schedule)
+        return schedules
+
+    def get(self, schedule_id):
+        return self._schedules.get(schedule_id)
+
+    # if_match に版数の集合を指定すると、現在の版数が含まれない場合は VersionConflict を送出する
+    def update(self, schedule_id, if_match=None, **fields):
+        with self._lock:
+            schedule = self._schedules.get(schedule_id)
+            if schedule is None:
+                return None
+            version = schedule['version']
+            if if_match is not None and version not in if_match:
+                raise VersionConflict(version)
+            status = fields.get('status', schedule['status'])
+            if status != schedule['status']:
+                self._status_index.remove(schedule_id, (schedule['status'],))
+                self._status_index.add(schedule_id, (status,))
+            reindex_items = 'order' in fields
+            if reindex_items:
+                self._unindex_items(schedule)
+            scheduled = fields.get('scheduled', schedule['scheduled'])
+            rescheduled = scheduled != schedule['scheduled']
+            if rescheduled:
+                self._index_scheduled((scheduled, schedule_id))
+            previous = schedule_contributions(schedule)
+            schedule.update(fields)
+            if reindex_items:
+                self._index_items(schedule)
+            self._stats.apply(previous, -1)
+            self._stats.apply(schedule_contributions(schedule))
+            schedule['version'] = version + 1
+            self._version += 1
+            # 古い scheduled のエントリは墓石になる
+            if rescheduled:
+                self._add_tombstone()
+        return schedule
+
+    def delete(self, schedule_id, if_match=None):
+        with self._lock:
+            schedule = self._schedules.get(schedule_id)
+            if schedule is None:
+                return False
+            if if_match is not None and schedule['version'] not in if_match:
+                raise VersionConflict(schedule['version'])
+            del self._schedules[schedule_id]
+            self._status_index.remove(schedule_id, (schedule['status'],))
+            self._unindex_items(schedule)
+            self._stats.apply(schedule_contributions(schedule), -1)
+            self._version += 1
+            self._add_tombstone()
+        return True
+
+    # query には絞り込み条件の Query を指定する。結果は scheduled の順で返す。
+    # after には直前のページの最後のスケジュールの (scheduled, ID) を指定し、
+    # その次のスケジュールから返す（キーセットページネーション）
+    def list(self, query=None, after=None, limit=None):
+        return self._query.list(query, after, limit)
+
+    def scan(self, query=None, after=None):
+        # スケジュールを scheduled の順に 1 件ずつ返すジェネレータ。
+        # 結果をリストに溜めないので、一定のメモリで全件を走査できる
+        return self._query.scan(query, after)
+
+    def count(self, status=None):
+        if status is None:
+            return len(self._schedules)
+        return len(self._status_index.ids(status))
+
+    def stats(self, buckets=24):
+        # 集計を返す。時間帯は現在の時間帯までの直近 buckets 個
+        last = bucket_of(datetime.utcnow())
+        with self._lock:
+            counts = {kind: self._stats.counts(kind) for kind in ('status', 'product', 'size')}
+            recent = self._stats.buckets(last - buckets + 1, last)
+        return render_stats(counts, recent, 'schedules')
+
+    def _index_items(self, schedule):
+        self._product_index.add(schedule['id'], {item['product'] for item in schedule['order']})
+        self._size_index.add(schedule['id'], {item['size'] for item in schedule['order']})
+
+    def _unindex_items(self, schedule):
+        self._product_index.remove(schedule['id'], {item['product'] for item in schedule['order']})
+        self._size_index.remove(schedule['id'], {item['size'] for item in schedule['order']})
+
+    def _index_scheduled(self, key):
+        # 新しいスケジュールの scheduled はほとんど現在時刻なので、末尾に追加できる
+        if not self._scheduled_index or self._scheduled_index[-1] < key:
+            self._scheduled_index.append(key)
+            return
+        index = bisect.bisect_left(self._scheduled_index, key)
+        # 同じキーの墓石が残っていれば、それを生き返らせて重複させない
+        if index < len(self._scheduled_index) and self._scheduled_index[index] == key:
+            if not self._is_live(key):
+                self._tombstones -= 1
+            return
+        self._scheduled_index.insert(index, key)
+
+    def _add_tombstone(self):
+        self._tombstones += 1
+        if self._tombstones > len(self._schedules):
+            self._compact_scheduled_index()
+
+    def _compact_scheduled_index(self):
+        # 走査中のクエリエンジンが同じリストの位置を二分探索し直せるように、その場で詰める
+        self._scheduled_index[:] = [key for key in self._scheduled_index if self._is_live(key)]
+        self._tombstones = 0
+
+    def _is_live(self, key):
+        schedule = self._schedules.get(key[1])
+        return schedule is not None and _scheduled_key(schedule) == key
+
+
+def _scheduled_key(schedule):
+    return schedule['scheduled'], schedule['id']
@@ -0,0 +1,192 @@
+import os
+import signal
+import sys
+from contextlib import contextmanager
+from multiprocessing.managers import BaseManager
+
+
+# 共有ストアのサーバーが公開するリポジトリと実行エンジン、変更フィード、
+# 冪等キーのキャッシュのメソッド
+_EXPOSED = (
+    'get', 'list', 'version', 'count', 'add', 'add_many', 'update', 'delete', 'stats',
+)
+_ENGINE_EXPOSED = ('submit', 'cancel', 'stats')
+_FEED_EXPOSED = ('publish', 'since', 'wait', 'position')
+_IDEMPOTENCY_EXPOSED = ('begin', 'complete', 'abandon', 'stats')
+
+
+class _StoreManager(BaseManager):
+    pass
+
+
+_StoreManager.register('repository')
+_StoreManager.register('engine')
+_StoreManager.register('feed')
+_StoreManager.register('idempotency')
+
+
+# 複数のワーカープロセスで共有するスケジュールリポジトリのクライアント
+# スケジュールは 1 つのストアのサーバープロセスが持ち、すべての読み書きを UNIX ソケット
+# 経由でそのプロセスのリポジトリに転送する。書き込むのはサーバーだけなので
+# （シングルライター）、どのワーカーから読んでも同じ状態が見え、版数と If-Match による
+# 排他制御もサーバーのリポジトリのロックの中で行われる
+class SharedScheduleRepository:
+
+    def __init__(self, address, authkey):
+        self._manager = _StoreManager(address=address, authkey=authkey)
+        self._manager.connect()
+        self._repository = self._manager.repository()
+
+    def engine(self):
+        # 実行エンジンはワーカーごとに起動せず、サーバーで 1 つだけ動かす。
+        # 待ち行列への追加と取り消しはこのプロキシ経由でサーバーのエンジンに送る
+        return self._manager.engine()
+
+    def feed(self):
+        # 変更フィードもサーバーで 1 つだけ持ち、イベントはこのプロキシ経由で発行する
+        return self._manager.feed()
+
+    def idempotency(self):
+        # 一括作成の冪等キーのキャッシュもサーバーで 1 つだけ持ち、別のワーカーに届いた
+        # 再送も重複排除する
+        return self._manager.idempotency()
+
+    @contextmanager
+    def batch(self):
+        # 各操作はサーバーでその場で反映される
+        yield self
+
+    def __len__(self):
+        return self.count()
+
+    def __contains__(self, schedule_id):
+        return self.get(schedule_id) is not None
+
+    def version(self):
+        return self._repository.version()
+
+    def add(self, schedule):
+        # サーバーに送るのはコピーなので、呼び出し元のスケジュールにも版数を設定しておく
+        schedule.setdefault('version', 1)
+        self._repository.add(schedule)
+        return schedule
+
+    def add_many(self, schedules):
+        for schedule in schedules:
+            schedule.setdefault('version', 1)
+        self._repository.add_many(schedules)
+        return schedules
+
+    def get(self, schedule_id):
+        return self._repository.get(schedule_id)
+
+    def update(self, schedule_id, if_match=None, **fields):
+        return self._repository.update(schedule_id, if_match=if_match, **fields)
+
+    def delete(self, schedule_id, if_match=None):
+        return self._repository.delete(schedule_id, if_match=if_match)
+
+    def list(self, query=None, after=None, limit=None):
+        return self._repository.list(query, after, limit)
+
+    def scan(self, query=None, after=None, chunk_size=500):
+        # サーバーのジェネレータは転送できないので、一定の件数ずつ
+        # キーセットページネーションで読み出す
+        while True:
+            chunk = self.list(query, after, chunk_size)
+            yield from chunk
+            if len(chunk) < chunk_size:
+                return
+            after = (chunk[-1]['scheduled'], chunk[-1]['id'])
+
+    def count(self, status=None):
+        return self._repository.count(status)
+
+    def stats(self, buckets=24):
+        return self._repository.stats(buckets)
+
+
+# 共有ストアのサーバー。repository と engine、feed、idempotency を address の
+# UNIX ソケットで公開し、停止するまで接続ごとのスレッドでリクエストを処理する
+def serve(repository, engine, feed, idempotency, address, authkey):
+    class ServerManager(BaseManager):
+        pass
+
+    ServerManager.register('repository', callable=lambda: repository, exposed=_EXPOSED)
+    if engine is not None:
+        ServerManager.register('engine', callable=lambda: engine, exposed=_ENGINE_EXPOSED)
+    ServerManager.register('feed', callable=lambda: feed, exposed=_FEED_EXPOSED)
+    ServerManager.register(
+        'idempotency', callable=lambda: idempotency, exposed=_IDEMPOTENCY_EXPOSED
+    )
+    # 前回のサーバーが残したソケットファイルがあるとバインドできないので削除する
+    if os.path.exists(address):
+        os.unlink(address)
+    server = ServerManager(address=address, authkey=authkey).get_server()
+    # ソケットには同じユーザーのプロセスだけが接続できるようにする
+    os.chmod(address, 0o600)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    # python -m repository.shared_repository
+    from coffeemesh.feed.change_feed import ChangeFeed
+    from coffeemesh.idempotency.cache import IdempotencyCache
+    from coffeemesh.repository.archive import Archive
+
+    from config import BaseConfig
+    from engine.kitchen_engine import KitchenEngine
+    from repository.factory import create_schedule_repository
+    from repository.retention import ScheduleRetention
+
+    if BaseConfig.SHARED_STORE_BACKEND not in ('memory', 'journal'):
+        raise SystemExit(f'Unsupported shared store backend {BaseConfig.SHARED_STORE_BACKEND}')
+    repository = create_schedule_repository(BaseConfig, backend=BaseConfig.SHARED_STORE_BACKEND)
+    feed = ChangeFeed(BaseConfig.CHANGE_FEED_SIZE)
+    idempotency = IdempotencyCache(BaseConfig.IDEMPOTENCY_CACHE_SIZE, BaseConfig.IDEMPOTENCY_TTL)
+
+    # 実行エンジンによるステータスの変更は、サーバーのフィードに直接発行する
+    def publish(event_type, schedule):
+        feed.publish(event_type, {
+            'id': schedule['id'],
+            'status': schedule['status'],
+            'version': schedule['version'],
+        })
+
+    engine = None
+    if BaseConfig.STATIONS > 0:
+        engine = KitchenEngine(
+            repository,
+            stations=BaseConfig.STATIONS,
+            preparation_time=BaseConfig.PREPARATION_TIME,
+            time_per_item=BaseConfig.TIME_PER_ITEM,
+            publish=publish,
+        )
+        engine.start()
+    # 保持期間を過ぎたスケジュールはサーバーがアーカイブに移し、ワーカーはアーカイブを
+    # 直接読み出す
+    retention = None
+    if BaseConfig.RETENTION_AGE > 0:
+        retention = ScheduleRetention(
+            repository,
+            Archive(BaseConfig.ARCHIVE_DIR),
+            BaseConfig.RETENTION_AGE,
+            interval=BaseConfig.RETENTION_INTERVAL,
+            batch_size=BaseConfig.RETENTION_BATCH_SIZE,
+        )
+        retention.start()
+    # SIGTERM でも終了処理を行い、調理中のスケジュールを保留中に戻してから終了する
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f'Serving schedules on {BaseConfig.SHARED_STORE_SOCKET}', flush=True)
+    try:
+        serve(
+            repository, engine, feed, idempotency,
+            BaseConfig.SHARED_STORE_SOCKET, BaseConfig.SHARED_STORE_AUTHKEY,
+        )
+    finally:
+        if retention is not None:
+            retention.stop()
+        if engine is not None:
+            engine.stop()
+        if hasattr(repository, 'close'):
+            repository.close()
@@ -0,0 +1,281 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from coffeemesh.repository.stats import KINDS, bucket_of, render_stats
+from repository.codec import dump_schedule, load_schedule
+from repository.schedules_repository import VersionConflict
+from repository.stats import schedule_contributions
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+# SQL 文は定数として定義し、sqlite3 の接続ごとのステートメントキャッシュで
+# プリペアドステートメントとして再利用されるようにする
+_SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS schedules (
+        id TEXT PRIMARY KEY,
+        scheduled INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        body TEXT NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS schedules_scheduled ON schedules (scheduled, id)',
+    'CREATE INDEX IF NOT EXISTS schedules_status ON schedules (status, scheduled, id)',
+    # ステータスごとの件数などの集計。スケジュールの変更と同じトランザクションで差分を加減する。
+    # key は種類によって文字列（ステータスなど）または整数（時間帯）になるので、型を指定しない
+    '''CREATE TABLE IF NOT EXISTS stats (
+        kind TEXT NOT NULL,
+        key NOT NULL,
+        value INTEGER NOT NULL,
+        PRIMARY KEY (kind, key)
+    )''',
+    # コレクション全体の版数。スケジュールが追加・変更・削除されるたびにトリガーで 1 ずつ増やし、
+    # 複数のプロセスから書き込んでも同じトランザクションの中で一貫して更新されるようにする
+    '''CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )''',
+    *(
+        f'''CREATE TRIGGER IF NOT EXISTS schedules_version_{event.lower()}
+        AFTER {event} ON schedules BEGIN
+            UPDATE meta SET value = value + 1 WHERE key = 'version';
+        END'''
+        for event in ('INSERT', 'UPDATE', 'DELETE')
+    ),
+)
+# データベースを作り直しても以前の版数と重ならないように、作成時刻（マイクロ秒）から数え始める
+_INIT_VERSION = "INSERT OR IGNORE INTO meta (key, value) VALUES ('version', ?)"
+_SELECT_VERSION = "SELECT value FROM meta WHERE key = 'version'"
+_INSERT = 'INSERT INTO schedules (id, scheduled, status, body) VALUES (?, ?, ?, ?)'
+_SELECT = 'SELECT body FROM schedules WHERE id = ?'
+_UPDATE = 'UPDATE schedules SET scheduled = ?, status = ?, body = ? WHERE id = ?'
+_DELETE = 'DELETE FROM schedules WHERE id = ?'
+_COUNT = 'SELECT COUNT(*) FROM schedules'
+_COUNT_STATUS = 'SELECT COUNT(*) FROM schedules WHERE status = ?'
+_UPDATE_STATS = '''INSERT INTO stats (kind, key, value) VALUES (?, ?, ?)
+    ON CONFLICT (kind, key) DO UPDATE SET value = value + excluded.value'''
+_SELECT_STATS = '''SELECT kind, key, value FROM stats
+    WHERE value != 0 AND (kind != 'bucket' OR key BETWEEN ? AND ?)'''
+_HAS_STATS = 'SELECT EXISTS (SELECT 1 FROM stats)'
+
+
+# SQLite を使った永続化されたスケジュールリポジトリ
+# ScheduleRepository と同じインターフェースを持ち、設定で切り替えて使う
+class SqliteScheduleRepository:
+
+    def __init__(self, path):
+        self._path = path
+        # スレッドごとの接続プール
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        connection = self._connection()
+        for statement in _SCHEMA:
+            connection.execute(statement)
+        connection.execute(_INIT_VERSION, (time.time_ns() // 1000,))
+        # 集計を導入する前に作成したデータベースは、既存のスケジュールから集計し直す
+        if not connection.execute(_HAS_STATS).fetchone()[0] and self.count():
+            with self.batch():
+                for schedule in self.scan():
+                    self._update_stats(schedule_contributions(schedule))
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # トランザクションは明示的に BEGIN / COMMIT で制御する
+            connection = sqlite3.connect(self._path, isolation_level=None)
+            # WAL モードでは読み取りが書き込みをブロックしない
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.depth = 0
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def close(self):
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    @contextmanager
+    def batch(self):
+        # ブロック内の書き込みを 1 つのトランザクションにまとめてコミットする
+        connection = self._connection()
+        if self._local.depth == 0:
+            connection.execute('BEGIN IMMEDIATE')
+        self._local.depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                connection.execute('ROLLBACK')
+            raise
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            connection.execute('COMMIT')
+
+    def __len__(self):
+        return self.count()
+
+    def __contains__(self, schedule_id):
+        return self.get(schedule_id) is not None
+
+    def version(self):
+        return self._connection().execute(_SELECT_VERSION).fetchone()[0]
+
+    def add(self, schedule):
+        schedule.setdefault('version', 1)
+        with self.batch() as repository:
+            repository._connection().execute(_INSERT, _to_row(schedule))
+            repository._update_stats(schedule_contributions(schedule))
+        return schedule
+
+    def add_many(self, schedules):
+        # 1 つのトランザクションでまとめて挿入する
+        for schedule in schedules:
+            schedule.setdefault('version', 1)
+        with self.batch() as repository:
+            repository._connection().executemany(
+                _INSERT, [_to_row(schedule) for schedule in schedules]
+            )
+            repository._update_stats([
+                contribution
+                for schedule in schedules for contribution in schedule_contributions(schedule)
+            ])
+        return schedules
+
+    def get(self, schedule_id):
+        row = self._connection().execute(_SELECT, (schedule_id,)).fetchone()
+        return _from_body(row[0]) if row is not None else None
+
+    # 版数の確認も変更と同じトランザクションの中で行う
+    def update(self, schedule_id, if_match=None, **fields):
+        with self.batch() as repository:
+            schedule = repository.get(schedule_id)
+            if schedule is None:
+                return None
+            version = schedule['version']
+            if if_match is not None and version not in if_match:
+                raise VersionConflict(version)
+            repository._update_stats(schedule_contributions(schedule), -1)
+            schedule.update(fields)
+            schedule['version'] = version + 1
+            row = _to_row(schedule)
+            repository._connection().execute(_UPDATE, row[1:] + row[:1])
+            repository._update_stats(schedule_contributions(schedule))
+        return schedule
+
+    def delete(self, schedule_id, if_match=None):
+        # 集計から差し引くために、削除するスケジュールを同じトランザクションで読み出す
+        with self.batch() as repository:
+            schedule = repository.get(schedule_id)
+            if schedule is None:
+                return False
+            if if_match is not None and schedule['version'] not in if_match:
+                raise VersionConflict(schedule['version'])
+            repository._connection().execute(_DELETE, (schedule_id,))
+            repository._update_stats(schedule_contributions(schedule), -1)
+        return True
+
+    def list(self, query=None, after=None, limit=None):
+        # 結果は (scheduled, id) の順で返す。予定日時の範囲と after はインデックスの
+        # 範囲検索になるので、O(log n + limit) で取り出せる
+        if limit is not None and limit <= 0:
+            return []
+        conditions, parameters = _conditions(query)
+        if after is not None:
+            conditions.append('(scheduled, id) > (?, ?)')
+            parameters.extend((_to_timestamp(after[0]), after[1]))
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        parameters.append(limit if limit is not None else -1)
+        rows = self._connection().execute(
+            f'SELECT body FROM schedules {where} ORDER BY scheduled, id LIMIT ?',
+            parameters,
+        )
+        return [_from_body(body) for (body,) in rows]
+
+    def scan(self, query=None, after=None, chunk_size=500):
+        # 一定の件数ずつキーセットページネーションで読み出すジェネレータ。
+        # 読み取りトランザクションをストリーミング中に保持し続けないようにする
+        while True:
+            chunk = self.list(query, after, chunk_size)
+            yield from chunk
+            if len(chunk) < chunk_size:
+                return
+            after = (chunk[-1]['scheduled'], chunk[-1]['id'])
+
+    def count(self, status=None):
+        if status is None:
+            return self._connection().execute(_COUNT).fetchone()[0]
+        return self._connection().execute(_COUNT_STATUS, (status,)).fetchone()[0]
+
+    def stats(self, buckets=24):
+        # 集計を返す。時間帯は現在の時間帯までの直近 buckets 個
+        last = bucket_of(datetime.utcnow())
+        first = last - buckets + 1
+        # 1 つの SELECT で読み出し、すべての種類を同じ時点の集計にそろえる
+        counts = {kind: {} for kind in KINDS}
+        for kind, key, value in self._connection().execute(_SELECT_STATS, (first, last)):
+            counts[kind][key] = value
+        return render_stats(
+            counts,
+            [(bucket, counts['bucket'].get(bucket, 0)) for bucket in range(first, last + 1)],
+            'schedules',
+        )
+
+    def _update_stats(self, contributions, sign=1):
+        self._connection().executemany(
+            _UPDATE_STATS, [(kind, key, sign * value) for kind, key, value in contributions]
+        )
+
+
+def _to_timestamp(value):
+    # scheduled はマイクロ秒単位の整数として保存し、インデックスで順序付けできるようにする
+    return (value - _EPOCH) // timedelta(microseconds=1)
+
+
+# Query を WHERE 句の条件とパラメータに変換する
+# 商品名とサイズは本文の JSON の明細から調べる
+def _conditions(query):
+    conditions, parameters = [], []
+    if query is None:
+        return conditions, parameters
+    for values, operator in ((query.status, 'IN'), (query.exclude_status, 'NOT IN')):
+        if values is not None:
+            conditions.append(f'status {operator} ({", ".join("?" * len(values))})')
+            parameters.extend(sorted(values))
+    if query.start is not None:
+        conditions.append('scheduled >= ?')
+        parameters.append(_to_timestamp(query.start))
+    if query.end is not None:
+        conditions.append('scheduled < ?')
+        parameters.append(_to_timestamp(query.end))
+    for field, values in (('product', query.product), ('size', query.size)):
+        if values is not None:
+            conditions.append(
+                "EXISTS (SELECT 1 FROM json_each(body, '$.order') "
+                f"WHERE json_extract(value, '$.{field}') IN ({', '.join('?' * len(values))}))"
+            )
+            parameters.extend(sorted(values))
+    return conditions, parameters
+
+
+def _to_row(schedule):
+    body = json.dumps(dump_schedule(schedule))
+    return (
+        schedule['id'],
+        _to_timestamp(schedule['scheduled']),
+        schedule['status'],
+        body,
+    )
+
+
+def _from_body(body):
+    return load_schedule(json.loads(body))
@@ -0,0 +1,14 @@
+from coffeemesh.repository.stats import bucket_of
+
+
+# スケジュール 1 件が集計に加える (種類, キー, 値) のリスト
+# スケジュールは予定日時の 1 時間ごとに数える
+def schedule_contributions(schedule):
+    contributions = [
+        ('status', schedule['status'], 1),
+        ('bucket', bucket_of(schedule['scheduled']), 1),
+    ]
+    for item in schedule['order']:
+        contributions.append(('product', item['product'], item['quantity']))
+        contributions.append(('size', item['size'], item['quantity']))
+    return contributions
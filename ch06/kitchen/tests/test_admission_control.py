@@ -0,0 +1,73 @@
+from flask import Flask
+from flask_smorest import Api
+
+from coffeemesh.admission.controller import AdmissionController, RateLimiter
+
+from admission.middleware import AdmissionControl
+from config import BaseConfig
+
+
+def make_client(principal=None, controller=None, routes=None, limiter=None):
+    app = Flask(__name__)
+    app.config.update(API_TITLE='test', API_VERSION='1', OPENAPI_VERSION='3.0.3')
+    # flask-smorest のエラーハンドラーが abort() の Retry-After ヘッダーを付ける
+    Api(app)
+    app.add_url_rule('/kitchen/schedules', 'schedules', lambda: 'ok')
+    app.add_url_rule('/kitchen/schedules/events', 'events', lambda: 'ok')
+    AdmissionControl(
+        controller or AdmissionController(capacity=4),
+        routes=routes or {},
+        limiter=limiter or RateLimiter(rate=0.001, burst=1),
+        principal=principal,
+    ).init_app(app)
+    return app.test_client()
+
+
+def test_rejects_rate_limited_requests_with_retry_after():
+    client = make_client()
+    assert client.get('/kitchen/schedules').status_code == 200
+
+    response = client.get('/kitchen/schedules')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+
+
+def test_sheds_requests_over_capacity():
+    client = make_client(
+        controller=AdmissionController(capacity=0, max_queue=0),
+        routes={('GET', '/kitchen/schedules/events'): None},
+        limiter=RateLimiter(rate=1000, burst=1000),
+    )
+
+    response = client.get('/kitchen/schedules')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    # 接続を保ち続けるルートは同時に処理する数に数えない
+    assert client.get('/kitchen/schedules/events').status_code == 200
+
+
+def test_rate_limiting_is_off_by_default():
+    from app import admission
+
+    assert BaseConfig.ADMISSION_RATE == 0
+    assert admission.limiter is None
+
+
+def test_unverified_authorization_header_does_not_bypass_rate_limit():
+    # Authorization ヘッダーを変えて送っても、同じ接続元のアドレスとして制限する
+    client = make_client()
+    statuses = [
+        client.get('/kitchen/schedules', headers={'Authorization': f'Bearer {token}'}).status_code
+        for token in 'abc'
+    ]
+    assert statuses == [200, 429, 429]
+
+
+def test_rate_limits_verified_principals_separately():
+    # テストでは X-User ヘッダーを検証済みのユーザーとみなす
+    client = make_client(lambda request: request.headers.get('X-User'))
+    statuses = [
+        client.get('/kitchen/schedules', headers=headers).status_code
+        for headers in ({'X-User': 'alice'}, {'X-User': 'bob'}, {'X-User': 'alice'}, {}, {})
+    ]
+    assert statuses == [200, 200, 429, 200, 429]
@@ -0,0 +1,70 @@
+import threading
+
+import pytest
+
+from api.api import feed
+from app import app
+
+
+ORDER = [{'product': 'latte', 'size': 'small', 'quantity': 1}]
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+def poll(client, **params):
+    response = client.get('/kitchen/schedules/events/poll', query_string={'timeout': 0, **params})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_polls_schedule_changes(client):
+    position = poll(client)['last_event_id']
+    schedule = client.post('/kitchen/schedules', json={'order': ORDER}).get_json()
+    client.put(f'/kitchen/schedules/{schedule["id"]}', json={'order': ORDER})
+    client.post(f'/kitchen/schedules/{schedule["id"]}/cancel')
+
+    page = poll(client, after=position)
+    assert [(event['type'], event['data']['version']) for event in page['events']] == [
+        ('schedule.updated', 2), ('schedule.cancelled', 3),
+    ]
+    assert page['last_event_id'] == page['events'][-1]['id']
+    response = client.get(
+        '/kitchen/schedules/events/poll',
+        query_string={'timeout': 0},
+        headers={'Last-Event-ID': str(page['events'][0]['id'])},
+    )
+    assert response.get_json()['events'] == page['events'][1:]
+    assert client.get(
+        '/kitchen/schedules/events/poll', headers={'Last-Event-ID': 'x'}
+    ).status_code == 422
+
+
+def test_long_poll_waits_for_next_event(client):
+    position = poll(client)['last_event_id']
+    threading.Timer(0.05, feed.publish, ('schedule.cancelled', {'id': 'a'})).start()
+
+    page = poll(client, after=position, timeout=5)
+    assert [event['data'] for event in page['events']] == [{'id': 'a'}]
+
+
+def test_unknown_position_resets_client(client):
+    page = poll(client, after=1)
+
+    assert page['reset']
+    assert page['last_event_id'] == feed.last_event_id
+
+
+def test_streams_events_as_server_sent_events(client):
+    position = feed.last_event_id
+    event_id = feed.publish('schedule.cancelled', {'id': 'a'})
+
+    response = client.get(
+        '/kitchen/schedules/events', query_string={'after': position}, buffered=False
+    )
+    assert response.mimetype == 'text/event-stream'
+    frame = next(response.response)
+    response.close()
+    assert frame == f'id: {event_id}\nevent: schedule.cancelled\ndata: {{"id":"a"}}\n\n'.encode()
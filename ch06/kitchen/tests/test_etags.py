@@ -0,0 +1,72 @@
+from datetime import datetime
+
+import pytest
+
+from app import app
+from repository.schedules_repository import ScheduleRepository, VersionConflict
+
+
+ORDER = [{'product': 'latte', 'size': 'small', 'quantity': 1}]
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+def schedule_order(client):
+    response = client.post('/kitchen/schedules', json={'order': ORDER})
+    assert response.status_code == 201
+    return response.get_json()['id'], response.headers['ETag']
+
+
+def test_get_schedule_returns_not_modified_for_current_etag(client):
+    schedule_id, etag = schedule_order(client)
+    assert etag == '"1"'
+
+    for url in (f'/kitchen/schedules/{schedule_id}', f'/kitchen/schedules/{schedule_id}/status'):
+        response = client.get(url, headers={'If-None-Match': f'W/{etag}'})
+        assert response.status_code == 304
+        assert response.headers['ETag'] == etag
+        assert client.get(url, headers={'If-None-Match': '"2"'}).status_code == 200
+
+
+def test_update_requires_matching_if_match(client):
+    schedule_id, etag = schedule_order(client)
+    url = f'/kitchen/schedules/{schedule_id}'
+    changed = {'order': [{**ORDER[0], 'quantity': 2}]}
+
+    response = client.put(url, json=changed, headers={'If-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] == '"2"'
+
+    assert client.put(url, json={'order': ORDER}, headers={'If-Match': etag}).status_code == 412
+    assert client.get(url).get_json()['order'][0]['quantity'] == 2
+    assert client.post(f'{url}/cancel', headers={'If-Match': 'W/"2"'}).status_code == 412
+    assert client.delete(url, headers={'If-Match': etag}).status_code == 412
+    assert client.delete(url, headers={'If-Match': '"2"'}).status_code == 204
+
+
+def test_list_etag_changes_when_schedules_change(client):
+    etag = client.get('/kitchen/schedules').headers['ETag']
+
+    assert client.get('/kitchen/schedules', headers={'If-None-Match': etag}).status_code == 304
+    schedule_order(client)
+    response = client.get('/kitchen/schedules', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_repository_checks_version_before_writing():
+    repository = ScheduleRepository()
+    schedule = repository.add({
+        'id': 'a', 'scheduled': datetime(2024, 1, 1), 'status': 'pending', 'order': ORDER,
+    })
+    version = repository.version()
+
+    with pytest.raises(VersionConflict):
+        repository.update('a', if_match={2}, status='progress')
+    assert schedule['status'] == 'pending'
+    assert repository.version() == version
+    repository.update('a', if_match={1}, status='progress')
+    assert (schedule['version'], repository.version()) == (2, version + 1)
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import uuid
+
+import pytest
+
+from api.api import idempotency_cache
+from app import app
+
+
+ORDER = [{'product': 'latte', 'size': 'small', 'quantity': 1}]
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+def key():
+    return {'Idempotency-Key': str(uuid.uuid4())}
+
+
+def test_replays_schedule_creation(client):
+    headers = key()
+    first = client.post('/kitchen/schedules', json={'order': ORDER}, headers=headers)
+    retry = client.post('/kitchen/schedules', json={'order': ORDER}, headers=headers)
+
+    assert first.status_code == retry.status_code == 201
+    assert retry.get_json()['id'] == first.get_json()['id']
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert 'Idempotent-Replayed' not in first.headers
+
+
+def test_rejects_key_reused_with_a_different_body(client):
+    headers = key()
+    client.post('/kitchen/schedules', json={'order': ORDER}, headers=headers)
+    response = client.post('/kitchen/schedules', json={
+        'order': [{**ORDER[0], 'quantity': 2}],
+    }, headers=headers)
+    assert response.status_code == 422
+
+
+def test_reports_key_still_being_processed(client):
+    headers = key()
+    body = json.dumps({'order': ORDER})
+    cache_key = ('POST', '/kitchen/schedules', None, headers['Idempotency-Key'])
+    idempotency_cache.begin(cache_key, hashlib.sha256(body.encode()).digest())
+
+    response = client.post('/kitchen/schedules', data=body, headers={
+        **headers, 'Content-Type': 'application/json',
+    })
+    assert response.status_code == 409
+    assert response.headers['Retry-After'] == '1'
+    idempotency_cache.abandon(cache_key)
+
+
+def test_header_and_batch_keys_do_not_collide(client):
+    key = str(uuid.uuid4())
+    created = client.post(
+        '/kitchen/schedules', json={'order': ORDER}, headers={'Idempotency-Key': key},
+    )
+    response = client.post('/kitchen/schedules/batch', json={
+        'schedules': [{'order': ORDER, 'idempotency_key': key}],
+    })
+    result = response.get_json()['results'][0]
+    assert result['status'] == 201
+    assert result['schedule']['id'] != created.get_json()['id']
+
+
+def test_rejects_overlong_key(client):
+    response = client.post(
+        '/kitchen/schedules', json={'order': ORDER}, headers={'Idempotency-Key': 'k' * 256},
+    )
+    assert response.status_code == 400
@@ -0,0 +1,92 @@
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from repository.journaled_repository import JournaledScheduleRepository
+
+
+def make_schedule(offset=0, status='pending'):
+    return {
+        'id': str(uuid.uuid4()),
+        'scheduled': datetime.utcnow() + timedelta(microseconds=offset),
+        'status': status,
+        'order': [{'product': 'latte', 'size': 'small', 'quantity': 1}],
+    }
+
+
+def state(repository):
+    return {schedule['id']: schedule['status'] for schedule in repository.scan()}
+
+
+def test_restores_changes_after_crash(tmp_path):
+    repository = JournaledScheduleRepository(tmp_path)
+    first, second = repository.add(make_schedule(0)), repository.add(make_schedule(1))
+    repository.update(first['id'], status='progress')
+    repository.delete(second['id'])
+    expected = state(repository)
+
+    # close() を呼ばずに再起動する
+    restored = JournaledScheduleRepository(tmp_path)
+    assert state(restored) == expected
+    restored.close()
+    repository.close()
+
+
+def test_ignores_torn_record_after_crash(tmp_path):
+    repository = JournaledScheduleRepository(tmp_path)
+    schedule = repository.add(make_schedule())
+    repository.close()
+    with open(tmp_path / 'journal.0.ndjson', 'ab') as file:
+        file.write(b'{"op":"put","schedule":{"id":')
+
+    restored = JournaledScheduleRepository(tmp_path)
+    assert list(state(restored)) == [schedule['id']]
+    later = restored.add(make_schedule(1))
+    restored.close()
+
+    restored = JournaledScheduleRepository(tmp_path)
+    assert set(state(restored)) == {schedule['id'], later['id']}
+    restored.close()
+
+
+def test_keeps_changes_made_while_snapshot_is_written(tmp_path):
+    repository = JournaledScheduleRepository(tmp_path)
+    schedules = [repository.add(make_schedule(offset)) for offset in range(100)]
+
+    started, resume = threading.Event(), threading.Event()
+    write_snapshot = repository._journal.write_snapshot
+
+    def blocked(generation, records):
+        started.set()
+        resume.wait()
+        write_snapshot(generation, records)
+
+    repository._journal.write_snapshot = blocked
+    repository.snapshot(wait=False)
+    assert started.wait(5)
+    for schedule in schedules[:80]:
+        repository.delete(schedule['id'])
+    for offset in range(100, 150):
+        repository.add(make_schedule(offset))
+    repository.update(schedules[90]['id'], status='progress')
+    expected = state(repository)
+    resume.set()
+    repository.snapshot()
+    repository.close()
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        'journal.1.ndjson', 'snapshot.1.ndjson',
+    ]
+    restored = JournaledScheduleRepository(tmp_path)
+    assert state(restored) == expected
+    restored.close()
+
+
+def test_restores_schedules_added_in_batch(tmp_path):
+    repository = JournaledScheduleRepository(tmp_path)
+    schedules = repository.add_many([make_schedule(offset) for offset in range(5)])
+    repository.close()
+
+    restored = JournaledScheduleRepository(tmp_path)
+    assert list(state(restored)) == [schedule['id'] for schedule in schedules]
+    restored.close()
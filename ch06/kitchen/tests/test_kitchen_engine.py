@@ -0,0 +1,113 @@
+import threading
+import uuid
+from datetime import datetime
+
+from engine.kitchen_engine import KitchenEngine
+from repository.schedules_repository import ScheduleRepository
+
+
+def make_schedule(quantity=1):
+    return {
+        'id': str(uuid.uuid4()),
+        'scheduled': datetime.utcnow(),
+        'status': 'pending',
+        'order': [{'product': 'latte', 'size': 'small', 'quantity': quantity}],
+    }
+
+
+class Events:
+
+    def __init__(self):
+        self.events = []
+        self._condition = threading.Condition()
+
+    def __call__(self, event_type, schedule):
+        with self._condition:
+            self.events.append((event_type, schedule['id']))
+            self._condition.notify_all()
+
+    def wait_for(self, count, timeout=5):
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self.events) >= count, timeout)
+
+
+def make_engine(repository, events, **options):
+    options = {'stations': 2, 'preparation_time': 0, 'time_per_item': 0, **options}
+    return KitchenEngine(repository, publish=events, **options)
+
+
+def test_prepares_pending_schedules():
+    repository, events = ScheduleRepository(), Events()
+    engine = make_engine(repository, events)
+    engine.start()
+    schedules = repository.add_many([make_schedule() for _ in range(5)])
+    for schedule in schedules:
+        engine.submit(schedule)
+
+    assert events.wait_for(10)
+    engine.stop()
+    assert all(repository.get(schedule['id'])['status'] == 'finished' for schedule in schedules)
+    stats = engine.stats()
+    assert (stats['started'], stats['finished'], stats['queue_depth']) == (5, 5, 0)
+
+
+def test_skips_schedules_cancelled_while_queued():
+    repository, events = ScheduleRepository(), Events()
+    engine = make_engine(repository, events)
+    schedule = repository.add(make_schedule())
+    engine.submit(schedule)
+
+    assert engine.cancel(schedule['id'])
+    repository.update(schedule['id'], status='cancelled')
+    engine.start()
+    engine.stop()
+    assert repository.get(schedule['id'])['status'] == 'cancelled'
+    assert events.events == []
+
+
+def test_stop_returns_schedules_in_progress_to_pending():
+    repository, events = ScheduleRepository(), Events()
+    engine = make_engine(repository, events, stations=1, preparation_time=60)
+    schedule = repository.add(make_schedule())
+    engine.start()
+    engine.submit(schedule)
+
+    assert events.wait_for(1)
+    engine.stop()
+    assert repository.get(schedule['id'])['status'] == 'pending'
+
+
+def test_start_requeues_schedules_left_in_progress():
+    repository, events = ScheduleRepository(), Events()
+    schedule = repository.add(make_schedule())
+    repository.update(schedule['id'], status='progress')
+    engine = make_engine(repository, events)
+    engine.start()
+
+    assert events.wait_for(2)
+    engine.stop()
+    assert repository.get(schedule['id'])['status'] == 'finished'
+
+
+def test_skips_schedule_resubmitted_while_being_prepared():
+    repository, events = ScheduleRepository(), Events()
+    engine = make_engine(repository, events, preparation_time=0.2)
+    schedule = repository.add(make_schedule())
+    engine.start()
+    engine.submit(schedule)
+    assert events.wait_for(1)
+
+    # 取り出された後に更新されて入れ直されても、別のステーションは調理しない
+    engine.submit(schedule)
+    assert events.wait_for(2)
+    assert events.events == [('schedule.started', schedule['id']), ('schedule.finished', schedule['id'])]
+
+    # どちらのステーションも動き続けている
+    others = repository.add_many([make_schedule() for _ in range(2)])
+    for other in others:
+        engine.submit(other)
+    assert events.wait_for(6)
+    assert all(thread.is_alive() for thread in engine._threads)
+    engine.stop()
+    assert engine.stats()['busy_stations'] == 0
+    assert all(repository.get(other['id'])['status'] == 'finished' for other in others)
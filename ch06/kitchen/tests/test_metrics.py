@@ -0,0 +1,53 @@
+import pytest
+
+from app import app
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+def metric(text, name, **labels):
+    prefix = name
+    if labels:
+        prefix += '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}'
+    values = [line.rsplit(' ', 1)[1] for line in text.splitlines() if line.startswith(prefix + ' ')]
+    return float(values[0]) if values else 0.0
+
+
+def test_records_requests_by_route_rule(client):
+    before = client.get('/metrics').get_data(as_text=True)
+    schedule_id = client.post(
+        '/kitchen/schedules', json={'order': [{'product': 'latte', 'size': 'small', 'quantity': 1}]}
+    ).get_json()['id']
+    client.get(f'/kitchen/schedules/{schedule_id}')
+    client.post('/kitchen/schedules', json={'order': [{'product': 'latte'}]})
+    client.get('/unknown')
+
+    response = client.get('/metrics')
+
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    text = response.get_data(as_text=True)
+    route = '/kitchen/schedules/<schedule_id>'
+    for name, labels, increase in [
+        ('http_requests_total', {'method': 'POST', 'route': '/kitchen/schedules', 'status': 201}, 1),
+        ('http_requests_total', {'method': 'POST', 'route': '/kitchen/schedules', 'status': 422}, 1),
+        ('http_requests_total', {'method': 'GET', 'route': route, 'status': 200}, 1),
+        ('http_requests_total', {'method': 'GET', 'route': '<unmatched>', 'status': 404}, 1),
+        ('http_request_phase_duration_seconds_count',
+         {'method': 'POST', 'route': '/kitchen/schedules', 'phase': 'validation'}, 2),
+        ('http_request_phase_duration_seconds_count',
+         {'method': 'POST', 'route': '/kitchen/schedules', 'phase': 'serialization'}, 1),
+    ]:
+        assert metric(text, name, **labels) - metric(before, name, **labels) == increase
+    assert f'/kitchen/schedules/{schedule_id}' not in text
+    assert metric(text, 'kitchen_repository_size') >= 1
+
+
+def test_reports_engine_gauges_and_counters(client):
+    text = client.get('/metrics').get_data(as_text=True)
+
+    assert '# TYPE kitchen_queue_depth gauge' in text
+    assert metric(text, 'kitchen_stations') == app.config['STATIONS']
+    assert '# TYPE kitchen_schedules_finished_total counter' in text
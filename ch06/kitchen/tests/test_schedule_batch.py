@@ -0,0 +1,70 @@
+import hashlib
+import json
+
+import pytest
+
+from api.api import idempotency_cache, schedules
+from app import app
+
+
+ITEMS = [{'product': 'latte', 'size': 'small', 'quantity': 1}]
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+def post_batch(client, *items):
+    response = client.post('/kitchen/schedules/batch', json={'schedules': list(items)})
+    return response.status_code, response.get_json()['results']
+
+
+def test_schedules_each_key_once(client):
+    status, first = post_batch(client, {'order': ITEMS, 'idempotency_key': 'order-1'})
+    assert status == 201
+    count = len(schedules)
+
+    status, second = post_batch(
+        client,
+        {'order': ITEMS, 'idempotency_key': 'order-1'},
+        {'order': ITEMS, 'idempotency_key': 'order-2'},
+    )
+    assert status == 201
+    assert second[0]['schedule']['id'] == first[0]['schedule']['id']
+    assert second[1]['schedule']['id'] != first[0]['schedule']['id']
+    assert len(schedules) == count + 1
+
+
+def test_rejects_key_reused_with_different_order(client):
+    post_batch(client, {'order': ITEMS, 'idempotency_key': 'order-3'})
+
+    status, results = post_batch(client, {
+        'order': [{**ITEMS[0], 'quantity': 2}], 'idempotency_key': 'order-3',
+    })
+    assert status == 207
+    assert results[0]['status'] == 422
+
+
+def test_reports_key_still_being_scheduled(client):
+    fingerprint = hashlib.sha256(json.dumps(ITEMS, sort_keys=True).encode()).digest()
+    idempotency_cache.begin(('batch', 'order-4'), fingerprint)
+
+    status, results = post_batch(
+        client,
+        {'order': ITEMS, 'idempotency_key': 'order-4'},
+        {'order': ITEMS},
+    )
+    assert status == 207
+    assert [result['status'] for result in results] == [409, 201]
+    idempotency_cache.abandon(('batch', 'order-4'))
+
+
+def test_invalid_schedule_does_not_keep_its_key(client):
+    status, results = post_batch(client, {
+        'order': [{**ITEMS[0], 'size': 'huge'}], 'idempotency_key': 'order-5',
+    })
+    assert results[0]['status'] == 422
+
+    status, results = post_batch(client, {'order': ITEMS, 'idempotency_key': 'order-5'})
+    assert status == 201
@@ -0,0 +1,221 @@
+import json
+
+import pytest
+
+from api import api
+from app import app
+
+
+ORDER = [{'product': 'latte', 'size': 'small', 'quantity': 1}]
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+def schedule_order(client):
+    response = client.post('/kitchen/schedules', json={'order': ORDER})
+    assert response.status_code == 201
+    return response.get_json()
+
+
+def test_schedules_and_gets_order(client):
+    schedule = schedule_order(client)
+
+    response = client.get(f'/kitchen/schedules/{schedule["id"]}')
+    assert response.status_code == 200
+    assert response.get_json() == schedule
+    assert schedule['status'] == 'pending'
+
+
+def test_updates_cancels_and_deletes_schedule(client):
+    schedule = schedule_order(client)
+    url = f'/kitchen/schedules/{schedule["id"]}'
+
+    response = client.put(url, json={'order': [{**ORDER[0], 'quantity': 2}]})
+    assert response.status_code == 200
+    assert response.get_json()['order'][0]['quantity'] == 2
+
+    response = client.post(f'{url}/cancel')
+    assert response.get_json()['status'] == 'cancelled'
+    assert client.get(f'{url}/status').get_json() == {'status': 'cancelled'}
+
+    assert client.delete(url).status_code == 204
+    assert client.get(url).status_code == 404
+    assert client.delete(url).status_code == 404
+
+
+def test_lists_schedules_since_with_limit(client):
+    first = schedule_order(client)
+    schedule_order(client)
+    schedule_order(client)
+
+    def listed(**parameters):
+        response = client.get('/kitchen/schedules', query_string={
+            'since': first['scheduled'], **parameters,
+        })
+        assert response.status_code == 200
+        return [schedule['id'] for schedule in response.get_json()['schedules']]
+
+    since = listed()
+    assert first['id'] in since
+    assert len(since) == 3
+    assert listed(limit=2) == since[:2]
+
+
+def test_reads_do_not_revalidate_stored_schedules(client, monkeypatch):
+    schedule = schedule_order(client)
+
+    def fail(schedule):
+        raise AssertionError('stored schedules are validated on write only')
+
+    monkeypatch.setattr(api, 'validate_schedule', fail)
+    assert client.get(f'/kitchen/schedules/{schedule["id"]}').status_code == 200
+    assert client.get('/kitchen/schedules').status_code == 200
+    assert client.get(f'/kitchen/schedules/{schedule["id"]}/status').status_code == 200
+
+
+def test_rejected_update_leaves_schedule_unchanged(client):
+    schedule = schedule_order(client)
+    url = f'/kitchen/schedules/{schedule["id"]}'
+
+    response = client.put(url, json={'order': [{**ORDER[0], 'quantity': 0}]})
+    assert response.status_code == 422
+    assert client.get(url).get_json() == schedule
+
+
+def test_pages_through_schedules_with_cursor(client):
+    first = schedule_order(client)
+    for _ in range(4):
+        schedule_order(client)
+
+    def page(**parameters):
+        response = client.get('/kitchen/schedules', query_string={
+            'since': first['scheduled'], **parameters,
+        })
+        assert response.status_code == 200
+        return response.get_json()
+
+    expected = [schedule['id'] for schedule in page()['schedules']]
+    pages, after = [], None
+    while True:
+        parameters = {'limit': 2} if after is None else {'limit': 2, 'after': after}
+        body = page(**parameters)
+        pages.extend(schedule['id'] for schedule in body['schedules'])
+        after = body['next_cursor']
+        if after is None:
+            break
+    assert pages == expected
+
+
+def test_filters_schedules_by_status_product_and_size(client):
+    def schedule(product, size):
+        response = client.post('/kitchen/schedules', json={
+            'order': [{'product': product, 'size': size, 'quantity': 1}],
+        })
+        assert response.status_code == 201
+        return response.get_json()
+
+    small = schedule('ristretto', 'small')
+    big = schedule('ristretto', 'big')
+    other = schedule('cortado', 'small')
+    client.post(f'/kitchen/schedules/{other["id"]}/cancel')
+
+    def listed(url='/kitchen/schedules', **parameters):
+        response = client.get(url, query_string={'since': small['scheduled'], **parameters})
+        assert response.status_code == 200
+        if url.endswith('/export'):
+            lines = response.get_data(as_text=True).splitlines()
+            return [json.loads(line)['id'] for line in lines]
+        return [schedule['id'] for schedule in response.get_json()['schedules']]
+
+    assert listed(product='ristretto') == [small['id'], big['id']]
+    assert listed(product='ristretto', size='big') == [big['id']]
+    assert listed(size='small', status='cancelled') == [other['id']]
+    assert listed(product=['ristretto', 'cortado'], size='small') == [small['id'], other['id']]
+    assert listed(product='ristretto', until=big['scheduled']) == [small['id']]
+    assert listed('/kitchen/schedules/export', product='cortado') == [other['id']]
+    response = client.get('/kitchen/schedules', query_string={'size': 'huge'})
+    assert response.status_code == 422
+
+
+def test_rejects_invalid_cursor(client):
+    response = client.get('/kitchen/schedules', query_string={'after': 'not-a-cursor'})
+    assert response.status_code == 422
+
+
+def test_exports_schedules_as_ndjson(client):
+    first = schedule_order(client)
+    second = schedule_order(client)
+    client.post(f'/kitchen/schedules/{second["id"]}/cancel')
+
+    response = client.get('/kitchen/schedules/export', query_string={'since': first['scheduled']})
+    assert response.mimetype == 'application/x-ndjson'
+    exported = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [schedule['id'] for schedule in exported] == [first['id'], second['id']]
+    assert exported[1]['status'] == 'cancelled'
+
+
+def test_schedules_orders_in_batch(client):
+    invalid = {'order': [{**ORDER[0], 'quantity': 0}]}
+    response = client.post('/kitchen/schedules/batch', json={
+        'schedules': [{'order': ORDER}, invalid],
+    })
+    assert response.status_code == 207
+    created, failed = response.get_json()['results']
+    assert created['status'] == 201
+    assert client.get(f'/kitchen/schedules/{created["schedule"]["id"]}').get_json() == created['schedule']
+    assert failed['index'] == 1
+    assert failed['status'] == 422
+
+    response = client.post('/kitchen/schedules/batch', json={'schedules': [{'order': ORDER}]})
+    assert response.status_code == 201
+
+
+def test_reports_stats_of_changes(client):
+    before = client.get('/kitchen/stats', query_string={'buckets': 1}).get_json()
+    response = client.post('/kitchen/schedules', json={
+        'order': [{'product': 'ristretto', 'size': 'big', 'quantity': 3}],
+    })
+    client.post(f'/kitchen/schedules/{response.get_json()["id"]}/cancel')
+
+    after = client.get('/kitchen/stats', query_string={'buckets': 1}).get_json()
+    assert after['total'] == before['total'] + 1
+    assert after['status'].get('cancelled', 0) == before['status'].get('cancelled', 0) + 1
+    assert after['quantity']['product']['ristretto'] == (
+        before['quantity']['product'].get('ristretto', 0) + 3
+    )
+    assert after['buckets'][0]['schedules'] == before['buckets'][0]['schedules'] + 1
+    response = client.get('/kitchen/stats', query_string={'buckets': 0})
+    assert response.status_code == 422
+
+
+def test_serves_archived_schedules_read_only(client, tmp_path, monkeypatch):
+    from coffeemesh.repository.archive import Archive
+
+    from repository.retention import ScheduleRetention
+
+    archive = Archive(tmp_path)
+    monkeypatch.setattr(api, 'archive', archive)
+    schedule = schedule_order(client)
+    url = f'/kitchen/schedules/{schedule["id"]}'
+    client.post(f'{url}/cancel')
+    assert ScheduleRetention(api.schedules, archive, age=0).sweep() >= 1
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'cancelled'
+    # アーカイブに移したスケジュールは変更も削除もできない
+    assert client.put(url, json={'order': ORDER}).status_code == 409
+    assert client.delete(url).status_code == 409
+
+
+def test_serves_precompiled_openapi_document(client):
+    from app import kitchen_api
+
+    response = client.get('/openapi/kitchen.json')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/json'
+    assert response.get_json() == kitchen_api.spec.to_dict()
+    assert '/kitchen/schedules' in response.get_json()['paths']
@@ -0,0 +1,140 @@
+import uuid
+from datetime import datetime, timedelta
+
+from coffeemesh.repository.query import Query
+
+from repository.schedules_repository import ScheduleRepository
+
+
+def make_schedule(offset=0, status='pending'):
+    return {
+        'id': str(uuid.uuid4()),
+        'scheduled': datetime(2024, 1, 1) + timedelta(seconds=offset),
+        'status': status,
+        'order': [{'product': 'latte', 'size': 'small', 'quantity': 1}],
+    }
+
+
+def ids(schedules):
+    return [schedule['id'] for schedule in schedules]
+
+
+def test_gets_updates_and_deletes_by_id():
+    repository = ScheduleRepository()
+    schedule = repository.add(make_schedule())
+
+    assert repository.get(schedule['id']) is schedule
+    assert repository.update(schedule['id'], status='progress')['status'] == 'progress'
+    assert repository.delete(schedule['id'])
+    assert repository.get(schedule['id']) is None
+    assert schedule['id'] not in repository
+    assert repository.update(schedule['id'], status='cancelled') is None
+    assert not repository.delete(schedule['id'])
+
+
+def test_filters_by_status_since_and_limit():
+    repository = ScheduleRepository()
+    schedules = [repository.add(make_schedule(offset)) for offset in range(6)]
+    for schedule in schedules[::2]:
+        repository.update(schedule['id'], status='progress')
+
+    assert ids(repository.list(Query(status='progress'))) == ids(schedules[::2])
+    assert ids(repository.list(Query(exclude_status='progress'))) == ids(schedules[1::2])
+    assert ids(repository.list(Query(start=schedules[3]['scheduled']))) == ids(schedules[3:])
+    query = Query(status='progress', start=schedules[1]['scheduled'])
+    assert ids(repository.list(query, limit=1)) == [schedules[2]['id']]
+    assert ids(repository.list(limit=2)) == ids(schedules[:2])
+    assert repository.list(limit=0) == []
+    assert repository.count('progress') == 3
+    assert repository.count() == 6
+
+
+def test_lists_in_scheduled_order_when_added_out_of_order():
+    repository = ScheduleRepository()
+    schedules = [repository.add(make_schedule(offset)) for offset in (3, 1, 2, 0)]
+
+    assert ids(repository.list()) == ids(sorted(schedules, key=lambda schedule: schedule['scheduled']))
+
+
+def test_skips_deleted_and_rescheduled_entries():
+    repository = ScheduleRepository()
+    schedules = [repository.add(make_schedule(offset)) for offset in range(4)]
+    repository.delete(schedules[1]['id'])
+    repository.update(schedules[0]['id'], scheduled=datetime(2024, 1, 2))
+
+    assert ids(repository.list()) == [schedules[2]['id'], schedules[3]['id'], schedules[0]['id']]
+
+
+def test_rescheduling_back_does_not_duplicate_entries():
+    repository = ScheduleRepository()
+    schedule = repository.add(make_schedule())
+    repository.add(make_schedule(10))
+    original = schedule['scheduled']
+    repository.update(schedule['id'], scheduled=original + timedelta(seconds=5))
+    repository.update(schedule['id'], scheduled=original)
+
+    assert ids(repository.list()).count(schedule['id']) == 1
+
+
+def test_compacts_index_when_tombstones_outnumber_schedules():
+    repository = ScheduleRepository()
+    schedules = [repository.add(make_schedule(offset)) for offset in range(10)]
+    for schedule in schedules[:6]:
+        repository.delete(schedule['id'])
+
+    assert len(repository._scheduled_index) == 4
+    assert ids(repository.list()) == ids(schedules[6:])
+
+
+def test_lists_after_cursor_key():
+    repository = ScheduleRepository()
+    schedules = [repository.add(make_schedule(offset)) for offset in range(5)]
+    repository.delete(schedules[2]['id'])
+    repository.update(schedules[4]['id'], status='progress')
+    after = (schedules[1]['scheduled'], schedules[1]['id'])
+
+    assert ids(repository.list(after=after)) == [schedules[3]['id'], schedules[4]['id']]
+    assert ids(repository.list(Query(status='progress'), after=after)) == [schedules[4]['id']]
+    assert ids(repository.list(after=after, limit=1)) == [schedules[3]['id']]
+
+
+def test_scan_tolerates_changes_while_iterating():
+    repository = ScheduleRepository()
+    schedules = [repository.add(make_schedule(offset)) for offset in range(4)]
+    scan = repository.scan()
+
+    assert next(scan) is schedules[0]
+    repository.delete(schedules[1]['id'])
+    repository.add(make_schedule(-1))
+    late = repository.add(make_schedule(10))
+    assert ids(scan) == [schedules[2]['id'], schedules[3]['id'], late['id']]
+
+
+def test_maintains_stats_through_updates_and_deletes():
+    repository = ScheduleRepository()
+    now = datetime.utcnow()
+    first = repository.add({
+        'id': str(uuid.uuid4()), 'scheduled': now, 'status': 'pending',
+        'order': [{'product': 'latte', 'size': 'small', 'quantity': 2}],
+    })
+    second = repository.add({
+        'id': str(uuid.uuid4()), 'scheduled': now, 'status': 'pending',
+        'order': [{'product': 'mocha', 'size': 'big', 'quantity': 1}],
+    })
+    repository.update(first['id'], status='cancelled')
+    repository.update(second['id'], order=[{'product': 'mocha', 'size': 'small', 'quantity': 1}])
+
+    stats = repository.stats(buckets=2)
+    assert stats['total'] == 2
+    assert stats['status'] == {'pending': 1, 'cancelled': 1}
+    assert stats['quantity'] == {
+        'product': {'latte': 2, 'mocha': 1}, 'size': {'small': 3},
+    }
+    assert [bucket['schedules'] for bucket in stats['buckets']] == [0, 2]
+
+    repository.update(first['id'], scheduled=now - timedelta(hours=1))
+    repository.delete(second['id'])
+    stats = repository.stats(buckets=2)
+    assert stats['status'] == {'cancelled': 1}
+    assert stats['quantity']['product'] == {'latte': 2}
+    assert [bucket['schedules'] for bucket in stats['buckets']] == [1, 0]
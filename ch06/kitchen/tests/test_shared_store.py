@@ -0,0 +1,98 @@
+import json
+import multiprocessing
+import time
+import uuid
+from datetime import datetime
+
+import pytest
+
+from coffeemesh.feed.change_feed import ChangeFeed
+from coffeemesh.idempotency.cache import NEW, REPLAY, IdempotencyCache
+
+from engine.kitchen_engine import KitchenEngine
+from repository.schedules_repository import ScheduleRepository, VersionConflict
+from repository.shared_repository import SharedScheduleRepository, serve
+
+
+AUTHKEY = b'test'
+
+
+def make_schedule():
+    return {
+        'id': str(uuid.uuid4()),
+        'scheduled': datetime.utcnow(),
+        'status': 'pending',
+        'order': [{'product': 'latte', 'size': 'small', 'quantity': 1}],
+    }
+
+
+def run_server(address):
+    # エンジンのスレッドは fork の後に、サーバーのプロセスで起動する
+    repository, feed = ScheduleRepository(), ChangeFeed()
+    engine = KitchenEngine(
+        repository,
+        stations=1,
+        preparation_time=0,
+        time_per_item=0,
+        publish=lambda event_type, schedule: feed.publish(event_type, {'id': schedule['id']}),
+    )
+    engine.start()
+    serve(repository, engine, feed, IdempotencyCache(), address, AUTHKEY)
+
+
+@pytest.fixture
+def address(tmp_path):
+    address = str(tmp_path / 'store.sock')
+    server = multiprocessing.get_context('fork').Process(target=run_server, args=(address,), daemon=True)
+    server.start()
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            SharedScheduleRepository(address, AUTHKEY)
+            break
+        except (FileNotFoundError, ConnectionRefusedError):
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+    yield address
+    server.terminate()
+    server.join()
+
+
+def test_workers_see_the_same_schedules(address):
+    # 別々のワーカーのクライアントとして接続する
+    first, second = (SharedScheduleRepository(address, AUTHKEY) for _ in range(2))
+    schedule = first.add(make_schedule())
+    assert schedule['version'] == 1
+
+    second.update(schedule['id'], if_match={1}, status='cancelled')
+    assert first.get(schedule['id'])['status'] == 'cancelled'
+    assert first.stats()['status'] == {'cancelled': 1}
+    with pytest.raises(VersionConflict) as conflict:
+        first.update(schedule['id'], if_match={1}, status='pending')
+    assert conflict.value.version == 2
+
+
+def test_server_engine_publishes_to_the_shared_feed(address):
+    repository = SharedScheduleRepository(address, AUTHKEY)
+    feed = repository.feed()
+    position = feed.position()
+    schedule = repository.add(make_schedule())
+
+    repository.engine().submit(schedule)
+    deadline = time.monotonic() + 5
+    while repository.get(schedule['id'])['status'] != 'finished':
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    records = [json.loads(event[2]) for event in feed.since(position)]
+    assert [(record['type'], record['data']['id']) for record in records] == [
+        ('schedule.started', schedule['id']), ('schedule.finished', schedule['id']),
+    ]
+
+
+def test_workers_share_idempotency_keys(address):
+    first, second = (SharedScheduleRepository(address, AUTHKEY).idempotency() for _ in range(2))
+
+    assert first.begin(('batch', 'abc'), b'body') == (NEW, None)
+    first.complete(('batch', 'abc'), {'status': 201})
+    assert second.begin(('batch', 'abc'), b'body') == (REPLAY, {'status': 201})
+    assert second.stats() == {'keys': 1, 'replayed': 1}
@@ -0,0 +1,150 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from coffeemesh.repository.query import Query
+
+from repository.factory import create_schedule_repository
+from repository.schedules_repository import ScheduleRepository
+from repository.sqlite_repository import SqliteScheduleRepository
+
+
+def make_schedule(offset=0, status='pending'):
+    return {
+        'id': str(uuid.uuid4()),
+        'scheduled': datetime(2024, 1, 1) + timedelta(seconds=offset),
+        'status': status,
+        'order': [{'product': 'latte', 'size': 'small', 'quantity': 1}],
+    }
+
+
+def ids(schedules):
+    return [schedule['id'] for schedule in schedules]
+
+
+@pytest.fixture
+def repository(tmp_path):
+    repository = SqliteScheduleRepository(str(tmp_path / 'kitchen.db'))
+    yield repository
+    repository.close()
+
+
+def test_persists_schedules_across_connections(tmp_path, repository):
+    schedule = repository.add(make_schedule())
+    repository.update(schedule['id'], status='progress')
+
+    reopened = SqliteScheduleRepository(str(tmp_path / 'kitchen.db'))
+    assert reopened.get(schedule['id']) == {**schedule, 'status': 'progress', 'version': 2}
+    assert reopened.delete(schedule['id'])
+    assert schedule['id'] not in repository
+    reopened.close()
+
+
+def test_lists_by_status_since_and_cursor(repository):
+    schedules = [repository.add(make_schedule(offset)) for offset in range(5)]
+    repository.update(schedules[3]['id'], status='progress')
+    after = (schedules[1]['scheduled'], schedules[1]['id'])
+
+    assert ids(repository.list(Query(status='progress'))) == [schedules[3]['id']]
+    assert ids(repository.list(Query(exclude_status='progress'), after=after)) == [
+        schedules[2]['id'], schedules[4]['id'],
+    ]
+    assert ids(repository.list(Query(start=schedules[3]['scheduled']), limit=1)) == [schedules[3]['id']]
+    assert ids(repository.scan(chunk_size=2)) == ids(schedules)
+    assert repository.count('progress') == 1
+
+
+def test_batch_commits_writes_together(repository):
+    with repository.batch():
+        repository.add(make_schedule())
+        repository.add(make_schedule(1))
+    with pytest.raises(RuntimeError):
+        with repository.batch():
+            repository.add(make_schedule(2))
+            raise RuntimeError
+
+    assert len(repository) == 2
+
+
+def test_factory_selects_backend(tmp_path):
+    class Config:
+        STORAGE_BACKEND = 'memory'
+        SQLITE_PATH = str(tmp_path / 'kitchen.db')
+
+    assert isinstance(create_schedule_repository(Config), ScheduleRepository)
+    Config.STORAGE_BACKEND = 'sqlite'
+    repository = create_schedule_repository(Config)
+    assert isinstance(repository, SqliteScheduleRepository)
+    repository.close()
+
+
+def test_adds_schedules_in_batch(repository):
+    schedules = repository.add_many([make_schedule(offset) for offset in range(3)])
+
+    assert ids(repository.list()) == ids(schedules)
+
+
+def test_filters_match_memory_repository(repository):
+    memory = ScheduleRepository()
+    choices = [
+        ('pending', [{'product': 'latte', 'size': 'small', 'quantity': 1}]),
+        ('cancelled', [{'product': 'mocha', 'size': 'big', 'quantity': 2}]),
+        ('progress', [
+            {'product': 'latte', 'size': 'big', 'quantity': 1},
+            {'product': 'espresso', 'size': 'medium', 'quantity': 1},
+        ]),
+    ]
+    for offset in range(12):
+        status, items = choices[offset % 3]
+        schedule = {**make_schedule(offset, status), 'order': items}
+        repository.add(dict(schedule))
+        memory.add(dict(schedule))
+
+    start = datetime(2024, 1, 1, 0, 0, 3)
+    for query in [
+        Query(product='latte'),
+        Query(product={'mocha', 'espresso'}, size='big'),
+        Query(status={'pending', 'progress'}, size='big'),
+        Query(exclude_status='cancelled', start=start, end=start + timedelta(seconds=6)),
+    ]:
+        assert ids(repository.list(query)) == ids(memory.list(query))
+        assert ids(repository.list(query, limit=2)) == ids(memory.list(query, limit=2))
+        assert ids(repository.scan(query, chunk_size=2)) == ids(memory.scan(query))
+
+
+def test_stats_match_memory_repository(repository):
+    memory = ScheduleRepository()
+    now = datetime.utcnow()
+    schedules = [
+        {
+            'id': str(uuid.uuid4()),
+            'scheduled': now - timedelta(minutes=offset * 20),
+            'status': 'pending',
+            'order': [{'product': product, 'size': size, 'quantity': offset + 1}],
+        }
+        for offset, (product, size) in enumerate([('latte', 'small'), ('mocha', 'big')] * 3)
+    ]
+    for schedule in schedules:
+        memory.add(dict(schedule))
+        repository.add(dict(schedule))
+    for target in (memory, repository):
+        target.update(schedules[0]['id'], status='cancelled')
+        target.update(schedules[1]['id'], order=[
+            {'product': 'flat white', 'size': 'medium', 'quantity': 1},
+        ])
+        target.delete(schedules[2]['id'])
+
+    assert repository.stats(buckets=3) == memory.stats(buckets=3)
+
+
+def test_rebuilds_stats_of_existing_database(tmp_path, repository):
+    repository.add(make_schedule(status='cancelled'))
+    repository.add(make_schedule(offset=1))
+    expected = repository.stats()
+    repository._connection().execute('DELETE FROM stats')
+
+    reopened = SqliteScheduleRepository(str(tmp_path / 'kitchen.db'))
+    assert reopened.stats() == expected
+    assert expected['status'] == {'cancelled': 1, 'pending': 1}
+    reopened.close()
@@ -0,0 +1,122 @@
+import asyncio
+import json
+import math
+from time import perf_counter
+
+from starlette.routing import compile_path
+
+from coffeemesh.admission.controller import GRANTED, NORMAL, QUEUED
+
+from orders.metrics.middleware import current_timer
+
+
+# リクエストの受け付けを制御する ASGI ミドルウェア
+# クライアントごとのレート制限を超えたリクエストには 429、同時に処理できる数の
+# 上限で待ちきれないリクエストには 503 を、どちらも Retry-After を付けてすぐに返す。
+# routes には (メソッド, ルートのパス) -> 優先度 のディクショナリを渡す。
+# 登録していないルートは NORMAL とし、優先度が None のルート（SSE など接続を
+# 保ち続けるもの）は同時に処理する数に数えず、レート制限だけを行う。
+# レート制限はクライアントを接続元のアドレスで区別する。principal に ASGI の scope から
+# 認証済みのクライアントの ID（認証されていなければ None）を返す関数を渡すと、
+# 認証されたリクエストはその ID で区別する。検証していない Authorization ヘッダーは
+# 送るたびに変えられ、制限を回避できてしまうので使わない
+class AdmissionMiddleware:
+
+    def __init__(self, app, controller, routes, limiter=None, principal=None):
+        self.app = app
+        self.controller = controller
+        self.limiter = limiter
+        self.principal = principal
+        self.routes = [
+            (method, path, compile_path(path)[0], priority)
+            for (method, path), priority in routes.items()
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        route, priority = self._route(scope)
+
+        if self.limiter is not None:
+            wait = self.limiter.acquire(self._client(scope))
+            if wait:
+                await _reject(scope, route, send, 429, 'Too many requests', math.ceil(wait))
+                return
+        if priority is None:
+            await self.app(scope, receive, send)
+            return
+
+        key = (scope['method'], route)
+        if not await self._admit(key, priority):
+            await _reject(
+                scope, route, send, 503, 'The server is overloaded', self.controller.retry_after()
+            )
+            return
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(key, priority, perf_counter() - start)
+
+    def _client(self, scope):
+        if self.principal is not None:
+            principal = self.principal(scope)
+            if principal is not None:
+                return ('principal', principal)
+        client = scope.get('client')
+        return client[0] if client else None
+
+    def _route(self, scope):
+        for method, path, pattern, priority in self.routes:
+            if scope['method'] == method and pattern.match(scope['path']):
+                return path, priority
+        return None, NORMAL
+
+    async def _admit(self, key, priority):
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def notify():
+            loop.call_soon_threadsafe(_resolve, granted)
+
+        state, waiter = self.controller.acquire(key, priority, notify)
+        if state != QUEUED:
+            return state == GRANTED
+        try:
+            await asyncio.wait_for(granted, self.controller.queue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            return self.controller.cancel(waiter)
+        except BaseException:
+            # 待っている間にクライアントが切断した場合など。許可されていれば枠を返す
+            if self.controller.cancel(waiter):
+                self.controller.release(key, priority, None)
+            raise
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+async def _reject(scope, route, send, status_code, detail, retry_after):
+    # 断ったリクエストもルートのラベルで記録する
+    timer = current_timer.get()
+    if timer is not None and route is not None:
+        timer.dispatch(scope['method'], route)
+    content = json.dumps({'detail': detail}).encode()
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': status_code,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(content)).encode()),
+                (b'retry-after', str(retry_after).encode()),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': content})
+    finally:
+        if timer is not None and route is not None:
+            timer.dispatched()
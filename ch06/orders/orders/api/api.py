@@ -1,129 +1,455 @@
+import json
 import uuid
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, timezone
+from typing import List, Optional
 from uuid import UUID
 
-from fastapi import HTTPException
-from starlette.responses import Response
+from anyio import to_thread
+from fastapi import Depends, Header, HTTPException, Query
+from pydantic import ValidationError
+from starlette.responses import Response, StreamingResponse
 from starlette import status
 
-from orders.app import app
+from coffeemesh.feed.relay import FeedRelay
+from coffeemesh.metrics.registry import CONTENT_TYPE
+from coffeemesh.repository.archive import Archive
+from coffeemesh.repository.query import Query as OrdersQuery
+
+from orders.app import admission, app, background_services, idempotency, metrics
 
 # pydantic モデルをインポートし、検証に使えるようにする
 from orders.api.schemas import (
     GetOrderSchema,
     CreateOrderSchema,
-    GetOrdersSchema
+    GetOrdersSchema,
+    CreateOrdersBatchSchema,
+    CreateOrdersBatchResultSchema,
+    GetOrderStatsSchema,
+    Size,
+    StatusEnum,
+)
+from orders.api.encoders import (
+    encode_batch_results,
+    encode_events_page,
+    encode_order,
+    encode_orders_page,
+)
+from orders.api.etags import etag_matches, make_etag, parse_if_match
+from orders.api.pagination import decode_cursor, encode_cursor
+from orders.api.responses import JSONBytesResponse
+from orders.config import BaseConfig
+from orders.dispatch.dispatcher import KitchenDispatcher
+from orders.dispatch.kitchen_client import KitchenClient
+from orders.feed.change_feed import AsyncChangeFeed
+from orders.repository.async_repository import AsyncOrderRepository
+from orders.repository.factory import create_order_repository
+from orders.repository.orders_repository import StatusConflict, VersionConflict
+from orders.repository.records import OrderRecord, make_items, to_timestamp
+from orders.repository.retention import OrderRetention
+
+
+# 設定に応じて、インメモリまたは SQLite の注文リポジトリを使う
+# 保存済みの注文は作成時と更新時に検証済みなので、レスポンスはエンコード済みの
+# JSON バイト列をそのまま返し、response_model による再検証を省略する。
+# ビュー関数は async def で定義し、スレッドプールを経由せずにイベントループ上で実行する
+# 保持期間を過ぎた終了状態の注文はアーカイブに移し、リポジトリにない注文は
+# アーカイブから読み出す
+archive = Archive(BaseConfig.ARCHIVE_DIR)
+orders = AsyncOrderRepository(
+    create_order_repository(BaseConfig, encoder=encode_order),
+    blocking=BaseConfig.STORAGE_BACKEND != 'memory',
+    archive=archive,
 )
 
+# 保存先が 'shared' の場合は、ストアのサーバーがアーカイブに移す
+if BaseConfig.RETENTION_AGE > 0 and BaseConfig.STORAGE_BACKEND != 'shared':
+    background_services.append(OrderRetention(
+        orders.repository,
+        archive,
+        BaseConfig.RETENTION_AGE,
+        interval=BaseConfig.RETENTION_INTERVAL,
+        batch_size=BaseConfig.RETENTION_BATCH_SIZE,
+    ))
+
+# 支払い済みの注文をアウトボックスから厨房サービスに送るディスパッチャー
+dispatcher = None
+if BaseConfig.KITCHEN_URL:
+    dispatcher = KitchenDispatcher(
+        orders.repository,
+        KitchenClient(BaseConfig.KITCHEN_URL, pool_size=BaseConfig.DISPATCH_POOL_SIZE),
+        workers=BaseConfig.DISPATCH_WORKERS,
+        batch_size=BaseConfig.DISPATCH_BATCH_SIZE,
+    )
+    background_services.append(dispatcher)
+
+# 注文の変更イベントの変更フィード。クライアントはポーリングの代わりに
+# /orders/events の SSE または /orders/events/poll の長ポーリングで変更を受け取る
+feed = AsyncChangeFeed(BaseConfig.CHANGE_FEED_SIZE)
+
+# 保存先が 'shared' の場合は、イベントをストアのサーバーのフィードに発行し、
+# リレーのスレッドでこのワーカーのフィードに写す。ワーカーを複数起動しても、
+# すべてのワーカーのクライアントが同じイベント ID で同じイベントを受け取る
+shared_feed = None
+if BaseConfig.STORAGE_BACKEND == 'shared':
+    shared_feed = orders.repository.feed()
+    background_services.append(FeedRelay(shared_feed, feed))
+
+# SSE の接続を維持するためにコメント行を送る間隔（秒）
+_HEARTBEAT_INTERVAL = 15
+
+
+def _order_not_found(order_id):
+    # 注文が見つからない場合は、status_code を 404 に設定した上で
+    # HTTPException を生成し、 404 レスポンスを返す
+    return HTTPException(
+        status_code=404,
+        detail=f'Order wiith ID {order_id} not found'
+        )
+
+
+def _order_archived(order_id):
+    # アーカイブに移した注文は終了状態なので、変更も削除もできない
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail=f'Order with ID {order_id} has been archived and can no longer be changed',
+    )
+
+
+def _version_conflict(error):
+    # If-Match の版数が一致しない場合は 412 を返し、現在の ETag を知らせる
+    return HTTPException(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        detail=f'Order has been modified (current version {error.version})',
+        headers={'ETag': make_etag(error.version)},
+    )
+
+
+def _status_conflict(error):
+    # 現在のステータスでは行えない操作には 409 を返す
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail=f'Order cannot be changed in status {error.status}',
+    )
+
+
+def _not_modified(etag):
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+
+async def _publish(event_type, order):
+    payload = {
+        'id': str(order.uuid),
+        'status': order.status,
+        'version': order.version,
+    }
+    if shared_feed is None:
+        feed.publish(event_type, payload)
+    else:
+        await to_thread.run_sync(shared_feed.publish, event_type, payload)
+
+
+def _resume_position(after, last_event_id):
+    # 再開位置はクエリパラメータ after または Last-Event-ID ヘッダーで指定する。
+    # どちらもない場合は、これから発行されるイベントを返す
+    if after is None and last_event_id is not None:
+        try:
+            after = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=422, detail=f'Invalid Last-Event-ID {last_event_id}')
+    return feed.last_event_id if after is None else after
+
+
+def _utc(value):
+    # created は UTC の naive な datetime で保存しているので、比較できる形にそろえる
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+# 一覧とエクスポートに共通の絞り込み条件のクエリパラメータを Query に変換する
+# status、product、size は繰り返し指定でき、いずれかに一致する注文を返す。
+# since 以上 until 未満に作成された注文を返す
+def _order_filters(
+    cancelled: Optional[bool] = None,
+    status: Optional[List[StatusEnum]] = Query(None),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    product: Optional[List[str]] = Query(None),
+    size: Optional[List[Size]] = Query(None),
+):
+    statuses = {value.value for value in status} if status else None
+    if cancelled:
+        statuses = {'cancelled'} if statuses is None else statuses & {'cancelled'}
+    return OrdersQuery(
+        status=statuses,
+        exclude_status='cancelled' if cancelled is False else None,
+        start=_utc(since),
+        end=_utc(until),
+        product=product or None,
+        size={value.value for value in size} if size else None,
+    )
+
+
+def _new_order(order_details):
+    return OrderRecord(
+        uuid.uuid4().int,
+        to_timestamp(datetime.utcnow()),
+        'created',
+        make_items(order_details.dict()['order']),
+    )
+
 
-orders = [] # インメモリの注文リストを Python リストとして表現
+def _order_response(order, status_code=status.HTTP_200_OK):
+    # ETag は版数から作るので、エンコードより先に読み出す。エンコード中に注文が
+    # 変更されても、ETag が古い側にずれるだけで、次のリクエストで再取得される
+    etag = make_etag(order.version)
+    return JSONBytesResponse(
+        orders.encode(order), status_code=status_code, headers={'ETag': etag}
+    )
+
+# リクエストのメトリクスと注文の件数を Prometheus のテキスト形式で返す
+@app.get('/metrics', response_class=Response)
+async def get_metrics():
+    admission_stats = admission.stats()
+    if BaseConfig.STORAGE_BACKEND == 'shared':
+        idempotency_stats = await to_thread.run_sync(idempotency.stats)
+    else:
+        idempotency_stats = idempotency.stats()
+    return Response(
+        metrics.render([
+            ('orders_repository_size', 'Number of stored orders.', await orders.count()),
+            ('orders_idempotency_keys', 'Stored Idempotency-Key responses.', idempotency_stats['keys']),
+            ('orders_admission_in_flight', 'Requests admitted and being processed.', admission_stats['in_flight']),
+            ('orders_admission_queued', 'Requests waiting for admission.', admission_stats['queued']),
+        ], [
+            ('orders_admission_admitted_total', 'Requests admitted.', admission_stats['admitted']),
+            ('orders_admission_shed_total', 'Requests rejected with 503 by load shedding.', admission_stats['shed']),
+            (
+                'orders_idempotent_replays_total',
+                'Retried requests answered with a stored response.',
+                idempotency_stats['replayed'],
+            ),
+        ]),
+        media_type=CONTENT_TYPE,
+    )
 
 # /orders URL パスの GET エンドポイントを登録
 @app.get('/orders', response_model=GetOrdersSchema)
 # 関数シグネチャに URL クエリパラメータを追加
-def get_orders(cancelled: Optional[bool] = None, limit: Optional[int] = None):
-    # パラメータが設定されていない場合はすぐに制御を戻す
-    if cancelled is None and limit is None:
-        return {'orders': orders}
-    
-    # いずれかのパラメータが設定されている場合は、リストを query_set に絞り込む
-    query_set = [order for order in orders]
-
-    # cancelled が設定されているかどうかを確認
-    if cancelled is not None:
-        if cancelled:
-            query_set = [
-                order
-                for order in query_set
-                if order['status'] == 'cancelled'
-            ]
-        else:
-            query_set = [
-                order
-                for order in query_set
-                if order['status'] != 'cancelled'
-            ]
-    
-    # limit が設定されていて、その値が query_set のサイズよりも小さい場合は、
-    # query-set のサブセットを返す
+async def get_orders(
+    filters: OrdersQuery = Depends(_order_filters),
+    limit: Optional[int] = None,
+    after: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+):
+    # コレクション全体の版数が変わっていなければ、一覧を取り出さずに 304 を返す
+    etag = make_etag(await orders.version())
+    if etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+
+    # after が設定されている場合は、カーソルの次の注文から返す
+    try:
+        after_key = decode_cursor(after) if after is not None else None
+    except ValueError as error:
+        raise HTTPException(status_code=422, detail=str(error))
+
+    # 次のページがあるかどうかを判定するために、limit より 1 件多く取り出す
+    # 絞り込み条件はリポジトリのインデックスで候補の最も少ないものから調べる
+    query_set = await orders.list(
+        query=filters,
+        after=after_key,
+        limit=limit + 1 if limit is not None else None,
+    )
+
+    # limit が設定されていて、まだ続きがある場合は次のページのカーソルを返す
+    next_cursor = None
     if limit is not None and len(query_set) > limit:
-        return {'orders': query_set[:limit]}
-    
-    return {'orders': query_set}
+        query_set = query_set[:limit]
+        next_cursor = encode_cursor(query_set[-1]) if query_set else None
+    return JSONBytesResponse(
+        encode_orders_page([orders.encode(order) for order in query_set], next_cursor),
+        headers={'ETag': etag},
+    )
+
+# 注文を 1 行 1 件の NDJSON としてストリーミングでエクスポートする
+# /orders/{order_id} より先に登録し、export が注文 ID として解釈されないようにする
+@app.get('/orders/export', response_class=StreamingResponse)
+async def export_orders(filters: OrdersQuery = Depends(_order_filters)):
+    # ジェネレータから 1 件ずつシリアライズするので、メモリ使用量は一定
+    records = orders.scan(query=filters)
+    return StreamingResponse(
+        (orders.encode(order) + b'\n' for order in records),
+        media_type='application/x-ndjson',
+    )
+
+async def _event_stream(last_event_id):
+    while True:
+        events = feed.since(last_event_id)
+        if events is None:
+            # 再開位置のイベントがすでに破棄されている場合は reset イベントを送り、
+            # クライアントに注文を取得し直してもらってから最新の位置で続ける
+            last_event_id = feed.last_event_id
+            yield f'id: {last_event_id}\nevent: reset\ndata: {{}}\n\n'.encode()
+        elif events:
+            last_event_id = events[-1][0]
+            yield b''.join(frame for _, frame, _ in events)
+        elif not await feed.wait(last_event_id, _HEARTBEAT_INTERVAL):
+            yield b': keepalive\n\n'
+
+# ステータスごとの件数、商品名ごと・サイズごとの数量、1 時間ごとの作成件数を返す
+# リポジトリが変更のたびに差分を加減している集計を読み出すだけなので、
+# 注文の件数に関係なく一定の時間で返せる。/orders/{order_id} より先に登録する
+@app.get('/orders/stats', response_model=GetOrderStatsSchema)
+async def get_order_stats(buckets: int = Query(24, ge=1, le=744)):
+    return await orders.stats(buckets)
+
+# 注文のステータスの変更を Server-Sent Events でストリーミングする
+# /orders/{order_id} より先に登録し、events が注文 ID として解釈されないようにする
+@app.get('/orders/events', response_class=StreamingResponse)
+async def stream_order_events(
+    after: Optional[int] = None, last_event_id: Optional[str] = Header(None)
+):
+    # クライアントが切断すると StreamingResponse がジェネレータをキャンセルする
+    return StreamingResponse(
+        _event_stream(_resume_position(after, last_event_id)),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+# SSE を使えないクライアントのための長ポーリング
+# after より後のイベントがあればすぐに返し、なければ timeout 秒まで待つ
+@app.get('/orders/events/poll')
+async def poll_order_events(
+    after: Optional[int] = None,
+    timeout: float = Query(30, ge=0, le=60),
+    limit: int = Query(1000, ge=1, le=1000),
+    last_event_id: Optional[str] = Header(None),
+):
+    after = _resume_position(after, last_event_id)
+    events = feed.since(after, limit)
+    if events == []:
+        await feed.wait(after, timeout)
+        events = feed.since(after, limit)
+    if events is None:
+        return JSONBytesResponse(encode_events_page([], feed.last_event_id, reset=True))
+    last_event_id = events[-1][0] if events else after
+    return JSONBytesResponse(
+        encode_events_page([record for _, _, record in events], last_event_id)
+    )
 
 # レスポンスのステータスコートが 201 (Created) であることを指定
 @app.post('/orders', status_code=status.HTTP_201_CREATED, response_model=GetOrderSchema)
 # ペイロードを関数のパラメータとして宣言することでインターセプトし、型ヒントを使って検証
-def create_order(order_details: CreateOrderSchema):
-    # 各注文をディクショナリに変換
-    order = order_details.dict()
-    # ID などのサーバー側の属性で order オブジェクトを拡張
-    order['id'] = uuid.uuid4()
-    order['created'] = datetime.utcnow()
-    order['status'] = 'created'
-    # 注文を作成するには、その注文をリストに追加
-    orders.append(order)
-    # 注文をリストに追加した後、その注文を返す
-    return order
+async def create_order(order_details: CreateOrderSchema):
+    # ID などのサーバー側の属性を設定し、保存用のコンパクトな注文に変換
+    order = _new_order(order_details)
+    # 注文を作成するには、その注文をリポジトリに追加
+    await orders.add(order)
+    # 注文をリポジトリに追加した後、その注文を返す
+    return _order_response(order, status_code=status.HTTP_201_CREATED)
+
+# 複数の注文を 1 回のリクエストで作成する
+# /orders/{order_id} より先に登録し、batch が注文 ID として解釈されないようにする
+@app.post('/orders/batch', status_code=status.HTTP_201_CREATED, response_model=CreateOrdersBatchResultSchema)
+async def create_orders(batch: CreateOrdersBatchSchema):
+    # 各注文を検証し、有効な注文だけを作成する。無効な注文はインデックスとエラーを報告する
+    results, created = [], []
+    for index, payload in enumerate(batch.orders):
+        try:
+            order_details = CreateOrderSchema.model_validate(payload)
+        except ValidationError as error:
+            results.append((index, json.loads(error.json(include_url=False))))
+            continue
+        order = _new_order(order_details)
+        created.append(order)
+        results.append((index, order))
+
+    # 有効な注文は 1 回の操作でまとめてリポジトリに追加する
+    await orders.add_many(created)
+
+    # すべて作成できた場合は 201、一部が失敗した場合は 207 (Multi-Status) を返す
+    return JSONBytesResponse(
+        encode_batch_results(
+            (index, orders.encode(result) if isinstance(result, OrderRecord) else result)
+            for index, result in results
+        ),
+        status_code=(
+            status.HTTP_201_CREATED
+            if len(created) == len(results)
+            else status.HTTP_207_MULTI_STATUS
+        ),
+    )
 
 # order_id などの URL パラメータを波かっこで囲んで定義
 @app.get('/orders/{order_id}', response_model=GetOrderSchema)
-def get_order(order_id: UUID): # URL パラメータを関数の引数として取得
-    # 注文を ID で検索するたけに、ORDERS リストを順番に処理して ID をチェック
-    for order in orders:
-        if order['id'] == order_id:
-            return order
-    # 注文が見つからない場合は、status_code を 404 に設定した上で
-    # HTTPException を生成し、 404 レスポンスを返す
-    raise HTTPException(
-        status_code=404,
-        detail=f'Order wiith ID {order_id} not found'
-        )
+async def get_order( # URL パラメータを関数の引数として取得
+    order_id: UUID, if_none_match: Optional[str] = Header(None)
+):
+    # 注文を ID のハッシュインデックスで検索
+    order = await orders.get(order_id)
+    if order is None:
+        raise _order_not_found(order_id)
+    # 版数が変わっていなければ、シリアライズせずに 304 を返す
+    etag = make_etag(order.version)
+    if etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+    return _order_response(order)
+
+
+# 変更操作は If-Match ヘッダーの ETag で楽観的排他制御を行う
+async def _update_order(order_id, if_match, **fields):
+    try:
+        order = await orders.update(order_id, if_match=parse_if_match(if_match), **fields)
+    except VersionConflict as error:
+        raise _version_conflict(error)
+    except StatusConflict as error:
+        raise _status_conflict(error)
+    if order is None:
+        archived = await orders.archived(order_id)
+        raise _order_archived(order_id) if archived else _order_not_found(order_id)
+    return order
+
+
+@app.put('/orders/{order_id}', response_model=GetOrderSchema)
+async def update_order(
+    order_id: UUID, order_details: CreateOrderSchema, if_match: Optional[str] = Header(None)
+):
+    order = await _update_order(
+        order_id, if_match, items=make_items(order_details.dict()['order'])
+    )
+    await _publish('order.updated', order)
+    return _order_response(order)
 
-@app.put('/orders/{order_id, response_model=GetOrderSchema}')
-def update_order(order_id: UUID, order_details: CreateOrderSchema):
-    for order in orders:
-        if order['id'] == order_id:
-            order.update(order_details.dict())
-            return order
-    raise HTTPException(
-        status_code=404,
-        detail=f'Order wiith ID {order_id} not found'
-        )
-        
 
 @app.delete('/orders/{order_id}', status_code=status.HTTP_204_NO_CONTENT, response_class=Response)
-def delete_order(order_id: UUID):
-    # list.pop() メソッドを使ってリストから注文を削除
-    for index, order in enumerate(orders):
-        if order['id'] == order_id:
-            orders.pop(index)
-            return 
-    raise HTTPException(
-        status_code=404,
-        detail=f'Order wiith ID {order_id} not found'
-        )
+async def delete_order(order_id: UUID, if_match: Optional[str] = Header(None)):
+    # リポジトリから注文を O(1) で削除
+    try:
+        deleted = await orders.delete(order_id, if_match=parse_if_match(if_match))
+    except VersionConflict as error:
+        raise _version_conflict(error)
+    if not deleted:
+        archived = await orders.archived(order_id)
+        raise _order_archived(order_id) if archived else _order_not_found(order_id)
 
 @app.post('/orders/{order_id}/cancel', response_model=GetOrderSchema)
-def cancel_order(order_id: UUID):
-    for order in orders:
-        if order['id'] == order_id:
-            order['status'] = 'cancelled'
-            return order
-    raise HTTPException(
-        status_code=404,
-        detail=f'Order wiith ID {order_id} not found'
-        )
+async def cancel_order(order_id: UUID, if_match: Optional[str] = Header(None)):
+    order = await _update_order(order_id, if_match, status='cancelled')
+    await _publish('order.cancelled', order)
+    return _order_response(order)
 
 
 @app.post('/orders/{order_id}/pay', response_model=GetOrderSchema)
-def pay_order(order_id: UUID):
-    for order in orders:
-        if order['id'] == order_id:
-            order['status'] = 'progress'
-            return order
-    raise HTTPException(
-        status_code=404,
-        detail=f'Order wiith ID {order_id} not found'
-        )
+async def pay_order(order_id: UUID, if_match: Optional[str] = Header(None)):
+    # 注文の変更と同時にアウトボックスに追加し、厨房への送信はディスパッチャーに任せる。
+    # 支払えるのは作成済みの注文だけで、ステータスの確認とアウトボックスへの追加は
+    # リポジトリが同じロック（トランザクション）の中で行う。二重の支払いやキャンセル済みの
+    # 注文の支払いで、厨房に同じ注文を送らないようにする
+    order = await _update_order(
+        order_id, if_match, status='progress', outbox=dispatcher is not None,
+        if_status={'created'},
+    )
+    if dispatcher is not None:
+        dispatcher.notify()
+    await _publish('order.paid', order)
+    return _order_response(order)
@@ -0,0 +1,59 @@
+import json
+
+from orders.metrics.middleware import serialization_phase
+
+
+# 保存済みの注文（OrderRecord）を GetOrderSchema と同じ形の JSON バイト列にエンコード
+# 整数で保持している ID と作成日時は、ここで API の表現に変換する
+@serialization_phase
+def encode_order(order):
+    return json.dumps(
+        {
+            'order': [
+                {'product': item.product, 'size': item.size, 'quantity': item.quantity}
+                for item in order.items
+            ],
+            'id': str(order.uuid),
+            'created': order.created_at.isoformat(),
+            'status': order.status,
+        },
+        separators=(',', ':'),
+    ).encode()
+
+
+# エンコード済みの注文を GetOrdersSchema と同じ形の JSON バイト列に連結する
+@serialization_phase
+def encode_orders_page(encoded_orders, next_cursor=None):
+    return b''.join((
+        b'{"orders":[',
+        b','.join(encoded_orders),
+        b'],"next_cursor":',
+        json.dumps(next_cursor).encode(),
+        b'}',
+    ))
+
+
+# 変更フィードのイベントを長ポーリングのレスポンスの JSON バイト列に連結する
+# records には ChangeFeed がエンコード済みのイベントの JSON を渡す
+@serialization_phase
+def encode_events_page(records, last_event_id, reset=False):
+    return b''.join((
+        b'{"events":[',
+        b','.join(records),
+        b'],"last_event_id":%d,"reset":%s}' % (last_event_id, b'true' if reset else b'false'),
+    ))
+
+
+# バッチ作成の結果を CreateOrdersBatchResultSchema と同じ形の JSON バイト列にエンコードする
+# results には (インデックス, エンコード済みの注文またはエラーのリスト) を渡す
+@serialization_phase
+def encode_batch_results(results):
+    encoded = []
+    for index, result in results:
+        if isinstance(result, bytes):
+            encoded.append(b'{"index":%d,"status":201,"order":%s}' % (index, result))
+        else:
+            encoded.append(
+                json.dumps({'index': index, 'status': 422, 'errors': result}).encode()
+            )
+    return b'{"results":[' + b','.join(encoded) + b']}'
@@ -0,0 +1,30 @@
+# ETag は版数をそのまま引用符で囲んだ強い ETag として表現する
+def make_etag(version):
+    return f'"{version}"'
+
+
+# If-None-Match ヘッダーが etag に一致するかどうかを判定する
+# GET の条件付きリクエストでは弱い比較を使うので、W/ の接頭辞は無視する
+def etag_matches(header, etag):
+    if header is None:
+        return False
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag == '*' or tag.removeprefix('W/') == etag:
+            return True
+    return False
+
+
+# If-Match ヘッダーを、リポジトリの update() と delete() に渡す版数の集合に変換する
+# ヘッダーがない場合と * の場合は None を返し、版数を確認しない。
+# 書き込みの条件付きリクエストでは強い比較を使うので、弱い ETag と不正な ETag は
+# どの版数にも一致しない
+def parse_if_match(header):
+    if header is None or header.strip() == '*':
+        return None
+    versions = set()
+    for tag in header.split(','):
+        tag = tag.strip()
+        if len(tag) > 2 and tag[0] == tag[-1] == '"' and tag[1:-1].isdigit():
+            versions.add(int(tag[1:-1]))
+    return versions
@@ -0,0 +1,21 @@
+import base64
+import json
+from datetime import datetime
+from uuid import UUID
+
+
+# カーソルは最後に返した注文の (created, 注文 ID) を URL セーフな Base64 で
+# エンコードした不透明な文字列として表現する
+def encode_cursor(order):
+    payload = json.dumps([order.created_at.isoformat(), str(order.uuid)])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+# 不正なカーソルの場合は ValueError を送出する
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created, order_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created), UUID(order_id)
+    except (TypeError, ValueError) as error:
+        raise ValueError(f'Invalid cursor {cursor}') from error
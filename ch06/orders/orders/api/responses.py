@@ -0,0 +1,7 @@
+from starlette.responses import Response
+
+
+# エンコード済みの JSON バイト列をそのまま返すレスポンスクラス
+# response_model による検証と再シリアライズを省略する
+class JSONBytesResponse(Response):
+    media_type = 'application/json'
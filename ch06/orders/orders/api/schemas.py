@@ -1,7 +1,7 @@
 
 from datetime import datetime
 from enum import Enum
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from uuid import UUID
 
 from pydantic import BaseModel, Extra, conint, validator, conlist
@@ -52,4 +52,40 @@ class GetOrderSchema(CreateOrderSchema):
 
 class GetOrdersSchema(BaseModel):
     orders: List[GetOrderSchema]
+    # 次のページを取得するためのカーソル。続きがない場合は None
+    next_cursor: Optional[str] = None
 
+
+class CreateOrdersBatchSchema(BaseModel):
+    # 各注文は CreateOrderSchema で個別に検証し、失敗した注文だけをエラーとして報告する
+    orders: conlist(Any, min_length=1, max_length=1000)
+
+    class Config:
+        extra = Extra.forbid
+
+class OrderBatchResultSchema(BaseModel):
+    index: int
+    status: int
+    order: Optional[GetOrderSchema] = None
+    errors: Optional[List[Any]] = None
+
+class CreateOrdersBatchResultSchema(BaseModel):
+    results: List[OrderBatchResultSchema]
+
+
+class ItemQuantitiesSchema(BaseModel):
+    # 商品名ごと、サイズごとの数量の合計
+    product: Dict[str, int]
+    size: Dict[str, int]
+
+class OrdersBucketSchema(BaseModel):
+    # start 以上 end 未満に作成された注文の件数
+    start: datetime
+    end: datetime
+    orders: int
+
+class GetOrderStatsSchema(BaseModel):
+    total: int
+    status: Dict[str, int]
+    quantity: ItemQuantitiesSchema
+    buckets: List[OrdersBucketSchema]
@@ -1,17 +1,113 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
 from pathlib import Path
-import yaml
+
+from fastapi import FastAPI
+from starlette.responses import Response
+from starlette.routing import request_response
+
+from coffeemesh.admission.controller import HIGH, LOW, AdmissionController, RateLimiter
+from coffeemesh.api.openapi import OpenAPIDocument
+from coffeemesh.idempotency.cache import IdempotencyCache
+from coffeemesh.metrics.registry import MetricsRegistry
+
+from orders.admission.middleware import AdmissionMiddleware
+from orders.config import BaseConfig
+from orders.idempotency.middleware import IdempotencyMiddleware
+from orders.metrics.middleware import InstrumentedRoute, MetricsMiddleware, instrument_route
+from orders.repository.shared_repository import SharedOrderRepository
+
+# アプリケーションの起動時に start()、終了時に stop() を呼び出すバックグラウンドサービス
+background_services = []
+
+@asynccontextmanager
+async def lifespan(app):
+    for service in background_services:
+        service.start()
+    yield
+    for service in reversed(background_services):
+        service.stop()
 
 # FastAPI クラスのインスタンスを作成。このオブジェクトは API アプリケーションを表す
-app = FastAPI(debug=True, openapi_url="/openapi/orders.json", docs_url="/docs/orders")
+app = FastAPI(
+    debug=True,
+    openapi_url="/openapi/orders.json",
+    docs_url="/docs/orders",
+    lifespan=lifespan,
+)
 
-# PyYAML を使って API 仕様書をロード
-oas_doc = yaml.safe_load(
-    (Path(__file__).parent / '../oas.yaml').read_text()
+# ルートごとのリクエスト数とレイテンシーを記録し、/metrics で公開する。
+# ビュー関数は api モジュールの読み込み時に登録されるので、その前にルートクラスを設定する
+# Idempotency-Key を付けて再送された注文の作成と支払いには、最初のレスポンスを返す。
+# メトリクスのミドルウェアの内側に置き、再送もルートごとに記録する。
+# 保存先が 'shared' の場合は、ストアのサーバーのキャッシュをスレッドプールから使い、
+# 別のワーカーに届いた再送も重複排除する
+if BaseConfig.STORAGE_BACKEND == 'shared':
+    idempotency = SharedOrderRepository(
+        BaseConfig.SHARED_STORE_SOCKET, BaseConfig.SHARED_STORE_AUTHKEY
+    ).idempotency()
+else:
+    idempotency = IdempotencyCache(BaseConfig.IDEMPOTENCY_CACHE_SIZE, BaseConfig.IDEMPOTENCY_TTL)
+app.add_middleware(
+    IdempotencyMiddleware,
+    cache=idempotency,
+    routes=[('POST', '/orders'), ('POST', '/orders/{order_id}/pay')],
+    blocking=BaseConfig.STORAGE_BACKEND == 'shared',
 )
 
+# 過負荷のときは、同時に処理するリクエストの数とクライアントごとのレートを制限し、
+# 超えたリクエストはすぐに 429 や 503 で断る。1 件の読み取りは一覧より優先して処理する。
+# 冪等キーのミドルウェアの外側に置き、再送の嵐も制限する
+admission = AdmissionController(
+    capacity=BaseConfig.ADMISSION_CAPACITY,
+    route_limits={
+        ('GET', '/orders'): 16,
+        ('GET', '/orders/export'): 2,
+        ('POST', '/orders/batch'): 4,
+    },
+    low_priority_share=BaseConfig.ADMISSION_LOW_PRIORITY_SHARE,
+    max_queue=BaseConfig.ADMISSION_QUEUE_SIZE,
+    queue_timeout=BaseConfig.ADMISSION_QUEUE_TIMEOUT,
+)
+app.add_middleware(
+    AdmissionMiddleware,
+    controller=admission,
+    routes={
+        ('GET', '/metrics'): HIGH,
+        ('GET', '/orders/stats'): HIGH,
+        ('GET', '/orders/events'): None,
+        ('GET', '/orders/events/poll'): None,
+        ('GET', '/orders/export'): LOW,
+        ('POST', '/orders/batch'): LOW,
+        ('GET', '/orders'): LOW,
+        ('GET', '/orders/{order_id}'): HIGH,
+    },
+    limiter=(
+        RateLimiter(BaseConfig.ADMISSION_RATE, BaseConfig.ADMISSION_BURST)
+        if BaseConfig.ADMISSION_RATE > 0 else None
+    ),
+)
+
+# API 仕様書はビルド時にコンパイルした JSON を最初のリクエストで読み込み、
+# エンコード済みのバイト列のまま返す。FastAPI が登録するルートはリクエストのたびに
+# ディクショナリを JSON にエンコードするので、ビュー関数を差し替える
+openapi_document = OpenAPIDocument(Path(__file__).parents[1] / 'oas.yaml')
+
+async def openapi_json(request):
+    return Response(openapi_document.content(), media_type='application/json')
+
+for route in app.router.routes:
+    if route.path == app.openapi_url:
+        route.endpoint = openapi_json
+        route.app = request_response(openapi_json)
+
 # FastAPI の openapi プロパティを上書きし、API 仕様書を返すようにする
-app.openapi = lambda: oas_doc
+app.openapi = openapi_document.document
+
+metrics = MetricsRegistry()
+for route in app.router.routes:
+    route.app = instrument_route(route.app, route.path)
+app.router.route_class = InstrumentedRoute
+app.add_middleware(MetricsMiddleware, registry=metrics)
 
 # api モジュールをインポートし、読み込み時にビュー関数を登録できるようにする
 from orders.api import api
\ No newline at end of file
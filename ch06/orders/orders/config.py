@@ -0,0 +1,53 @@
+import os
+
+
+class BaseConfig:
+    # 注文の保存先: 'memory'（インメモリ）、'journal'（ジャーナルで永続化する
+    # インメモリ）、'sqlite' または 'shared'（共有ストアのサーバー）
+    STORAGE_BACKEND = os.getenv('ORDERS_STORAGE_BACKEND', 'memory')
+    SQLITE_PATH = os.getenv('ORDERS_SQLITE_PATH', 'orders.db')
+    JOURNAL_DIR = os.getenv('ORDERS_JOURNAL_DIR', 'orders-journal')
+    # この件数のレコードを追記するごとにスナップショットを書き出す
+    JOURNAL_SNAPSHOT_EVERY = int(os.getenv('ORDERS_JOURNAL_SNAPSHOT_EVERY', 100_000))
+    # 複数のワーカープロセスで注文を共有するストアのサーバーの UNIX ソケットと認証キー。
+    # サーバー自身の保存先は SHARED_STORE_BACKEND（'memory' または 'journal'）
+    SHARED_STORE_SOCKET = os.getenv('ORDERS_SHARED_STORE_SOCKET', 'orders-store.sock')
+    SHARED_STORE_AUTHKEY = os.getenv('ORDERS_SHARED_STORE_AUTHKEY', 'orders-store').encode()
+    SHARED_STORE_BACKEND = os.getenv('ORDERS_SHARED_STORE_BACKEND', 'memory')
+    # 支払い済みの注文を送る厨房 API の URL。設定されていない場合は送信しない
+    KITCHEN_URL = os.getenv('ORDERS_KITCHEN_URL')
+    DISPATCH_WORKERS = int(os.getenv('ORDERS_DISPATCH_WORKERS', 2))
+    DISPATCH_BATCH_SIZE = int(os.getenv('ORDERS_DISPATCH_BATCH_SIZE', 100))
+    DISPATCH_POOL_SIZE = int(os.getenv('ORDERS_DISPATCH_POOL_SIZE', 4))
+    # SQLite の保存先で、送信中のアウトボックスのエントリを他のワーカーが
+    # 取り出し直せるようになるまでの秒数
+    OUTBOX_LEASE = float(os.getenv('ORDERS_OUTBOX_LEASE', 60))
+    # 変更フィードのリングバッファに保持するイベントの件数
+    CHANGE_FEED_SIZE = int(os.getenv('ORDERS_CHANGE_FEED_SIZE', 10_000))
+    # Idempotency-Key ごとに保存するレスポンスの件数の上限と、保存する期間（秒）
+    IDEMPOTENCY_CACHE_SIZE = int(os.getenv('ORDERS_IDEMPOTENCY_CACHE_SIZE', 10_000))
+    IDEMPOTENCY_TTL = float(os.getenv('ORDERS_IDEMPOTENCY_TTL', 86_400))
+    # 終了状態の注文を移す圧縮アーカイブのディレクトリ。注文は作成日時から
+    # RETENTION_AGE 秒を過ぎたものを RETENTION_INTERVAL 秒ごとに移す。0 の場合は移さない
+    ARCHIVE_DIR = os.getenv('ORDERS_ARCHIVE_DIR', 'orders-archive')
+    RETENTION_AGE = float(os.getenv('ORDERS_RETENTION_AGE', 0))
+    RETENTION_INTERVAL = float(os.getenv('ORDERS_RETENTION_INTERVAL', 60))
+    RETENTION_BATCH_SIZE = int(os.getenv('ORDERS_RETENTION_BATCH_SIZE', 1000))
+    # 同時に処理するリクエストの数の上限と、一覧などの重いリクエストに使える割合
+    ADMISSION_CAPACITY = int(os.getenv('ORDERS_ADMISSION_CAPACITY', 64))
+    ADMISSION_LOW_PRIORITY_SHARE = float(os.getenv('ORDERS_ADMISSION_LOW_PRIORITY_SHARE', 0.5))
+    # 上限に達している間に待たせるリクエストの件数と、待たせる時間（秒）の上限
+    ADMISSION_QUEUE_SIZE = int(os.getenv('ORDERS_ADMISSION_QUEUE_SIZE', 256))
+    ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ORDERS_ADMISSION_QUEUE_TIMEOUT', 0.5))
+    # クライアントごとの 1 秒あたりのリクエスト数と、一度に送れるリクエスト数。
+    # ADMISSION_RATE が 0（既定値）の場合はレート制限を行わない
+    ADMISSION_RATE = float(os.getenv('ORDERS_ADMISSION_RATE', 0))
+    ADMISSION_BURST = int(os.getenv('ORDERS_ADMISSION_BURST', 200))
+
+
+class Production(BaseConfig):
+    debug = False
+
+
+class Development(BaseConfig):
+    debug = True
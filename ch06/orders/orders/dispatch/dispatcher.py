@@ -0,0 +1,135 @@
+import logging
+import random
+import threading
+
+from orders.dispatch.kitchen_client import KitchenRejected, KitchenUnavailable
+
+
+logger = logging.getLogger(__name__)
+
+
+# 支払い済みの注文を厨房サービスに送るディスパッチャー
+# pay_order はアウトボックスにエントリを追加するだけで、厨房への送信は待たない。
+# バックグラウンドのワーカーがアウトボックスからエントリを取り出し、まとまった件数を
+# 1 回のバッチリクエストで送信する。送信に失敗した場合は指数バックオフで再試行する。
+# 再送しても重複しないように、各スケジュールには注文 ID を idempotency_key として付ける
+class KitchenDispatcher:
+
+    def __init__(
+        self,
+        repository,
+        client,
+        workers=2,
+        batch_size=100,
+        linger=0.01,
+        poll_interval=1.0,
+        initial_backoff=0.1,
+        max_backoff=30.0,
+    ):
+        self._repository = repository
+        self._client = client
+        self._workers = workers
+        self._batch_size = batch_size
+        # バーストをまとめるために、バッチが埋まるまで待つ最大の時間（秒）
+        self._linger = linger
+        self._poll_interval = poll_interval
+        self._initial_backoff = initial_backoff
+        self._max_backoff = max_backoff
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._threads = []
+        self._stats_lock = threading.Lock()
+        self.dispatched = 0
+        self.rejected = 0
+        self.retries = 0
+
+    def notify(self):
+        # アウトボックスにエントリが追加されたことをワーカーに知らせる
+        self._wakeup.set()
+
+    def start(self):
+        self._stopped.clear()
+        for number in range(self._workers):
+            thread = threading.Thread(
+                target=self._run, name=f'kitchen-dispatcher-{number}', daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+        self._client.close()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+            entries = self._repository.claim_outbox(self._batch_size)
+            if not entries:
+                # 通知がなくても、再起動前に残っていたエントリを定期的に確認する
+                self._wakeup.wait(self._poll_interval)
+                continue
+            # バッチが埋まっていなければ少し待ち、その間に追加されたエントリもまとめる
+            if len(entries) < self._batch_size and self._linger:
+                self._stopped.wait(self._linger)
+                entries += self._repository.claim_outbox(self._batch_size - len(entries))
+            self._dispatch(entries)
+
+    def _dispatch(self, entries):
+        backoff = self._initial_backoff
+        while entries:
+            sequences = [sequence for sequence, _ in entries]
+            payloads = [
+                {'order': payload['order'], 'idempotency_key': payload['id']}
+                for _, payload in entries
+            ]
+            try:
+                results = self._client.schedule_orders(payloads)
+            except KitchenUnavailable as error:
+                if self._stopped.is_set():
+                    self._repository.release_outbox(sequences)
+                    return
+                backoff = self._backoff(backoff, f'Kitchen unavailable ({error})')
+                continue
+            except KitchenRejected as error:
+                # 再試行しても成功しないので、エントリを破棄して記録を残す
+                logger.error('Kitchen rejected %d orders: %s', len(entries), error)
+                self._repository.ack_outbox(sequences)
+                with self._stats_lock:
+                    self.rejected += len(entries)
+                return
+
+            # 409 は前回送信した同じ注文のスケジュールを厨房が作成中であることを示すので、
+            # その注文だけ時間をおいて送り直し、作成された結果を受け取る
+            retry = [entries[result['index']] for result in results if result['status'] == 409]
+            rejected = [result for result in results if result['status'] not in (201, 409)]
+            for result in rejected:
+                payload = entries[result['index']][1]
+                logger.error(
+                    'Kitchen rejected order %s: %s', payload['id'], result.get('errors')
+                )
+            retried = {sequence for sequence, _ in retry}
+            self._repository.ack_outbox(
+                [sequence for sequence in sequences if sequence not in retried]
+            )
+            with self._stats_lock:
+                self.dispatched += len(entries) - len(retry) - len(rejected)
+                self.rejected += len(rejected)
+            entries = retry
+            if entries:
+                if self._stopped.is_set():
+                    self._repository.release_outbox(list(retried))
+                    return
+                backoff = self._backoff(backoff, f'{len(entries)} orders still being scheduled')
+
+    def _backoff(self, backoff, reason):
+        # ジッターを加えた指数バックオフで待ち、次の待ち時間を返す
+        with self._stats_lock:
+            self.retries += 1
+        delay = backoff * random.uniform(0.5, 1.0)
+        logger.warning('%s, retrying in %.2fs', reason, delay)
+        self._stopped.wait(delay)
+        return min(backoff * 2, self._max_backoff)
@@ -0,0 +1,97 @@
+import http.client
+import json
+import queue
+from urllib.parse import urlsplit
+
+
+# 厨房サービスに接続できない、または一時的にリクエストを処理できない場合の例外
+# 時間をおいて再試行すれば成功する可能性がある
+class KitchenUnavailable(Exception):
+    pass
+
+
+# 厨房サービスがリクエストを拒否した場合の例外。再試行しても成功しない
+class KitchenRejected(Exception):
+    pass
+
+
+# 厨房 API のクライアント
+# キープアライブの HTTP 接続をプールして再利用し、リクエストごとに
+# 新しい接続を開かないようにする
+class KitchenClient:
+
+    def __init__(self, base_url, pool_size=4, timeout=5):
+        url = urlsplit(base_url)
+        self._connection_class = (
+            http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        )
+        self._host = url.hostname
+        self._port = url.port
+        self._prefix = url.path.rstrip('/')
+        self._timeout = timeout
+        # 使用されていない接続のプール。最後に返した接続から再利用する
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self):
+        return self._connection_class(self._host, self._port, timeout=self._timeout)
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait(), True
+        except queue.Empty:
+            return self._connect(), False
+
+    def _release(self, connection):
+        try:
+            self._pool.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _request(self, method, path, payload, idempotent=False):
+        # プールしていた接続がサーバー側で閉じられていた場合は、新しい接続で一度だけやり直す。
+        # リクエストを送り終えた後の失敗では、サーバーが処理したかどうか分からないので、
+        # 同じリクエストを二度処理しても結果が変わらない（idempotent）場合だけやり直す
+        body = json.dumps(payload).encode()
+        headers = {'Content-Type': 'application/json', 'Connection': 'keep-alive'}
+        connection, reused = self._acquire()
+        while True:
+            sent = False
+            try:
+                connection.request(method, self._prefix + path, body, headers)
+                sent = True
+                response = connection.getresponse()
+                data = response.read()
+            except (OSError, http.client.HTTPException) as error:
+                connection.close()
+                if reused and (not sent or idempotent):
+                    connection, reused = self._connect(), False
+                    continue
+                raise KitchenUnavailable(str(error)) from error
+            break
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(connection)
+        return response.status, data
+
+    def schedule_orders(self, orders):
+        # orders は厨房 API のバッチの各スケジュールの形のペイロードのリスト。
+        # 厨房 API のバッチエンドポイントで 1 回のリクエストにまとめて送信する。
+        # すべてのスケジュールに idempotency_key が付いていれば、厨房は再送を
+        # 重複して作成しないので、送信後の失敗でもやり直せる
+        idempotent = all('idempotency_key' in order for order in orders)
+        status, data = self._request(
+            'POST', '/kitchen/schedules/batch', {'schedules': orders}, idempotent=idempotent
+        )
+        if status in (201, 207):
+            return json.loads(data)['results']
+        if status == 429 or status >= 500:
+            raise KitchenUnavailable(f'Kitchen API responded with status {status}')
+        raise KitchenRejected(f'Kitchen API responded with status {status}: {data[:200]!r}')
@@ -0,0 +1,114 @@
+import argparse
+import json
+import threading
+import uuid
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# テストやローカルでの開発で厨房サービスの代わりに使うスタブ
+# POST /kitchen/schedules/batch だけを実装し、受け取ったスケジュールを記録する。
+# 厨房 API と同じく、idempotency_key が同じスケジュールは一度だけ記録する
+#
+#   python -m orders.dispatch.kitchen_stub --port 5000
+class KitchenStub:
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.received = []
+        # idempotency_key -> 作成したスケジュール
+        self.keys = {}
+        self.requests = 0
+        # 指定した回数だけ 503 を返し、再試行の動作を確認できるようにする
+        self.failures = 0
+        # 指定した回数だけ、スケジュールを記録した後にレスポンスを返さずに接続を閉じ、
+        # 送信の結果が分からない場合の再送を確認できるようにする
+        self.drops = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # キープアライブの接続を受け付ける
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _respond(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                if self.path != '/kitchen/schedules/batch':
+                    self._respond(404, {'message': 'Not Found'})
+                    return
+                with stub._lock:
+                    stub.requests += 1
+                    if stub.failures:
+                        stub.failures -= 1
+                        self._respond(503, {'message': 'Service Unavailable'})
+                        return
+                    results = []
+                    for index, schedule in enumerate(payload['schedules']):
+                        key = schedule.pop('idempotency_key', None)
+                        if key in stub.keys:
+                            results.append(
+                                {'index': index, 'status': 201, 'schedule': stub.keys[key]}
+                            )
+                            continue
+                        schedule = {
+                            **schedule,
+                            'id': str(uuid.uuid4()),
+                            'scheduled': datetime.utcnow().isoformat(),
+                            'status': 'pending',
+                        }
+                        if key is not None:
+                            stub.keys[key] = schedule
+                        stub.received.append(schedule)
+                        results.append({'index': index, 'status': 201, 'schedule': schedule})
+                    if stub.drops:
+                        stub.drops -= 1
+                        self.close_connection = True
+                        return
+                self._respond(201, {'results': results})
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+    stub = KitchenStub(args.host, args.port)
+    print(f'Kitchen stub listening on {stub.url}')
+    stub._server.serve_forever()
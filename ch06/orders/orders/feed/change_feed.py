@@ -0,0 +1,41 @@
+import asyncio
+
+from coffeemesh.feed.change_feed import ChangeFeed
+
+
+# イベントループ上のビュー関数から新しいイベントを待てる変更フィード
+# 共有ストアを使う場合は、リレーのスレッドからもイベントが追加されるので、
+# 待っているクライアントはイベントループのスレッドで起こす
+class AsyncChangeFeed(ChangeFeed):
+
+    def __init__(self, capacity=10_000):
+        super().__init__(capacity)
+        # 新しいイベントを待っているクライアントを起こすためのイベント。
+        # 発行のたびに新しいオブジェクトに置き換え、それまで待っていたクライアントだけを起こす
+        self._waiting = asyncio.Event()
+        self._loop = None
+
+    def _notify(self):
+        waiting, self._waiting = self._waiting, asyncio.Event()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        # 待っていたループがすでに閉じている場合は、起こすクライアントもいない
+        if self._loop is None or loop is self._loop or self._loop.is_closed():
+            waiting.set()
+        else:
+            self._loop.call_soon_threadsafe(waiting.set)
+
+    async def wait(self, last_event_id, timeout):
+        # last_event_id より後のイベントが発行されるまで待つ。
+        # タイムアウトした場合は False を返す
+        self._loop = asyncio.get_running_loop()
+        waiting = self._waiting
+        if self.last_event_id != last_event_id:
+            return True
+        try:
+            await asyncio.wait_for(waiting.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
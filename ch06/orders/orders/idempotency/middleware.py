@@ -0,0 +1,169 @@
+import hashlib
+import json
+from functools import partial
+
+from anyio import to_thread
+from starlette.routing import compile_path
+
+from coffeemesh.idempotency.cache import IN_PROGRESS, MISMATCH, NEW
+
+from orders.metrics.middleware import current_timer
+
+
+HEADER = b'idempotency-key'
+REPLAYED_HEADER = (b'idempotent-replayed', b'true')
+MAX_KEY_LENGTH = 255
+
+
+# Idempotency-Key ヘッダーの付いたリクエストのレスポンスを保存し、同じキーの再送には
+# 保存したレスポンスをそのまま返す ASGI ミドルウェア
+# ルーティングより前で処理するので、再送ではリクエストボディの検証もビュー関数も
+# 実行しない。キーはメソッド、パス、Authorization ヘッダーごとに区別し、
+# 同じキーで別のボディを送った場合は 422、最初のリクエストの処理中に再送した場合は
+# 409 を返す。5xx のレスポンスは保存せず、再送で処理し直す。
+# routes には (メソッド, ルートのパス) のリストを渡す。共有ストアのサーバーのキャッシュの
+# ようにブロックするキャッシュは、blocking=True でスレッドプールから呼び出す
+class IdempotencyMiddleware:
+
+    def __init__(self, app, cache, routes, blocking=False):
+        self.app = app
+        self.cache = cache
+        self.routes = [
+            (method, path, compile_path(path)[0]) for method, path in routes
+        ]
+        self._blocking = blocking
+
+    async def _call(self, method, *args):
+        # スレッドの処理はキャンセルされても最後まで待つので、abandon() も取りこぼさない
+        if self._blocking:
+            return await to_thread.run_sync(partial(method, *args))
+        return method(*args)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        route = self._route(scope)
+        key = _header(scope, HEADER) if route is not None else None
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+        if len(key) > MAX_KEY_LENGTH:
+            await _send_error(send, 400, f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters')
+            return
+
+        body = await _read_body(receive)
+        if body is None:
+            # ボディを受け取る前にクライアントが切断した
+            return
+        cache_key = (scope['method'], scope['path'], _header(scope, b'authorization'), key)
+        state, response = await self._call(
+            self.cache.begin, cache_key, hashlib.sha256(body).digest()
+        )
+        if state == NEW:
+            await self._process(scope, _replay_body(body, receive), send, cache_key)
+            return
+
+        # 保存したレスポンスもルートのラベルで記録する
+        timer = current_timer.get()
+        if timer is not None:
+            timer.dispatch(scope['method'], route)
+        try:
+            if state == MISMATCH:
+                await _send_error(
+                    send, 422, 'Idempotency-Key was already used with a different request body'
+                )
+            elif state == IN_PROGRESS:
+                await _send_error(
+                    send, 409, 'A request with this Idempotency-Key is being processed',
+                    headers=[(b'retry-after', b'1')],
+                )
+            else:
+                status_code, headers, content = response
+                await send({
+                    'type': 'http.response.start',
+                    'status': status_code,
+                    'headers': headers + [REPLAYED_HEADER],
+                })
+                await send({'type': 'http.response.body', 'body': content})
+        finally:
+            if timer is not None:
+                timer.dispatched()
+
+    def _route(self, scope):
+        for method, path, pattern in self.routes:
+            if scope['method'] == method and pattern.match(scope['path']):
+                return path
+        return None
+
+    async def _process(self, scope, receive, send, cache_key):
+        start = None
+        chunks = []
+
+        async def send_and_store(message):
+            nonlocal start
+            if message['type'] == 'http.response.start':
+                start = message
+            elif message['type'] == 'http.response.body':
+                chunks.append(message.get('body', b''))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_store)
+        except BaseException:
+            await self._call(self.cache.abandon, cache_key)
+            raise
+        if start is None or start['status'] >= 500:
+            await self._call(self.cache.abandon, cache_key)
+        else:
+            await self._call(
+                self.cache.complete,
+                cache_key, (start['status'], list(start.get('headers', ())), b''.join(chunks)),
+            )
+
+
+def _header(scope, name):
+    for header, value in scope['headers']:
+        if header == name:
+            return value.decode('latin-1')
+    return None
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] != 'http.request':
+            return None
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body', False):
+            break
+    return b''.join(chunks)
+
+
+def _replay_body(body, receive):
+    # 読み込んだボディを 1 回で渡し、その後は元の receive で切断を待たせる
+    sent = False
+
+    async def replayed():
+        nonlocal sent
+        if sent:
+            return await receive()
+        sent = True
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    return replayed
+
+
+async def _send_error(send, status_code, detail, headers=()):
+    content = json.dumps({'detail': detail}).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status_code,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(content)).encode()),
+            *headers,
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': content})
@@ -0,0 +1,106 @@
+import functools
+from contextvars import ContextVar
+from time import perf_counter
+
+from fastapi.routing import APIRoute
+
+from coffeemesh.metrics.registry import RequestTimer
+
+
+# 処理中のリクエストの RequestTimer。ミドルウェアが設定し、ルートとエンコーダーが
+# 各フェーズの時刻を書き込む
+current_timer = ContextVar('current_timer', default=None)
+
+
+# リクエストの件数とレイテンシーを記録する ASGI ミドルウェア
+# BaseHTTPMiddleware はリクエストごとにタスクとストリームを作るので使わず、
+# send をラップしてステータスコードを受け取るだけにする
+class MetricsMiddleware:
+
+    def __init__(self, app, registry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        timer = RequestTimer(self.registry)
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                timer.status = message['status']
+            await send(message)
+
+        token = current_timer.set(timer)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            current_timer.reset(token)
+            timer.finish(scope['method'])
+
+
+# ルートごとの処理中のリクエスト数と、検証・ハンドラー・シリアライズの各フェーズの
+# 時刻を記録するルートクラス。app.router.route_class に設定してから
+# ビュー関数を登録する
+class InstrumentedRoute(APIRoute):
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, _instrument_endpoint(endpoint), **kwargs)
+        self.app = instrument_route(self.app, self.path)
+
+
+# ルートの ASGI アプリケーションをラップし、ルートのパスをラベルにして記録する
+# FastAPI が route_class を設定する前に登録するルート（/openapi/orders.json など）にも使う
+def instrument_route(app, path):
+    # ルーティング後に呼び出される。ここからビュー関数の呼び出しまでが
+    # リクエストボディの読み込みとパラメータの検証
+    @functools.wraps(app)
+    async def instrumented(scope, receive, send):
+        timer = current_timer.get()
+        if timer is None:
+            await app(scope, receive, send)
+            return
+        timer.dispatch(scope['method'], path)
+        try:
+            await app(scope, receive, send)
+        finally:
+            timer.dispatched()
+
+    return instrumented
+
+
+def _instrument_endpoint(endpoint):
+    @functools.wraps(endpoint)
+    async def instrumented(*args, **kwargs):
+        timer = current_timer.get()
+        if timer is None:
+            return await endpoint(*args, **kwargs)
+        timer.handler_start = perf_counter()
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            timer.handler_end = perf_counter()
+
+    return instrumented
+
+
+# ハンドラーの中で呼び出すエンコーダーに付けるデコレーター
+# エンコードにかかった時間を、ハンドラーではなくシリアライズのフェーズに数える。
+# エンコーダーの中で別のエンコーダーを呼び出す場合は、外側の時間だけを数える
+def serialization_phase(encoder):
+    @functools.wraps(encoder)
+    def timed(*args, **kwargs):
+        timer = current_timer.get()
+        if timer is None or timer.serializing:
+            return encoder(*args, **kwargs)
+        timer.serializing = True
+        start = perf_counter()
+        try:
+            return encoder(*args, **kwargs)
+        finally:
+            timer.serialization += perf_counter() - start
+            timer.serializing = False
+
+    return timed
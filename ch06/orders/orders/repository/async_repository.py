@@ -0,0 +1,93 @@
+import asyncio
+from contextlib import asynccontextmanager
+from functools import partial
+
+from anyio import to_thread
+
+from orders.repository.codec import load_order
+
+
+# 非同期のビュー関数から注文リポジトリを使うためのラッパー
+# インメモリのリポジトリはイベントループ上で直接呼び出し、SQLite やジャーナルなど
+# ブロックするリポジトリはスレッドプールで呼び出してイベントループを止めないようにする。
+# 同じ注文に対する変更は注文ごとのロックで直列化し、更新が失われないようにする
+class AsyncOrderRepository:
+
+    # archive を指定すると、リポジトリにない注文をアーカイブから読み出す
+    def __init__(self, repository, blocking=False, archive=None):
+        self.repository = repository
+        self._blocking = blocking
+        self._archive = archive
+        # 注文 ID -> [asyncio.Lock, そのロックを待っているタスクの数]
+        self._locks = {}
+
+    async def _call(self, method, *args, **kwargs):
+        if self._blocking:
+            return await to_thread.run_sync(partial(method, *args, **kwargs))
+        return method(*args, **kwargs)
+
+    @asynccontextmanager
+    async def lock(self, order_id):
+        # 注文ごとのロック。使われなくなったロックは破棄してメモリを解放する
+        entry = self._locks.get(order_id)
+        if entry is None:
+            entry = self._locks[order_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[order_id]
+
+    def __len__(self):
+        return len(self.repository)
+
+    def encode(self, order):
+        return self.repository.encode(order)
+
+    def scan(self, **filters):
+        return self.repository.scan(**filters)
+
+    async def get(self, order_id):
+        order = await self._call(self.repository.get, order_id)
+        if order is None and self._archive is not None:
+            # アーカイブはインデックスの追記分の読み込みと、ブロックの読み込みと展開で
+            # ファイルを読むので、ID の確認も含めてスレッドプールで行う
+            record = await to_thread.run_sync(self._archive.get, str(order_id))
+            if record is not None:
+                order = load_order(record)
+        return order
+
+    async def archived(self, order_id):
+        # ID の確認でもインデックスの追記分を読み込むので、スレッドプールで行う
+        if self._archive is None:
+            return False
+        return await to_thread.run_sync(self._archive.__contains__, str(order_id))
+
+    async def list(self, **filters):
+        return await self._call(self.repository.list, **filters)
+
+    async def version(self):
+        return await self._call(self.repository.version)
+
+    async def count(self, status=None):
+        return await self._call(self.repository.count, status)
+
+    async def stats(self, buckets=24):
+        return await self._call(self.repository.stats, buckets)
+
+    async def add(self, order):
+        return await self._call(self.repository.add, order)
+
+    async def add_many(self, orders):
+        return await self._call(self.repository.add_many, orders)
+
+    async def update(self, order_id, **fields):
+        async with self.lock(order_id):
+            return await self._call(self.repository.update, order_id, **fields)
+
+    async def delete(self, order_id, if_match=None):
+        async with self.lock(order_id):
+            return await self._call(self.repository.delete, order_id, if_match=if_match)
@@ -0,0 +1,30 @@
+from datetime import datetime
+from uuid import UUID
+
+from orders.repository.records import OrderRecord, make_items, to_timestamp
+
+
+# 保存用に、注文を JSON に変換できるディクショナリに変換する
+def dump_order(order):
+    return {
+        'order': [
+            {'product': item.product, 'size': item.size, 'quantity': item.quantity}
+            for item in order.items
+        ],
+        'id': str(order.uuid),
+        'created': order.created_at.isoformat(),
+        'status': order.status,
+        'version': order.version,
+    }
+
+
+# dump_order() で変換したディクショナリから注文を復元する
+def load_order(data):
+    return OrderRecord(
+        UUID(data['id']).int,
+        to_timestamp(datetime.fromisoformat(data['created'])),
+        data['status'],
+        make_items(data['order']),
+        # 版数を導入する前に保存された注文は版数 1 として扱う
+        data.get('version', 1),
+    )
@@ -0,0 +1,27 @@
+from orders.repository.journaled_repository import JournaledOrderRepository
+from orders.repository.orders_repository import OrderRepository
+from orders.repository.shared_repository import SharedOrderRepository
+from orders.repository.sqlite_repository import SqliteOrderRepository
+
+
+# 設定の STORAGE_BACKEND に応じて注文リポジトリを生成する
+# backend を指定すると、設定の代わりにその保存先を使う
+def create_order_repository(config, encoder=None, backend=None):
+    backend = backend or config.STORAGE_BACKEND
+    if backend == 'memory':
+        return OrderRepository(encoder=encoder)
+    if backend == 'journal':
+        return JournaledOrderRepository(
+            config.JOURNAL_DIR,
+            encoder=encoder,
+            snapshot_every=config.JOURNAL_SNAPSHOT_EVERY,
+        )
+    if backend == 'sqlite':
+        return SqliteOrderRepository(
+            config.SQLITE_PATH, encoder=encoder, outbox_lease=config.OUTBOX_LEASE
+        )
+    if backend == 'shared':
+        return SharedOrderRepository(
+            config.SHARED_STORE_SOCKET, config.SHARED_STORE_AUTHKEY, encoder=encoder
+        )
+    raise ValueError(f'Unknown storage backend {backend}')
@@ -0,0 +1,127 @@
+import threading
+from itertools import chain
+from uuid import UUID
+
+from coffeemesh.repository.journal import Journal
+
+from orders.repository.codec import dump_order, load_order
+from orders.repository.orders_repository import OrderRepository
+
+
+# ジャーナルで永続化するインメモリの注文リポジトリ
+# 読み取りは OrderRepository のインデックスをそのまま使い、変更操作だけを
+# ジャーナルに追記する。起動時はスナップショットとジャーナルから状態を復元する
+class JournaledOrderRepository(OrderRepository):
+
+    def __init__(self, directory, encoder=None, snapshot_every=100_000, sync_interval=0):
+        super().__init__(encoder=encoder)
+        self._journal = Journal(directory, sync_interval=sync_interval)
+        self._snapshot_every = snapshot_every
+        self._snapshot_thread = None
+        for record in self._journal.load():
+            self._replay(record)
+
+    def _replay(self, record):
+        if record['op'] == 'delete':
+            super().delete(UUID(record['id']))
+            return
+        if record['op'] == 'outbox':
+            self._enqueue_outbox(record['payload'], record['sequence'])
+            return
+        if record['op'] == 'ack':
+            super().ack_outbox(record['sequences'])
+            return
+        order = load_order(record['order'])
+        if order.id in self._orders:
+            # 版数は再生中に数え直さず、記録された値をそのまま使う
+            existing = super().update(order.uuid, status=order.status, items=order.items)
+            existing.version = order.version
+        else:
+            super().add(order)
+        # アウトボックスへの追加は注文の変更と同じレコードに記録している
+        if 'outbox' in record:
+            self._enqueue_outbox(record['order'], record['outbox'])
+
+    def _commit(self, position):
+        # グループコミットで fsync されるまで待ってから呼び出し元に戻る
+        self._journal.wait(position)
+        if self._journal.records_since_snapshot >= self._snapshot_every:
+            self.snapshot(wait=False)
+
+    # インメモリの変更とジャーナルへの追記は同じロックの中で行い、順序をそろえる
+    def add(self, order):
+        with self._lock:
+            super().add(order)
+            position = self._journal.append({'op': 'put', 'order': dump_order(order)})
+        self._commit(position)
+        return order
+
+    def add_many(self, orders):
+        # まとめて追記し、最後のレコードの fsync を 1 回だけ待つ
+        if not orders:
+            return orders
+        with self._lock:
+            super().add_many(orders)
+            for order in orders:
+                position = self._journal.append({'op': 'put', 'order': dump_order(order)})
+        self._commit(position)
+        return orders
+
+    def update(self, order_id, outbox=False, if_match=None, if_status=None, **fields):
+        with self._lock:
+            order = super().update(
+                order_id, outbox=outbox, if_match=if_match, if_status=if_status, **fields
+            )
+            if order is None:
+                return None
+            record = {'op': 'put', 'order': dump_order(order)}
+            if outbox:
+                record['outbox'] = self._outbox_sequence
+            position = self._journal.append(record)
+        self._commit(position)
+        return order
+
+    def ack_outbox(self, sequences):
+        # 送信済みの記録は失われても再送されるだけなので、fsync は待たない
+        with self._lock:
+            super().ack_outbox(sequences)
+            self._journal.append({'op': 'ack', 'sequences': list(sequences)})
+
+    def delete(self, order_id, if_match=None):
+        with self._lock:
+            if not super().delete(order_id, if_match=if_match):
+                return False
+            position = self._journal.append({'op': 'delete', 'id': str(order_id)})
+        self._commit(position)
+        return True
+
+    def snapshot(self, wait=True):
+        # スナップショットはバックグラウンドのスレッドで書き出し、ジャーナルを圧縮する。
+        # 世代の切り替えと、スナップショットに含める注文とアウトボックスのコピーは
+        # 同じロックの中で行い、その間の変更がどちらにも記録されない状態を作らない。
+        # 書き出し中に変更された注文は新しい世代のジャーナルにも記録されるので、
+        # 再生結果は変わらない
+        with self._lock:
+            if self._snapshot_thread is None or not self._snapshot_thread.is_alive():
+                generation = self._journal.rotate()
+                orders = list(self._orders.values())
+                entries = list(self._outbox.items())
+                records = chain(
+                    ({'op': 'put', 'order': dump_order(order)} for order in orders),
+                    (
+                        {'op': 'outbox', 'sequence': sequence, 'payload': payload}
+                        for sequence, payload in entries
+                    ),
+                )
+                self._snapshot_thread = threading.Thread(
+                    target=self._journal.write_snapshot, args=(generation, records), daemon=True
+                )
+                self._snapshot_thread.start()
+            thread = self._snapshot_thread
+        if wait:
+            thread.join()
+
+    def close(self):
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join()
+        self._journal.close()
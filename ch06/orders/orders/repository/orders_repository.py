@@ -0,0 +1,301 @@
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+from coffeemesh.repository.query import HashIndex, QueryEngine
+from coffeemesh.repository.stats import Aggregates, bucket_of, render_stats
+
+from orders.repository.codec import dump_order
+from orders.repository.records import to_timestamp
+from orders.repository.stats import order_contributions
+
+
+# エンコード結果のキャッシュの件数の上限。超えた場合は最も長く使われていない注文から破棄する
+_ENCODED_CACHE_SIZE = 100_000
+
+
+# If-Match で指定された版数が、注文の現在の版数と一致しない場合の例外
+class VersionConflict(Exception):
+
+    def __init__(self, version):
+        super().__init__(f'Order version {version} does not match')
+        self.version = version
+
+    # 共有ストアのサーバーからワーカーに送り返せるように、版数から復元する
+    def __reduce__(self):
+        return type(self), (self.version,)
+
+
+# 注文のステータスが、変更の前提とするステータスと異なる
+class StatusConflict(Exception):
+
+    def __init__(self, status):
+        super().__init__(f'Order status {status} does not allow this change')
+        self.status = status
+
+    def __reduce__(self):
+        return type(self), (self.status,)
+
+
+# インメモリの注文リポジトリ
+# 注文 ID のハッシュインデックス（主インデックス）と、ステータス、商品名、サイズの
+# 二次インデックスを持ち、すべての変更操作ですべてのインデックスを同期する。
+# 注文は OrderRecord として保存し、インデックスのキーには UUID の整数表現を使う。
+# 注文 ID を受け取るメソッドは、API と同じ UUID を受け取る
+class OrderRepository:
+
+    # encoder には注文をレスポンス用の JSON バイト列に変換する関数を指定する。
+    # エンコード結果は注文ごとにキャッシュし、注文が変更されたら破棄する
+    def __init__(self, encoder=None, encoded_cache_size=_ENCODED_CACHE_SIZE):
+        self._encoder = encoder
+        # 注文 ID -> エンコード結果。最近使った順に並べた LRU キャッシュ
+        self._encoded = OrderedDict()
+        self._encoded_cache_size = encoded_cache_size
+        # 変更操作でインデックスを同期している間、他のスレッドからの変更を待たせる
+        self._lock = threading.RLock()
+        # コレクション全体の版数。変更操作のたびに 1 ずつ増やす。
+        # 再起動しても以前の版数と重ならないように、起動時刻（マイクロ秒）から数え始める
+        self._version = _initial_version()
+        # 主インデックス: 注文 ID の整数表現 -> 注文
+        self._orders = {}
+        # 二次インデックス: ステータス、明細の商品名、明細のサイズ -> {注文 ID: None}
+        self._status_index = HashIndex()
+        self._product_index = HashIndex()
+        self._size_index = HashIndex()
+        # 作成順のインデックス: (created, 注文 ID) の整数のタプルを昇順で保持
+        # 削除時は墓石として残し、走査時に読み飛ばす。墓石が増えたら詰め直す
+        self._created_index = []
+        self._tombstones = 0
+        # 一覧の絞り込みは、これらのインデックスを使ってクエリエンジンで実行する。
+        # 作成順のインデックスは詰め直すと置き換わるので、関数で参照する
+        self._query = QueryEngine(
+            self._orders,
+            lambda: self._created_index,
+            _created_key,
+            {
+                'status': self._status_index,
+                'product': self._product_index,
+                'size': self._size_index,
+            },
+            to_key=to_timestamp,
+        )
+        # ステータスごとの件数などの集計。変更操作のたびに差分だけを加減する
+        self._stats = Aggregates()
+        # トランザクショナルアウトボックス: シーケンス番号 -> 厨房に送る注文
+        # 注文の変更と同じロックの中で追加し、ディスパッチャーが送信に成功したら削除する
+        self._outbox = {}
+        self._outbox_claimed = set()
+        self._outbox_sequence = 0
+
+    @contextmanager
+    def batch(self):
+        # インメモリのリポジトリでは、書き込みはその場で反映される
+        yield self
+
+    def __len__(self):
+        return len(self._orders)
+
+    def __contains__(self, order_id):
+        return order_id.int in self._orders
+
+    def version(self):
+        return self._version
+
+    def add(self, order):
+        with self._lock:
+            # 注文ごとの版数は 1 から始め、変更のたびに 1 ずつ増やす
+            self._version += 1
+            self._orders[order.id] = order
+            self._status_index.add(order.id, (order.status,))
+            self._index_items(order)
+            self._stats.apply(order_contributions(order))
+            key = _created_key(order)
+            # 通常は末尾への追加になるので、二分探索の挿入はほぼ O(1)
+            if not self._created_index or self._created_index[-1] < key:
+                self._created_index.append(key)
+            else:
+                bisect.insort(self._created_index, key)
+        return order
+
+    def add_many(self, orders):
+        # すべての注文を 1 回のロックの中で追加し、他のスレッドの変更と混ざらないようにする
+        with self._lock:
+            for order in orders:
+                OrderRepository.add(self, order)
+        return orders
+
+    def get(self, order_id):
+        return self._orders.get(order_id.int)
+
+    def encode(self, order):
+        encoded = self._encoded.get(order.id)
+        if encoded is None:
+            # エンコード中に他のスレッドが注文を変更した場合は、古い内容をキャッシュしない
+            version = self._version
+            encoded = self._encoder(order)
+            with self._lock:
+                if version == self._version and self._orders.get(order.id) is order:
+                    self._encoded[order.id] = encoded
+                    if len(self._encoded) > self._encoded_cache_size:
+                        self._encoded.popitem(last=False)
+        else:
+            try:
+                self._encoded.move_to_end(order.id)
+            except KeyError:
+                # 他のスレッドが同時に注文を変更してキャッシュから破棄した
+                pass
+        return encoded
+
+    # fields には変更する OrderRecord の属性（status や items）を指定する。
+    # outbox=True の場合は、変更後の注文を同じロックの中でアウトボックスに追加する。
+    # if_match に版数の集合を指定すると、現在の版数が含まれない場合は VersionConflict を、
+    # if_status にステータスの集合を指定すると、現在のステータスが含まれない場合は
+    # StatusConflict を送出する
+    def update(self, order_id, outbox=False, if_match=None, if_status=None, **fields):
+        key = order_id.int
+        with self._lock:
+            order = self._orders.get(key)
+            if order is None:
+                return None
+            version = order.version
+            if if_match is not None and version not in if_match:
+                raise VersionConflict(version)
+            if if_status is not None and order.status not in if_status:
+                raise StatusConflict(order.status)
+            # ステータスや明細が変わる場合は二次インデックスを付け替える
+            status = fields.get('status', order.status)
+            if status != order.status:
+                self._status_index.remove(key, (order.status,))
+                self._status_index.add(key, (status,))
+            reindex_items = fields.get('items', order.items) is not order.items
+            if reindex_items:
+                self._unindex_items(order)
+            previous = order_contributions(order)
+            for name, value in fields.items():
+                setattr(order, name, value)
+            if reindex_items:
+                self._index_items(order)
+            self._stats.apply(previous, -1)
+            self._stats.apply(order_contributions(order))
+            order.version = version + 1
+            self._encoded.pop(key, None)
+            self._version += 1
+            if outbox:
+                self._enqueue_outbox(dump_order(order))
+        return order
+
+    def delete(self, order_id, if_match=None):
+        key = order_id.int
+        with self._lock:
+            order = self._orders.get(key)
+            if order is None:
+                return False
+            if if_match is not None and order.version not in if_match:
+                raise VersionConflict(order.version)
+            del self._orders[key]
+            self._encoded.pop(key, None)
+            self._version += 1
+            self._status_index.remove(key, (order.status,))
+            self._unindex_items(order)
+            self._stats.apply(order_contributions(order), -1)
+            self._tombstones += 1
+            if self._tombstones > len(self._orders):
+                self._compact_created_index()
+        return True
+
+    # query には絞り込み条件の Query を指定する。結果は作成日時の順で返す。
+    # after には直前のページの最後の注文の (created, 注文 ID) を指定し、
+    # その次の注文から返す（キーセットページネーション）
+    def list(self, query=None, after=None, limit=None):
+        if after is not None:
+            after = _index_key(after)
+        return self._query.list(query, after, limit)
+
+    def scan(self, query=None, after=None):
+        # 注文を作成順に 1 件ずつ返すジェネレータ。結果をリストに溜めないので、
+        # ストアのサイズに関係なく一定のメモリで全件を走査できる。
+        # 走査中に注文が追加・削除されても安全なように、インデックスの位置で走査する
+        if after is not None:
+            after = _index_key(after)
+        return self._query.scan(query, after)
+
+    def _enqueue_outbox(self, payload, sequence=None):
+        if sequence is None:
+            sequence = self._outbox_sequence + 1
+        self._outbox_sequence = max(self._outbox_sequence, sequence)
+        self._outbox[sequence] = payload
+        return sequence
+
+    def claim_outbox(self, limit):
+        # 他のワーカーが送信中でないエントリを古い順に取り出す
+        entries = []
+        with self._lock:
+            for sequence, payload in self._outbox.items():
+                if sequence in self._outbox_claimed:
+                    continue
+                self._outbox_claimed.add(sequence)
+                entries.append((sequence, payload))
+                if len(entries) >= limit:
+                    break
+        return entries
+
+    def ack_outbox(self, sequences):
+        # 送信に成功したエントリを削除する
+        with self._lock:
+            for sequence in sequences:
+                self._outbox.pop(sequence, None)
+                self._outbox_claimed.discard(sequence)
+
+    def release_outbox(self, sequences):
+        # 送信に失敗したエントリを、再び取り出せるように戻す
+        with self._lock:
+            self._outbox_claimed.difference_update(sequences)
+
+    def outbox_size(self):
+        return len(self._outbox)
+
+    def count(self, status=None):
+        if status is None:
+            return len(self._orders)
+        return len(self._status_index.ids(status))
+
+    def stats(self, buckets=24):
+        # 集計を返す。時間帯は現在の時間帯までの直近 buckets 個
+        last = bucket_of(datetime.utcnow())
+        with self._lock:
+            counts = {kind: self._stats.counts(kind) for kind in ('status', 'product', 'size')}
+            recent = self._stats.buckets(last - buckets + 1, last)
+        return render_stats(counts, recent, 'orders')
+
+    def _index_items(self, order):
+        self._product_index.add(order.id, {item.product for item in order.items})
+        self._size_index.add(order.id, {item.size for item in order.items})
+
+    def _unindex_items(self, order):
+        self._product_index.remove(order.id, {item.product for item in order.items})
+        self._size_index.remove(order.id, {item.size for item in order.items})
+
+    def _compact_created_index(self):
+        # 走査中のクエリエンジンが同じリストの位置を二分探索し直せるように、その場で詰める
+        self._created_index[:] = [
+            key for key in self._created_index
+            if key[1] in self._orders and self._orders[key[1]].created == key[0]
+        ]
+        self._tombstones = 0
+
+
+def _initial_version():
+    return time.time_ns() // 1000
+
+
+def _created_key(order):
+    return order.created, order.id
+
+
+# API のカーソルの (datetime, UUID) をインデックスのキーに変換する
+def _index_key(after):
+    created, order_id = after
+    return to_timestamp(created), order_id.int
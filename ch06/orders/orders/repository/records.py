@@ -0,0 +1,76 @@
+import sys
+from datetime import datetime, timedelta
+from uuid import UUID
+
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+# インメモリのリポジトリに保存する注文の明細
+# __slots__ でインスタンスごとの __dict__ を持たないようにする。商品名とサイズは
+# 種類が少ないので intern し、すべての注文で同じ文字列オブジェクトを共有する
+class OrderItemRecord:
+
+    __slots__ = ('product', 'size', 'quantity')
+
+    def __init__(self, product, size, quantity):
+        self.product = sys.intern(product)
+        self.size = sys.intern(getattr(size, 'value', size))
+        self.quantity = quantity
+
+
+# インメモリのリポジトリに保存する注文
+# id は UUID の 128 ビットの整数、created は UTC のエポックからのマイクロ秒で保持し、
+# UUID や datetime のオブジェクトを注文ごとに持たないようにする。
+# API のスキーマの形への変換は、エンコーダーとコーデックでだけ行う
+class OrderRecord:
+
+    __slots__ = ('id', 'created', 'status', 'items', 'version')
+
+    def __init__(self, id, created, status, items, version=1):
+        self.id = id
+        self.created = created
+        self.status = sys.intern(status)
+        # OrderItemRecord のタプル
+        self.items = items
+        self.version = version
+
+    @property
+    def uuid(self):
+        return UUID(int=self.id)
+
+    @property
+    def created_at(self):
+        return from_timestamp(self.created)
+
+
+# 明細は作成後に変更せず、更新時はタプルごと置き換える。そのため同じ内容の明細の
+# タプルは 1 つのオブジェクトを共有できる。メニューの組み合わせは限られているので、
+# ほとんどの注文はキャッシュ済みのタプルを参照するだけになる。
+# 想定外に種類が多い場合に備えて、キャッシュの件数には上限を設ける
+_ITEMS_CACHE_SIZE = 100_000
+_items_cache = {}
+
+
+# 明細のディクショナリ（CreateOrderSchema の order の各要素）のリストを
+# OrderItemRecord のタプルに変換する
+def make_items(items):
+    key = tuple(
+        (item['product'], getattr(item['size'], 'value', item['size']), item['quantity'])
+        for item in items
+    )
+    records = _items_cache.get(key)
+    if records is None:
+        records = tuple(OrderItemRecord(*values) for values in key)
+        if len(_items_cache) < _ITEMS_CACHE_SIZE:
+            _items_cache[key] = records
+    return records
+
+
+def to_timestamp(value):
+    return (value - _EPOCH) // _MICROSECOND
+
+
+def from_timestamp(value):
+    return _EPOCH + timedelta(microseconds=value)
@@ -0,0 +1,22 @@
+
+from coffeemesh.repository.retention import Retention
+
+from orders.repository.codec import dump_order
+from orders.repository.orders_repository import VersionConflict
+
+
+# 作成から age 秒を過ぎた、これ以上変更されることのない注文をアーカイブに移す
+class OrderRetention(Retention):
+
+    statuses = ('cancelled', 'delivered')
+    conflict = VersionConflict
+    name = 'orders-retention'
+
+    def dump(self, order):
+        return dump_order(order)
+
+    def identity(self, order):
+        return order.uuid
+
+    def cursor(self, order):
+        return (order.created_at, order.uuid)
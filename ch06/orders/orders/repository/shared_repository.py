@@ -0,0 +1,177 @@
+import os
+import signal
+import sys
+from contextlib import contextmanager
+from multiprocessing.managers import BaseManager
+
+
+# 共有ストアのサーバーが公開するリポジトリと変更フィード、冪等キーのキャッシュのメソッド
+_EXPOSED = (
+    'get', 'list', 'version', 'count', 'add', 'add_many', 'update', 'delete',
+    'claim_outbox', 'ack_outbox', 'release_outbox', 'outbox_size', 'stats',
+)
+_FEED_EXPOSED = ('publish', 'since', 'wait', 'position')
+_IDEMPOTENCY_EXPOSED = ('begin', 'complete', 'abandon', 'stats')
+
+
+class _StoreManager(BaseManager):
+    pass
+
+
+_StoreManager.register('repository')
+_StoreManager.register('feed')
+_StoreManager.register('idempotency')
+
+
+# 複数のワーカープロセスで共有する注文リポジトリのクライアント
+# 注文は 1 つのストアのサーバープロセスが持ち、すべての読み書きを UNIX ソケット経由で
+# そのプロセスのリポジトリに転送する。書き込むのはサーバーだけなので（シングルライター）、
+# どのワーカーから読んでも同じ状態が見え、版数と If-Match による排他制御も
+# サーバーのリポジトリのロックの中で行われる。
+# 接続はスレッドごとに作られるので、スレッドプールから並行して呼び出せる
+class SharedOrderRepository:
+
+    def __init__(self, address, authkey, encoder=None):
+        self._manager = _StoreManager(address=address, authkey=authkey)
+        self._manager.connect()
+        self._repository = self._manager.repository()
+        self._encoder = encoder
+
+    def feed(self):
+        # 変更フィードはワーカーごとに持たず、サーバーで 1 つだけ持つ。
+        # イベントはこのプロキシ経由でサーバーのフィードに発行する
+        return self._manager.feed()
+
+    def idempotency(self):
+        # Idempotency-Key のキャッシュもサーバーで 1 つだけ持ち、別のワーカーに届いた
+        # 再送も重複排除する
+        return self._manager.idempotency()
+
+    @contextmanager
+    def batch(self):
+        # 各操作はサーバーでその場で反映される
+        yield self
+
+    def __len__(self):
+        return self.count()
+
+    def __contains__(self, order_id):
+        return self.get(order_id) is not None
+
+    def version(self):
+        return self._repository.version()
+
+    def add(self, order):
+        self._repository.add(order)
+        return order
+
+    def add_many(self, orders):
+        self._repository.add_many(orders)
+        return orders
+
+    def get(self, order_id):
+        return self._repository.get(order_id)
+
+    def encode(self, order):
+        # エンコード結果のキャッシュはサーバーに持たせず、ワーカーで毎回エンコードする
+        return self._encoder(order)
+
+    def update(self, order_id, outbox=False, if_match=None, if_status=None, **fields):
+        return self._repository.update(
+            order_id, outbox=outbox, if_match=if_match, if_status=if_status, **fields
+        )
+
+    def delete(self, order_id, if_match=None):
+        return self._repository.delete(order_id, if_match=if_match)
+
+    def list(self, query=None, after=None, limit=None):
+        return self._repository.list(query, after, limit)
+
+    def scan(self, query=None, after=None, chunk_size=500):
+        # サーバーのジェネレータは転送できないので、一定の件数ずつ
+        # キーセットページネーションで読み出す
+        while True:
+            chunk = self.list(query, after, chunk_size)
+            yield from chunk
+            if len(chunk) < chunk_size:
+                return
+            after = (chunk[-1].created_at, chunk[-1].uuid)
+
+    def claim_outbox(self, limit):
+        return self._repository.claim_outbox(limit)
+
+    def ack_outbox(self, sequences):
+        self._repository.ack_outbox(sequences)
+
+    def release_outbox(self, sequences):
+        self._repository.release_outbox(sequences)
+
+    def outbox_size(self):
+        return self._repository.outbox_size()
+
+    def count(self, status=None):
+        return self._repository.count(status)
+
+    def stats(self, buckets=24):
+        return self._repository.stats(buckets)
+
+
+# 共有ストアのサーバー。repository と feed、idempotency を address の UNIX ソケットで
+# 公開し、停止するまで接続ごとのスレッドでリクエストを処理する
+def serve(repository, feed, idempotency, address, authkey):
+    class ServerManager(BaseManager):
+        pass
+
+    ServerManager.register('repository', callable=lambda: repository, exposed=_EXPOSED)
+    ServerManager.register('feed', callable=lambda: feed, exposed=_FEED_EXPOSED)
+    ServerManager.register(
+        'idempotency', callable=lambda: idempotency, exposed=_IDEMPOTENCY_EXPOSED
+    )
+    # 前回のサーバーが残したソケットファイルがあるとバインドできないので削除する
+    if os.path.exists(address):
+        os.unlink(address)
+    server = ServerManager(address=address, authkey=authkey).get_server()
+    # ソケットには同じユーザーのプロセスだけが接続できるようにする
+    os.chmod(address, 0o600)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    # python -m orders.repository.shared_repository
+    from coffeemesh.feed.change_feed import ChangeFeed
+    from coffeemesh.idempotency.cache import IdempotencyCache
+    from coffeemesh.repository.archive import Archive
+
+    from orders.config import BaseConfig
+    from orders.repository.factory import create_order_repository
+    from orders.repository.retention import OrderRetention
+
+    if BaseConfig.SHARED_STORE_BACKEND not in ('memory', 'journal'):
+        raise SystemExit(f'Unsupported shared store backend {BaseConfig.SHARED_STORE_BACKEND}')
+    repository = create_order_repository(BaseConfig, backend=BaseConfig.SHARED_STORE_BACKEND)
+    # 保持期間を過ぎた注文はサーバーがアーカイブに移し、ワーカーはアーカイブを直接読み出す
+    retention = None
+    if BaseConfig.RETENTION_AGE > 0:
+        retention = OrderRetention(
+            repository,
+            Archive(BaseConfig.ARCHIVE_DIR),
+            BaseConfig.RETENTION_AGE,
+            interval=BaseConfig.RETENTION_INTERVAL,
+            batch_size=BaseConfig.RETENTION_BATCH_SIZE,
+        )
+        retention.start()
+    feed = ChangeFeed(BaseConfig.CHANGE_FEED_SIZE)
+    idempotency = IdempotencyCache(BaseConfig.IDEMPOTENCY_CACHE_SIZE, BaseConfig.IDEMPOTENCY_TTL)
+    # SIGTERM でも終了処理を行い、ジャーナルを閉じてから終了する
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f'Serving orders on {BaseConfig.SHARED_STORE_SOCKET}', flush=True)
+    try:
+        serve(
+            repository, feed, idempotency,
+            BaseConfig.SHARED_STORE_SOCKET, BaseConfig.SHARED_STORE_AUTHKEY,
+        )
+    finally:
+        if retention is not None:
+            retention.stop()
+        if hasattr(repository, 'close'):
+            repository.close()
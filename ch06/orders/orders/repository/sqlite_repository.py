@@ -0,0 +1,348 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from coffeemesh.repository.stats import KINDS, bucket_of, render_stats
+
+from orders.repository.codec import dump_order, load_order
+from orders.repository.orders_repository import StatusConflict, VersionConflict
+from orders.repository.records import to_timestamp
+from orders.repository.stats import order_contributions
+
+
+# アウトボックスのエントリを取り出してから、他のワーカーが取り出し直せるようになるまでの秒数
+_OUTBOX_LEASE = 60
+
+# SQL 文は定数として定義し、sqlite3 の接続ごとのステートメントキャッシュで
+# プリペアドステートメントとして再利用されるようにする
+_SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS orders (
+        id TEXT PRIMARY KEY,
+        created INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        body TEXT NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS orders_created ON orders (created, id)',
+    'CREATE INDEX IF NOT EXISTS orders_status ON orders (status, created, id)',
+    # ステータスごとの件数などの集計。注文の変更と同じトランザクションで差分を加減する。
+    # key は種類によって文字列（ステータスなど）または整数（時間帯）になるので、型を指定しない
+    '''CREATE TABLE IF NOT EXISTS stats (
+        kind TEXT NOT NULL,
+        key NOT NULL,
+        value INTEGER NOT NULL,
+        PRIMARY KEY (kind, key)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS outbox (
+        sequence INTEGER PRIMARY KEY AUTOINCREMENT,
+        payload TEXT NOT NULL,
+        claimed_by TEXT,
+        claimed_at REAL
+    )''',
+    # コレクション全体の版数。注文が追加・変更・削除されるたびにトリガーで 1 ずつ増やし、
+    # 複数のプロセスから書き込んでも同じトランザクションの中で一貫して更新されるようにする
+    '''CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )''',
+    *(
+        f'''CREATE TRIGGER IF NOT EXISTS orders_version_{event.lower()}
+        AFTER {event} ON orders BEGIN
+            UPDATE meta SET value = value + 1 WHERE key = 'version';
+        END'''
+        for event in ('INSERT', 'UPDATE', 'DELETE')
+    ),
+)
+# データベースを作り直しても以前の版数と重ならないように、作成時刻（マイクロ秒）から数え始める
+_INIT_VERSION = "INSERT OR IGNORE INTO meta (key, value) VALUES ('version', ?)"
+_SELECT_VERSION = "SELECT value FROM meta WHERE key = 'version'"
+_INSERT = 'INSERT INTO orders (id, created, status, body) VALUES (?, ?, ?, ?)'
+_SELECT = 'SELECT body FROM orders WHERE id = ?'
+_UPDATE = 'UPDATE orders SET status = ?, body = ? WHERE id = ?'
+_DELETE = 'DELETE FROM orders WHERE id = ?'
+_COUNT = 'SELECT COUNT(*) FROM orders'
+_ENQUEUE_OUTBOX = 'INSERT INTO outbox (payload) VALUES (?)'
+_SELECT_OUTBOX = (
+    'SELECT sequence, payload FROM outbox WHERE claimed_at IS NULL OR claimed_at < ? '
+    'ORDER BY sequence LIMIT ?'
+)
+_CLAIM_OUTBOX = 'UPDATE outbox SET claimed_by = ?, claimed_at = ? WHERE sequence = ?'
+_RELEASE_OUTBOX = (
+    'UPDATE outbox SET claimed_by = NULL, claimed_at = NULL WHERE sequence = ? AND claimed_by = ?'
+)
+_DELETE_OUTBOX = 'DELETE FROM outbox WHERE sequence = ?'
+_COUNT_OUTBOX = 'SELECT COUNT(*) FROM outbox'
+_COUNT_STATUS = 'SELECT COUNT(*) FROM orders WHERE status = ?'
+_UPDATE_STATS = '''INSERT INTO stats (kind, key, value) VALUES (?, ?, ?)
+    ON CONFLICT (kind, key) DO UPDATE SET value = value + excluded.value'''
+_SELECT_STATS = '''SELECT kind, key, value FROM stats
+    WHERE value != 0 AND (kind != 'bucket' OR key BETWEEN ? AND ?)'''
+_HAS_STATS = 'SELECT EXISTS (SELECT 1 FROM stats)'
+
+
+# SQLite を使った永続化された注文リポジトリ
+# OrderRepository と同じインターフェースを持ち、設定で切り替えて使う
+class SqliteOrderRepository:
+
+    def __init__(self, path, encoder=None, outbox_lease=_OUTBOX_LEASE):
+        self._path = path
+        self._encoder = encoder
+        # スレッドごとの接続プール
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        # アウトボックスのエントリを取り出したことをテーブルに記録する際の識別子。
+        # 同じデータベースを使う他のプロセスのリポジトリと区別する
+        self._claimant = uuid.uuid4().hex
+        self._outbox_lease = outbox_lease
+        connection = self._connection()
+        for statement in _SCHEMA:
+            connection.execute(statement)
+        connection.execute(_INIT_VERSION, (time.time_ns() // 1000,))
+        # 集計を導入する前に作成したデータベースは、既存の注文から集計し直す
+        if not connection.execute(_HAS_STATS).fetchone()[0] and self.count():
+            with self.batch():
+                for order in self.scan():
+                    self._update_stats(order_contributions(order))
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # トランザクションは明示的に BEGIN / COMMIT で制御する
+            connection = sqlite3.connect(self._path, isolation_level=None)
+            # WAL モードでは読み取りが書き込みをブロックしない
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.depth = 0
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def close(self):
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    @contextmanager
+    def batch(self):
+        # ブロック内の書き込みを 1 つのトランザクションにまとめてコミットする
+        connection = self._connection()
+        if self._local.depth == 0:
+            connection.execute('BEGIN IMMEDIATE')
+        self._local.depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                connection.execute('ROLLBACK')
+            raise
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            connection.execute('COMMIT')
+
+    def __len__(self):
+        return self.count()
+
+    def __contains__(self, order_id):
+        return self.get(order_id) is not None
+
+    def version(self):
+        return self._connection().execute(_SELECT_VERSION).fetchone()[0]
+
+    def add(self, order):
+        with self.batch() as repository:
+            repository._connection().execute(_INSERT, _to_row(order))
+            repository._update_stats(order_contributions(order))
+        return order
+
+    def add_many(self, orders):
+        # 1 つのトランザクションでまとめて挿入する
+        with self.batch() as repository:
+            repository._connection().executemany(_INSERT, [_to_row(order) for order in orders])
+            repository._update_stats(
+                [contribution for order in orders for contribution in order_contributions(order)]
+            )
+        return orders
+
+    def get(self, order_id):
+        row = self._connection().execute(_SELECT, (str(order_id),)).fetchone()
+        return _from_body(row[0]) if row is not None else None
+
+    def encode(self, order):
+        return self._encoder(order)
+
+    # outbox=True の場合は、変更後の注文を同じトランザクションでアウトボックスに追加する。
+    # if_match による版数の確認と if_status によるステータスの確認も、同じトランザクションの
+    # 中で行う
+    def update(self, order_id, outbox=False, if_match=None, if_status=None, **fields):
+        with self.batch() as repository:
+            order = repository.get(order_id)
+            if order is None:
+                return None
+            version = order.version
+            if if_match is not None and version not in if_match:
+                raise VersionConflict(version)
+            if if_status is not None and order.status not in if_status:
+                raise StatusConflict(order.status)
+            repository._update_stats(order_contributions(order), -1)
+            for name, value in fields.items():
+                setattr(order, name, value)
+            order.version = version + 1
+            body = _to_body(order)
+            connection = repository._connection()
+            connection.execute(_UPDATE, (order.status, body, str(order_id)))
+            repository._update_stats(order_contributions(order))
+            if outbox:
+                connection.execute(_ENQUEUE_OUTBOX, (body,))
+        return order
+
+    def delete(self, order_id, if_match=None):
+        # 集計から差し引くために、削除する注文を同じトランザクションで読み出す
+        with self.batch() as repository:
+            order = repository.get(order_id)
+            if order is None:
+                return False
+            if if_match is not None and order.version not in if_match:
+                raise VersionConflict(order.version)
+            repository._connection().execute(_DELETE, (str(order_id),))
+            repository._update_stats(order_contributions(order), -1)
+        return True
+
+    def list(self, query=None, after=None, limit=None):
+        # 結果は (created, id) の順で返す。インデックスを使ったキーセット
+        # ページネーションなので、ページの深さに関係なく O(limit) で取り出せる。
+        # ステータスと作成日時の条件はインデックスで絞り込み、どのインデックスを使うかは
+        # SQLite のクエリプランナーに任せる
+        if limit is not None and limit <= 0:
+            return []
+        conditions, parameters = _conditions(query)
+        if after is not None:
+            conditions.append('(created, id) > (?, ?)')
+            parameters.extend((to_timestamp(after[0]), str(after[1])))
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        parameters.append(limit if limit is not None else -1)
+        rows = self._connection().execute(
+            f'SELECT body FROM orders {where} ORDER BY created, id LIMIT ?',
+            parameters,
+        )
+        return [_from_body(body) for (body,) in rows]
+
+    def scan(self, query=None, after=None, chunk_size=500):
+        # 一定の件数ずつキーセットページネーションで読み出すジェネレータ。
+        # 読み取りトランザクションをストリーミング中に保持し続けないようにする
+        while True:
+            chunk = self.list(query, after, chunk_size)
+            yield from chunk
+            if len(chunk) < chunk_size:
+                return
+            after = (chunk[-1].created_at, chunk[-1].uuid)
+
+    def claim_outbox(self, limit):
+        # 送信中でないエントリを古い順に取り出し、取り出したことを claimed_by と
+        # claimed_at に記録する。選択と記録は BEGIN IMMEDIATE のトランザクションで行うので、
+        # 同じデータベースを使う他のプロセスのワーカーと同じエントリを取り出すことはない。
+        # 送信中にプロセスが停止した場合は、リースの期限が切れた後に他のワーカーが取り出す。
+        # 期限切れで二重に送信しても、厨房は idempotency_key で重複を取り除く
+        now = time.time()
+        with self.batch() as repository:
+            connection = repository._connection()
+            rows = connection.execute(
+                _SELECT_OUTBOX, (now - self._outbox_lease, limit)
+            ).fetchall()
+            connection.executemany(
+                _CLAIM_OUTBOX, [(self._claimant, now, sequence) for sequence, _ in rows]
+            )
+        return [(sequence, json.loads(payload)) for sequence, payload in rows]
+
+    def ack_outbox(self, sequences):
+        with self.batch() as repository:
+            repository._connection().executemany(
+                _DELETE_OUTBOX, [(sequence,) for sequence in sequences]
+            )
+
+    def release_outbox(self, sequences):
+        # 他のワーカーがリースの期限切れで取り出し直したエントリの記録は消さない
+        with self.batch() as repository:
+            repository._connection().executemany(
+                _RELEASE_OUTBOX, [(sequence, self._claimant) for sequence in sequences]
+            )
+
+    def outbox_size(self):
+        return self._connection().execute(_COUNT_OUTBOX).fetchone()[0]
+
+    def count(self, status=None):
+        if status is None:
+            return self._connection().execute(_COUNT).fetchone()[0]
+        return self._connection().execute(_COUNT_STATUS, (status,)).fetchone()[0]
+
+    def stats(self, buckets=24):
+        # 集計を返す。時間帯は現在の時間帯までの直近 buckets 個
+        last = bucket_of(datetime.utcnow())
+        first = last - buckets + 1
+        # 1 つの SELECT で読み出し、すべての種類を同じ時点の集計にそろえる
+        counts = {kind: {} for kind in KINDS}
+        for kind, key, value in self._connection().execute(_SELECT_STATS, (first, last)):
+            counts[kind][key] = value
+        return render_stats(
+            counts,
+            [(bucket, counts['bucket'].get(bucket, 0)) for bucket in range(first, last + 1)],
+            'orders',
+        )
+
+    def _update_stats(self, contributions, sign=1):
+        self._connection().executemany(
+            _UPDATE_STATS, [(kind, key, sign * value) for kind, key, value in contributions]
+        )
+
+
+# Query を WHERE 句の条件とパラメータに変換する
+# 商品名とサイズは本文の JSON の明細から調べる
+def _conditions(query):
+    conditions, parameters = [], []
+    if query is None:
+        return conditions, parameters
+    for column, values, operator in (
+        ('status', query.status, 'IN'), ('status', query.exclude_status, 'NOT IN'),
+    ):
+        if values is not None:
+            conditions.append(f'{column} {operator} ({", ".join("?" * len(values))})')
+            parameters.extend(sorted(values))
+    if query.start is not None:
+        conditions.append('created >= ?')
+        parameters.append(to_timestamp(query.start))
+    if query.end is not None:
+        conditions.append('created < ?')
+        parameters.append(to_timestamp(query.end))
+    for field, values in (('product', query.product), ('size', query.size)):
+        if values is not None:
+            conditions.append(
+                "EXISTS (SELECT 1 FROM json_each(body, '$.order') "
+                f"WHERE json_extract(value, '$.{field}') IN ({', '.join('?' * len(values))}))"
+            )
+            parameters.extend(sorted(values))
+    return conditions, parameters
+
+
+def _to_body(order):
+    return json.dumps(dump_order(order))
+
+
+def _to_row(order):
+    return (
+        str(order.uuid),
+        # created はマイクロ秒単位の整数として保存し、インデックスで順序付けできるようにする
+        order.created,
+        order.status,
+        _to_body(order),
+    )
+
+
+def _from_body(body):
+    return load_order(json.loads(body))
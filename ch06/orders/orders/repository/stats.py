@@ -0,0 +1,11 @@
+from coffeemesh.repository.stats import BUCKET_SIZE
+
+
+# 注文 1 件が集計に加える (種類, キー, 値) のリスト
+# 注文は作成日時の 1 時間ごとに数える。created はマイクロ秒単位のタイムスタンプ
+def order_contributions(order):
+    contributions = [('status', order.status, 1), ('bucket', order.created // BUCKET_SIZE, 1)]
+    for item in order.items:
+        contributions.append(('product', item.product, item.quantity))
+        contributions.append(('size', item.size, item.quantity))
+    return contributions
@@ -0,0 +1,52 @@
+import asyncio
+
+import httpx
+import pytest
+
+
+# ASGI アプリケーションに同期的にリクエストを送るテスト用のクライアント
+# テストごとに 1 つのイベントループで、httpx の ASGITransport を経由して呼び出す
+class Client:
+
+    def __init__(self, app, loop):
+        self._loop = loop
+        self._client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url='http://test'
+        )
+
+    def request(self, method, url, **kwargs):
+        return self._loop.run_until_complete(self._client.request(method, url, **kwargs))
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    # (メソッド, URL, キーワード引数) のリクエストを同時に送り、レスポンスを順に返す
+    def concurrently(self, *requests):
+        async def send():
+            return await asyncio.gather(*(
+                self._client.request(method, url, **kwargs) for method, url, kwargs in requests
+            ))
+        return self._loop.run_until_complete(send())
+
+    def close(self):
+        self._loop.run_until_complete(self._client.aclose())
+
+
+@pytest.fixture
+def client():
+    from orders.app import app
+
+    loop = asyncio.new_event_loop()
+    client = Client(app, loop)
+    yield client
+    client.close()
+    loop.close()
@@ -0,0 +1,91 @@
+import asyncio
+
+import httpx
+from starlette.responses import PlainTextResponse
+
+from coffeemesh.admission.controller import AdmissionController, RateLimiter
+
+from orders.admission.middleware import AdmissionMiddleware
+from orders.app import app
+from orders.config import BaseConfig
+
+
+async def endpoint(scope, receive, send):
+    await PlainTextResponse('ok')(scope, receive, send)
+
+
+def send(middleware, requests):
+    # (パス, ヘッダー) のリクエストを順に送り、レスポンスを返す
+    async def run():
+        transport = httpx.ASGITransport(app=middleware)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return [await client.get(path, headers=headers) for path, headers in requests]
+
+    return asyncio.run(run())
+
+
+def send_requests(middleware, headers):
+    return [
+        response.status_code
+        for response in send(middleware, [('/orders', request_headers) for request_headers in headers])
+    ]
+
+
+def make_middleware(principal=None):
+    return AdmissionMiddleware(
+        endpoint,
+        AdmissionController(capacity=4),
+        routes={},
+        limiter=RateLimiter(rate=0.001, burst=1),
+        principal=principal,
+    )
+
+
+def test_rejects_rate_limited_requests_with_retry_after():
+    first, second = send(make_middleware(), [('/orders', {}), ('/orders', {})])
+
+    assert first.status_code == 200
+    assert second.status_code == 429
+    assert int(second.headers['retry-after']) > 0
+
+
+def test_sheds_requests_over_capacity():
+    middleware = AdmissionMiddleware(
+        endpoint,
+        AdmissionController(capacity=0, max_queue=0),
+        routes={('GET', '/orders/events'): None},
+    )
+    shed, streamed = send(middleware, [('/orders', {}), ('/orders/events', {})])
+
+    assert shed.status_code == 503
+    assert shed.headers['retry-after'] == '1'
+    # 接続を保ち続けるルートは同時に処理する数に数えない
+    assert streamed.status_code == 200
+
+
+def test_app_does_not_rate_limit_by_default():
+    assert BaseConfig.ADMISSION_RATE == 0
+    middleware, = [entry for entry in app.user_middleware if entry.cls is AdmissionMiddleware]
+    assert middleware.kwargs['limiter'] is None
+
+
+def test_unverified_authorization_header_does_not_bypass_rate_limit():
+    # Authorization ヘッダーを変えて送っても、同じ接続元のアドレスとして制限する
+    statuses = send_requests(make_middleware(), [
+        {'Authorization': 'Bearer a'}, {'Authorization': 'Bearer b'}, {},
+    ])
+    assert statuses == [200, 429, 429]
+
+
+def test_rate_limits_verified_principals_separately():
+    def principal(scope):
+        # テストでは X-User ヘッダーを検証済みのユーザーとみなす
+        for header, value in scope['headers']:
+            if header == b'x-user':
+                return value.decode()
+        return None
+
+    statuses = send_requests(make_middleware(principal), [
+        {'X-User': 'alice'}, {'X-User': 'bob'}, {'X-User': 'alice'}, {}, {},
+    ])
+    assert statuses == [200, 200, 429, 200, 429]
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import uuid
+from datetime import datetime
+
+from coffeemesh.repository.archive import Archive
+
+from orders.repository.async_repository import AsyncOrderRepository
+from orders.repository.codec import dump_order
+from orders.repository.orders_repository import OrderRepository
+from orders.repository.records import OrderRecord, make_items, to_timestamp
+
+
+class RecordingRepository(OrderRepository):
+
+    # 変更操作を呼び出したスレッドと、同時に実行されている変更の数を記録する
+    def __init__(self):
+        super().__init__()
+        self.threads = set()
+        self.running = 0
+        self.overlapped = False
+
+    def update(self, order_id, **fields):
+        self.threads.add(threading.get_ident())
+        self.running += 1
+        self.overlapped |= self.running > 1
+        try:
+            return super().update(order_id, **fields)
+        finally:
+            self.running -= 1
+
+
+class RecordingArchive(Archive):
+
+    # インデックスを読み込んだスレッドを記録する
+    def __init__(self, directory):
+        super().__init__(directory)
+        self.threads = set()
+
+    def _refresh(self):
+        self.threads.add(threading.get_ident())
+        super()._refresh()
+
+
+def make_order(status='created'):
+    return OrderRecord(
+        uuid.uuid4().int,
+        to_timestamp(datetime.utcnow()),
+        status,
+        make_items([{'product': 'latte', 'size': 'small', 'quantity': 1}]),
+    )
+
+
+def test_calls_memory_repository_on_the_event_loop():
+    repository = RecordingRepository()
+    orders = AsyncOrderRepository(repository)
+
+    async def run():
+        order = await orders.add(make_order())
+        await orders.update(order.uuid, status='progress')
+        return threading.get_ident(), await orders.get(order.uuid)
+
+    loop_thread, order = asyncio.run(run())
+    assert order.status == 'progress'
+    assert repository.threads == {loop_thread}
+
+
+def test_offloads_blocking_repository_and_serializes_changes_per_order():
+    repository = RecordingRepository()
+    orders = AsyncOrderRepository(repository, blocking=True)
+    order = repository.add(make_order())
+
+    async def run():
+        await asyncio.gather(*(
+            orders.update(order.uuid, status=status)
+            for status in ('progress', 'cancelled') * 20
+        ))
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+    assert loop_thread not in repository.threads
+    assert not repository.overlapped
+    # 使われなくなった注文ごとのロックは破棄される
+    assert orders._locks == {}
+
+
+def test_reads_archive_off_the_event_loop(tmp_path):
+    archive = RecordingArchive(tmp_path)
+    order = make_order('delivered')
+    archive.append([dump_order(order)])
+    archive.threads.clear()
+    orders = AsyncOrderRepository(OrderRepository(), archive=archive)
+
+    async def run():
+        loop_thread = threading.get_ident()
+        found = await orders.get(order.uuid)
+        results = (found.uuid, await orders.archived(order.uuid), await orders.archived(uuid.uuid4()))
+        return loop_thread, results
+
+    loop_thread, results = asyncio.run(run())
+    assert results == (order.uuid, True, False)
+    assert archive.threads and loop_thread not in archive.threads
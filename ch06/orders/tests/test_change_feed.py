@@ -0,0 +1,96 @@
+import asyncio
+import threading
+
+from coffeemesh.feed.change_feed import ChangeFeed
+
+from orders.api import api
+from orders.feed.change_feed import AsyncChangeFeed
+
+
+ORDER = {'order': [{'product': 'latte', 'size': 'small', 'quantity': 1}]}
+
+
+def test_wakes_clients_on_event_loop():
+    feed = AsyncChangeFeed()
+
+    async def run():
+        position = feed.last_event_id
+        timed_out = not await feed.wait(position, 0.01)
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.05, feed.publish, 'order.paid', {'id': 'a'})
+        return timed_out, await feed.wait(position, 5)
+
+    assert asyncio.run(run()) == (True, True)
+
+
+def test_wakes_clients_on_events_relayed_from_another_thread():
+    server, feed = ChangeFeed(), AsyncChangeFeed()
+    feed.reset(server.position())
+
+    async def run():
+        position = feed.last_event_id
+        server.publish('order.paid', {'id': 'a'})
+        events = server.since(position)
+        threading.Timer(0.05, feed.extend, (events,)).start()
+        assert await feed.wait(position, 5)
+        return feed.since(position) == events
+
+    assert asyncio.run(run())
+
+
+def poll(client, **params):
+    response = client.get('/orders/events/poll', params={'timeout': 0, **params})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_polls_order_changes(client):
+    position = poll(client)['last_event_id']
+    order = client.post('/orders', json=ORDER).json()
+    client.post(f'/orders/{order["id"]}/pay')
+    client.post(f'/orders/{order["id"]}/cancel')
+
+    page = poll(client, after=position)
+    assert [(event['type'], event['data']['status']) for event in page['events']] == [
+        ('order.paid', 'progress'), ('order.cancelled', 'cancelled'),
+    ]
+    assert page['last_event_id'] == page['events'][-1]['id']
+    assert poll(client, after=position, limit=1)['events'] == page['events'][:1]
+    response = client.get('/orders/events/poll', params={'timeout': 0}, headers={
+        'Last-Event-ID': str(page['events'][0]['id']),
+    })
+    assert response.json()['events'] == page['events'][1:]
+
+
+def test_long_poll_waits_for_next_event(client):
+    position = poll(client)['last_event_id']
+    order = client.post('/orders', json=ORDER).json()
+
+    page, paid = client.concurrently(
+        ('GET', '/orders/events/poll', {'params': {'after': position, 'timeout': 5}}),
+        ('POST', f'/orders/{order["id"]}/pay', {}),
+    )
+    assert paid.status_code == 200
+    assert [event['data']['id'] for event in page.json()['events']] == [order['id']]
+
+
+def test_unknown_position_resets_client(client):
+    page = poll(client, after=1)
+
+    assert page['reset']
+    assert page['events'] == []
+    assert page['last_event_id'] == api.feed.last_event_id
+
+
+def test_streams_events_as_server_sent_events():
+    feed = api.feed
+
+    async def run():
+        stream = api._event_stream(feed.last_event_id)
+        event_id = feed.publish('order.paid', {'id': 'a'})
+        frame = await stream.__anext__()
+        await stream.aclose()
+        return event_id, frame
+
+    event_id, frame = asyncio.run(run())
+    assert frame == f'id: {event_id}\nevent: order.paid\ndata: {{"id":"a"}}\n\n'.encode()
@@ -0,0 +1,97 @@
+import uuid
+from datetime import datetime
+
+from orders.api.etags import etag_matches, parse_if_match
+from orders.repository.journaled_repository import JournaledOrderRepository
+from orders.repository.records import OrderRecord, make_items, to_timestamp
+from orders.repository.sqlite_repository import SqliteOrderRepository
+
+
+ORDER = {'order': [{'product': 'latte', 'size': 'small', 'quantity': 1}]}
+
+
+def make_order():
+    return OrderRecord(
+        uuid.uuid4().int,
+        to_timestamp(datetime.utcnow()),
+        'created',
+        make_items([{'product': 'latte', 'size': 'small', 'quantity': 1}]),
+    )
+
+
+def test_parses_conditional_headers():
+    assert etag_matches('W/"3", "4"', '"3"')
+    assert etag_matches('*', '"3"')
+    assert not etag_matches(None, '"3"')
+    assert parse_if_match(None) is None
+    assert parse_if_match('*') is None
+    assert parse_if_match('"1", W/"2", "x"') == {1}
+
+
+def test_get_order_returns_not_modified_for_current_etag(client):
+    order = client.post('/orders', json=ORDER)
+    etag = order.headers['ETag']
+    assert etag == '"1"'
+
+    response = client.get(f'/orders/{order.json()["id"]}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.content == b''
+    response = client.get(f'/orders/{order.json()["id"]}', headers={'If-None-Match': '"2"'})
+    assert response.status_code == 200
+    assert response.headers['ETag'] == etag
+
+
+def test_update_requires_matching_if_match(client):
+    order_id = client.post('/orders', json=ORDER).json()['id']
+    changed = {'order': [{'product': 'mocha', 'size': 'big', 'quantity': 2}]}
+
+    response = client.put(f'/orders/{order_id}', json=changed, headers={'If-Match': '"1"'})
+    assert response.status_code == 200
+    assert response.headers['ETag'] == '"2"'
+
+    stale = client.put(f'/orders/{order_id}', json=ORDER, headers={'If-Match': '"1"'})
+    assert stale.status_code == 412
+    assert stale.headers['ETag'] == '"2"'
+    assert client.get(f'/orders/{order_id}').json()['order'][0]['product'] == 'mocha'
+
+    assert client.post(
+        f'/orders/{order_id}/pay', headers={'If-Match': '"1"'}
+    ).status_code == 412
+    assert client.delete(f'/orders/{order_id}', headers={'If-Match': '"1"'}).status_code == 412
+    assert client.delete(f'/orders/{order_id}', headers={'If-Match': '"2"'}).status_code == 204
+
+
+def test_list_etag_changes_when_orders_change(client):
+    etag = client.get('/orders').headers['ETag']
+
+    assert client.get('/orders', headers={'If-None-Match': etag}).status_code == 304
+    client.post('/orders', json=ORDER)
+    response = client.get('/orders', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_sqlite_version_is_shared_across_connections(tmp_path):
+    repository = SqliteOrderRepository(str(tmp_path / 'orders.db'))
+    other = SqliteOrderRepository(str(tmp_path / 'orders.db'))
+    version = repository.version()
+
+    order = other.add(make_order())
+    other.update(order.uuid, status='cancelled')
+    assert repository.version() == version + 2
+    assert repository.get(order.uuid).version == 2
+    repository.close()
+    other.close()
+
+
+def test_journal_restores_versions(tmp_path):
+    repository = JournaledOrderRepository(tmp_path)
+    order = repository.add(make_order())
+    repository.update(order.uuid, status='cancelled')
+    version = repository.version()
+    repository.close()
+
+    repository = JournaledOrderRepository(tmp_path)
+    assert repository.get(order.uuid).version == 2
+    assert repository.version() > version
+    repository.close()
@@ -0,0 +1,72 @@
+import uuid
+
+import pytest
+
+from orders.api.api import orders
+
+
+ORDER = {'order': [{'product': 'latte', 'size': 'small', 'quantity': 1}]}
+
+
+def key():
+    return {'Idempotency-Key': str(uuid.uuid4())}
+
+
+def test_replays_order_creation(client):
+    headers = key()
+    first = client.post('/orders', json=ORDER, headers=headers)
+    retry = client.post('/orders', json=ORDER, headers=headers)
+
+    assert first.status_code == retry.status_code == 201
+    assert retry.json() == first.json()
+    assert retry.headers['idempotent-replayed'] == 'true'
+    assert 'idempotent-replayed' not in first.headers
+
+
+def test_creates_orders_without_a_key_each_time(client):
+    first = client.post('/orders', json=ORDER).json()
+    second = client.post('/orders', json=ORDER).json()
+    assert first['id'] != second['id']
+
+
+def test_rejects_key_reused_with_a_different_body(client):
+    headers = key()
+    client.post('/orders', json=ORDER, headers=headers)
+    response = client.post('/orders', json={
+        'order': [{'product': 'mocha', 'size': 'big', 'quantity': 1}],
+    }, headers=headers)
+    assert response.status_code == 422
+
+
+def test_keys_are_scoped_by_path(client):
+    headers = key()
+    order = client.post('/orders', json=ORDER, headers=headers).json()
+
+    paid = client.post(f'/orders/{order["id"]}/pay', headers=headers)
+    assert paid.status_code == 200
+    assert 'idempotent-replayed' not in paid.headers
+    retry = client.post(f'/orders/{order["id"]}/pay', headers=headers)
+    # 2 回目の支払いは 409 になるが、再送には最初の支払いの結果を返す
+    assert retry.status_code == 200
+    assert retry.json() == paid.json()
+
+
+def test_does_not_store_server_errors(client, monkeypatch):
+    headers = key()
+
+    async def fail(order):
+        raise RuntimeError('unavailable')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(orders, 'add', fail)
+        with pytest.raises(RuntimeError):
+            client.post('/orders', json=ORDER, headers=headers)
+
+    response = client.post('/orders', json=ORDER, headers=headers)
+    assert response.status_code == 201
+    assert 'idempotent-replayed' not in response.headers
+
+
+def test_rejects_overlong_key(client):
+    response = client.post('/orders', json=ORDER, headers={'Idempotency-Key': 'k' * 256})
+    assert response.status_code == 400
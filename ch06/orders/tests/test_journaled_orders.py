@@ -0,0 +1,111 @@
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from orders.repository.journaled_repository import JournaledOrderRepository
+from orders.repository.records import OrderRecord, make_items, to_timestamp
+
+
+def make_order(offset=0, status='created'):
+    return OrderRecord(
+        uuid.uuid4().int,
+        to_timestamp(datetime.utcnow() + timedelta(microseconds=offset)),
+        status,
+        make_items([{'product': 'latte', 'size': 'small', 'quantity': 1}]),
+    )
+
+
+def state(repository):
+    return {order.uuid: order.status for order in repository.scan()}
+
+
+def test_restores_changes_after_crash(tmp_path):
+    repository = JournaledOrderRepository(tmp_path)
+    first, second = repository.add(make_order(0)), repository.add(make_order(1))
+    repository.update(first.uuid, status='progress')
+    repository.delete(second.uuid)
+    expected = state(repository)
+
+    # close() を呼ばずに再起動する
+    restored = JournaledOrderRepository(tmp_path)
+    assert state(restored) == expected
+    restored.close()
+    repository.close()
+
+
+def test_ignores_torn_record_after_crash(tmp_path):
+    repository = JournaledOrderRepository(tmp_path)
+    order = repository.add(make_order())
+    repository.close()
+    with open(tmp_path / 'journal.0.ndjson', 'ab') as file:
+        file.write(b'{"op":"put","order":{"order":[')
+
+    restored = JournaledOrderRepository(tmp_path)
+    assert list(state(restored)) == [order.uuid]
+    later = restored.add(make_order(1))
+    restored.close()
+
+    restored = JournaledOrderRepository(tmp_path)
+    assert set(state(restored)) == {order.uuid, later.uuid}
+    restored.close()
+
+
+def test_keeps_changes_made_while_snapshot_is_written(tmp_path):
+    repository = JournaledOrderRepository(tmp_path)
+    orders = [repository.add(make_order(offset)) for offset in range(100)]
+
+    # スナップショットの書き出しを止めている間に、インデックスを圧縮するほど削除し、
+    # 注文を追加・変更する
+    started, resume = threading.Event(), threading.Event()
+    write_snapshot = repository._journal.write_snapshot
+
+    def blocked(generation, records):
+        started.set()
+        resume.wait()
+        write_snapshot(generation, records)
+
+    repository._journal.write_snapshot = blocked
+    repository.snapshot(wait=False)
+    assert started.wait(5)
+    for order in orders[:80]:
+        repository.delete(order.uuid)
+    added = [repository.add(make_order(offset)) for offset in range(100, 150)]
+    repository.update(orders[90].uuid, status='progress')
+    expected = state(repository)
+    resume.set()
+    repository.snapshot()
+    repository.close()
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        'journal.1.ndjson', 'snapshot.1.ndjson',
+    ]
+    restored = JournaledOrderRepository(tmp_path)
+    assert state(restored) == expected
+    assert all(order.uuid in expected for order in added)
+    restored.close()
+
+
+def test_snapshot_alone_restores_store(tmp_path):
+    repository = JournaledOrderRepository(tmp_path)
+    orders = [repository.add(make_order(offset)) for offset in range(10)]
+    repository.update(orders[0].uuid, status='cancelled')
+    repository.snapshot()
+    expected = state(repository)
+    repository.close()
+    (tmp_path / 'journal.1.ndjson').unlink()
+
+    restored = JournaledOrderRepository(tmp_path)
+    assert state(restored) == expected
+    restored.close()
+
+
+def test_restores_orders_added_in_batch(tmp_path):
+    repository = JournaledOrderRepository(tmp_path)
+    orders = repository.add_many([make_order(offset) for offset in range(5)])
+    expected = state(repository)
+    repository.close()
+
+    restored = JournaledOrderRepository(tmp_path)
+    assert list(state(restored)) == [order.uuid for order in orders]
+    assert state(restored) == expected
+    restored.close()
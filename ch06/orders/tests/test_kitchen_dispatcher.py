@@ -0,0 +1,115 @@
+import time
+import uuid
+from datetime import datetime
+
+import pytest
+
+from orders.dispatch.dispatcher import KitchenDispatcher
+from orders.dispatch.kitchen_client import KitchenClient, KitchenUnavailable
+from orders.dispatch.kitchen_stub import KitchenStub
+from orders.repository.orders_repository import OrderRepository
+from orders.repository.records import OrderRecord, make_items, to_timestamp
+
+
+ITEMS = [{'product': 'latte', 'size': 'small', 'quantity': 1}]
+
+
+@pytest.fixture
+def stub():
+    with KitchenStub() as stub:
+        yield stub
+
+
+def pay_orders(repository, count):
+    orders = []
+    for _ in range(count):
+        order = repository.add(OrderRecord(
+            uuid.uuid4().int, to_timestamp(datetime.utcnow()), 'created', make_items(ITEMS)
+        ))
+        repository.update(order.uuid, outbox=True, if_status={'created'}, status='progress')
+        orders.append(order)
+    return orders
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_lost_responses_do_not_duplicate_schedules(stub):
+    # 厨房がスケジュールを作成した後にレスポンスが失われても、再送で重複しない
+    repository = OrderRepository()
+    stub.drops = 2
+    stub.failures = 1
+    dispatcher = KitchenDispatcher(
+        repository, KitchenClient(stub.url), workers=2, batch_size=5, initial_backoff=0.01
+    )
+    dispatcher.start()
+    orders = pay_orders(repository, 20)
+    dispatcher.notify()
+
+    assert wait_until(lambda: repository.outbox_size() == 0)
+    dispatcher.stop()
+    assert len(stub.received) == 20
+    assert set(stub.keys) == {str(order.uuid) for order in orders}
+    assert dispatcher.dispatched == 20
+
+
+def test_does_not_resend_request_without_keys_after_it_was_sent(stub):
+    client = KitchenClient(stub.url)
+    client.schedule_orders([{'order': ITEMS}])
+    stub.drops = 1
+
+    # プールした接続で送った後に接続が閉じられても、キーがなければ送り直さない
+    with pytest.raises(KitchenUnavailable):
+        client.schedule_orders([{'order': ITEMS}])
+    assert len(stub.received) == 2
+    client.close()
+
+
+def test_resends_request_with_keys_on_reused_connection(stub):
+    client = KitchenClient(stub.url)
+    client.schedule_orders([{'order': ITEMS, 'idempotency_key': 'a'}])
+    stub.drops = 1
+
+    results = client.schedule_orders([{'order': ITEMS, 'idempotency_key': 'b'}])
+    assert [result['status'] for result in results] == [201]
+    assert stub.requests == 3
+    assert len(stub.received) == 2
+    client.close()
+
+
+class InProgressClient:
+
+    # 最初の送信では、2 件目のスケジュールを作成中（409）として返す
+    def __init__(self):
+        self.requests = []
+
+    def schedule_orders(self, orders):
+        self.requests.append([order['idempotency_key'] for order in orders])
+        return [
+            {'index': index, 'status': 409 if len(self.requests) == 1 and index == 1 else 201}
+            for index in range(len(orders))
+        ]
+
+    def close(self):
+        pass
+
+
+def test_resends_orders_still_being_scheduled():
+    repository = OrderRepository()
+    client = InProgressClient()
+    dispatcher = KitchenDispatcher(repository, client, workers=1, linger=0, initial_backoff=0.01)
+    orders = pay_orders(repository, 3)
+    dispatcher.start()
+    dispatcher.notify()
+
+    assert wait_until(lambda: repository.outbox_size() == 0)
+    dispatcher.stop()
+    keys = [str(order.uuid) for order in orders]
+    assert client.requests == [keys, [keys[1]]]
+    assert (dispatcher.dispatched, dispatcher.rejected) == (3, 0)
@@ -0,0 +1,35 @@
+def metric(text, name, **labels):
+    prefix = name
+    if labels:
+        prefix += '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}'
+    values = [line.rsplit(' ', 1)[1] for line in text.splitlines() if line.startswith(prefix + ' ')]
+    return float(values[0]) if values else 0.0
+
+
+def test_records_requests_by_route_template(client):
+    before = client.get('/metrics').text
+    order_id = client.post(
+        '/orders', json={'order': [{'product': 'latte', 'size': 'small', 'quantity': 1}]}
+    ).json()['id']
+    client.get(f'/orders/{order_id}')
+    client.post('/orders', json={'order': []})
+    client.get('/unknown')
+
+    response = client.get('/metrics')
+
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+    text = response.text
+    route = '/orders/{order_id}'
+    for name, labels, increase in [
+        ('http_requests_total', {'method': 'POST', 'route': '/orders', 'status': 201}, 1),
+        ('http_requests_total', {'method': 'POST', 'route': '/orders', 'status': 422}, 1),
+        ('http_requests_total', {'method': 'GET', 'route': route, 'status': 200}, 1),
+        ('http_requests_total', {'method': 'GET', 'route': '<unmatched>', 'status': 404}, 1),
+        ('http_request_phase_duration_seconds_count',
+         {'method': 'POST', 'route': '/orders', 'phase': 'validation'}, 2),
+        ('http_request_phase_duration_seconds_count',
+         {'method': 'POST', 'route': '/orders', 'phase': 'serialization'}, 1),
+    ]:
+        assert metric(text, name, **labels) - metric(before, name, **labels) == increase
+    assert f'/orders/{order_id}' not in text
+    assert metric(text, 'orders_repository_size') >= 1
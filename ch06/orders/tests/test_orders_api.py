@@ -0,0 +1,198 @@
+import json
+import uuid
+
+
+ORDER = {'order': [{'product': 'latte', 'size': 'small', 'quantity': 1}]}
+
+
+def test_creates_gets_updates_and_deletes_order(client):
+    order = client.post('/orders', json=ORDER).json()
+
+    assert client.get(f'/orders/{order["id"]}').json()['status'] == 'created'
+    updated = client.put(f'/orders/{order["id"]}', json={
+        'order': [{'product': 'mocha', 'size': 'big', 'quantity': 2}],
+    })
+    assert updated.status_code == 200
+    assert updated.json()['order'][0]['product'] == 'mocha'
+    assert client.delete(f'/orders/{order["id"]}').status_code == 204
+    assert client.get(f'/orders/{order["id"]}').status_code == 404
+    assert client.delete(f'/orders/{order["id"]}').status_code == 404
+
+
+def listed(client, **params):
+    return [order['id'] for order in client.get('/orders', params=params).json()['orders']]
+
+
+def test_filters_cancelled_orders(client):
+    created = client.post('/orders', json=ORDER).json()
+    cancelled = client.post('/orders', json=ORDER).json()
+    assert client.post(f'/orders/{cancelled["id"]}/cancel').json()['status'] == 'cancelled'
+
+    assert cancelled['id'] in listed(client, cancelled=True)
+    assert created['id'] not in listed(client, cancelled=True)
+    assert created['id'] in listed(client, cancelled=False)
+    assert cancelled['id'] not in listed(client, cancelled=False)
+
+
+def test_filters_orders_by_status_product_size_and_range(client):
+    def place(product, size):
+        return client.post('/orders', json={
+            'order': [{'product': product, 'size': size, 'quantity': 1}],
+        }).json()
+
+    small = place('ristretto', 'small')
+    big = place('ristretto', 'big')
+    other = place('cortado', 'small')
+    client.post(f'/orders/{big["id"]}/pay')
+    client.post(f'/orders/{other["id"]}/cancel')
+
+    assert listed(client, product='ristretto') == [small['id'], big['id']]
+    assert listed(client, product='ristretto', size='big') == [big['id']]
+    assert listed(
+        client, product=['ristretto', 'cortado'], status=['created', 'cancelled'],
+    ) == [small['id'], other['id']]
+    assert listed(client, product='cortado', cancelled=False) == []
+    assert listed(client, product='ristretto', since=big['created']) == [big['id']]
+    assert listed(client, product='ristretto', until=big['created']) == [small['id']]
+
+    response = client.get('/orders/export', params={'product': 'ristretto', 'status': 'progress'})
+    assert [json.loads(line)['id'] for line in response.text.splitlines()] == [big['id']]
+    assert client.get('/orders', params={'size': 'huge'}).status_code == 422
+
+
+def test_pages_through_orders_with_cursor(client):
+    for _ in range(5):
+        client.post('/orders', json=ORDER)
+    expected = listed(client)
+
+    pages, after = [], None
+    while True:
+        params = {'limit': 2} if after is None else {'limit': 2, 'after': after}
+        page = client.get('/orders', params=params).json()
+        pages.extend(order['id'] for order in page['orders'])
+        after = page['next_cursor']
+        if after is None:
+            break
+    assert pages == expected
+
+
+def test_rejects_invalid_cursor(client):
+    assert client.get('/orders', params={'after': 'not-a-cursor'}).status_code == 422
+
+
+def test_exports_orders_as_ndjson(client):
+    created = client.post('/orders', json=ORDER).json()
+    cancelled = client.post('/orders', json=ORDER).json()
+    client.post(f'/orders/{cancelled["id"]}/cancel')
+
+    response = client.get('/orders/export')
+    assert response.headers['content-type'].startswith('application/x-ndjson')
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert [order['id'] for order in exported] == listed(client)
+    assert exported[-1] == client.get(f'/orders/{cancelled["id"]}').json()
+
+    response = client.get('/orders/export', params={'cancelled': False})
+    exported = [json.loads(line)['id'] for line in response.text.splitlines()]
+    assert created['id'] in exported
+    assert cancelled['id'] not in exported
+
+
+def test_serves_current_order_after_update(client):
+    order = client.post('/orders', json=ORDER).json()
+    url = f'/orders/{order["id"]}'
+    first = client.get(url)
+    assert first.headers['content-type'] == 'application/json'
+    assert first.json() == order
+
+    client.put(url, json={'order': [{'product': 'mocha', 'size': 'big', 'quantity': 2}]})
+    assert client.get(url).json()['order'][0]['product'] == 'mocha'
+    listed_order = next(
+        item for item in client.get('/orders').json()['orders'] if item['id'] == order['id']
+    )
+    assert listed_order['order'][0]['product'] == 'mocha'
+
+
+def test_concurrent_updates_of_one_order_all_succeed(client):
+    order = client.post('/orders', json=ORDER).json()
+    url = f'/orders/{order["id"]}'
+
+    responses = client.concurrently(*(
+        ('PUT', url, {'json': {
+            'order': [{'product': 'latte', 'size': 'small', 'quantity': quantity}],
+        }})
+        for quantity in range(1, 21)
+    ))
+    assert [response.status_code for response in responses] == [200] * 20
+    assert client.get(url).json()['order'][0]['quantity'] in range(1, 21)
+
+
+def test_creates_orders_in_batch(client):
+    response = client.post('/orders/batch', json={'orders': [ORDER, ORDER]})
+    assert response.status_code == 201
+    results = response.json()['results']
+    assert [result['index'] for result in results] == [0, 1]
+    for result in results:
+        assert result['status'] == 201
+        assert client.get(f'/orders/{result["order"]["id"]}').json() == result['order']
+
+
+def test_reports_invalid_orders_in_batch(client):
+    invalid = {'order': [{'product': 'latte', 'size': 'huge', 'quantity': 1}]}
+    response = client.post('/orders/batch', json={'orders': [ORDER, invalid]})
+    assert response.status_code == 207
+    created, failed = response.json()['results']
+    assert created['status'] == 201
+    assert failed['index'] == 1
+    assert failed['status'] == 422
+    assert failed['errors']
+
+    assert client.post('/orders/batch', json={'orders': []}).status_code == 422
+
+
+def test_reports_stats_of_changes(client):
+    before = client.get('/orders/stats', params={'buckets': 1}).json()
+    created = client.post('/orders', json={
+        'order': [{'product': 'ristretto', 'size': 'big', 'quantity': 3}],
+    }).json()
+    client.post(f'/orders/{created["id"]}/cancel')
+
+    after = client.get('/orders/stats', params={'buckets': 1}).json()
+    assert after['total'] == before['total'] + 1
+    assert after['status'].get('cancelled', 0) == before['status'].get('cancelled', 0) + 1
+    assert after['quantity']['product']['ristretto'] == (
+        before['quantity']['product'].get('ristretto', 0) + 3
+    )
+    assert after['buckets'][0]['orders'] == before['buckets'][0]['orders'] + 1
+    assert client.get('/orders/stats', params={'buckets': 0}).status_code == 422
+
+
+def test_serves_archived_orders_read_only(client, tmp_path, monkeypatch):
+    from coffeemesh.repository.archive import Archive
+
+    from orders.api import api
+    from orders.repository.retention import OrderRetention
+
+    archive = Archive(tmp_path)
+    monkeypatch.setattr(api.orders, '_archive', archive)
+    order = client.post('/orders', json=ORDER).json()
+    client.post(f'/orders/{order["id"]}/cancel')
+    assert OrderRetention(api.orders.repository, archive, age=0).sweep() >= 1
+
+    url = f'/orders/{order["id"]}'
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.json()['status'] == 'cancelled'
+    # アーカイブに移した注文は変更も削除もできない
+    assert client.put(url, json=ORDER).status_code == 409
+    assert client.delete(url).status_code == 409
+    assert client.delete(f'/orders/{uuid.uuid4()}').status_code == 404
+
+
+def test_serves_precompiled_openapi_document(client):
+    from orders.app import app
+
+    response = client.get('/openapi/orders.json')
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/json'
+    assert response.json() == app.openapi()
+    assert '/orders/{order_id}' in response.json()['paths']
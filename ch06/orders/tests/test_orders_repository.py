@@ -0,0 +1,161 @@
+import uuid
+from datetime import datetime, timedelta
+
+from coffeemesh.repository.query import Query
+
+from orders.repository.orders_repository import OrderRepository
+from orders.repository.records import OrderRecord, make_items, to_timestamp
+
+
+def make_order(offset=0, status='created'):
+    return OrderRecord(
+        uuid.uuid4().int,
+        to_timestamp(datetime(2024, 1, 1) + timedelta(seconds=offset)),
+        status,
+        make_items([{'product': 'latte', 'size': 'small', 'quantity': 1}]),
+    )
+
+
+def test_gets_updates_and_deletes_by_id():
+    repository = OrderRepository()
+    order = repository.add(make_order())
+
+    assert repository.get(order.uuid) is order
+    assert repository.update(order.uuid, status='progress').status == 'progress'
+    assert repository.delete(order.uuid)
+    assert repository.get(order.uuid) is None
+    assert order.uuid not in repository
+    assert repository.update(order.uuid, status='cancelled') is None
+    assert not repository.delete(order.uuid)
+
+
+def test_keeps_status_index_in_sync():
+    repository = OrderRepository()
+    orders = [repository.add(make_order(offset)) for offset in range(5)]
+    repository.update(orders[3].uuid, status='cancelled')
+    repository.update(orders[1].uuid, status='cancelled')
+    repository.delete(orders[4].uuid)
+
+    assert [order.uuid for order in repository.list(Query(status='cancelled'))] == [
+        orders[1].uuid, orders[3].uuid,
+    ]
+    assert repository.count('cancelled') == 2
+    assert repository.count('created') == 2
+    assert repository.count() == 4
+    # 最後の注文がなくなったステータスのインデックスは残さない
+    repository.update(orders[0].uuid, status='progress')
+    repository.update(orders[2].uuid, status='progress')
+    assert repository.count('created') == 0
+    assert repository.list(Query(status='created')) == []
+
+
+def test_lists_in_creation_order_with_limit():
+    repository = OrderRepository()
+    orders = [repository.add(make_order(offset)) for offset in range(6)]
+    repository.update(orders[2].uuid, status='cancelled')
+    repository.update(orders[4].uuid, status='cancelled')
+
+    assert repository.list(limit=3) == orders[:3]
+    assert repository.list(Query(exclude_status='cancelled'), limit=3) == [orders[0], orders[1], orders[3]]
+    assert repository.list(Query(status='cancelled'), limit=1) == [orders[2]]
+    assert repository.list(limit=0) == []
+
+
+def test_lists_after_cursor_key_skipping_deleted_orders():
+    repository = OrderRepository()
+    orders = [repository.add(make_order(offset)) for offset in range(5)]
+    repository.delete(orders[2].uuid)
+    after = (orders[1].created_at, orders[1].uuid)
+
+    assert [order.uuid for order in repository.list(after=after)] == [
+        orders[3].uuid, orders[4].uuid,
+    ]
+    assert [order.uuid for order in repository.list(after=after, limit=1)] == [orders[3].uuid]
+    assert repository.list(Query(status='cancelled'), after=after) == []
+
+
+def test_compacts_created_index_when_tombstones_outnumber_orders():
+    repository = OrderRepository()
+    orders = [repository.add(make_order(offset)) for offset in range(10)]
+    for order in orders[:6]:
+        repository.delete(order.uuid)
+
+    assert len(repository._created_index) == 4
+    assert [order.uuid for order in repository.list()] == [order.uuid for order in orders[6:]]
+
+
+def test_scan_tolerates_changes_while_iterating():
+    repository = OrderRepository()
+    orders = [repository.add(make_order(offset)) for offset in range(4)]
+    scan = repository.scan()
+
+    assert next(scan) is orders[0]
+    repository.delete(orders[1].uuid)
+    late = repository.add(make_order(10))
+    assert [order.uuid for order in scan] == [orders[2].uuid, orders[3].uuid, late.uuid]
+
+
+def test_caches_encoded_orders_until_changed():
+    calls = []
+
+    def encoder(order):
+        calls.append(order.uuid)
+        return str(order.status).encode()
+
+    repository = OrderRepository(encoder=encoder)
+    order = repository.add(make_order())
+
+    assert repository.encode(order) == b'created'
+    assert repository.encode(order) == b'created'
+    repository.update(order.uuid, status='cancelled')
+    assert repository.encode(order) == b'cancelled'
+    assert len(calls) == 2
+
+
+def test_evicts_least_recently_encoded_orders():
+    calls = []
+
+    def encoder(order):
+        calls.append(order.uuid)
+        return b'{}'
+
+    repository = OrderRepository(encoder=encoder, encoded_cache_size=2)
+    first, second, third = (repository.add(make_order(offset)) for offset in range(3))
+    repository.encode(first)
+    repository.encode(second)
+    repository.encode(first)
+    repository.encode(third)
+
+    calls.clear()
+    repository.encode(first)
+    repository.encode(second)
+    assert calls == [second.uuid]
+
+
+def test_maintains_stats_through_updates_and_deletes():
+    repository = OrderRepository()
+    now = to_timestamp(datetime.utcnow())
+    first = repository.add(OrderRecord(
+        uuid.uuid4().int, now, 'created',
+        make_items([{'product': 'latte', 'size': 'small', 'quantity': 2}]),
+    ))
+    second = repository.add(OrderRecord(
+        uuid.uuid4().int, now, 'created',
+        make_items([{'product': 'mocha', 'size': 'big', 'quantity': 1}]),
+    ))
+    repository.update(first.uuid, status='cancelled')
+    repository.update(second.uuid, items=make_items([{'product': 'mocha', 'size': 'small', 'quantity': 1}]))
+
+    stats = repository.stats(buckets=2)
+    assert stats['total'] == 2
+    assert stats['status'] == {'created': 1, 'cancelled': 1}
+    assert stats['quantity'] == {
+        'product': {'latte': 2, 'mocha': 1}, 'size': {'small': 3},
+    }
+    assert [bucket['orders'] for bucket in stats['buckets']] == [0, 2]
+
+    repository.delete(first.uuid)
+    stats = repository.stats(buckets=1)
+    assert stats['status'] == {'created': 1}
+    assert stats['quantity']['product'] == {'mocha': 1}
+    assert stats['buckets'][0]['orders'] == 1
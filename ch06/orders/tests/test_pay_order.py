@@ -0,0 +1,68 @@
+import uuid
+from datetime import datetime
+
+import pytest
+
+from orders.repository.journaled_repository import JournaledOrderRepository
+from orders.repository.orders_repository import OrderRepository, StatusConflict
+from orders.repository.records import OrderRecord, make_items, to_timestamp
+from orders.repository.sqlite_repository import SqliteOrderRepository
+
+
+ORDER = {'order': [{'product': 'latte', 'size': 'small', 'quantity': 1}]}
+
+
+def make_order(status='created'):
+    return OrderRecord(
+        uuid.uuid4().int,
+        to_timestamp(datetime.utcnow()),
+        status,
+        make_items([{'product': 'latte', 'size': 'small', 'quantity': 1}]),
+    )
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'journal'])
+def repository(request, tmp_path):
+    if request.param == 'memory':
+        yield OrderRepository()
+    elif request.param == 'sqlite':
+        repository = SqliteOrderRepository(str(tmp_path / 'orders.db'))
+        yield repository
+        repository.close()
+    else:
+        repository = JournaledOrderRepository(tmp_path / 'journal')
+        yield repository
+        repository.close()
+
+
+def test_pays_created_order_once(repository):
+    order = repository.add(make_order())
+
+    paid = repository.update(order.uuid, outbox=True, if_status={'created'}, status='progress')
+    assert paid.status == 'progress'
+    with pytest.raises(StatusConflict) as error:
+        repository.update(order.uuid, outbox=True, if_status={'created'}, status='progress')
+    assert error.value.status == 'progress'
+    assert repository.outbox_size() == 1
+
+
+def test_does_not_pay_cancelled_order(repository):
+    order = repository.add(make_order())
+    repository.update(order.uuid, status='cancelled')
+
+    with pytest.raises(StatusConflict):
+        repository.update(order.uuid, outbox=True, if_status={'created'}, status='progress')
+    assert repository.get(order.uuid).status == 'cancelled'
+    assert repository.outbox_size() == 0
+
+
+def test_pay_endpoint_rejects_second_payment(client):
+    order = client.post('/orders', json=ORDER).json()
+    cancelled = client.post('/orders', json=ORDER).json()
+    client.post(f'/orders/{cancelled["id"]}/cancel')
+
+    assert client.post(f'/orders/{order["id"]}/pay').status_code == 200
+    second = client.post(f'/orders/{order["id"]}/pay')
+    assert second.status_code == 409
+    assert second.json()['detail'] == 'Order cannot be changed in status progress'
+    assert client.post(f'/orders/{cancelled["id"]}/pay').status_code == 409
@@ -0,0 +1,47 @@
+import json
+import uuid
+from datetime import datetime
+
+from orders.api.encoders import encode_order
+from orders.api.pagination import decode_cursor, encode_cursor
+from orders.repository.codec import dump_order, load_order
+from orders.repository.records import OrderRecord, from_timestamp, make_items, to_timestamp
+
+
+ITEMS = [{'product': 'latte', 'size': 'small', 'quantity': 1}]
+
+
+def test_shares_identical_item_tuples():
+    items = make_items(ITEMS)
+
+    assert make_items([dict(item) for item in ITEMS]) is items
+    assert make_items([{**ITEMS[0], 'quantity': 2}]) is not items
+    assert not hasattr(items[0], '__dict__')
+    assert items[0].product is make_items([{**ITEMS[0], 'quantity': 3}])[0].product
+
+
+def test_converts_ids_and_timestamps_at_the_edge():
+    order_id, created = uuid.uuid4(), datetime(2024, 1, 1, 12, 30, 0, 123456)
+    order = OrderRecord(order_id.int, to_timestamp(created), 'created', make_items(ITEMS))
+
+    assert (order.uuid, order.created_at) == (order_id, created)
+    assert from_timestamp(order.created) == created
+    assert json.loads(encode_order(order)) == {
+        'order': ITEMS,
+        'id': str(order_id),
+        'created': created.isoformat(),
+        'status': 'created',
+    }
+    assert decode_cursor(encode_cursor(order)) == (created, order_id)
+
+
+def test_codec_keeps_the_stored_format():
+    data = {
+        'order': ITEMS,
+        'id': str(uuid.uuid4()),
+        'created': datetime(2024, 1, 1).isoformat(),
+        'status': 'paid',
+    }
+
+    # 版数を導入する前に保存された注文は版数 1 として読み込む
+    assert dump_order(load_order(data)) == {**data, 'version': 1}
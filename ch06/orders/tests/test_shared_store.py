@@ -0,0 +1,99 @@
+import multiprocessing
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from coffeemesh.feed.change_feed import ChangeFeed
+from coffeemesh.idempotency.cache import NEW, REPLAY, IdempotencyCache
+
+from orders.repository.orders_repository import OrderRepository, StatusConflict, VersionConflict
+from orders.repository.records import OrderRecord, make_items, to_timestamp
+from orders.repository.shared_repository import SharedOrderRepository, serve
+
+
+AUTHKEY = b'test'
+
+
+def make_order(offset=0):
+    return OrderRecord(
+        uuid.uuid4().int,
+        to_timestamp(datetime(2024, 1, 1) + timedelta(seconds=offset)),
+        'created',
+        make_items([{'product': 'latte', 'size': 'small', 'quantity': 1}]),
+    )
+
+
+@pytest.fixture
+def address(tmp_path):
+    address = str(tmp_path / 'store.sock')
+    server = multiprocessing.get_context('fork').Process(
+        target=serve,
+        args=(OrderRepository(), ChangeFeed(), IdempotencyCache(), address, AUTHKEY),
+        daemon=True,
+    )
+    server.start()
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            SharedOrderRepository(address, AUTHKEY)
+            break
+        except (FileNotFoundError, ConnectionRefusedError):
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+    yield address
+    server.terminate()
+    server.join()
+
+
+def test_workers_see_the_same_orders(address):
+    # 別々のワーカーのクライアントとして接続する
+    first, second = (SharedOrderRepository(address, AUTHKEY) for _ in range(2))
+    order = first.add(make_order())
+
+    assert second.get(order.uuid).uuid == order.uuid
+    updated = second.update(order.uuid, if_match={1}, if_status={'created'}, status='progress')
+    assert (updated.status, updated.version) == ('progress', 2)
+    assert first.get(order.uuid).version == 2
+    assert len(first) == 1
+    assert first.stats()['status'] == {'progress': 1}
+
+
+def test_conflicts_reach_the_worker(address):
+    repository = SharedOrderRepository(address, AUTHKEY)
+    order = repository.add(make_order())
+    repository.update(order.uuid, status='cancelled')
+
+    with pytest.raises(VersionConflict) as conflict:
+        repository.update(order.uuid, if_match={1}, status='progress')
+    assert conflict.value.version == 2
+    with pytest.raises(StatusConflict) as conflict:
+        repository.update(order.uuid, if_status={'created'}, status='progress')
+    assert conflict.value.status == 'cancelled'
+
+
+def test_scans_in_chunks(address):
+    repository = SharedOrderRepository(address, AUTHKEY)
+    orders = repository.add_many([make_order(offset) for offset in range(7)])
+
+    assert [order.uuid for order in repository.scan(chunk_size=3)] == [order.uuid for order in orders]
+
+
+def test_workers_read_the_same_feed(address):
+    first, second = (SharedOrderRepository(address, AUTHKEY).feed() for _ in range(2))
+    position = second.position()
+
+    event_id = first.publish('order.paid', {'id': 'a'})
+    assert second.wait(position, 5)
+    assert [event[0] for event in second.since(position)] == [event_id]
+
+
+def test_workers_share_idempotency_keys(address):
+    first, second = (SharedOrderRepository(address, AUTHKEY).idempotency() for _ in range(2))
+    key = ('POST', '/orders', None, 'abc')
+
+    assert first.begin(key, b'body') == (NEW, None)
+    first.complete(key, (201, [], b'{}'))
+    assert second.begin(key, b'body') == (REPLAY, (201, [], b'{}'))
+    assert second.stats() == {'keys': 1, 'replayed': 1}
@@ -0,0 +1,202 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from coffeemesh.repository.query import Query
+
+from orders.repository.codec import dump_order
+from orders.repository.factory import create_order_repository
+from orders.repository.orders_repository import OrderRepository
+from orders.repository.records import OrderRecord, make_items, to_timestamp
+from orders.repository.sqlite_repository import SqliteOrderRepository
+
+
+def make_order(offset=0, status='created'):
+    return OrderRecord(
+        uuid.uuid4().int,
+        to_timestamp(datetime(2024, 1, 1) + timedelta(seconds=offset)),
+        status,
+        make_items([{'product': 'latte', 'size': 'small', 'quantity': 1}]),
+    )
+
+
+def ids(orders):
+    return [order.uuid for order in orders]
+
+
+@pytest.fixture
+def repository(tmp_path):
+    repository = SqliteOrderRepository(str(tmp_path / 'orders.db'))
+    yield repository
+    repository.close()
+
+
+def test_persists_orders_across_connections(tmp_path, repository):
+    order = repository.add(make_order())
+    repository.update(order.uuid, status='cancelled')
+
+    reopened = SqliteOrderRepository(str(tmp_path / 'orders.db'))
+    assert dump_order(reopened.get(order.uuid)) == {
+        **dump_order(order), 'status': 'cancelled', 'version': 2,
+    }
+    assert order.uuid in reopened
+    assert reopened.delete(order.uuid)
+    assert not reopened.delete(order.uuid)
+    assert repository.get(order.uuid) is None
+    reopened.close()
+
+
+def test_lists_by_status_and_cursor(repository):
+    orders = [repository.add(make_order(offset)) for offset in range(5)]
+    repository.update(orders[1].uuid, status='cancelled')
+    repository.update(orders[3].uuid, status='cancelled')
+    after = (orders[1].created_at, orders[1].uuid)
+
+    assert ids(repository.list(Query(status='cancelled'))) == [orders[1].uuid, orders[3].uuid]
+    assert ids(repository.list(Query(exclude_status='cancelled'), after=after)) == [
+        orders[2].uuid, orders[4].uuid,
+    ]
+    assert ids(repository.list(after=after, limit=2)) == [orders[2].uuid, orders[3].uuid]
+    assert repository.list(limit=0) == []
+    assert repository.count() == 5
+    assert repository.count('cancelled') == 2
+
+
+def test_scans_in_chunks(repository):
+    orders = [repository.add(make_order(offset)) for offset in range(7)]
+
+    assert ids(repository.scan(chunk_size=3)) == ids(orders)
+
+
+def test_batch_rolls_back_on_error(repository):
+    with pytest.raises(RuntimeError):
+        with repository.batch():
+            repository.add(make_order())
+            raise RuntimeError
+
+    assert len(repository) == 0
+
+
+def test_factory_selects_backend(tmp_path):
+    class Config:
+        STORAGE_BACKEND = 'memory'
+        SQLITE_PATH = str(tmp_path / 'orders.db')
+        OUTBOX_LEASE = 60
+
+    assert isinstance(create_order_repository(Config), OrderRepository)
+    Config.STORAGE_BACKEND = 'sqlite'
+    repository = create_order_repository(Config)
+    assert isinstance(repository, SqliteOrderRepository)
+    repository.close()
+    Config.STORAGE_BACKEND = 'redis'
+    with pytest.raises(ValueError):
+        create_order_repository(Config)
+
+
+def test_adds_orders_in_batch(repository):
+    orders = repository.add_many([make_order(offset) for offset in range(3)])
+
+    assert ids(repository.list()) == ids(orders)
+
+
+def test_claims_outbox_entries_once_across_repositories(tmp_path, repository):
+    orders = [repository.add(make_order(offset)) for offset in range(3)]
+    for order in orders:
+        repository.update(order.uuid, status='progress', outbox=True)
+    other = SqliteOrderRepository(str(tmp_path / 'orders.db'))
+
+    first = repository.claim_outbox(2)
+    second = other.claim_outbox(2)
+    assert [payload['id'] for _, payload in first + second] == [
+        str(order.uuid) for order in orders
+    ]
+    assert other.claim_outbox(2) == []
+
+    # 他のリポジトリが取り出したエントリは解放できない
+    other.release_outbox([sequence for sequence, _ in first])
+    assert other.claim_outbox(2) == []
+    repository.release_outbox([sequence for sequence, _ in first])
+    assert other.claim_outbox(2) == first
+
+    other.ack_outbox([sequence for sequence, _ in first + second])
+    assert repository.outbox_size() == 0
+    other.close()
+
+
+def test_reclaims_outbox_entries_after_lease_expires(tmp_path):
+    repository = SqliteOrderRepository(str(tmp_path / 'orders.db'), outbox_lease=0)
+    order = repository.add(make_order())
+    repository.update(order.uuid, status='progress', outbox=True)
+    other = SqliteOrderRepository(str(tmp_path / 'orders.db'))
+
+    [entry] = repository.claim_outbox(1)
+    assert other.claim_outbox(1) == []
+    assert repository.claim_outbox(1) == [entry]
+    repository.close()
+    other.close()
+
+
+def test_filters_match_memory_repository(repository):
+    memory = OrderRepository()
+    choices = [
+        ('created', [{'product': 'latte', 'size': 'small', 'quantity': 1}]),
+        ('cancelled', [{'product': 'mocha', 'size': 'big', 'quantity': 2}]),
+        ('progress', [
+            {'product': 'latte', 'size': 'big', 'quantity': 1},
+            {'product': 'espresso', 'size': 'medium', 'quantity': 1},
+        ]),
+    ]
+    for offset in range(12):
+        status, items = choices[offset % 3]
+        order = OrderRecord(
+            uuid.uuid4().int,
+            to_timestamp(datetime(2024, 1, 1) + timedelta(seconds=offset)),
+            status,
+            make_items(items),
+        )
+        repository.add(order)
+        memory.add(OrderRecord(order.id, order.created, status, make_items(items)))
+
+    start = datetime(2024, 1, 1, 0, 0, 3)
+    for query in [
+        Query(product='latte'),
+        Query(product={'mocha', 'espresso'}, size='big'),
+        Query(status={'created', 'progress'}, size='big'),
+        Query(exclude_status='cancelled', start=start, end=start + timedelta(seconds=6)),
+    ]:
+        assert ids(repository.list(query)) == ids(memory.list(query))
+        assert ids(repository.list(query, limit=2)) == ids(memory.list(query, limit=2))
+        assert ids(repository.scan(query, chunk_size=2)) == ids(memory.scan(query))
+
+
+def test_stats_match_memory_repository(repository):
+    memory = OrderRepository()
+    now = to_timestamp(datetime.utcnow())
+    orders = [
+        OrderRecord(uuid.uuid4().int, now - offset, 'created', make_items([
+            {'product': product, 'size': size, 'quantity': offset + 1},
+        ]))
+        for offset, (product, size) in enumerate([('latte', 'small'), ('mocha', 'big')] * 3)
+    ]
+    for order in orders:
+        memory.add(order)
+        repository.add(OrderRecord(order.id, order.created, order.status, order.items))
+    for target in (memory, repository):
+        target.update(orders[0].uuid, status='cancelled')
+        target.update(orders[1].uuid, items=make_items([{'product': 'flat white', 'size': 'medium', 'quantity': 1}]))
+        target.delete(orders[2].uuid)
+
+    assert repository.stats(buckets=3) == memory.stats(buckets=3)
+
+
+def test_rebuilds_stats_of_existing_database(tmp_path, repository):
+    repository.add(make_order(status='cancelled'))
+    repository.add(make_order(offset=1))
+    expected = repository.stats()
+    repository._connection().execute('DELETE FROM stats')
+
+    reopened = SqliteOrderRepository(str(tmp_path / 'orders.db'))
+    assert reopened.stats() == expected
+    assert expected['status'] == {'cancelled': 1, 'created': 1}
+    reopened.close()